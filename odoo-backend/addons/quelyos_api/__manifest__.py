@@ -8,7 +8,7 @@
     'website': 'https://quelyos.com',
     'license': 'LGPL-3',
     'external_dependencies': {
-        'python': ['qrcode', 'Pillow', 'faker'],
+        'python': ['qrcode', 'Pillow', 'faker', 'numpy'],
     },
     'depends': [
         'base',
@@ -52,12 +52,20 @@
         'data/payment_providers.xml',
         'data/ir_cron_stock_alerts.xml',
         'data/ir_cron_abandoned_cart.xml',
+        'data/ir_cron_product_facet.xml',
+        'data/ir_cron_cart_store.xml',
+        'data/ir_cron_pos_catalog.xml',
+        'data/ir_cron_pos_sync.xml',
+        'data/ir_cron_sales_rollup.xml',
         # 'data/ir_cron_theme_payouts.xml',  # TEMPORAIREMENT DÉSACTIVÉ (erreur Python dans code)
         'data/ir_cron_subscriptions.xml',
         'data/ir_cron_auth_tokens.xml',
         'data/ir_cron_backup_schedules.xml',
         'data/ir_cron_reservations.xml',
         'data/ir_cron_sitemap_healthcheck.xml',
+        'data/ir_cron_cashflow_forecast.xml',
+        'data/ir_cron_finance_metric.xml',
+        'data/ir_cron_consolidation_cache.xml',
         'data/res_country_state_tn.xml',
         'data/email_templates_data.xml',
         'data/email_templates_subscriptions.xml',
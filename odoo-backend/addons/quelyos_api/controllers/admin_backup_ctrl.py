@@ -540,6 +540,8 @@ class AdminBackupController(SuperAdminController):
             'error_message': backup.error_message,
             'records_count': backup.records_count if backup.type == 'tenant' else 0,
             'data_models': backup.data_models,
+            'progress': backup.progress,
+            'parent_backup_id': backup.parent_backup_id.id if backup.parent_backup_id else None,
         }
 
     @http.route('/api/super-admin/backup-schedules', type='http', auth='public', methods=['GET', 'POST', 'OPTIONS'], csrf=False)
@@ -597,6 +599,7 @@ class AdminBackupController(SuperAdminController):
                     'minute': data.get('minute', 0),
                     'backup_type': 'tenant',
                     'retention_count': data.get('retention_count', 7),
+                    'full_backup_interval': data.get('full_backup_interval', 7),
                     'notification_email': data.get('notification_email'),
                 })
 
@@ -680,6 +683,8 @@ class AdminBackupController(SuperAdminController):
                     update_vals['minute'] = data['minute']
                 if 'retention_count' in data:
                     update_vals['retention_count'] = data['retention_count']
+                if 'full_backup_interval' in data:
+                    update_vals['full_backup_interval'] = data['full_backup_interval']
                 if 'notification_email' in data:
                     update_vals['notification_email'] = data['notification_email']
 
@@ -792,6 +797,7 @@ class AdminBackupController(SuperAdminController):
             'minute': schedule.minute,
             'backup_type': schedule.backup_type,
             'retention_count': schedule.retention_count,
+            'full_backup_interval': schedule.full_backup_interval,
             'last_run': schedule.last_run.isoformat() if schedule.last_run else None,
             'next_run': schedule.next_run.isoformat() if schedule.next_run else None,
             'last_backup_id': schedule.last_backup_id.id if schedule.last_backup_id else None,
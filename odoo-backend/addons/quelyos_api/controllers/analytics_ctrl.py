@@ -20,132 +20,20 @@ class QuelyosAnalyticsAPI(BaseController):
     def get_analytics_stats(self, **kwargs):
         """Statistiques globales (admin uniquement)"""
         try:
-            # Total produits
-            total_products = request.env['product.product'].sudo().search_count([])
-
-            # Total clients
-            total_customers = request.env['res.partner'].sudo().search_count([
-                ('customer_rank', '>', 0)
-            ])
-
-            # Commandes
-            total_orders = request.env['sale.order'].sudo().search_count([])
-            confirmed_orders = request.env['sale.order'].sudo().search_count([
-                ('state', 'in', ['sale', 'done'])
-            ])
-
-            # Chiffre d'affaires total
-            confirmed_orders_obj = request.env['sale.order'].sudo().search([
-                ('state', 'in', ['sale', 'done'])
-            ])
-            total_revenue = sum(confirmed_orders_obj.mapped('amount_total'))
-
-            # Commandes en attente
-            pending_orders = request.env['sale.order'].sudo().search_count([
-                ('state', '=', 'draft')
-            ])
+            params = self._get_params()
 
-            # Produits en rupture de stock (filtrage côté Python car qty_available est calculé)
-            # Limite à 50000 produits actifs pour éviter surcharge mémoire sur très gros catalogues
-            all_products = request.env['product.product'].sudo().search(
-                [('active', '=', True)],
-                limit=50000
-            )
-            out_of_stock_products = len([p for p in all_products if p.qty_available <= 0])
+            # Société du tenant (header X-Tenant-Domain), sinon toutes sociétés
+            tenant = self._get_tenant()
+            company = tenant.company_id if tenant else None
 
-            # Dernières commandes (5 dernières)
-            recent_orders = request.env['sale.order'].sudo().search(
-                [],
-                limit=5,
-                order='date_order desc'
+            # Agrégats SQL matérialisés par société (voir models/analytics_stats.py)
+            data = request.env['quelyos.analytics.stats'].sudo().get_stats(
+                company, use_cache=not params.get('refresh'),
             )
 
-            recent_orders_data = [{
-                'id': o.id,
-                'name': o.name,
-                'date_order': o.date_order.isoformat() if o.date_order else None,
-                'state': o.state,
-                'amount_total': o.amount_total,
-                'customer': {
-                    'id': o.partner_id.id,
-                    'name': o.partner_id.name,
-                } if o.partner_id else None,
-            } for o in recent_orders]
-
-            # Top 5 produits les plus vendus
-            order_lines = request.env['sale.order.line'].sudo().search([
-                ('order_id.state', 'in', ['sale', 'done'])
-            ])
-
-            # Compter les ventes par produit
-            product_sales = {}
-            for line in order_lines:
-                product_id = line.product_id.id
-                if product_id not in product_sales:
-                    product_sales[product_id] = {
-                        'id': product_id,
-                        'name': line.product_id.name,
-                        'qty_sold': 0,
-                        'revenue': 0,
-                    }
-                product_sales[product_id]['qty_sold'] += line.product_uom_qty
-                product_sales[product_id]['revenue'] += line.price_total
-
-            # Trier et prendre les 5 meilleurs
-            top_products = sorted(
-                product_sales.values(),
-                key=lambda x: x['qty_sold'],
-                reverse=True
-            )[:5]
-
-            # Alertes de stock (produits en rupture ou stock faible)
-            # Filtrage côté Python car qty_available est un champ calculé
-            sale_products = request.env['product.template'].sudo().search([('sale_ok', '=', True)])
-            low_stock_products = [p for p in sale_products if p.qty_available <= 5]
-            # Trier par stock croissant et limiter à 10
-            low_stock_products.sort(key=lambda p: p.qty_available)
-            stock_alert_products = low_stock_products[:10]
-
-            stock_alerts = []
-            for p in stock_alert_products:
-                qty = p.qty_available
-                if qty <= 0:
-                    alert_level = 'critical'
-                    alert_message = 'Rupture de stock'
-                else:
-                    alert_level = 'warning'
-                    alert_message = f'Stock faible ({int(qty)} restants)'
-
-                stock_alerts.append({
-                    'id': p.id,
-                    'name': p.name,
-                    'default_code': p.default_code or '',
-                    'qty_available': qty,
-                    'alert_level': alert_level,
-                    'alert_message': alert_message,
-                    'image': f'/web/image/product.template/{p.id}/image_128' if p.image_128 else None,
-                })
-
-            # Compter les alertes par niveau (filtrage côté Python)
-            low_stock_count = len([p for p in sale_products if 0 < p.qty_available <= 5])
-
             return {
                 'success': True,
-                'data': {
-                    'totals': {
-                        'products': total_products,
-                        'customers': total_customers,
-                        'orders': total_orders,
-                        'confirmed_orders': confirmed_orders,
-                        'pending_orders': pending_orders,
-                        'out_of_stock_products': out_of_stock_products,
-                        'low_stock_products': low_stock_count,
-                        'revenue': total_revenue,
-                    },
-                    'recent_orders': recent_orders_data,
-                    'top_products': top_products,
-                    'stock_alerts': stock_alerts,
-                }
+                'data': data,
             }
 
         except Exception as e:
@@ -164,64 +52,23 @@ class QuelyosAnalyticsAPI(BaseController):
 
             params = self._get_params()
             period = params.get('period', '30d')  # 7d, 30d, 12m, custom
+            start_date, end_date, group_by = self._get_chart_range(params)
 
-            from datetime import datetime, timedelta
-            from dateutil.relativedelta import relativedelta
-
-            today = datetime.now().date()
-
-            if period == '7d':
-                start_date = today - timedelta(days=7)
-                group_by = 'day'
-            elif period == '30d':
-                start_date = today - timedelta(days=30)
-                group_by = 'day'
-            elif period == '12m':
-                start_date = today - relativedelta(months=12)
-                group_by = 'month'
-            elif period == 'custom':
-                start_date = datetime.strptime(params.get('start_date'), '%Y-%m-%d').date()
-                end_date = datetime.strptime(params.get('end_date', today.isoformat()), '%Y-%m-%d').date()
-                group_by = params.get('group_by', 'day')
-            else:
-                start_date = today - timedelta(days=30)
-                group_by = 'day'
-
-            # Récupérer les commandes confirmées sur la période
-            orders = request.env['sale.order'].sudo().search([
-                ('state', 'in', ['sale', 'done']),
-                ('date_order', '>=', start_date.isoformat()),
-            ])
+            # Agrégat quotidien (voir models/sales_rollup.py), regroupé par jour/semaine/mois
+            series = request.env['quelyos.sales.rollup'].sudo().get_series(
+                start_date, end_date, group_by, company=self._get_chart_company(),
+            )
 
-            # Grouper par période
-            chart_data = {}
-            for order in orders:
-                if not order.date_order:
+            data = []
+            for point in series:
+                confirmed = [point['states'][state] for state in ('sale', 'done') if state in point['states']]
+                if not confirmed:
                     continue
-
-                date = order.date_order.date()
-                if group_by == 'day':
-                    key = date.isoformat()
-                elif group_by == 'month':
-                    key = date.strftime('%Y-%m')
-                else:
-                    key = date.isoformat()
-
-                if key not in chart_data:
-                    chart_data[key] = {'revenue': 0, 'orders': 0}
-
-                chart_data[key]['revenue'] += order.amount_total
-                chart_data[key]['orders'] += 1
-
-            # Convertir en liste triée
-            data = [
-                {
-                    'period': key,
-                    'revenue': round(values['revenue'], 2),
-                    'orders': values['orders']
-                }
-                for key, values in sorted(chart_data.items())
-            ]
+                data.append({
+                    'period': point['period'],
+                    'revenue': round(sum(values['revenue'] for values in confirmed), 2),
+                    'orders': sum(values['orders'] for values in confirmed),
+                })
 
             return {
                 'success': True,
@@ -243,69 +90,22 @@ class QuelyosAnalyticsAPI(BaseController):
 
             params = self._get_params()
             period = params.get('period', '30d')
+            start_date, end_date, group_by = self._get_chart_range(params)
 
-            from datetime import datetime, timedelta
-            from dateutil.relativedelta import relativedelta
-
-            today = datetime.now().date()
-
-            if period == '7d':
-                start_date = today - timedelta(days=7)
-                group_by = 'day'
-            elif period == '30d':
-                start_date = today - timedelta(days=30)
-                group_by = 'day'
-            elif period == '12m':
-                start_date = today - relativedelta(months=12)
-                group_by = 'month'
-            else:
-                start_date = today - timedelta(days=30)
-                group_by = 'day'
-
-            # Récupérer toutes les commandes sur la période
-            orders = request.env['sale.order'].sudo().search([
-                ('date_order', '>=', start_date.isoformat()),
-            ])
-
-            # Grouper par période et par état
-            chart_data = {}
-            for order in orders:
-                if not order.date_order:
-                    continue
+            series = request.env['quelyos.sales.rollup'].sudo().get_series(
+                start_date, end_date, group_by, company=self._get_chart_company(),
+            )
 
-                date = order.date_order.date()
-                if group_by == 'day':
-                    key = date.isoformat()
-                elif group_by == 'month':
-                    key = date.strftime('%Y-%m')
-                else:
-                    key = date.isoformat()
-
-                if key not in chart_data:
-                    chart_data[key] = {
-                        'total': 0,
-                        'draft': 0,
-                        'sent': 0,
-                        'sale': 0,
-                        'done': 0,
-                        'cancel': 0
-                    }
-
-                chart_data[key]['total'] += 1
-                if order.state in chart_data[key]:
-                    chart_data[key][order.state] += 1
-
-            # Convertir en liste triée
-            data = [
-                {
-                    'period': key,
-                    'total': values['total'],
-                    'confirmed': values['sale'] + values['done'],
-                    'pending': values['draft'] + values['sent'],
-                    'cancelled': values['cancel']
-                }
-                for key, values in sorted(chart_data.items())
-            ]
+            data = []
+            for point in series:
+                counts = {state: values['orders'] for state, values in point['states'].items()}
+                data.append({
+                    'period': point['period'],
+                    'total': sum(counts.values()),
+                    'confirmed': counts.get('sale', 0) + counts.get('done', 0),
+                    'pending': counts.get('draft', 0) + counts.get('sent', 0),
+                    'cancelled': counts.get('cancel', 0)
+                })
 
             return {
                 'success': True,
@@ -318,6 +118,38 @@ class QuelyosAnalyticsAPI(BaseController):
             _logger.error(f"Get orders chart error: {e}")
             return {'success': False, 'error': 'Une erreur est survenue'}
 
+    def _get_chart_range(self, params):
+        """Période des graphiques : (date début, date fin ou None, granularité day/week/month)"""
+        from dateutil.relativedelta import relativedelta
+
+        period = params.get('period', '30d')
+        today = datetime.now().date()
+        end_date = None
+
+        if period == '7d':
+            start_date = today - timedelta(days=7)
+            group_by = 'day'
+        elif period == '12m':
+            start_date = today - relativedelta(months=12)
+            group_by = 'month'
+        elif period == 'custom':
+            start_date = datetime.strptime(params.get('start_date'), '%Y-%m-%d').date()
+            end_date = datetime.strptime(params.get('end_date', today.isoformat()), '%Y-%m-%d').date()
+            group_by = 'day'
+        else:
+            start_date = today - timedelta(days=30)
+            group_by = 'day'
+
+        group_by = params.get('group_by') or group_by
+        if group_by not in ('day', 'week', 'month'):
+            group_by = 'day'
+        return start_date, end_date, group_by
+
+    def _get_chart_company(self):
+        """Société du tenant (header X-Tenant-Domain), sinon toutes sociétés"""
+        tenant = self._get_tenant()
+        return tenant.company_id if tenant else None
+
     @http.route('/api/ecommerce/analytics/conversion-funnel', type='jsonrpc', auth='public', methods=['POST'], csrf=False, cors='*')
     def get_conversion_funnel(self, **kwargs):
         """Funnel de conversion : visiteurs → panier → commande → paiement"""
@@ -421,42 +253,13 @@ class QuelyosAnalyticsAPI(BaseController):
             params = self._get_params()
             limit = int(params.get('limit', 10))
 
-            # Récupérer toutes les lignes de commandes confirmées
-            order_lines = request.env['sale.order.line'].sudo().search([
-                ('order_id.state', 'in', ['sale', 'done'])
-            ])
-
-            # Compter les ventes par catégorie
-            category_sales = {}
-            for line in order_lines:
-                if not line.product_id or not line.product_id.categ_id:
-                    continue
-
-                category = line.product_id.categ_id
-                category_id = category.id
-
-                if category_id not in category_sales:
-                    category_sales[category_id] = {
-                        'id': category_id,
-                        'name': category.complete_name or category.name,
-                        'qty_sold': 0,
-                        'revenue': 0,
-                    }
-
-                category_sales[category_id]['qty_sold'] += line.product_uom_qty
-                category_sales[category_id]['revenue'] += line.price_total
-
-            # Trier et prendre les top N
-            top_categories = sorted(
-                category_sales.values(),
-                key=lambda x: x['revenue'],
-                reverse=True
-            )[:limit]
-
-            # Arrondir les revenues
-            for cat in top_categories:
-                cat['revenue'] = round(cat['revenue'], 2)
-                cat['qty_sold'] = int(cat['qty_sold'])
+            # Ventilation par catégorie de l'agrégat quotidien, commandes confirmées
+            top_categories = request.env['quelyos.sales.rollup'].sudo().get_top_categories(
+                limit=limit,
+                date_from=params.get('start_date'),
+                date_to=params.get('end_date'),
+                company=self._get_chart_company(),
+            )
 
             return {
                 'success': True,
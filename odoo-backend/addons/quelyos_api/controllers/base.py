@@ -546,3 +546,72 @@ class BaseController(http.Controller):
             return None
 
         return get_quota_status(tenant)
+
+    def _get_cart_owner(self, params, email_key='guest_email'):
+        """
+        Propriétaire du panier e-commerce (voir models/cart.py) : client
+        connecté, sinon invité identifié par son email. Aucune requête SQL.
+
+        Returns:
+            tuple: ('partner:<id>' | 'guest:<email>', None) ou (None, réponse d'erreur)
+        """
+        if request.session.uid:
+            return f'partner:{request.env.user.partner_id.id}', None
+        guest_email = (params.get(email_key) or '').strip().lower()
+        if not guest_email:
+            return None, {
+                'success': False,
+                'error': 'Authentication required or guest_email needed'
+            }
+        return f'guest:{guest_email}', None
+
+    def _get_finance_tenant(self):
+        """
+        Authentifie la requête (header Authorization) et récupère le tenant
+        (header X-Tenant-Domain) des endpoints Finance.
+
+        Returns:
+            tuple: (quelyos.tenant, None) ou (None, réponse d'erreur)
+
+        Usage:
+            tenant, error = self._get_finance_tenant()
+            if error:
+                return error
+        """
+        if self._authenticate_from_header():
+            return None, self._error_response("Session expirée", "UNAUTHORIZED", 401)
+
+        tenant = self._get_tenant()
+        if not tenant:
+            return None, self._error_response("Tenant non trouvé", "FORBIDDEN", 403)
+        return tenant, None
+
+    def _success_response(self, data, message=None):
+        """
+        Réponse JSON de succès standard des endpoints Finance.
+
+        Usage:
+            return self._success_response({'lines': lines})
+        """
+        response = {
+            'success': True,
+            'data': data,
+        }
+        if message:
+            response['message'] = message
+        return response
+
+    def _error_response(self, message, error_code='SERVER_ERROR', status=400):
+        """
+        Réponse JSON d'erreur standard des endpoints Finance.
+        `status` est indicatif (les routes JSON-RPC répondent toujours 200).
+
+        Usage:
+            return self._error_response("Compte introuvable", "NOT_FOUND", 404)
+        """
+        return {
+            'success': False,
+            'error': message,
+            'error_code': error_code,
+            'status': status,
+        }
@@ -16,27 +16,17 @@ _logger = logging.getLogger(__name__)
 class QuelyosCartAPI(BaseController):
     """API contrôleur pour le panier, coupons et parrainage"""
 
-    def _get_or_create_cart(self, partner_id):
-        """Récupérer ou créer un panier pour le client"""
-        # Chercher un panier existant (commande en brouillon sans date de commande)
-        cart = request.env['sale.order'].sudo().search([
-            ('partner_id', '=', partner_id),
-            ('state', '=', 'draft'),
-            ('date_order', '=', False),
-        ], limit=1)
-
-        # Créer un panier si inexistant
-        if not cart:
-            cart = request.env['sale.order'].sudo().create({
-                'partner_id': partner_id,
-                'state': 'draft',
-            })
-
-        return cart
+    def _cart_summary(self, cart):
+        """Résumé du panier renvoyé par les endpoints de modification"""
+        return {
+            'id': cart['order_id'],
+            'amount_total': cart['amount_total'],
+            'lines_count': len(cart['lines']),
+        }
 
     @http.route('/api/ecommerce/cart/add', type='jsonrpc', auth='public', methods=['POST'], csrf=False, cors='*')
     def add_to_cart(self, **kwargs):
-        """Ajouter un produit au panier"""
+        """Ajouter un produit au panier (store éphémère, voir models/cart.py)"""
         try:
             params = self._get_params()
             product_id = params.get('product_id')
@@ -48,65 +38,20 @@ class QuelyosCartAPI(BaseController):
                     'error': 'Product ID is required'
                 }
 
-            # Déterminer le partner_id
-            if request.session.uid:
-                partner_id = request.env.user.partner_id.id
-            else:
-                guest_email = params.get('guest_email')
-                if not guest_email:
-                    return {
-                        'success': False,
-                        'error': 'Authentication required or guest_email needed'
-                    }
-
-                partner = request.env['res.partner'].sudo().search([
-                    ('email', '=', guest_email)
-                ], limit=1)
-
-                if not partner:
-                    partner = request.env['res.partner'].sudo().create({
-                        'name': 'Guest',
-                        'email': guest_email,
-                        'customer_rank': 1,
-                    })
-
-                partner_id = partner.id
-
-            cart = self._get_or_create_cart(partner_id)
-
-            # Vérifier si le produit existe déjà dans le panier
-            existing_line = request.env['sale.order.line'].sudo().search([
-                ('order_id', '=', cart.id),
-                ('product_id', '=', int(product_id))
-            ], limit=1)
-
-            if existing_line:
-                # Augmenter la quantité
-                existing_line.write({
-                    'product_uom_qty': existing_line.product_uom_qty + quantity
-                })
-            else:
-                # Créer une nouvelle ligne
-                product = request.env['product.product'].sudo().browse(int(product_id))
-                if not product.exists():
-                    return {
-                        'success': False,
-                        'error': 'Product not found'
-                    }
+            owner, error = self._get_cart_owner(params)
+            if error:
+                return error
 
-                request.env['sale.order.line'].sudo().create({
-                    'order_id': cart.id,
-                    'product_id': int(product_id),
-                    'product_uom_qty': quantity,
-                })
+            cart = request.env['quelyos.cart'].sudo().add_product(owner, int(product_id), quantity)
+            if cart is None:
+                return {
+                    'success': False,
+                    'error': 'Product not found'
+                }
 
             return {
                 'success': True,
-                'cart': {
-                    'id': cart.id,
-                    'amount_total': cart.amount_total,
-                    'lines_count': len(cart.order_line),
-                }
+                'cart': self._cart_summary(cart),
             }
 
         except Exception as e:
@@ -130,52 +75,21 @@ class QuelyosCartAPI(BaseController):
                     'error': 'Line ID is required'
                 }
 
-            line = request.env['sale.order.line'].sudo().browse(int(line_id))
+            # Le panier est celui du propriétaire : une ligne d'un autre panier est introuvable
+            owner, error = self._get_cart_owner(params)
+            if error:
+                return error
 
-            if not line.exists():
+            cart = request.env['quelyos.cart'].sudo().set_quantity(owner, int(line_id), quantity)
+            if cart is None:
                 return {
                     'success': False,
                     'error': 'Cart line not found'
                 }
 
-            # Vérifier que c'est bien le panier de l'utilisateur
-            if request.session.uid:
-                partner_id = request.env.user.partner_id.id
-            else:
-                guest_email = params.get('guest_email')
-                if not guest_email:
-                    return {
-                        'success': False,
-                        'error': 'Authentication required or guest_email needed'
-                    }
-                partner = request.env['res.partner'].sudo().search([
-                    ('email', '=', guest_email)
-                ], limit=1)
-                if not partner:
-                    return {
-                        'success': False,
-                        'error': 'Partner not found'
-                    }
-                partner_id = partner.id
-
-            if line.order_id.partner_id.id != partner_id:
-                return {
-                    'success': False,
-                    'error': 'Unauthorized'
-                }
-
-            if quantity <= 0:
-                line.unlink()
-            else:
-                line.write({'product_uom_qty': quantity})
-
             return {
                 'success': True,
-                'cart': {
-                    'id': line.order_id.id,
-                    'amount_total': line.order_id.amount_total,
-                    'lines_count': len(line.order_id.order_line),
-                }
+                'cart': self._cart_summary(cart),
             }
 
         except Exception as e:
@@ -189,53 +103,20 @@ class QuelyosCartAPI(BaseController):
     def remove_from_cart(self, line_id, **kwargs):
         """Supprimer une ligne du panier"""
         try:
-            line = request.env['sale.order.line'].sudo().browse(line_id)
+            owner, error = self._get_cart_owner(self._get_params())
+            if error:
+                return error
 
-            if not line.exists():
+            cart = request.env['quelyos.cart'].sudo().set_quantity(owner, line_id, 0)
+            if cart is None:
                 return {
                     'success': False,
                     'error': 'Cart line not found'
                 }
 
-            # Vérifier que c'est bien le panier de l'utilisateur
-            params = self._get_params()
-            if request.session.uid:
-                partner_id = request.env.user.partner_id.id
-            else:
-                guest_email = params.get('guest_email')
-                if not guest_email:
-                    return {
-                        'success': False,
-                        'error': 'Authentication required or guest_email needed'
-                    }
-                partner = request.env['res.partner'].sudo().search([
-                    ('email', '=', guest_email)
-                ], limit=1)
-                if not partner:
-                    return {
-                        'success': False,
-                        'error': 'Partner not found'
-                    }
-                partner_id = partner.id
-
-            if line.order_id.partner_id.id != partner_id:
-                return {
-                    'success': False,
-                    'error': 'Unauthorized'
-                }
-
-            cart_id = line.order_id.id
-            line.unlink()
-
-            cart = request.env['sale.order'].sudo().browse(cart_id)
-
             return {
                 'success': True,
-                'cart': {
-                    'id': cart.id,
-                    'amount_total': cart.amount_total,
-                    'lines_count': len(cart.order_line),
-                }
+                'cart': self._cart_summary(cart),
             }
 
         except Exception as e:
@@ -249,40 +130,15 @@ class QuelyosCartAPI(BaseController):
     def clear_cart(self, **kwargs):
         """Vider le panier"""
         try:
-            params = self._get_params()
-
-            # Déterminer le partner_id
-            if request.session.uid:
-                partner_id = request.env.user.partner_id.id
-            else:
-                guest_email = params.get('guest_email')
-                if not guest_email:
-                    return {
-                        'success': False,
-                        'error': 'Authentication required or guest_email needed'
-                    }
-                partner = request.env['res.partner'].sudo().search([
-                    ('email', '=', guest_email)
-                ], limit=1)
-                if not partner:
-                    return {
-                        'success': False,
-                        'error': 'Partner not found'
-                    }
-                partner_id = partner.id
-
-            cart = self._get_or_create_cart(partner_id)
+            owner, error = self._get_cart_owner(self._get_params())
+            if error:
+                return error
 
-            # Supprimer toutes les lignes
-            cart.order_line.unlink()
+            cart = request.env['quelyos.cart'].sudo().clear(owner)
 
             return {
                 'success': True,
-                'cart': {
-                    'id': cart.id,
-                    'amount_total': 0,
-                    'lines_count': 0,
-                }
+                'cart': self._cart_summary(cart),
             }
 
         except Exception as e:
@@ -296,7 +152,8 @@ class QuelyosCartAPI(BaseController):
     def save_cart_for_guest(self, **kwargs):
         """
         Sauvegarder le panier pour un invité (non connecté)
-        Génère un token de récupération et envoie un email immédiatement
+        Enregistre le panier en commande brouillon, génère un token de
+        récupération et envoie un email immédiatement
 
         Args:
             email (str): Email de l'invité pour sauvegarder le panier
@@ -330,25 +187,15 @@ class QuelyosCartAPI(BaseController):
 
             _logger.info(f"Demande sauvegarde panier pour: {guest_email}")
 
-            # Rechercher ou créer le partner
-            partner = request.env['res.partner'].sudo().search([
-                ('email', '=', guest_email)
-            ], limit=1)
-
-            if not partner:
-                # Créer un nouveau partner invité
-                partner = request.env['res.partner'].sudo().create({
-                    'name': guest_email.split('@')[0].title(),
-                    'email': guest_email,
-                    'customer_rank': 1,
-                })
-                _logger.info(f"Nouveau partner créé: {partner.id} ({guest_email})")
+            owner, error = self._get_cart_owner(params, email_key='email')
+            if error:
+                return error
 
-            # Récupérer ou créer le panier
-            cart = self._get_or_create_cart(partner.id)
+            # Panier du store -> commande brouillon (partner invité retrouvé ou créé par email)
+            cart = request.env['quelyos.cart'].sudo().materialize(owner)
 
             # Vérifier que le panier contient des produits
-            if not cart.order_line:
+            if not cart or not cart.order_line:
                 return {
                     'success': False,
                     'error': 'Votre panier est vide. Ajoutez des produits avant de le sauvegarder.'
@@ -915,28 +762,18 @@ class QuelyosCartAPI(BaseController):
                     'error': 'Coupon code is required'
                 }
 
-            # Déterminer le partner_id
-            if request.session.uid:
-                partner_id = request.env.user.partner_id.id
-            else:
-                guest_email = params.get('guest_email')
-                if not guest_email:
-                    return {
-                        'success': False,
-                        'error': 'Authentication required or guest_email needed'
-                    }
-                partner = request.env['res.partner'].sudo().search([
-                    ('email', '=', guest_email)
-                ], limit=1)
-                if not partner:
-                    return {
-                        'success': False,
-                        'error': 'Partner not found'
-                    }
-                partner_id = partner.id
+            owner, error = self._get_cart_owner(params)
+            if error:
+                return error
 
-            # Récupérer le panier
-            cart = self._get_or_create_cart(partner_id)
+            # Le coupon s'applique à la commande : panier matérialisé en commande brouillon
+            Cart = request.env['quelyos.cart'].sudo()
+            cart = Cart.materialize(owner)
+            if not cart:
+                return {
+                    'success': False,
+                    'error': 'Cart is empty'
+                }
 
             # Chercher le coupon par code
             coupon_card = request.env['loyalty.card'].sudo().search([
@@ -977,6 +814,7 @@ class QuelyosCartAPI(BaseController):
             cart.write({
                 'pricelist_id': program.pricelist_id.id if program.pricelist_id else cart.pricelist_id.id,
             })
+            Cart.set_pricelist(owner, cart.pricelist_id.id)
 
             # Calculer la réduction
             discount_amount = 0
@@ -1011,28 +849,18 @@ class QuelyosCartAPI(BaseController):
         try:
             params = self._get_params()
 
-            # Déterminer le partner_id
-            if request.session.uid:
-                partner_id = request.env.user.partner_id.id
-            else:
-                guest_email = params.get('guest_email')
-                if not guest_email:
-                    return {
-                        'success': False,
-                        'error': 'Authentication required or guest_email needed'
-                    }
-                partner = request.env['res.partner'].sudo().search([
-                    ('email', '=', guest_email)
-                ], limit=1)
-                if not partner:
-                    return {
-                        'success': False,
-                        'error': 'Partner not found'
-                    }
-                partner_id = partner.id
+            owner, error = self._get_cart_owner(params)
+            if error:
+                return error
 
-            # Récupérer le panier
-            cart = self._get_or_create_cart(partner_id)
+            # Le coupon s'applique à la commande : panier matérialisé en commande brouillon
+            Cart = request.env['quelyos.cart'].sudo()
+            cart = Cart.materialize(owner)
+            if not cart:
+                return {
+                    'success': False,
+                    'error': 'Cart is empty'
+                }
 
             # Réinitialiser la pricelist par défaut
             default_pricelist = request.env['product.pricelist'].sudo().search([
@@ -1041,6 +869,7 @@ class QuelyosCartAPI(BaseController):
 
             if default_pricelist:
                 cart.write({'pricelist_id': default_pricelist.id})
+                Cart.set_pricelist(owner, default_pricelist.id)
 
             return {
                 'success': True,
@@ -1231,6 +1060,13 @@ class QuelyosCartAPI(BaseController):
                         'error': 'Le lien de récupération a expiré. Veuillez créer un nouveau panier.'
                     }
 
+            # Le panier récupéré redevient le panier courant de son propriétaire
+            owner = order.x_cart_owner
+            if not owner and order.partner_id.email:
+                owner = f"guest:{order.partner_id.email.strip().lower()}"
+            if owner:
+                request.env['quelyos.cart'].sudo().load_order(owner, order)
+
             # Formater les lignes de commande
             lines = []
             for line in order.order_line:
@@ -1284,64 +1120,44 @@ class QuelyosCartAPI(BaseController):
         except Exception as e:
             _logger.error(f"Cart recovery error: {e}")
             return {'success': False, 'error': 'Une erreur est survenue'}
-
     @http.route('/api/ecommerce/cart', type='jsonrpc', auth='public', methods=['POST'], csrf=False, cors='*')
     def get_cart(self, **kwargs):
-        """Récupérer le panier du client"""
+        """
+        Récupérer le panier du client (store éphémère, prix et taxes déjà calculés)
+
+        Params:
+        - for_checkout: bool (page de paiement : panier matérialisé, `id` = commande à payer)
+        """
         try:
-            # Pour les utilisateurs connectés
-            if request.session.uid:
-                partner_id = request.env.user.partner_id.id
-            else:
-                # Pour les invités, créer un partenaire temporaire si nécessaire
-                params = self._get_params()
-                guest_email = params.get('guest_email')
-
-                if guest_email:
-                    # Chercher ou créer un partenaire invité
-                    partner = request.env['res.partner'].sudo().search([
-                        ('email', '=', guest_email),
-                        ('customer_rank', '>', 0)
-                    ], limit=1)
-
-                    if not partner:
-                        partner = request.env['res.partner'].sudo().create({
-                            'name': 'Guest',
-                            'email': guest_email,
-                            'customer_rank': 1,
-                        })
-
-                    partner_id = partner.id
-                else:
-                    return {
-                        'success': False,
-                        'error': 'Authentication required or guest_email needed'
-                    }
+            params = self._get_params()
+            owner, error = self._get_cart_owner(params)
+            if error:
+                return error
 
-            cart = self._get_or_create_cart(partner_id)
+            cart = request.env['quelyos.cart'].sudo().get_cart(owner, for_checkout=bool(params.get('for_checkout')))
 
             lines = [{
-                'id': line.id,
+                'id': line['id'],
                 'product': {
-                    'id': line.product_id.id,
-                    'name': line.product_id.name,
-                    'image': f'/web/image/product.product/{line.product_id.id}/image_128',
+                    'id': line['product_id'],
+                    'name': line.get('name', ''),
+                    'image': f"/web/image/product.product/{line['product_id']}/image_128",
                 },
-                'quantity': line.product_uom_qty,
-                'price_unit': line.price_unit,
-                'price_subtotal': line.price_subtotal,
-                'price_total': line.price_total,
-            } for line in cart.order_line]
+                'quantity': line['quantity'],
+                'price_unit': line.get('price_unit', 0.0),
+                'price_subtotal': line.get('price_subtotal', 0.0),
+                'price_total': line.get('price_total', 0.0),
+            } for line in cart['lines']]
 
             return {
                 'success': True,
                 'cart': {
-                    'id': cart.id,
+                    'id': cart['order_id'],
                     'lines': lines,
-                    'amount_untaxed': cart.amount_untaxed,
-                    'amount_tax': cart.amount_tax,
-                    'amount_total': cart.amount_total,
-                    'lines_count': len(cart.order_line),
+                    'amount_untaxed': cart['amount_untaxed'],
+                    'amount_tax': cart['amount_tax'],
+                    'amount_total': cart['amount_total'],
+                    'lines_count': len(lines),
                 }
             }
 
@@ -19,6 +19,27 @@ class QuelyosCheckout(BaseController):
         """Extrait les paramètres de la requête JSON-RPC"""
         return request.params if hasattr(request, 'params') and request.params else {}
 
+    def _get_payment_order(self, params):
+        """
+        Commande à payer : `order_id`, sinon le panier du client (store
+        éphémère, voir models/cart.py) matérialisé en commande brouillon.
+        Une commande brouillon issue d'un panier est resynchronisée avec le
+        store avant le calcul du montant.
+
+        Returns:
+            sale.order: commande, vide si introuvable
+        """
+        Cart = request.env['quelyos.cart'].sudo()
+        order_id = params.get('order_id')
+        if not order_id:
+            cart_owner, _error = self._get_cart_owner(params)
+            return Cart.materialize(cart_owner) if cart_owner else request.env['sale.order'].sudo()
+
+        order = request.env['sale.order'].sudo().browse(int(order_id)).exists()
+        if order.state == 'draft' and order.x_cart_owner:
+            Cart.materialize(order.x_cart_owner)
+        return order
+
     # ==================== STATES / GOVERNORATES ====================
 
     @http.route('/api/ecommerce/states', type='jsonrpc', auth='public', methods=['POST'], csrf=False, cors='*')
@@ -279,6 +300,11 @@ class QuelyosCheckout(BaseController):
 
             _logger.info(f"Validating cart for guest_email: {guest_email}, tenant_id: {tenant_id}")
 
+            # Panier du store éphémère -> commande brouillon lue ci-dessous (voir models/cart.py)
+            cart_owner, _error = self._get_cart_owner(params)
+            if cart_owner:
+                request.env['quelyos.cart'].sudo().materialize(cart_owner)
+
             # SUDO justifié : Endpoint public permettant validation panier invité.
             # sudo() nécessaire pour accéder aux paniers sans session utilisateur (guests).
             # Sécurité : Filtrage strict sur guest_email ou session.uid (ligne 69-86)
@@ -419,6 +445,11 @@ class QuelyosCheckout(BaseController):
             IrConfig = request.env['ir.config_parameter'].sudo()
             free_threshold = float(IrConfig.get_param('shipping.free_threshold', '150.0'))
 
+            # Panier du store éphémère -> commande brouillon lue ci-dessous (voir models/cart.py)
+            cart_owner, _error = self._get_cart_owner(params)
+            if cart_owner:
+                request.env['quelyos.cart'].sudo().materialize(cart_owner)
+
             # Récupérer le panier pour vérifier le montant
             Order = request.env['sale.order'].sudo()
             domain = [('state', '=', 'draft')]
@@ -563,6 +594,11 @@ class QuelyosCheckout(BaseController):
                     'error': 'Paramètres manquants (shipping_address_id, delivery_method_id, payment_method_id requis)'
                 }
 
+            # Panier du store éphémère -> commande brouillon lue ci-dessous (voir models/cart.py)
+            cart_owner, _error = self._get_cart_owner(params)
+            if cart_owner:
+                request.env['quelyos.cart'].sudo().materialize(cart_owner)
+
             # Récupérer le panier
             Order = request.env['sale.order'].sudo()
             domain = [('state', '=', 'draft')]
@@ -768,7 +804,8 @@ class QuelyosCheckout(BaseController):
         Créer un ordre PayPal
 
         Args:
-            order_id (int): ID de la commande Odoo
+            order_id (int, optional): ID de la commande Odoo (défaut : panier du client)
+            guest_email (str, optional): email de l'invité, sans order_id ni session
 
         Returns:
             dict: {
@@ -783,18 +820,9 @@ class QuelyosCheckout(BaseController):
             return rate_error
         try:
             params = self._get_params()
-            order_id = params.get('order_id')
+            order = self._get_payment_order(params)
 
-            if not order_id:
-                return {
-                    'success': False,
-                    'error': 'order_id requis'
-                }
-
-            Order = request.env['sale.order'].sudo()
-            order = Order.browse(order_id)
-
-            if not order.exists():
+            if not order:
                 return {
                     'success': False,
                     'error': 'Commande non trouvée'
@@ -810,6 +838,10 @@ class QuelyosCheckout(BaseController):
                 'success': True,
                 'paypal_order_id': mock_paypal_order_id,
                 'approval_url': f'https://www.sandbox.paypal.com/checkoutnow?token={mock_paypal_order_id}',
+                'order': {
+                    'id': order.id,
+                    'name': order.name,
+                },
                 'message': 'PayPal order created (MOCK - not implemented yet)'
             }
 
@@ -925,7 +957,8 @@ class QuelyosCheckout(BaseController):
         Créer un Payment Intent Stripe pour un paiement par carte bancaire
 
         Args:
-            order_id (int): ID de la commande Odoo
+            order_id (int, optional): ID de la commande Odoo (défaut : panier du client)
+            guest_email (str, optional): email de l'invité, sans order_id ni session
             return_url (str, optional): URL de retour après paiement 3D Secure
 
         Returns:
@@ -939,20 +972,12 @@ class QuelyosCheckout(BaseController):
         """
         try:
             params = self._get_params()
-            order_id = params.get('order_id')
             return_url = params.get('return_url', '')
 
-            if not order_id:
-                return {
-                    'success': False,
-                    'error': 'order_id requis'
-                }
-
-            # Récupérer la commande
-            Order = request.env['sale.order'].sudo()
-            order = Order.browse(order_id)
+            # Récupérer la commande (panier matérialisé si order_id absent)
+            order = self._get_payment_order(params)
 
-            if not order.exists():
+            if not order:
                 return {
                     'success': False,
                     'error': 'Commande non trouvée'
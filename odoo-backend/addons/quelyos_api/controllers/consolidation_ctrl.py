@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 """Contrôleur Consolidation Multi-Sociétés"""
 
+import calendar
 import logging
-from odoo import http
+from datetime import date
+from odoo import http, fields
 from odoo.http import request
 from .base import BaseController
 
@@ -10,54 +12,26 @@ _logger = logging.getLogger(__name__)
 
 
 class ConsolidationController(BaseController):
-    """API Consolidation Financière Multi-Entités"""
+    """API Consolidation Financière Multi-Entités (voir models/finance/consolidation.py)"""
+
+    def _get_entity_ids(self, params):
+        entity_ids = params.get('entity_ids')
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_id for entity_id in entity_ids.split(',') if entity_id]
+        return [int(entity_id) for entity_id in entity_ids or []]
 
     @http.route('/api/finance/consolidation/entities', type='json', auth='public', methods=['GET', 'OPTIONS'], cors='*', csrf=False)
     def get_entities(self, **params):
         """
-        Liste sociétés du groupe consolidé
-        
-        Query params:
-        - include_inactive: bool
+        Liste sociétés du groupe consolidé (société du tenant et filiales)
         """
         try:
-            user = self._authenticate_from_header()
-            if not user:
-                return self._error_response("Session expirée", "UNAUTHORIZED", 401)
-
-            tenant_id = self._get_tenant_id(user)
-            
-            # TODO: Récupérer depuis res.company avec hiérarchie groupe
-            entities = [
-                {
-                    'id': 1,
-                    'name': 'Quelyos France SAS',
-                    'code': 'FR001',
-                    'currency': 'EUR',
-                    'consolidationPercent': 100.0,
-                    'parent': None,
-                    'type': 'parent',
-                },
-                {
-                    'id': 2,
-                    'name': 'Quelyos Belgium SPRL',
-                    'code': 'BE001',
-                    'currency': 'EUR',
-                    'consolidationPercent': 80.0,
-                    'parent': 1,
-                    'type': 'subsidiary',
-                },
-                {
-                    'id': 3,
-                    'name': 'Quelyos Switzerland SA',
-                    'code': 'CH001',
-                    'currency': 'CHF',
-                    'consolidationPercent': 60.0,
-                    'parent': 1,
-                    'type': 'subsidiary',
-                },
-            ]
-            
+            tenant, error = self._get_finance_tenant()
+            if error:
+                return error
+
+            entities = request.env['quelyos.finance.consolidation'].sudo().get_entities(tenant)
+
             return self._success_response({'entities': entities})
 
         except Exception as e:
@@ -68,67 +42,27 @@ class ConsolidationController(BaseController):
     def get_consolidated_balance_sheet(self, **params):
         """
         Bilan consolidé groupe
-        
+
+        Soldes convertis au taux de la date du bilan, pondérés par le
+        pourcentage de consolidation, après éliminations inter-sociétés.
+
         Query params:
-        - date_at: YYYY-MM-DD (date du bilan)
+        - date_at: YYYY-MM-DD (date du bilan, défaut : aujourd'hui)
         - entity_ids: list[int] (filtrer entités, default: toutes)
         """
         try:
-            user = self._authenticate_from_header()
-            if not user:
-                return self._error_response("Session expirée", "UNAUTHORIZED", 401)
-
-            tenant_id = self._get_tenant_id(user)
-            
-            # TODO: Agréger bilans de toutes entités
-            # - Conversion devises au taux du jour
-            # - Éliminations inter-sociétés
-            # - Application pourcentages consolidation
-            
-            balance_sheet = {
-                'assets': {
-                    'fixed': {
-                        'label': 'Actif Immobilisé',
-                        'quelyosFrance': 500000.0,
-                        'quelyosBelgium': 200000.0,
-                        'quelyosSwitzerland': 150000.0,
-                        'eliminations': -50000.0,
-                        'consolidated': 800000.0,
-                    },
-                    'current': {
-                        'label': 'Actif Circulant',
-                        'quelyosFrance': 300000.0,
-                        'quelyosBelgium': 120000.0,
-                        'quelyosSwitzerland': 80000.0,
-                        'eliminations': -30000.0,
-                        'consolidated': 470000.0,
-                    },
-                    'total': {
-                        'label': 'Total Actif',
-                        'consolidated': 1270000.0,
-                    },
-                },
-                'liabilities': {
-                    'equity': {
-                        'label': 'Capitaux Propres',
-                        'consolidated': 800000.0,
-                    },
-                    'longTerm': {
-                        'label': 'Dettes Long Terme',
-                        'consolidated': 300000.0,
-                    },
-                    'current': {
-                        'label': 'Dettes Court Terme',
-                        'consolidated': 170000.0,
-                    },
-                    'total': {
-                        'label': 'Total Passif',
-                        'consolidated': 1270000.0,
-                    },
-                },
-            }
-            
-            return self._success_response(balance_sheet)
+            tenant, error = self._get_finance_tenant()
+            if error:
+                return error
+
+            date_at = fields.Date.to_date(params.get('date_at')) or date.today()
+            result = request.env['quelyos.finance.consolidation'].sudo().get_balance_sheet(
+                tenant, date_at, self._get_entity_ids(params),
+            )
+
+            return self._success_response(dict(
+                result['report'], entities=result['entities'], currency=result['currency'], missingRates=result['missingRates'],
+            ))
 
         except Exception as e:
             _logger.error(f"Erreur get_consolidated_balance_sheet: {e}", exc_info=True)
@@ -138,46 +72,29 @@ class ConsolidationController(BaseController):
     def get_consolidated_profit_loss(self, **params):
         """
         Compte de résultat consolidé
-        
+
         Query params:
-        - date_from: YYYY-MM-DD
-        - date_to: YYYY-MM-DD
+        - date_from: YYYY-MM-DD (défaut : début d'exercice civil)
+        - date_to: YYYY-MM-DD (défaut : aujourd'hui)
+        - entity_ids: list[int] (filtrer entités, default: toutes)
         """
         try:
-            user = self._authenticate_from_header()
-            if not user:
-                return self._error_response("Session expirée", "UNAUTHORIZED", 401)
-
-            tenant_id = self._get_tenant_id(user)
-            
-            profit_loss = {
-                'revenue': {
-                    'label': 'Chiffre d\'Affaires',
-                    'consolidated': 1500000.0,
-                },
-                'costOfSales': {
-                    'label': 'Coût des Ventes',
-                    'consolidated': -600000.0,
-                },
-                'grossProfit': {
-                    'label': 'Marge Brute',
-                    'consolidated': 900000.0,
-                },
-                'operatingExpenses': {
-                    'label': 'Charges Opérationnelles',
-                    'consolidated': -500000.0,
-                },
-                'ebitda': {
-                    'label': 'EBITDA',
-                    'consolidated': 400000.0,
-                },
-                'netProfit': {
-                    'label': 'Résultat Net',
-                    'consolidated': 280000.0,
-                },
-            }
-            
-            return self._success_response(profit_loss)
+            tenant, error = self._get_finance_tenant()
+            if error:
+                return error
+
+            date_to = fields.Date.to_date(params.get('date_to')) or date.today()
+            date_from = fields.Date.to_date(params.get('date_from')) or date_to.replace(month=1, day=1)
+            if date_from > date_to:
+                return self._error_response("date_from doit précéder date_to", "VALIDATION_ERROR", 400)
+
+            result = request.env['quelyos.finance.consolidation'].sudo().get_profit_loss(
+                tenant, date_from, date_to, self._get_entity_ids(params),
+            )
+
+            return self._success_response(dict(
+                result['report'], entities=result['entities'], currency=result['currency'], missingRates=result['missingRates'],
+            ))
 
         except Exception as e:
             _logger.error(f"Erreur get_consolidated_profit_loss: {e}", exc_info=True)
@@ -187,37 +104,29 @@ class ConsolidationController(BaseController):
     def get_eliminations(self, **params):
         """
         Écritures d'élimination inter-sociétés
-        
+
+        Créances/dettes et prêts à la fin de la période, ventes/achats sur la période.
+
         Query params:
-        - period: YYYY-MM
+        - period: YYYY-MM (défaut : mois courant)
         """
         try:
-            user = self._authenticate_from_header()
-            if not user:
-                return self._error_response("Session expirée", "UNAUTHORIZED", 401)
-
-            tenant_id = self._get_tenant_id(user)
-            
-            # Types éliminations : ventes inter-sociétés, prêts, dividendes, participations
-            eliminations = [
-                {
-                    'id': 1,
-                    'type': 'inter_company_sales',
-                    'label': 'Ventes inter-sociétés',
-                    'debit': 50000.0,
-                    'credit': 50000.0,
-                    'entities': ['Quelyos France', 'Quelyos Belgium'],
-                },
-                {
-                    'id': 2,
-                    'type': 'inter_company_loans',
-                    'label': 'Prêts inter-sociétés',
-                    'debit': 30000.0,
-                    'credit': 30000.0,
-                    'entities': ['Quelyos France', 'Quelyos Switzerland'],
-                },
-            ]
-            
+            tenant, error = self._get_finance_tenant()
+            if error:
+                return error
+
+            period = params.get('period') or date.today().strftime('%Y-%m')
+            try:
+                year, month = (int(part) for part in period.split('-'))
+                date_from = date(year, month, 1)
+            except (ValueError, TypeError):
+                return self._error_response("Période invalide (format YYYY-MM)", "VALIDATION_ERROR", 400)
+            date_to = date_from.replace(day=calendar.monthrange(year, month)[1])
+
+            eliminations = request.env['quelyos.finance.consolidation'].sudo().get_eliminations(
+                tenant, date_from, date_to, self._get_entity_ids(params),
+            )
+
             return self._success_response({'eliminations': eliminations})
 
         except Exception as e:
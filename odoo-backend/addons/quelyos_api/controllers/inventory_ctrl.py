@@ -1759,15 +1759,21 @@ class QuelyosInventoryAPI(BaseController):
         - Catégorie A: 20% produits = 80% valeur stock
         - Catégorie B: 30% produits = 15% valeur stock
         - Catégorie C: 50% produits = 5% valeur stock
+        - Classe XYZ: régularité de la demande (coefficient de variation des ventes quotidiennes)
+
+        Analyse du catalogue du tenant calculée en une passe et mise en cache
+        (voir models/inventory_analytics.py).
 
         Paramètres optionnels:
         - warehouse_id (int): Filtrer par entrepôt
         - category_id (int): Filtrer par catégorie produit
         - threshold_a (float): Seuil % catégorie A (défaut: 80)
         - threshold_b (float): Seuil % catégorie B (défaut: 95)
+        - period_days (int): Période de demande pour XYZ (défaut: 90)
+        - refresh (bool): Ignorer le cache
 
         Returns:
-            - products: Liste produits avec classification A/B/C
+            - products: Liste produits avec classification A/B/C et X/Y/Z
             - kpis: Statistiques par catégorie
             - cumulative: Données pour courbe de Pareto
         """
@@ -1779,123 +1785,31 @@ class QuelyosInventoryAPI(BaseController):
             #     return error
             pass
 
-            Product = request.env['product.product'].sudo()
             params = self._get_params()
 
             warehouse_id = params.get('warehouse_id')
             category_id = params.get('category_id')
             threshold_a = float(params.get('threshold_a', 80))
             threshold_b = float(params.get('threshold_b', 95))
+            period_days = min(max(int(params.get('period_days', 90)), 7), 730)
 
-            # Domain de base : produits stockables uniquement
-            domain = [
-                ('type', '=', 'product'),
-                ('active', '=', True),
-            ]
-
-            if category_id:
-                domain.append(('categ_id', '=', int(category_id)))
-
-            # Rechercher tous les produits
-            products = Product.search(domain)
-
-            # Calculer valeur stock pour chaque produit
-            products_data = []
-            total_value = 0
-
-            for product in products:
-                # Quantité en stock (filtré par warehouse si spécifié)
-                if warehouse_id:
-                    qty = product.with_context(warehouse=int(warehouse_id)).qty_available
-                else:
-                    qty = product.qty_available
-
-                # Valeur = quantité × prix coût
-                value = qty * product.standard_price
-                total_value += value
-
-                if value > 0:  # On garde uniquement les produits avec valeur > 0
-                    products_data.append({
-                        'id': product.id,
-                        'name': product.display_name,
-                        'sku': product.default_code or '',
-                        'qty': qty,
-                        'standard_price': product.standard_price,
-                        'value': value,
-                    })
-
-            # Trier par valeur décroissante
-            products_data.sort(key=lambda x: x['value'], reverse=True)
-
-            # Calculer % cumulé et classifier
-            cumulative_value = 0
-            cumulative_data = []
+            # Catalogue du tenant (header X-Tenant-Domain), sinon catalogue complet
+            tenant = self._get_tenant()
+            warehouse = request.env['stock.warehouse'].sudo().browse(int(warehouse_id)) if warehouse_id else None
 
-            for i, product in enumerate(products_data):
-                cumulative_value += product['value']
-                cumulative_pct = (cumulative_value / total_value * 100) if total_value > 0 else 0
-
-                # Classification ABC selon seuils
-                if cumulative_pct <= threshold_a:
-                    category = 'A'
-                elif cumulative_pct <= threshold_b:
-                    category = 'B'
-                else:
-                    category = 'C'
-
-                product['category'] = category
-                product['cumulative_value'] = cumulative_value
-                product['cumulative_pct'] = round(cumulative_pct, 2)
-                product['value_pct'] = round((product['value'] / total_value * 100), 2) if total_value > 0 else 0
-
-                # Données pour graphique courbe de Pareto
-                cumulative_data.append({
-                    'product_index': i + 1,
-                    'cumulative_pct': round(cumulative_pct, 2),
-                    'category': category
-                })
-
-            # Calculer KPIs par catégorie
-            category_a = [p for p in products_data if p['category'] == 'A']
-            category_b = [p for p in products_data if p['category'] == 'B']
-            category_c = [p for p in products_data if p['category'] == 'C']
-
-            kpis = {
-                'total_value': round(total_value, 2),
-                'total_products': len(products_data),
-                'category_a': {
-                    'count': len(category_a),
-                    'count_pct': round((len(category_a) / len(products_data) * 100), 1) if products_data else 0,
-                    'value': round(sum(p['value'] for p in category_a), 2),
-                    'value_pct': round((sum(p['value'] for p in category_a) / total_value * 100), 1) if total_value > 0 else 0,
-                },
-                'category_b': {
-                    'count': len(category_b),
-                    'count_pct': round((len(category_b) / len(products_data) * 100), 1) if products_data else 0,
-                    'value': round(sum(p['value'] for p in category_b), 2),
-                    'value_pct': round((sum(p['value'] for p in category_b) / total_value * 100), 1) if total_value > 0 else 0,
-                },
-                'category_c': {
-                    'count': len(category_c),
-                    'count_pct': round((len(category_c) / len(products_data) * 100), 1) if products_data else 0,
-                    'value': round(sum(p['value'] for p in category_c), 2),
-                    'value_pct': round((sum(p['value'] for p in category_c) / total_value * 100), 1) if total_value > 0 else 0,
-                },
-            }
+            result = request.env['quelyos.inventory.analytics'].sudo().get_abc_analysis(
+                tenant, warehouse, category_id, threshold_a, threshold_b, period_days,
+                use_cache=not params.get('refresh'),
+            )
 
-            _logger.info(f"ABC Analysis completed: {len(products_data)} products analyzed")
+            _logger.info(f"ABC Analysis completed: {result['kpis']['total_products']} products analyzed")
 
             return {
                 'success': True,
-                'data': {
-                    'products': products_data,
-                    'kpis': kpis,
-                    'cumulative': cumulative_data,
-                    'thresholds': {
-                        'a': threshold_a,
-                        'b': threshold_b,
-                    }
-                }
+                'data': dict(result, thresholds={
+                    'a': threshold_a,
+                    'b': threshold_b,
+                }),
             }
 
         except Exception as e:
@@ -1912,15 +1826,20 @@ class QuelyosInventoryAPI(BaseController):
         Calcul des prévisions de besoins stock basées sur historique ventes (admin uniquement).
 
         Méthodes:
-        - Moyenne mobile (7j, 30j, 90j, 365j)
+        - Moyenne mobile (7j, 30j, 90j)
         - Tendance linéaire
         - Prévisions sur N jours
 
-        Paramètres optionnels:
-        - product_id (int): ID du produit (requis pour prévisions produit)
+        Les ventes de tous les produits demandés sont lues en une requête
+        groupée et les prévisions calculées ensemble (voir models/inventory_analytics.py).
+
+        Paramètres:
+        - product_id (int): ID du produit, ou
+        - product_ids (list[int]): plusieurs produits (réponse par produit, sans historique)
         - forecast_days (int): Nombre de jours à prévoir (défaut: 30)
         - method (str): 'moving_average' ou 'linear_trend' (défaut: 'moving_average')
         - period_days (int): Période historique en jours (défaut: 90)
+        - warehouse_id (int): Filtrer par entrepôt
 
         Returns:
             - historical: Données historiques de vente
@@ -1936,171 +1855,60 @@ class QuelyosInventoryAPI(BaseController):
             #     return error
             pass
 
-            from datetime import datetime, timedelta
-
-            Product = request.env['product.product'].sudo()
-            Move = request.env['stock.move'].sudo()
             params = self._get_params()
 
             product_id = params.get('product_id')
-            if not product_id:
+            product_ids = params.get('product_ids')
+            if not product_id and not product_ids:
                 return {
                     'success': False,
                     'error': 'Le paramètre product_id est requis',
                     'errorCode': 'MISSING_PRODUCT_ID'
                 }
 
-            product_id = int(product_id)
-            forecast_days = int(params.get('forecast_days', 30))
+            forecast_days = min(max(int(params.get('forecast_days', 30)), 1), 365)
             method = params.get('method', 'moving_average')
-            period_days = int(params.get('period_days', 90))
+            period_days = min(max(int(params.get('period_days', 90)), 7), 730)
+            warehouse_id = params.get('warehouse_id')
+            warehouse = request.env['stock.warehouse'].sudo().browse(int(warehouse_id)) if warehouse_id else None
 
-            # Vérifier que le produit existe
-            product = Product.browse(product_id)
-            if not product.exists():
+            Analytics = request.env['quelyos.inventory.analytics'].sudo()
+
+            if product_ids:
+                forecasts = Analytics.get_forecast(
+                    [int(pid) for pid in product_ids], forecast_days, method, period_days, warehouse,
+                    with_history=False,
+                )
+                return {
+                    'success': True,
+                    'data': {
+                        'products': [dict(forecast, product_id=pid) for pid, forecast in forecasts.items()],
+                        'method': method,
+                        'period_days': period_days,
+                        'forecast_days': forecast_days,
+                    }
+                }
+
+            product_id = int(product_id)
+            forecast = Analytics.get_forecast([product_id], forecast_days, method, period_days, warehouse).get(product_id)
+            if not forecast:
                 return {
                     'success': False,
                     'error': 'Produit introuvable',
                     'errorCode': 'PRODUCT_NOT_FOUND'
                 }
 
-            # Récupérer historique des ventes (mouvements done depuis internal vers customer)
-            date_from = datetime.now() - timedelta(days=period_days)
-            moves = Move.search([
-                ('product_id', '=', product_id),
-                ('state', '=', 'done'),
-                ('location_id.usage', '=', 'internal'),
-                ('location_dest_id.usage', '=', 'customer'),
-                ('date', '>=', date_from),
-            ], order='date ASC')
-
-            # Agréger ventes par jour
-            daily_sales = {}
-            for move in moves:
-                date_key = move.date.date().isoformat() if move.date else None
-                if date_key:
-                    daily_sales[date_key] = daily_sales.get(date_key, 0) + move.product_uom_qty
-
-            # Construire série temporelle complète (avec 0 pour jours sans vente)
-            current_date = date_from.date()
-            end_date = datetime.now().date()
-            historical = []
-
-            while current_date <= end_date:
-                date_key = current_date.isoformat()
-                qty_sold = daily_sales.get(date_key, 0)
-                historical.append({
-                    'date': date_key,
-                    'qty_sold': qty_sold
-                })
-                current_date += timedelta(days=1)
-
-            # Calculer moyennes mobiles
-            ma_7 = sum(d['qty_sold'] for d in historical[-7:]) / 7 if len(historical) >= 7 else 0
-            ma_30 = sum(d['qty_sold'] for d in historical[-30:]) / 30 if len(historical) >= 30 else 0
-            ma_90 = sum(d['qty_sold'] for d in historical[-90:]) / 90 if len(historical) >= 90 else 0
-
-            # Calcul de tendance (régression linéaire simple)
-            n = len(historical)
-            if n > 10:  # Besoin d'au moins 10 points
-                sum_x = sum(range(n))
-                sum_y = sum(d['qty_sold'] for d in historical)
-                sum_xy = sum(i * d['qty_sold'] for i, d in enumerate(historical))
-                sum_x2 = sum(i * i for i in range(n))
-
-                # Pente (a) et ordonnée (b) de y = ax + b
-                a = (n * sum_xy - sum_x * sum_y) / (n * sum_x2 - sum_x * sum_x) if (n * sum_x2 - sum_x * sum_x) != 0 else 0
-                b = (sum_y - a * sum_x) / n
-
-                trend = 'increasing' if a > 0.01 else ('decreasing' if a < -0.01 else 'stable')
-                trend_slope = round(a, 4)
-            else:
-                a, b, trend, trend_slope = 0, ma_7, 'stable', 0
-
-            # Générer prévisions
-            forecast = []
-            forecast_date = datetime.now().date() + timedelta(days=1)
-
-            if method == 'moving_average':
-                # Utiliser la moyenne mobile comme prévision constante
-                forecast_qty = ma_7 if ma_7 > 0 else ma_30
-            else:  # linear_trend
-                # Utiliser la tendance linéaire
-                forecast_qty = max(0, b + a * n)  # Commencer à partir du dernier point
-
-            for i in range(forecast_days):
-                if method == 'linear_trend':
-                    # Ajuster selon la pente
-                    daily_forecast = max(0, b + a * (n + i))
-                else:
-                    # Moyenne mobile constante
-                    daily_forecast = forecast_qty
-
-                forecast.append({
-                    'date': forecast_date.isoformat(),
-                    'qty_forecast': round(daily_forecast, 2)
-                })
-                forecast_date += timedelta(days=1)
-
-            # Calcul total prévisionnel
-            total_forecast = sum(f['qty_forecast'] for f in forecast)
-
-            # Stock actuel
-            current_stock = product.qty_available
-
-            # Recommandations
-            recommendations = []
-            if total_forecast > current_stock:
-                shortage = total_forecast - current_stock
-                recommendations.append({
-                    'type': 'warning',
-                    'message': f'Risque de rupture : {round(shortage, 2)} unités manquantes sur {forecast_days} jours',
-                    'qty_to_order': round(shortage * 1.2, 2),  # +20% marge sécurité
-                })
-            elif current_stock > total_forecast * 3:
-                recommendations.append({
-                    'type': 'info',
-                    'message': f'Surstock détecté : {round(current_stock - total_forecast, 2)} unités en excès',
-                })
-            else:
-                recommendations.append({
-                    'type': 'success',
-                    'message': 'Stock adéquat pour la période prévue',
-                })
-
-            # Métriques
-            metrics = {
-                'moving_averages': {
-                    'ma_7': round(ma_7, 2),
-                    'ma_30': round(ma_30, 2),
-                    'ma_90': round(ma_90, 2),
-                },
-                'trend': {
-                    'status': trend,
-                    'slope': trend_slope,
-                },
-                'current_stock': current_stock,
-                'total_forecast': round(total_forecast, 2),
-                'avg_daily_forecast': round(total_forecast / forecast_days, 2),
-                'days_of_stock': round(current_stock / (total_forecast / forecast_days), 1) if total_forecast > 0 else 0,
-            }
-
-            _logger.info(f"Stock forecast generated for product {product.display_name}: {forecast_days} days")
+            _logger.info(f"Stock forecast generated for product {forecast['product_name']}: {forecast_days} days")
 
             return {
                 'success': True,
-                'data': {
-                    'product_id': product_id,
-                    'product_name': product.display_name,
-                    'product_sku': product.default_code or '',
-                    'historical': historical,
-                    'forecast': forecast,
-                    'metrics': metrics,
-                    'recommendations': recommendations,
-                    'method': method,
-                    'period_days': period_days,
-                    'forecast_days': forecast_days,
-                }
+                'data': dict(
+                    forecast,
+                    product_id=product_id,
+                    method=method,
+                    period_days=period_days,
+                    forecast_days=forecast_days,
+                ),
             }
 
         except Exception as e:
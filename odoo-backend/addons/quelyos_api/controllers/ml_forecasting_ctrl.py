@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
-"""Contrôleur ML Cash Flow Forecasting (Facebook Prophet)"""
+"""Contrôleur ML Cash Flow Forecasting (tendance + saisonnalités, NumPy)"""
 
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from odoo import http
 from odoo.http import request
 from .base import BaseController
@@ -11,52 +11,43 @@ _logger = logging.getLogger(__name__)
 
 
 class MLForecastingController(BaseController):
-    """API ML Cash Flow Forecasting avec Prophet"""
+    """API ML Cash Flow Forecasting (voir models/finance/cashflow_forecast.py)"""
+
+    def _get_forecast(self, tenant):
+        return request.env['quelyos.cashflow.forecast'].sudo().search([('tenant_id', '=', tenant.id)], limit=1)
+
+    @staticmethod
+    def _model_id(forecast):
+        return f'cashflow_{forecast.tenant_id.id}_{forecast.trained_at:%Y%m%d%H%M%S}'
 
     @http.route('/api/finance/forecasting/train', type='json', auth='public', methods=['POST', 'OPTIONS'], cors='*', csrf=False)
     def train_model(self, **params):
         """
-        Entraîner modèle Prophet sur historique trésorerie
-        
+        Entraîner le modèle de prévision sur l'historique de trésorerie du tenant
+        (ré-entraînement quotidien de tous les tenants par cron)
+
         Body params:
         - months_history: int (default: 12, minimum: 6)
-        - include_seasonality: bool
         """
         try:
-            user = self._authenticate_from_header()
-            if not user:
-                return self._error_response("Session expirée", "UNAUTHORIZED", 401)
+            tenant, error = self._get_finance_tenant()
+            if error:
+                return error
 
-            tenant_id = self._get_tenant_id(user)
             months_history = params.get('months_history', 12)
-            
-            # TODO: Implémenter entraînement réel avec Prophet
-            # from prophet import Prophet
-            # import pandas as pd
-            # 
-            # # 1. Récupérer historique paiements/factures
-            # payments = request.env['account.payment'].sudo().search([
-            #     ('tenant_id', '=', tenant_id),
-            #     ('date', '>=', date_from)
-            # ])
-            # 
-            # # 2. Agréger par jour
-            # df = pd.DataFrame({'ds': dates, 'y': amounts})
-            # 
-            # # 3. Entraîner Prophet
-            # model = Prophet(yearly_seasonality=True, weekly_seasonality=True)
-            # model.fit(df)
-            # 
-            # # 4. Sauvegarder modèle (pickle ou DB)
-            
-            # Simuler entraînement
+            forecast = request.env['quelyos.cashflow.forecast'].sudo().train(tenant, months_history)
+            if not forecast:
+                return self._error_response(
+                    "Historique de trésorerie insuffisant pour entraîner le modèle", "INSUFFICIENT_DATA", 422
+                )
+
             return self._success_response({
-                'modelId': 'prophet_model_001',
-                'trainedAt': datetime.now().isoformat(),
-                'monthsHistory': months_history,
-                'dataPoints': 365,
-                'mae': 1250.50,  # Mean Absolute Error
-                'rmse': 2100.75,  # Root Mean Squared Error
+                'modelId': self._model_id(forecast),
+                'trainedAt': forecast.trained_at.isoformat(),
+                'monthsHistory': forecast.months_history,
+                'dataPoints': forecast.data_points,
+                'mae': round(forecast.mae, 2),  # Mean Absolute Error
+                'rmse': round(forecast.rmse, 2),  # Root Mean Squared Error
                 'status': 'trained'
             })
 
@@ -68,72 +59,29 @@ class MLForecastingController(BaseController):
     def predict_cashflow(self, **params):
         """
         Prédictions trésorerie 30/60/90 jours
-        
+
         Query params:
-        - model_id: str (optional, use latest if not provided)
         - days_ahead: int (default: 90)
         """
         try:
-            user = self._authenticate_from_header()
-            if not user:
-                return self._error_response("Session expirée", "UNAUTHORIZED", 401)
+            tenant, error = self._get_finance_tenant()
+            if error:
+                return error
 
-            tenant_id = self._get_tenant_id(user)
             days_ahead = params.get('days_ahead', 90)
-            
-            # TODO: Implémenter prédictions réelles avec Prophet
-            # model = load_prophet_model(model_id)
-            # future = model.make_future_dataframe(periods=days_ahead)
-            # forecast = model.predict(future)
-            # predictions = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(days_ahead)
-            
-            # Simuler prédictions
-            today = datetime.now().date()
-            predictions = []
-            
-            base_amount = 50000.0
-            for i in range(1, days_ahead + 1):
-                date = today + timedelta(days=i)
-                # Simuler tendance + saisonnalité
-                trend = base_amount + (i * 100)
-                seasonality = 5000 * (1 if date.weekday() < 5 else -0.5)  # Weekend dip
-                predicted = trend + seasonality
-                
-                predictions.append({
-                    'date': date.isoformat(),
-                    'predicted': round(predicted, 2),
-                    'lowerBound': round(predicted * 0.85, 2),
-                    'upperBound': round(predicted * 1.15, 2),
-                })
-            
-            # Métriques agrégées
-            summary = {
-                'days30': {
-                    'avgCashFlow': 55000.0,
-                    'minCashFlow': 45000.0,
-                    'maxCashFlow': 65000.0,
-                    'trend': 'increasing',
-                },
-                'days60': {
-                    'avgCashFlow': 60000.0,
-                    'minCashFlow': 50000.0,
-                    'maxCashFlow': 70000.0,
-                    'trend': 'stable',
-                },
-                'days90': {
-                    'avgCashFlow': 62000.0,
-                    'minCashFlow': 52000.0,
-                    'maxCashFlow': 72000.0,
-                    'trend': 'increasing',
-                }
-            }
-            
-            return self._success_response({
-                'predictions': predictions,
-                'summary': summary,
-                'modelId': 'prophet_model_001',
-                'predictedAt': datetime.now().isoformat(),
-            })
+
+            # Modèle en cache pour le tenant, entraîné à la demande au premier appel
+            forecast = self._get_forecast(tenant) or request.env['quelyos.cashflow.forecast'].sudo().train(tenant)
+            if not forecast:
+                return self._error_response(
+                    "Historique de trésorerie insuffisant pour la prévision", "INSUFFICIENT_DATA", 422
+                )
+
+            return self._success_response(dict(
+                forecast.predict(days_ahead),
+                modelId=self._model_id(forecast),
+                predictedAt=datetime.now().isoformat(),
+            ))
 
         except Exception as e:
             _logger.error(f"Erreur predict_cashflow: {e}", exc_info=True)
@@ -142,26 +90,27 @@ class MLForecastingController(BaseController):
     @http.route('/api/finance/forecasting/accuracy', type='json', auth='public', methods=['GET', 'OPTIONS'], cors='*', csrf=False)
     def get_model_accuracy(self, **params):
         """
-        Métriques précision du modèle (MAE, RMSE, MAPE)
-        
-        Query params:
-        - model_id: str
+        Métriques précision du modèle (MAE, RMSE, MAPE), validation sur les
+        30 derniers jours d'historique
         """
         try:
-            user = self._authenticate_from_header()
-            if not user:
-                return self._error_response("Session expirée", "UNAUTHORIZED", 401)
+            tenant, error = self._get_finance_tenant()
+            if error:
+                return error
+
+            forecast = self._get_forecast(tenant)
+            if not forecast:
+                return self._error_response("Aucun modèle entraîné", "NOT_FOUND", 404)
 
-            # Métriques de validation croisée
             accuracy = {
-                'mae': 1250.50,  # Mean Absolute Error (€)
-                'rmse': 2100.75,  # Root Mean Squared Error (€)
-                'mape': 4.5,  # Mean Absolute Percentage Error (%)
-                'r2': 0.89,  # Coefficient de détermination
-                'lastValidation': datetime.now().isoformat(),
-                'recommendation': 'good' if 4.5 < 10 else 'retrain',
+                'mae': round(forecast.mae, 2),  # Mean Absolute Error (€)
+                'rmse': round(forecast.rmse, 2),  # Root Mean Squared Error (€)
+                'mape': round(forecast.mape, 1),  # Mean Absolute Percentage Error (%)
+                'r2': round(forecast.r2, 2),  # Coefficient de détermination
+                'lastValidation': forecast.trained_at.isoformat(),
+                'recommendation': 'good' if forecast.mape < 10 else 'retrain',
             }
-            
+
             return self._success_response(accuracy)
 
         except Exception as e:
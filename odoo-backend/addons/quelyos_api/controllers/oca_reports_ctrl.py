@@ -2,6 +2,7 @@
 """Contrôleur Rapports OCA (account-financial-reporting)"""
 
 import logging
+from datetime import date
 from odoo import http
 from odoo.http import request
 from .base import BaseController
@@ -166,35 +167,88 @@ class OCAReportsController(BaseController):
             _logger.error(f"Erreur get_trial_balance: {e}", exc_info=True)
             return self._error_response(str(e), "SERVER_ERROR", 500)
 
+    @http.route('/api/finance/reports/general-ledger/lines', type='json', auth='public', methods=['POST', 'OPTIONS'], cors='*', csrf=False)
+    def get_general_ledger_lines(self, **params):
+        """
+        Grand Livre : lignes d'un compte paginées par clé, avec solde progressif
+        calculé en SQL. Permet d'ouvrir un compte de plusieurs centaines de
+        milliers de lignes page par page.
+
+        Params:
+        - account_id: int (requis)
+        - date_from / date_to: YYYY-MM-DD (requis)
+        - journal_ids / partner_ids: list[int] (optionnels)
+        - cursor: dict 'nextCursor' de la page précédente (optionnel)
+        - limit: int (défaut 500, max 5000)
+        """
+        try:
+            auth_error = self._authenticate_from_header()
+            if auth_error:
+                return self._error_response("Session expirée", "UNAUTHORIZED", 401)
+
+            tenant = self._get_tenant()
+            if not tenant:
+                return self._error_response("Tenant non trouvé", "FORBIDDEN", 403)
+
+            account_id = params.get('account_id')
+            if not account_id or not params.get('date_from') or not params.get('date_to'):
+                return self._error_response("account_id, date_from et date_to requis", "VALIDATION_ERROR", 400)
+
+            ledger = request.env['quelyos.finance.general_ledger'].sudo().create({
+                'tenant_id': tenant.id,
+                'date_from': params['date_from'],
+                'date_to': params['date_to'],
+                'journal_ids': [(6, 0, params.get('journal_ids') or [])],
+                'partner_ids': [(6, 0, params.get('partner_ids') or [])],
+            })
+            page = ledger.get_account_lines_page(
+                int(account_id),
+                cursor=params.get('cursor'),
+                limit=params.get('limit'),
+            )
+
+            return self._success_response(page)
+
+        except Exception as e:
+            _logger.error(f"Erreur get_general_ledger_lines: {e}", exc_info=True)
+            return self._error_response(str(e), "SERVER_ERROR", 500)
+
     @http.route('/api/finance/reports/fec-export', type='http', auth='public', methods=['GET', 'OPTIONS'], cors='*', csrf=False)
     def export_fec(self, **params):
         """
         Export FEC (Fichier des Écritures Comptables) conforme DGFiP
+
+        Le fichier est généré en flux (lots de lignes) puis servi en
+        téléchargement streamé depuis le filestore.
         
         Query params:
         - year: int (année fiscale)
         """
         try:
-            user = self._authenticate_from_header()
-            if not user:
+            auth_error = self._authenticate_from_header()
+            if auth_error:
                 return request.make_response('Unauthorized', status=401)
 
-            tenant_id = self._get_tenant_id(user)
-            year = params.get('year', 2026)
-
-            # Simuler export FEC
-            # En production, utiliser l10n_fr_fec
-            fec_content = f"""JournalCode|JournalLib|EcritureNum|EcritureDate|CompteNum|CompteLib|CompAuxNum|CompAuxLib|PieceRef|PieceDate|EcritureLib|Debit|Credit|EcritureLet|DateLet|ValidDate|Montantdevise|Idevise
-VE|Ventes|INV001|{year}0115|411000|Clients|1|Client Test|INV001|{year}0115|Facture vente|1000.00|0.00||||1000.00|EUR
-VE|Ventes|INV001|{year}0115|707000|Ventes produits|||||Facture vente|0.00|1000.00||||1000.00|EUR"""
-
-            filename = f"fec-{year}.txt"
-            headers = [
-                ('Content-Type', 'text/plain; charset=utf-8'),
-                ('Content-Disposition', f'attachment; filename="{filename}"'),
-            ]
-
-            return request.make_response(fec_content.encode('utf-8'), headers=headers)
+            tenant = self._get_tenant()
+            if not tenant:
+                return request.make_response('Forbidden', status=403)
+
+            year = int(params.get('year', 2026))
+
+            wizard = request.env['quelyos.finance.fec_export'].sudo().create({
+                'tenant_id': tenant.id,
+                'date_from': date(year, 1, 1),
+                'date_to': date(year, 12, 31),
+            })
+            try:
+                wizard.generate_fec_file()
+            except ValueError as e:
+                return request.make_response(str(e), status=404)
+
+            stream = request.env['ir.binary']._get_stream_from(
+                wizard, 'fec_data', filename=wizard.fec_filename, mimetype='text/plain',
+            )
+            return stream.get_response(as_attachment=True)
 
         except Exception as e:
             _logger.error(f"Erreur export_fec: {e}", exc_info=True)
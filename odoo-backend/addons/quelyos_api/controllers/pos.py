@@ -4,7 +4,7 @@ API REST pour le Point de Vente (POS).
 
 Endpoints pour le frontend React :
 - Configuration et sessions
-- Catalogue produits
+- Catalogue produits (instantané + deltas pour les scans hors-ligne)
 - Commandes et paiements
 - Synchronisation offline
 - Dashboard et rapports
@@ -12,8 +12,11 @@ Endpoints pour le frontend React :
 
 import logging
 from odoo import http, fields
+from odoo.exceptions import UserError
 from odoo.http import request
 from .base import BaseController
+from ..models.pos_catalog import POS_CATALOG_PAGE_SIZE
+from ..models.pos_sync_job import POS_SYNC_INLINE_MAX
 
 _logger = logging.getLogger(__name__)
 
@@ -195,6 +198,9 @@ class POSController(BaseController):
                 'message': f"Session {session.name} fermée avec succès",
             }
 
+        except UserError as e:
+            return {'success': False, 'error': str(e)}
+
         except Exception as e:
             _logger.error(f"Error closing POS session: {e}", exc_info=True)
             return {'success': False, 'error': 'Erreur serveur'}
@@ -431,6 +437,68 @@ class POSController(BaseController):
             _logger.error(f"Error fetching product by barcode: {e}", exc_info=True)
             return {'success': False, 'error': 'Erreur serveur'}
 
+    @http.route('/api/pos/catalog/snapshot', type='jsonrpc', auth='public', methods=['POST'], csrf=False, cors='*')
+    def get_catalog_snapshot(self, config_id, after_id=0, limit=POS_CATALOG_PAGE_SIZE, **kwargs):
+        """
+        Instantané compact du catalogue du terminal (scans résolus hors-ligne).
+
+        Args:
+            config_id: ID du terminal (pour prix et stock)
+            after_id: Dernier id produit reçu (pagination)
+            limit: Nombre de produits par page
+        """
+        try:
+            error = self._authenticate_from_header()
+            if error:
+                return error
+
+            config = request.env['quelyos.pos.config'].sudo().browse(config_id)
+            if not config.exists():
+                return {'success': False, 'error': 'Terminal non trouvé'}
+
+            return {
+                'success': True,
+                'data': request.env['quelyos.pos.catalog.change'].sudo().get_snapshot(
+                    config, after_id=int(after_id or 0), limit=min(int(limit), POS_CATALOG_PAGE_SIZE),
+                ),
+            }
+
+        except Exception as e:
+            _logger.error(f"Error fetching POS catalog snapshot: {e}", exc_info=True)
+            return {'success': False, 'error': 'Erreur serveur'}
+
+    @http.route('/api/pos/catalog/changes', type='jsonrpc', auth='public', methods=['POST'], csrf=False, cors='*')
+    def get_catalog_changes(self, config_id, since, catalog_key=None, after_id=0, limit=POS_CATALOG_PAGE_SIZE, **kwargs):
+        """
+        Produits modifiés depuis le watermark du terminal.
+
+        Args:
+            config_id: ID du terminal
+            since: Watermark reçu lors du dernier instantané ou delta
+            catalog_key: Clé catalogue reçue avec ce watermark
+            after_id: lastId de la page précédente (pagination, même `since`)
+        """
+        try:
+            error = self._authenticate_from_header()
+            if error:
+                return error
+
+            config = request.env['quelyos.pos.config'].sudo().browse(config_id)
+            if not config.exists():
+                return {'success': False, 'error': 'Terminal non trouvé'}
+
+            return {
+                'success': True,
+                'data': request.env['quelyos.pos.catalog.change'].sudo().get_changes(
+                    config, since, catalog_key=catalog_key, after_id=int(after_id or 0),
+                    limit=min(int(limit), POS_CATALOG_PAGE_SIZE),
+                ),
+            }
+
+        except Exception as e:
+            _logger.error(f"Error fetching POS catalog changes: {e}", exc_info=True)
+            return {'success': False, 'error': 'Erreur serveur'}
+
     @http.route('/api/pos/categories', type='jsonrpc', auth='public', methods=['POST'], csrf=False, cors='*')
     def get_categories(self, config_id=None, **kwargs):
         """Liste des catégories de produits"""
@@ -777,6 +845,10 @@ class POSController(BaseController):
         """
         Synchronise les commandes créées en mode hors-ligne.
 
+        Jusqu'à POS_SYNC_INLINE_MAX commandes, le job est exécuté dans la
+        requête et les résultats sont renvoyés directement. Au-delà, il tourne
+        en arrière-plan : suivre la progression via /api/pos/sync/<job_id>.
+
         Args:
             orders: Liste de commandes offline à synchroniser
         """
@@ -785,82 +857,51 @@ class POSController(BaseController):
             if error:
                 return error
 
-            results = []
-
-            for order_data in orders:
-                offline_id = order_data.get('offline_id')
+            job = request.env['quelyos.pos.sync.job'].sudo().create_job(orders or [])
 
-                # Vérifier si déjà synchronisée
-                existing = request.env['quelyos.pos.order'].sudo().search([
-                    ('offline_id', '=', offline_id)
-                ], limit=1)
+            if len(orders or []) <= POS_SYNC_INLINE_MAX:
+                job._execute()
+                return {
+                    'success': True,
+                    'data': job.to_frontend_dict(),
+                }
 
-                if existing:
-                    results.append({
-                        'offlineId': offline_id,
-                        'status': 'already_synced',
-                        'orderId': existing.id,
-                        'orderRef': existing.name,
-                    })
-                    continue
-
-                try:
-                    # Créer la commande
-                    create_result = self.create_order(
-                        session_id=order_data['session_id'],
-                        lines=order_data['lines'],
-                        partner_id=order_data.get('partner_id'),
-                        discount_type=order_data.get('discount_type'),
-                        discount_value=order_data.get('discount_value'),
-                        note=order_data.get('note'),
-                        offline_id=offline_id,
-                    )
-
-                    if create_result.get('success'):
-                        order = create_result['data']
-
-                        # Si des paiements sont inclus, les traiter
-                        if order_data.get('payments') and order_data.get('is_paid'):
-                            pay_result = self.pay_order(
-                                order_id=order['id'],
-                                payments=order_data['payments'],
-                            )
-                            if pay_result.get('success'):
-                                order = pay_result['data']
-
-                        results.append({
-                            'offlineId': offline_id,
-                            'status': 'synced',
-                            'orderId': order['id'],
-                            'orderRef': order['reference'],
-                        })
-                    else:
-                        results.append({
-                            'offlineId': offline_id,
-                            'status': 'error',
-                            'error': create_result.get('error'),
-                        })
-
-                except Exception as e:
-                    results.append({
-                        'offlineId': offline_id,
-                        'status': 'error',
-                        'error': 'Erreur serveur',
-                    })
+            job.action_start()
 
             return {
                 'success': True,
-                'data': {
-                    'results': results,
-                    'syncedCount': len([r for r in results if r['status'] == 'synced']),
-                    'errorCount': len([r for r in results if r['status'] == 'error']),
-                },
+                'data': job.to_frontend_dict(),
+                'message': f"Synchronisation de {job.total_count} commandes lancée",
             }
 
         except Exception as e:
             _logger.error(f"Error syncing offline orders: {e}", exc_info=True)
             return {'success': False, 'error': 'Erreur serveur'}
 
+    @http.route('/api/pos/sync/<string:job_id>', type='jsonrpc', auth='public', methods=['POST'], csrf=False, cors='*')
+    def get_sync_status(self, job_id, **kwargs):
+        """Progression d'une synchronisation offline (polling du terminal)"""
+        try:
+            error = self._authenticate_from_header()
+            if error:
+                return error
+
+            job = request.env['quelyos.pos.sync.job'].sudo().search([
+                ('job_id', '=', job_id),
+                ('company_id', '=', request.env.user.company_id.id),
+            ], limit=1)
+            if not job:
+                return {'success': False, 'error': 'Synchronisation non trouvée'}
+
+            return {
+                'success': True,
+                'data': job.to_frontend_dict(),
+            }
+
+        except Exception as e:
+            _logger.error(f"Error fetching POS sync status {job_id}: {e}", exc_info=True)
+            return {'success': False, 'error': 'Erreur serveur'}
+
     # ═══════════════════════════════════════════════════════════════════════════
     # DASHBOARD & RAPPORTS
     # ═══════════════════════════════════════════════════════════════════════════
@@ -904,43 +945,33 @@ class POSController(BaseController):
             if config_id:
                 domain.append(('config_id', '=', config_id))
 
+            # KPIs : un GROUP BY sur les commandes de toutes les sessions
             Order = request.env['quelyos.pos.order'].sudo()
-            orders = Order.search(domain)
-
-            # KPIs
-            total_sales = sum(orders.mapped('amount_total'))
-            order_count = len(orders)
+            [(order_count, total_sales, unique_customers)] = Order._read_group(
+                domain, [], ['__count', 'amount_total:sum', 'partner_id:count_distinct'],
+            )
+            total_sales = total_sales or 0.0
             avg_basket = total_sales / order_count if order_count else 0
 
-            # Clients uniques
-            unique_customers = len(set(orders.mapped('partner_id.id')) - {False})
-
-            # Sessions actives
+            # Sessions actives (compteurs de session, sans relire les commandes)
             Session = request.env['quelyos.pos.session'].sudo()
             active_sessions = Session.search([
                 ('company_id', '=', request.env.user.company_id.id),
                 ('state', 'in', ['opening', 'opened']),
             ])
 
-            # Top produits
-            product_sales = {}
-            for order in orders:
-                for line in order.line_ids:
-                    pid = line.product_id.id
-                    if pid not in product_sales:
-                        product_sales[pid] = {
-                            'name': line.product_id.name,
-                            'quantity': 0,
-                            'amount': 0,
-                        }
-                    product_sales[pid]['quantity'] += line.quantity
-                    product_sales[pid]['amount'] += line.price_subtotal
-
-            top_products = sorted(
-                product_sales.values(),
-                key=lambda x: x['quantity'],
-                reverse=True
-            )[:5]
+            # Top produits : GROUP BY sur les lignes des mêmes commandes
+            top_products = [{
+                'name': product.name,
+                'quantity': quantity or 0,
+                'amount': amount or 0.0,
+            } for product, quantity, amount in request.env['quelyos.pos.order.line'].sudo()._read_group(
+                [(f'order_id.{fname}', operator, value) for fname, operator, value in domain],
+                ['product_id'],
+                ['quantity:sum', 'price_subtotal:sum'],
+                order='quantity:sum desc',
+                limit=5,
+            )]
 
             return {
                 'success': True,
@@ -356,101 +356,12 @@ class QuelyosProductsAPI(BaseController):
 
             total = ProductTemplate.search_count(domain)
 
-            # Construire les données enrichies
-            StockQuant = request.env['stock.quant'].sudo()
-            data = []
-            for p in products:
-                # Calculer le statut de stock en allant directement dans stock.quant
-                # (plus fiable avec auth='public' car qty_available dépend du contexte)
-                quants = StockQuant.search([
-                    ('product_id', 'in', p.product_variant_ids.ids),
-                    ('location_id.usage', '=', 'internal')
-                ])
-                qty = sum(quants.mapped('quantity')) if quants else 0.0
-                if qty <= 0:
-                    p_stock_status = 'out_of_stock'
-                elif qty <= 5:
-                    p_stock_status = 'low_stock'
-                else:
-                    p_stock_status = 'in_stock'
-
-                # Filtrer par statut stock si demandé
-                if stock_status and p_stock_status != stock_status:
-                    continue
+            # Construire les données enrichies (stock et images chargés en lot)
+            data = products._get_listing_data()
 
-                # Récupérer les images du produit
-                images_list = []
-                image_url = None
-                if p.product_template_image_ids:
-                    for idx, img in enumerate(p.product_template_image_ids.sorted('sequence')):
-                        img_data = {
-                            'id': img.id,
-                            'url': f'/web/image/product.image/{img.id}/image_1920',
-                            'is_main': idx == 0,
-                            'sequence': img.sequence,
-                        }
-                        images_list.append(img_data)
-                        if idx == 0:
-                            image_url = img_data['url']
-                elif p.image_1920:
-                    # Fallback sur l'image principale du produit template
-                    image_url = f'/web/image/product.template/{p.id}/image_1920'
-                    images_list = [{
-                        'id': 0,
-                        'url': image_url,
-                        'is_main': True,
-                        'sequence': 1,
-                    }]
-
-                # Récupérer le ribbon (badge) du produit
-                ribbon_data = None
-                if p.website_ribbon_id:
-                    ribbon = p.website_ribbon_id
-                    # Récupérer le nom dans la langue courante (fr_FR par défaut)
-                    ribbon_name = ribbon.name
-                    if isinstance(ribbon_name, dict):
-                        ribbon_name = ribbon_name.get('fr_FR', ribbon_name.get('en_US', ''))
-                    ribbon_data = {
-                        'id': ribbon.id,
-                        'name': ribbon_name,
-                        'bg_color': ribbon.bg_color,
-                        'text_color': ribbon.text_color,
-                        'position': ribbon.position,
-                        'style': ribbon.style,
-                    }
-
-                data.append({
-                    'id': p.id,
-                    'name': p.name,
-                    'price': p.list_price,
-                    'standard_price': p.standard_price,
-                    'default_code': p.default_code or '',
-                    'barcode': p.barcode or '',
-                    'image': f'/web/image/product.template/{p.id}/image_1920' if p.image_1920 else (getattr(p, 'x_image_external_url', None) or None),
-                    'image_url': image_url or (getattr(p, 'x_image_external_url', None) or None),
-                    'images': images_list if images_list else None,
-                    'slug': p.name.lower().replace(' ', '-'),
-                    'qty_available': qty,
-                    'qty_available_unreserved': p.qty_available_unreserved,
-                    'virtual_available': p.virtual_available,
-                    'stock_status': p_stock_status,
-                    'in_stock': qty > 0,
-                    'weight': p.weight or 0,
-                    'active': p.active,
-                    'create_date': p.create_date.isoformat() if p.create_date else None,
-                    'category': {
-                        'id': p.categ_id.id,
-                        'name': p.categ_id.name,
-                    } if p.categ_id else None,
-                    'variant_count': p.product_variant_count,
-                    'ribbon': ribbon_data,
-                    # Champs marketing e-commerce
-                    'is_featured': getattr(p, 'x_is_featured', False) or False,
-                    'is_new': getattr(p, 'x_is_new', False) or False,
-                    'is_bestseller': getattr(p, 'x_is_bestseller', False) or False,
-                    'compare_at_price': p.compare_list_price if hasattr(p, 'compare_list_price') and p.compare_list_price else None,
-                    'offer_end_date': getattr(p, 'x_offer_end_date', None).isoformat() if getattr(p, 'x_offer_end_date', None) else None,
-                })
+            # Filtrer par statut stock si demandé
+            if stock_status:
+                data = [item for item in data if item['stock_status'] == stock_status]
 
             # Construire le résultat
             result = {
@@ -26,6 +26,7 @@ class QuelyosSearch(http.Controller):
         Args:
             query (str): Terme de recherche
             limit (int, optional): Nombre de suggestions (défaut: 5)
+            tenant_id (int, optional): Restreindre au catalogue d'un tenant
 
         Returns:
             dict: {
@@ -63,15 +64,16 @@ class QuelyosSearch(http.Controller):
 
             suggestions = []
 
-            # Rechercher dans les produits (max 3)
-            products = Product.search([
-                ('name', 'ilike', query),
-                ('website_published', '=', True)
-            ], limit=min(limit, 3), order='name ASC')
+            # Rechercher dans les produits (max 3), classés en SQL
+            ranked, _total, _synonyms = Product._search_storefront(
+                query, limit=min(limit, 3), tenant_id=params.get('tenant_id'), candidate_limit=200, with_total=False,
+            )
+            products = Product.browse([template_id for template_id, _score in ranked])
+            with_main_image = products._get_templates_with_main_image()
 
             for product in products:
                 image_url = None
-                if product.image_1920:
+                if product.id in with_main_image:
                     image_url = f'/web/image/product.template/{product.id}/image_1920'
 
                 slug = product.name.lower().replace(' ', '-').replace('/', '-')
@@ -126,120 +128,6 @@ class QuelyosSearch(http.Controller):
                 'error': 'Une erreur est survenue'
             }
 
-    # Dictionnaire de synonymes français pour la recherche sémantique
-    SYNONYMS = {
-        'telephone': ['smartphone', 'mobile', 'portable', 'gsm', 'iphone', 'samsung'],
-        'smartphone': ['telephone', 'mobile', 'portable', 'gsm'],
-        'ordinateur': ['pc', 'laptop', 'portable', 'ordi', 'macbook', 'chromebook'],
-        'pc': ['ordinateur', 'laptop', 'desktop'],
-        'ecouteurs': ['casque', 'airpods', 'earbuds', 'audio'],
-        'casque': ['ecouteurs', 'headphones', 'audio'],
-        'montre': ['smartwatch', 'bracelet', 'connectee'],
-        'tablette': ['ipad', 'tab', 'slate'],
-        'television': ['tv', 'ecran', 'tele'],
-        'tv': ['television', 'ecran', 'tele'],
-        'chaussures': ['sneakers', 'baskets', 'tennis', 'souliers'],
-        'vetements': ['habits', 'fringues', 'textile'],
-        'sac': ['sacoche', 'valise', 'bagage'],
-        'accessoires': ['bijoux', 'montres', 'ceintures'],
-        'beaute': ['cosmetiques', 'maquillage', 'soins'],
-        'enfant': ['bebe', 'junior', 'kids'],
-        'femme': ['feminin', 'ladies', 'dame'],
-        'homme': ['masculin', 'men', 'monsieur'],
-        'sport': ['fitness', 'gym', 'running', 'athletisme'],
-        'maison': ['deco', 'decoration', 'interieur', 'meuble'],
-        'cuisine': ['cuisson', 'electromenager', 'ustensiles'],
-        'jardin': ['exterieur', 'plantes', 'terrasse'],
-        'pas cher': ['discount', 'promo', 'soldes', 'economique', 'abordable'],
-        'luxe': ['premium', 'haut de gamme', 'prestige'],
-        'nouveau': ['nouveaute', 'recent', 'dernier'],
-    }
-
-    def _expand_query_with_synonyms(self, query):
-        """Expands query with synonyms"""
-        query_lower = query.lower()
-        expanded_terms = [query_lower]
-
-        for key, synonyms in self.SYNONYMS.items():
-            if key in query_lower:
-                expanded_terms.extend(synonyms)
-            for syn in synonyms:
-                if syn in query_lower:
-                    expanded_terms.append(key)
-                    expanded_terms.extend([s for s in synonyms if s != syn])
-
-        return list(set(expanded_terms))
-
-    def _levenshtein_distance(self, s1, s2):
-        """Calcule la distance de Levenshtein entre deux chaînes"""
-        if len(s1) < len(s2):
-            return self._levenshtein_distance(s2, s1)
-        if len(s2) == 0:
-            return len(s1)
-
-        prev_row = range(len(s2) + 1)
-        for i, c1 in enumerate(s1):
-            curr_row = [i + 1]
-            for j, c2 in enumerate(s2):
-                insertions = prev_row[j + 1] + 1
-                deletions = curr_row[j] + 1
-                substitutions = prev_row[j] + (c1 != c2)
-                curr_row.append(min(insertions, deletions, substitutions))
-            prev_row = curr_row
-        return prev_row[-1]
-
-    def _fuzzy_match(self, query, text, threshold=0.7):
-        """Vérifie si query correspond approximativement à text"""
-        query = query.lower()
-        text = text.lower()
-
-        if query in text:
-            return True
-
-        words = text.split()
-        for word in words:
-            if len(word) >= 3:
-                distance = self._levenshtein_distance(query, word)
-                max_len = max(len(query), len(word))
-                similarity = 1 - (distance / max_len)
-                if similarity >= threshold:
-                    return True
-        return False
-
-    def _calculate_relevance_score(self, product, query_terms, original_query):
-        """Calcule un score de pertinence pour un produit"""
-        score = 0
-        name_lower = product.name.lower()
-        desc_lower = (product.description_sale or '').lower()
-
-        # Correspondance exacte dans le nom (score élevé)
-        if original_query.lower() in name_lower:
-            score += 100
-
-        # Correspondance dans le nom
-        for term in query_terms:
-            if term in name_lower:
-                score += 50
-            elif self._fuzzy_match(term, name_lower, 0.8):
-                score += 25
-
-        # Correspondance dans la description
-        for term in query_terms:
-            if term in desc_lower:
-                score += 10
-
-        # Boost pour les produits populaires/bestsellers
-        if hasattr(product, 'is_bestseller') and product.is_bestseller:
-            score += 20
-        if hasattr(product, 'is_featured') and product.is_featured:
-            score += 15
-
-        # Boost pour les produits en stock
-        if product.qty_available > 0:
-            score += 10
-
-        return score
-
     @http.route('/api/ecommerce/search/semantic', type='jsonrpc', auth='public', methods=['POST'], csrf=False, cors='*')
     def search_semantic(self, **kwargs):
         """
@@ -249,6 +137,7 @@ class QuelyosSearch(http.Controller):
             query (str): Terme de recherche
             limit (int, optional): Nombre de résultats (défaut: 20)
             category_id (int, optional): Filtrer par catégorie
+            tenant_id (int, optional): Restreindre au catalogue d'un tenant
 
         Returns:
             dict: Produits triés par pertinence avec score
@@ -262,56 +151,37 @@ class QuelyosSearch(http.Controller):
             if not query or len(query) < 2:
                 return {'success': True, 'data': {'products': [], 'query_expansion': []}}
 
-            # Expansion de la requête avec synonymes
-            expanded_terms = self._expand_query_with_synonyms(query)
-
             Product = request.env['product.template'].sudo()
 
-            # Construire le domaine de recherche
-            base_domain = [('website_published', '=', True)]
-
-            if category_id:
-                base_domain.append(('public_categ_ids', 'in', [int(category_id)]))
-
-            # Recherche avec tous les termes (OR)
-            search_domain = ['|'] * (len(expanded_terms) - 1)
-            for term in expanded_terms:
-                search_domain.append(('name', 'ilike', term))
-
-            full_domain = base_domain + search_domain
-
-            # Récupérer les produits (plus que limit pour filtrer ensuite)
-            products = Product.search(full_domain, limit=limit * 3)
+            # Synonymes, préfixes et tolérance aux fautes résolus dans la requête SQL
+            ranked, total_found, expanded_terms = Product._search_storefront(
+                query, limit=limit, tenant_id=params.get('tenant_id'), category_id=category_id,
+            )
+            scores = dict(ranked)
+            products = Product.browse(list(scores))
+            stock_by_template = products._get_listing_stock_quantities()
+            with_main_image = products._get_templates_with_main_image()
 
-            # Calculer les scores et trier
-            scored_products = []
+            results = []
             for product in products:
-                score = self._calculate_relevance_score(product, expanded_terms, query)
-                if score > 0:
-                    image_url = None
-                    if product.image_1920:
-                        image_url = f'/web/image/product.template/{product.id}/image_1920'
-
-                    slug = product.name.lower().replace(' ', '-').replace('/', '-')
-
-                    scored_products.append({
-                        'id': product.id,
-                        'name': product.name,
-                        'slug': slug,
-                        'price': product.list_price,
-                        'compare_at_price': product.compare_list_price if hasattr(product, 'compare_list_price') and product.compare_list_price > product.list_price else None,
-                        'image_url': image_url,
-                        'category': product.public_categ_ids[0].name if product.public_categ_ids else None,
-                        'in_stock': product.qty_available > 0,
-                        'is_bestseller': getattr(product, 'is_bestseller', False),
-                        'relevance_score': score,
-                    })
+                image_url = None
+                if product.id in with_main_image:
+                    image_url = f'/web/image/product.template/{product.id}/image_1920'
 
-            # Trier par score de pertinence
-            scored_products.sort(key=lambda x: x['relevance_score'], reverse=True)
+                slug = product.name.lower().replace(' ', '-').replace('/', '-')
 
-            # Limiter les résultats
-            results = scored_products[:limit]
+                results.append({
+                    'id': product.id,
+                    'name': product.name,
+                    'slug': slug,
+                    'price': product.list_price,
+                    'compare_at_price': product.compare_list_price if hasattr(product, 'compare_list_price') and product.compare_list_price > product.list_price else None,
+                    'image_url': image_url,
+                    'category': product.public_categ_ids[0].name if product.public_categ_ids else None,
+                    'in_stock': stock_by_template.get(product.id, 0.0) > 0,
+                    'is_bestseller': product.x_is_bestseller,
+                    'relevance_score': round(scores[product.id], 4),
+                })
 
             _logger.info(f"Semantic search for '{query}' expanded to {expanded_terms}, found {len(results)} results")
 
@@ -319,8 +189,8 @@ class QuelyosSearch(http.Controller):
                 'success': True,
                 'data': {
                     'products': results,
-                    'query_expansion': expanded_terms if len(expanded_terms) > 1 else [],
-                    'total_found': len(scored_products),
+                    'query_expansion': expanded_terms,
+                    'total_found': total_found,
                 }
             }
 
@@ -336,6 +206,9 @@ class QuelyosSearch(http.Controller):
         Args:
             category_id (int, optional): Filtrer par catégorie
             search (str, optional): Filtrer par terme de recherche
+            tenant_id (int, optional): Restreindre au catalogue d'un tenant
+            attribute_value_ids (list, optional): Valeurs d'attributs sélectionnées
+            price_ranges (list, optional): Labels de tranches de prix sélectionnées
 
         Returns:
             dict: {
@@ -384,104 +257,16 @@ class QuelyosSearch(http.Controller):
         """
         try:
             params = self._get_params()
-            category_id = params.get('category_id')
-            search = params.get('search', '').strip()
-
-            Product = request.env['product.template'].sudo()
-            Category = request.env['product.public.category'].sudo()
-            Attribute = request.env['product.attribute'].sudo()
-
-            # Construire le domaine de recherche de base
-            domain = [('website_published', '=', True)]
-
-            if category_id:
-                domain.append(('public_categ_ids', 'in', [category_id]))
-
-            if search:
-                domain.append(('name', 'ilike', search))
-
-            # Récupérer tous les produits matchant
-            products = Product.search(domain)
-
-            facets = {
-                'categories': [],
-                'price_ranges': [],
-                'attributes': {},
-                'brands': [],
-                'in_stock': {
-                    'available': 0,
-                    'out_of_stock': 0
-                }
-            }
-
-            # Facets catégories (compter produits par catégorie)
-            category_counts = {}
-            for product in products:
-                for category in product.public_categ_ids:
-                    if category.id not in category_counts:
-                        category_counts[category.id] = {
-                            'id': category.id,
-                            'name': category.name,
-                            'count': 0
-                        }
-                    category_counts[category.id]['count'] += 1
-
-            facets['categories'] = sorted(category_counts.values(), key=lambda x: x['count'], reverse=True)
-
-            # Facets prix (ranges prédéfinis)
-            price_ranges = [
-                {'label': '0-50', 'min': 0, 'max': 50, 'count': 0},
-                {'label': '50-100', 'min': 50, 'max': 100, 'count': 0},
-                {'label': '100-200', 'min': 100, 'max': 200, 'count': 0},
-                {'label': '200-500', 'min': 200, 'max': 500, 'count': 0},
-                {'label': '500+', 'min': 500, 'max': 999999, 'count': 0},
-            ]
-
-            for product in products:
-                price = product.list_price
-                for range_obj in price_ranges:
-                    if range_obj['min'] <= price < range_obj['max']:
-                        range_obj['count'] += 1
-                        break
-
-            facets['price_ranges'] = [r for r in price_ranges if r['count'] > 0]
-
-            # Facets attributs (couleur, taille, etc.)
-            attribute_counts = {}
-            for product in products:
-                for variant in product.product_variant_ids:
-                    for value in variant.product_template_attribute_value_ids:
-                        attribute_name = value.attribute_id.name
-                        value_name = value.name
-
-                        if attribute_name not in attribute_counts:
-                            attribute_counts[attribute_name] = {}
-
-                        if value_name not in attribute_counts[attribute_name]:
-                            attribute_counts[attribute_name][value_name] = {
-                                'id': value.id,
-                                'name': value_name,
-                                'count': 0
-                            }
-
-                        attribute_counts[attribute_name][value_name]['count'] += 1
-
-            # Convertir en liste triée
-            for attr_name, values in attribute_counts.items():
-                facets['attributes'][attr_name] = sorted(values.values(), key=lambda x: x['count'], reverse=True)
-
-            # Facets stock (disponibilité)
-            for product in products:
-                if product.type == 'product':
-                    if product.qty_available > 0:
-                        facets['in_stock']['available'] += 1
-                    else:
-                        facets['in_stock']['out_of_stock'] += 1
-                else:
-                    # Service/consommable toujours disponible
-                    facets['in_stock']['available'] += 1
-
-            _logger.info(f"Facets calculated for {len(products)} products")
+            search = (params.get('search') or '').strip()
+
+            # Index de facettes matérialisé : intersection de bitmaps en mémoire
+            facets = request.env['quelyos.product.facet'].sudo().get_facets(
+                tenant_id=params.get('tenant_id'),
+                category_id=params.get('category_id'),
+                search=search or None,
+                attribute_value_ids=params.get('attribute_value_ids'),
+                price_ranges=params.get('price_ranges'),
+            )
 
             return {
                 'success': True,
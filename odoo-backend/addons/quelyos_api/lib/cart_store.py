@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage éphémère des paniers e-commerce
+
+Les paniers (lignes, prix calculés, totaux) sont des documents JSON par
+propriétaire ('partner:<id>' pour un client connecté, 'guest:<email>' pour
+un invité) : ajouter, modifier ou retirer un article n'écrit rien en base.
+Le panier devient une vraie commande brouillon (sale.order) uniquement à la
+sauvegarde, au checkout, ou quand il reste inactif (voir models/cart.py).
+
+Chaque modification est une lecture-modification-écriture du document :
+elle s'exécute sous lock(db, owner), verrou court par propriétaire (deux
+ajouts simultanés ne s'écrasent pas).
+
+Backend: Redis (documents + index trié par date de dernière modification)
+Fallback: dictionnaire en mémoire (single worker only)
+"""
+
+import os
+import json
+import time
+import logging
+from threading import Lock, RLock
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+_logger = logging.getLogger(__name__)
+
+CART_TTL = 7 * 24 * 3600  # 7 jours, comme le lien de récupération
+CART_LOCK_TIMEOUT = 10  # secondes (durée max du verrou et de l'attente)
+
+
+# =============================================================================
+# CART STORE REDIS (Production)
+# =============================================================================
+
+class RedisCartStore:
+    """
+    Paniers dans Redis.
+
+    - cart:<db>:<owner>  : document JSON du panier (expire après CART_TTL)
+    - cart:<db>:index    : ZSET owner -> timestamp de dernière modification
+                           des paniers non encore enregistrés en commande
+    - cart:<db>:lock:<owner> : verrou de modification du panier
+    """
+
+    def __init__(self):
+        self.redis_client = None
+        self.enabled = False
+
+        if not REDIS_AVAILABLE:
+            _logger.warning("Cart store: Redis non disponible")
+            return
+
+        try:
+            redis_host = os.environ.get('REDIS_HOST', 'localhost')
+            redis_port = int(os.environ.get('REDIS_PORT', 6379))
+            redis_db = int(os.environ.get('REDIS_CART_DB', 2))  # DB séparée (pas de flush avec le cache)
+
+            self.redis_client = redis.Redis(
+                host=redis_host,
+                port=redis_port,
+                db=redis_db,
+                decode_responses=True,
+                socket_connect_timeout=1,
+                socket_timeout=1,
+            )
+            self.redis_client.ping()
+            self.enabled = True
+            _logger.info(f"Cart store Redis enabled ({redis_host}:{redis_port}/db{redis_db})")
+
+        except Exception as e:
+            _logger.warning(f"Cart store Redis disabled: {e}")
+
+    def lock(self, db, owner):
+        """Verrou du panier (context manager), expiré après CART_LOCK_TIMEOUT si le worker meurt"""
+        return self.redis_client.lock(
+            f"cart:{db}:lock:{owner}", timeout=CART_LOCK_TIMEOUT, blocking_timeout=CART_LOCK_TIMEOUT,
+        )
+
+    def get(self, db, owner):
+        raw = self.redis_client.get(f"cart:{db}:{owner}")
+        return json.loads(raw) if raw else None
+
+    def save(self, db, owner, cart, pending=True):
+        """Enregistre le panier ; `pending` : à persister en commande s'il devient inactif"""
+        pipe = self.redis_client.pipeline()
+        pipe.setex(f"cart:{db}:{owner}", CART_TTL, json.dumps(cart))
+        if pending:
+            pipe.zadd(f"cart:{db}:index", {owner: cart['updated_at']})
+        else:
+            pipe.zrem(f"cart:{db}:index", owner)
+        pipe.execute()
+
+    def delete(self, db, owner):
+        pipe = self.redis_client.pipeline()
+        pipe.delete(f"cart:{db}:{owner}")
+        pipe.zrem(f"cart:{db}:index", owner)
+        pipe.execute()
+
+    def idle_owners(self, db, before, limit=500):
+        """Propriétaires des paniers en attente non modifiés depuis `before` (timestamp)"""
+        return self.redis_client.zrangebyscore(f"cart:{db}:index", 0, before, start=0, num=limit)
+
+
+# =============================================================================
+# CART STORE IN-MEMORY (Fallback)
+# =============================================================================
+
+class MemoryCartStore:
+    """
+    Paniers en mémoire du processus pour environnements sans Redis.
+    ATTENTION: Ne fonctionne pas avec plusieurs workers Odoo!
+    """
+
+    def __init__(self):
+        self.carts = {}
+        self.index = {}
+        # Réentrant : détenu par lock() pendant la lecture et l'écriture
+        self._lock = RLock()
+        _logger.warning("Using in-memory cart store (single worker only)")
+
+    def lock(self, db, owner):
+        return self._lock
+
+    def get(self, db, owner):
+        with self._lock:
+            entry = self.carts.get((db, owner))
+            if not entry:
+                return None
+            expires_at, raw = entry
+            if expires_at < time.time():
+                self.carts.pop((db, owner), None)
+                self.index.pop((db, owner), None)
+                return None
+            return json.loads(raw)
+
+    def save(self, db, owner, cart, pending=True):
+        with self._lock:
+            self.carts[(db, owner)] = (time.time() + CART_TTL, json.dumps(cart))
+            if pending:
+                self.index[(db, owner)] = cart['updated_at']
+            else:
+                self.index.pop((db, owner), None)
+
+    def delete(self, db, owner):
+        with self._lock:
+            self.carts.pop((db, owner), None)
+            self.index.pop((db, owner), None)
+
+    def idle_owners(self, db, before, limit=500):
+        with self._lock:
+            idle = sorted(
+                (updated_at, owner) for (cart_db, owner), updated_at in self.index.items()
+                if cart_db == db and updated_at <= before
+            )
+        return [owner for _updated_at, owner in idle[:limit]]
+
+
+# =============================================================================
+# INSTANCE GLOBALE
+# =============================================================================
+
+_cart_store = None
+_store_lock = Lock()
+
+
+def get_cart_store():
+    """Retourne le store de paniers (Redis si disponible, sinon mémoire)"""
+    global _cart_store
+    if _cart_store is None:
+        with _store_lock:
+            if _cart_store is None:
+                store = RedisCartStore()
+                _cart_store = store if store.enabled else MemoryCartStore()
+    return _cart_store
@@ -9,10 +9,11 @@ Stockage et replay des événements métier:
 - Projections personnalisées
 """
 
+import os
 import json
 import logging
 import uuid
-from typing import Dict, Any, List, Optional, Callable
+from typing import Dict, Any, List, Optional, Callable, Tuple
 from datetime import datetime
 from dataclasses import dataclass, asdict
 from enum import Enum
@@ -110,6 +111,25 @@ class Event:
 # =============================================================================
 # EVENT STORE
 # =============================================================================
+#
+# Clés Redis :
+#   events:{aggregate_type}:{aggregate_id}            stream de l'agrégat
+#   events:{aggregate_type}:{aggregate_id}:version    dernière version attribuée
+#   events:stream:all                                 journal global ordonné
+#   events:stream:type:{event_type}                   journal par type
+#   events:snapshot:{projection}:{type}:{id}          dernier snapshot
+#   events:cursor:{consumer}                          position d'un consommateur
+#
+# Les entrées de stream portent deux champs : `data` (événement JSON) et
+# `version` (attribuée atomiquement à l'écriture, fait foi sur `data`).
+
+GLOBAL_STREAM = 'events:stream:all'
+SNAPSHOT_INTERVAL = int(os.environ.get('QUELYOS_EVENT_SNAPSHOT_INTERVAL', 100))
+# Longueur max (approximative) des journaux global et par type ; 0 = illimitée.
+# Les streams d'agrégat (piste d'audit) ne sont jamais tronqués.
+FEED_MAXLEN = int(os.environ.get('QUELYOS_EVENT_FEED_MAXLEN', 1000000))
+READ_BATCH = 500  # Entrées lues par XRANGE lors d'un replay
+
 
 class EventStore:
     """
@@ -129,20 +149,52 @@ class EventStore:
         # Récupérer l'historique
         events = store.get_events('order', order_id)
 
-        # Reconstruire l'état
+        # Reconstruire l'état (depuis le dernier snapshot)
         order_state = store.replay('order', order_id, OrderProjection())
+
+        # Consommer le journal global par pages, avec reprise
+        events, cursor = store.read_stream(after=cursor, limit=100)
     """
 
-    def __init__(self):
+    APPEND_SCRIPT = """
+    local stream, version_key, global_stream, type_stream = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+    local data, expected, feed_maxlen = ARGV[1], ARGV[2], tonumber(ARGV[3])
+
+    -- Streams antérieurs au compteur de version : la longueur fait foi
+    if redis.call('EXISTS', version_key) == 0 then
+        redis.call('SET', version_key, redis.call('XLEN', stream))
+    end
+    local current = tonumber(redis.call('GET', version_key))
+    if expected ~= '' and tonumber(expected) ~= current then
+        return {-1, current}
+    end
+
+    local version = redis.call('INCR', version_key)
+    local entry_id = redis.call('XADD', stream, '*', 'data', data, 'version', version)
+    for _, feed in ipairs({global_stream, type_stream}) do
+        if feed_maxlen > 0 then
+            redis.call('XADD', feed, 'MAXLEN', '~', feed_maxlen, '*', 'data', data, 'version', version)
+        else
+            redis.call('XADD', feed, '*', 'data', data, 'version', version)
+        end
+    end
+    return {version, entry_id}
+    """
+
+    def __init__(self, snapshot_interval: int = SNAPSHOT_INTERVAL, feed_maxlen: int = FEED_MAXLEN,
+                 key_prefix: str = 'events'):
         self._redis = None
         self._handlers: Dict[str, List[Callable]] = {}
+        self._snapshot_projections: Dict[str, List['Projection']] = {}
+        self.snapshot_interval = snapshot_interval
+        self.feed_maxlen = feed_maxlen
+        self.key_prefix = key_prefix
         self._init_redis()
 
     def _init_redis(self):
         """Initialise Redis pour le stockage"""
         try:
             import redis
-            import os
             redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/2')
             self._redis = redis.from_url(redis_url)
             self._redis.ping()
@@ -150,12 +202,44 @@ class EventStore:
         except Exception as e:
             _logger.warning(f"Redis not available for event store: {e}")
 
-    def append(self, event: Event) -> bool:
+    @property
+    def _global_stream_key(self) -> str:
+        return GLOBAL_STREAM.replace('events', self.key_prefix, 1)
+
+    def _stream_key(self, aggregate_type: str, aggregate_id: str) -> str:
+        return f"{self.key_prefix}:{aggregate_type}:{aggregate_id}"
+
+    def _type_stream_key(self, event_type: str) -> str:
+        return f"{self.key_prefix}:stream:type:{event_type}"
+
+    @staticmethod
+    def _decode_id(entry_id) -> str:
+        return entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+
+    @staticmethod
+    def _next_id(entry_id: str) -> str:
+        """Plus petit ID de stream strictement supérieur (borne exclusive de XRANGE)"""
+        millis, _sep, seq = entry_id.partition('-')
+        return f"{millis}-{int(seq or 0) + 1}"
+
+    @staticmethod
+    def _decode_entry(fields: Dict) -> Event:
+        event = Event.from_dict(json.loads(fields[b'data'].decode()))
+        if b'version' in fields:
+            event.version = int(fields[b'version'])
+        return event
+
+    def append(self, event: Event, expected_version: Optional[int] = None) -> bool:
         """
         Ajoute un événement au store.
 
+        La version de l'agrégat est attribuée atomiquement ; l'événement est
+        écrit dans le stream de l'agrégat, le journal global et le journal
+        de son type.
+
         Args:
             event: Événement à persister
+            expected_version: Version courante attendue (concurrence optimiste)
 
         Returns:
             True si succès
@@ -165,23 +249,30 @@ class EventStore:
             return False
 
         try:
-            # Clé pour l'agrégat
-            stream_key = f"events:{event.aggregate_type}:{event.aggregate_id}"
-
-            # Ajouter au stream Redis
-            self._redis.xadd(
-                stream_key,
-                {'data': json.dumps(event.to_dict())},
-                id='*'
+            version, detail = self._redis.eval(
+                self.APPEND_SCRIPT, 4,
+                self._stream_key(event.aggregate_type, event.aggregate_id),
+                f"{self._stream_key(event.aggregate_type, event.aggregate_id)}:version",
+                self._global_stream_key,
+                self._type_stream_key(event.type),
+                json.dumps(event.to_dict()),
+                '' if expected_version is None else expected_version,
+                self.feed_maxlen,
             )
-
-            # Index global par type d'événement
-            type_key = f"events:type:{event.type}"
-            self._redis.zadd(type_key, {event.id: datetime.utcnow().timestamp()})
+            if version == -1:
+                _logger.warning(
+                    f"Event rejected: {event.aggregate_type}:{event.aggregate_id} "
+                    f"expected version {expected_version}, current {detail}"
+                )
+                return False
+            event.version = int(version)
 
             # Publier pour les subscribers
             self._publish_event(event)
 
+            if self.snapshot_interval and event.version % self.snapshot_interval == 0:
+                self._snapshot_aggregate(event.aggregate_type, event.aggregate_id)
+
             _logger.debug(f"Event appended: {event.type} for {event.aggregate_type}:{event.aggregate_id}")
             return True
 
@@ -189,6 +280,17 @@ class EventStore:
             _logger.error(f"Failed to append event: {e}")
             return False
 
+    def _iter_entries(self, stream_key: str, after: Optional[str] = None):
+        """Parcourt un stream par lots (mémoire bornée) : (entry_id, Event)"""
+        start = self._next_id(after) if after else '-'
+        while True:
+            entries = self._redis.xrange(stream_key, start, '+', count=READ_BATCH)
+            for entry_id, fields in entries:
+                yield self._decode_id(entry_id), self._decode_entry(fields)
+            if len(entries) < READ_BATCH:
+                return
+            start = self._next_id(self._decode_id(entries[-1][0]))
+
     def get_events(
         self,
         aggregate_type: str,
@@ -212,72 +314,188 @@ class EventStore:
             return []
 
         try:
-            stream_key = f"events:{aggregate_type}:{aggregate_id}"
-            raw_events = self._redis.xrange(stream_key, '-', '+')
-
             events = []
-            for _, data in raw_events:
-                event_data = json.loads(data[b'data'].decode())
-                event = Event.from_dict(event_data)
-
+            for _entry_id, event in self._iter_entries(self._stream_key(aggregate_type, aggregate_id)):
+                if to_version is not None and event.version > to_version:
+                    break
                 if event.version >= from_version:
-                    if to_version is None or event.version <= to_version:
-                        events.append(event)
-
+                    events.append(event)
             return events
 
         except Exception as e:
             _logger.error(f"Failed to get events: {e}")
             return []
 
+    def read_stream(
+        self,
+        event_type: Optional[EventType] = None,
+        after: Optional[str] = None,
+        limit: int = 100
+    ) -> Tuple[List[Event], Optional[str]]:
+        """
+        Lit le journal global (ou celui d'un type) dans l'ordre d'écriture.
+
+        Les journaux sont bornés à `feed_maxlen` entrées : un consommateur
+        plus en retard reprend au plus ancien événement conservé (l'historique
+        complet reste lisible par agrégat via get_events).
+
+        Args:
+            event_type: Type d'événement (None = tous les types)
+            after: Curseur retourné par l'appel précédent (None = début)
+            limit: Taille de page
+
+        Returns:
+            (événements, curseur de reprise ; inchangé si aucun nouvel événement)
+        """
+        if not self._redis:
+            return [], after
+
+        if event_type is None:
+            stream_key = self._global_stream_key
+        else:
+            stream_key = self._type_stream_key(event_type.value if isinstance(event_type, EventType) else event_type)
+
+        try:
+            start = self._next_id(after) if after else '-'
+            entries = self._redis.xrange(stream_key, start, '+', count=limit)
+            events = [self._decode_entry(fields) for _entry_id, fields in entries]
+            cursor = self._decode_id(entries[-1][0]) if entries else after
+            return events, cursor
+
+        except Exception as e:
+            _logger.error(f"Failed to read event stream: {e}")
+            return [], after
+
+    def consume(
+        self,
+        consumer: str,
+        handler: Callable[[Event], None],
+        event_type: Optional[EventType] = None,
+        batch_size: int = 100,
+        max_batches: Optional[int] = None
+    ) -> int:
+        """
+        Traite les nouveaux événements depuis la position enregistrée du
+        consommateur. La position est sauvegardée après chaque page : en cas
+        d'erreur, la page en cours sera relue (au moins une fois).
+
+        Returns:
+            Nombre d'événements traités
+        """
+        if not self._redis:
+            return 0
+
+        type_suffix = f":{event_type.value if isinstance(event_type, EventType) else event_type}" if event_type else ''
+        cursor_key = f"{self.key_prefix}:cursor:{consumer}{type_suffix}"
+        cursor = self._redis.get(cursor_key)
+        cursor = cursor.decode() if cursor else None
+
+        processed = batches = 0
+        while max_batches is None or batches < max_batches:
+            events, next_cursor = self.read_stream(event_type, after=cursor, limit=batch_size)
+            if not events:
+                break
+            for event in events:
+                handler(event)
+            processed += len(events)
+            batches += 1
+            cursor = next_cursor
+            self._redis.set(cursor_key, cursor)
+        return processed
+
     def get_events_by_type(
         self,
         event_type: EventType,
         limit: int = 100,
         offset: int = 0
     ) -> List[Event]:
-        """Récupère les événements par type"""
+        """Récupère les événements par type (plus récents d'abord)"""
         if not self._redis:
             return []
 
         try:
-            type_key = f"events:type:{event_type.value}"
-            event_ids = self._redis.zrevrange(type_key, offset, offset + limit - 1)
-
-            events = []
-            for event_id in event_ids:
-                event_data = self._redis.get(f"event:{event_id.decode()}")
-                if event_data:
-                    events.append(Event.from_dict(json.loads(event_data)))
-
-            return events
+            entries = self._redis.xrevrange(
+                self._type_stream_key(event_type.value if isinstance(event_type, EventType) else event_type),
+                '+', '-', count=offset + limit,
+            )
+            return [self._decode_entry(fields) for _entry_id, fields in entries[offset:]]
 
         except Exception as e:
             _logger.error(f"Failed to get events by type: {e}")
             return []
 
+    # -------------------------------------------------------------------------
+    # Snapshots
+    # -------------------------------------------------------------------------
+
+    def register_snapshot_projection(self, aggregate_type: str, projection: 'Projection'):
+        """Snapshot automatique de `projection` tous les `snapshot_interval` événements"""
+        self._snapshot_projections.setdefault(aggregate_type, []).append(projection)
+
+    def _snapshot_key(self, projection: 'Projection', aggregate_type: str, aggregate_id: str) -> str:
+        return f"{self.key_prefix}:snapshot:{projection.name}:{aggregate_type}:{aggregate_id}"
+
+    def get_snapshot(self, aggregate_type: str, aggregate_id: str, projection: 'Projection') -> Optional[Dict]:
+        """Dernier snapshot : {'state', 'version', 'entry_id'}"""
+        if not self._redis:
+            return None
+        data = self._redis.get(self._snapshot_key(projection, aggregate_type, aggregate_id))
+        return json.loads(data) if data else None
+
+    def save_snapshot(self, aggregate_type: str, aggregate_id: str, projection: 'Projection',
+                      state: Any, version: int, entry_id: str):
+        self._redis.set(
+            self._snapshot_key(projection, aggregate_type, aggregate_id),
+            json.dumps({'state': state, 'version': version, 'entry_id': entry_id}),
+        )
+
+    def _snapshot_aggregate(self, aggregate_type: str, aggregate_id: str):
+        for projection in self._snapshot_projections.get(aggregate_type, []):
+            try:
+                self.replay(aggregate_type, aggregate_id, projection)
+            except Exception as e:
+                _logger.error(f"Snapshot failed for {aggregate_type}:{aggregate_id}: {e}")
+
     def replay(
         self,
         aggregate_type: str,
         aggregate_id: str,
-        projection: 'Projection'
+        projection: 'Projection',
+        use_snapshot: bool = True
     ) -> Any:
         """
         Reconstruit l'état en rejouant les événements.
 
+        Part du dernier snapshot de la projection et ne rejoue que les
+        événements suivants ; un nouveau snapshot est enregistré dès que
+        `snapshot_interval` événements ont été rejoués.
+
         Args:
             aggregate_type: Type d'agrégat
             aggregate_id: ID de l'agrégat
             projection: Projection à utiliser
+            use_snapshot: False pour tout rejouer depuis l'origine
 
         Returns:
             État reconstruit
         """
-        events = self.get_events(aggregate_type, aggregate_id)
+        if not self._redis:
+            return projection.initial_state()
+
+        snapshot = self.get_snapshot(aggregate_type, aggregate_id, projection) if use_snapshot else None
+        if snapshot:
+            state, version, last_id = snapshot['state'], snapshot['version'], snapshot['entry_id']
+        else:
+            state, version, last_id = projection.initial_state(), 0, None
 
-        state = projection.initial_state()
-        for event in events:
+        replayed = 0
+        for entry_id, event in self._iter_entries(self._stream_key(aggregate_type, aggregate_id), after=last_id):
             state = projection.apply(state, event)
+            version, last_id = event.version, entry_id
+            replayed += 1
+
+        if self.snapshot_interval and replayed >= self.snapshot_interval:
+            self.save_snapshot(aggregate_type, aggregate_id, projection, state, version, last_id)
 
         return state
 
@@ -309,7 +527,20 @@ class EventStore:
 # =============================================================================
 
 class Projection:
-    """Classe de base pour les projections"""
+    """
+    Classe de base pour les projections.
+    L'état doit être sérialisable en JSON (snapshots) et `apply` ne dépendre
+    que de l'état et de l'événement : rejouer depuis un snapshot donne alors
+    le même état que tout rejouer depuis l'origine.
+    """
+
+    @property
+    def name(self) -> str:
+        """
+        Identifiant de la projection dans les clés de snapshot ; doit changer
+        avec tout paramètre qui modifie l'état produit
+        """
+        return type(self).__name__
 
     def initial_state(self) -> Any:
         """Retourne l'état initial"""
@@ -369,7 +600,25 @@ class OrderProjection(Projection):
 
 
 class ProductStockProjection(Projection):
-    """Projection pour l'historique de stock d'un produit"""
+    """
+    Projection pour l'historique de stock d'un produit.
+
+    Contrat : quantity / reserved / available portent sur tout l'historique ;
+    `movements` ne contient que les `max_movements` derniers ajustements (la
+    taille de l'état et du snapshot ne croît pas avec l'historique) et
+    `movements_total` compte tous les ajustements. L'historique complet des
+    mouvements se lit avec EventStore.get_events.
+    """
+
+    MAX_MOVEMENTS = 100
+
+    def __init__(self, max_movements: int = MAX_MOVEMENTS):
+        self.max_movements = max_movements
+
+    @property
+    def name(self) -> str:
+        # Un snapshot pris avec une autre fenêtre ne serait pas équivalent
+        return f"{type(self).__name__}:{self.max_movements}"
 
     def initial_state(self) -> Dict:
         return {
@@ -378,6 +627,7 @@ class ProductStockProjection(Projection):
             'reserved': 0,
             'available': 0,
             'movements': [],
+            'movements_total': 0,
         }
 
     def apply(self, state: Dict, event: Event) -> Dict:
@@ -391,6 +641,8 @@ class ProductStockProjection(Projection):
                 'quantity': delta,
                 'timestamp': event.timestamp,
             })
+            state['movements_total'] = state.get('movements_total', 0) + 1
+            del state['movements'][:-self.max_movements]
 
         elif event.type == EventType.STOCK_RESERVED.value:
             reserved = event.data.get('quantity', 0)
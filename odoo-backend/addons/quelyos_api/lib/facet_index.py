@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Index de facettes produits par bitmaps.
+
+Chaque valeur de facette (catégorie, valeur d'attribut, tranche de prix,
+suivi de stock) est représentée par un bitmap d'ids produits (entier Python :
+bit n = produit n). Une combinaison de filtres se résout par intersection
+(&) et chaque compteur par un popcount : le coût ne dépend plus du nombre
+de variantes ni d'un parcours ORM du catalogue.
+
+Les lignes sources viennent de la table matérialisée `quelyos.product.facet`,
+maintenue à l'écriture des produits. Les index sont gardés en mémoire par
+processus et invalidés par un numéro de version (Redis) ou, à défaut, un TTL.
+"""
+
+import time
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+# Tranches de prix prédéfinies (bornes [min, max[)
+PRICE_RANGES = [
+    {'label': '0-50', 'min': 0, 'max': 50},
+    {'label': '50-100', 'min': 50, 'max': 100},
+    {'label': '100-200', 'min': 100, 'max': 200},
+    {'label': '200-500', 'min': 200, 'max': 500},
+    {'label': '500+', 'min': 500, 'max': 999999},
+]
+
+# Types de facettes
+FACET_PUBLISHED = 'published'
+FACET_CATEGORY = 'category'
+FACET_ATTRIBUTE = 'attribute'
+FACET_PRICE = 'price'
+FACET_UNTRACKED = 'untracked'  # Produit sans suivi de stock (toujours disponible)
+
+
+def price_bucket(price):
+    """Retourne le label de la tranche de prix, ou None hors tranches"""
+    for price_range in PRICE_RANGES:
+        if price_range['min'] <= (price or 0.0) < price_range['max']:
+            return price_range['label']
+    return None
+
+
+def to_bitmap(ids):
+    """Construit un bitmap à partir d'une liste d'ids (O(n), via bytearray)"""
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray((max(ids) >> 3) + 1)
+    for record_id in ids:
+        buffer[record_id >> 3] |= 1 << (record_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def iter_bitmap(bitmap):
+    """Itère sur les ids présents dans un bitmap (ordre croissant)"""
+    if not bitmap:
+        return
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) >> 3, 'little')
+    for byte_index, byte in enumerate(data):
+        if not byte:
+            continue
+        for bit in range(8):
+            if byte & (1 << bit):
+                yield (byte_index << 3) + bit
+
+
+class FacetIndex:
+    """Bitmaps de facettes d'un tenant"""
+
+    def __init__(self):
+        self.bitmaps = {}   # (facet_type, key) -> bitmap
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Construit l'index à partir de lignes (product_id, facet_type, facet_key)"""
+        index = cls()
+        ids_by_facet = {}
+        for product_id, facet_type, key in rows:
+            ids_by_facet.setdefault((facet_type, key), []).append(product_id)
+        for facet, ids in ids_by_facet.items():
+            index.bitmaps[facet] = to_bitmap(ids)
+        return index
+
+    def get(self, facet_type, key):
+        return self.bitmaps.get((facet_type, str(key)), 0)
+
+    def union(self, facet_type, keys):
+        bitmap = 0
+        for key in keys:
+            bitmap |= self.get(facet_type, key)
+        return bitmap
+
+    def candidates(self, category_id=None, attribute_value_ids=None, price_labels=None, restrict=None):
+        """
+        Produits publiés correspondant aux filtres (intersection de bitmaps).
+        Les valeurs d'un même filtre sont combinées en OU.
+
+        restrict: bitmap optionnel (ex: résultat d'une recherche texte)
+        """
+        candidate = self.get(FACET_PUBLISHED, '1')
+        if category_id:
+            candidate &= self.get(FACET_CATEGORY, category_id)
+        if attribute_value_ids:
+            candidate &= self.union(FACET_ATTRIBUTE, attribute_value_ids)
+        if price_labels:
+            candidate &= self.union(FACET_PRICE, price_labels)
+        if restrict is not None:
+            candidate &= restrict
+        return candidate
+
+    def compute_facets(self, candidate, stocked=0):
+        """
+        Compte les produits candidats par valeur de facette (popcount).
+
+        stocked: bitmap des produits ayant du stock interne
+        Returns: dict {
+            'categories': {category_id: count},
+            'attributes': {attribute_value_id: count},
+            'price_ranges': [{'label', 'min', 'max', 'count'}],
+            'in_stock': {'available': int, 'out_of_stock': int},
+        }
+        """
+        counts = {FACET_CATEGORY: {}, FACET_ATTRIBUTE: {}, FACET_PRICE: {}}
+
+        for (facet_type, key), bitmap in self.bitmaps.items():
+            if facet_type not in counts:
+                continue
+            count = (bitmap & candidate).bit_count()
+            if count:
+                counts[facet_type][key] = count
+
+        available = (candidate & (stocked | self.get(FACET_UNTRACKED, '1'))).bit_count()
+
+        return {
+            'categories': {int(key): count for key, count in counts[FACET_CATEGORY].items()},
+            'attributes': {int(key): count for key, count in counts[FACET_ATTRIBUTE].items()},
+            'price_ranges': [
+                dict(price_range, count=counts[FACET_PRICE][price_range['label']])
+                for price_range in PRICE_RANGES
+                if counts[FACET_PRICE].get(price_range['label'])
+            ],
+            'in_stock': {
+                'available': available,
+                'out_of_stock': candidate.bit_count() - available,
+            },
+        }
+
+
+class FacetIndexCache:
+    """
+    Cache processus des index par clé (base, tenant).
+    Une entrée est rechargée si sa version change ou si elle dépasse le TTL.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, version, loader):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry and entry[0] == version and now - entry[1] < self.ttl:
+            return entry[2]
+
+        index = loader()
+        with self._lock:
+            self._entries[key] = (version, now, index)
+        return index
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+# Instance partagée par le processus
+facet_index_cache = FacetIndexCache()
@@ -8,16 +8,19 @@ File d'attente pour tâches asynchrones:
 - Synchronisation de données
 - Traitements lourds
 
-Utilise Celery avec Redis comme broker.
+Files stockées dans Redis (ou en mémoire pour les tests), consommées par
+le worker multi-processus de lib/job_worker.py.
 """
 
 import os
+import time
 import logging
 import json
 from typing import Any, Dict, Optional, Callable
 from datetime import datetime, timedelta
 from functools import wraps
 from enum import Enum
+import threading
 import uuid
 
 _logger = logging.getLogger(__name__)
@@ -78,6 +81,227 @@ class JobRegistry:
 job_handler = JobRegistry.register
 
 
+# =============================================================================
+# STOCKAGE DES FILES
+# =============================================================================
+#
+# Par file `<q>` :
+#   queue:<q>             ZSET jobs prêts, score = rang de priorité puis date
+#   queue:<q>:scheduled   ZSET jobs différés / retries, score = date d'exécution
+#   queue:<q>:processing  ZSET jobs en cours, score = échéance de visibilité
+#   queue:<q>:priority    HASH job_id -> priorité
+#
+# Un job réclamé passe de `queue:<q>` à `processing` atomiquement. Si le
+# worker meurt, l'échéance de visibilité expire et le job redevient prêt.
+
+JOB_TTL = 86400 * 7
+PRIORITY_SCORE_SPAN = 10 ** 10  # > timestamp : la priorité domine, puis FIFO
+CLAIM_BATCH = 100  # Jobs différés / expirés déplacés par réclamation
+
+
+def ready_score(priority: int, timestamp: float) -> float:
+    """Score d'un job prêt : priorité décroissante, puis ancienneté"""
+    return (JobPriority.CRITICAL.value - priority) * PRIORITY_SCORE_SPAN + timestamp
+
+
+def queue_keys(queue: str):
+    """Clés Redis d'une file : (ready, scheduled, processing, priority)"""
+    base = f"{JOB_QUEUE_PREFIX}queue:{queue}"
+    return base, f"{base}:scheduled", f"{base}:processing", f"{base}:priority"
+
+
+class RedisJobBackend:
+    """Files de jobs dans Redis (réclamation atomique par script Lua)"""
+
+    CLAIM_SCRIPT = """
+    local ready, scheduled, processing, priorities = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+    local now = tonumber(ARGV[1])
+    local deadline = tonumber(ARGV[2])
+    local span = tonumber(ARGV[3])
+    local max_priority = tonumber(ARGV[4])
+    local default_priority = tonumber(ARGV[5])
+    local batch = tonumber(ARGV[6])
+
+    local function score(job_id, timestamp)
+        local priority = tonumber(redis.call('HGET', priorities, job_id)) or default_priority
+        return (max_priority - priority) * span + timestamp
+    end
+
+    -- Jobs différés arrivés à échéance
+    local due = redis.call('ZRANGEBYSCORE', scheduled, '-inf', now, 'WITHSCORES', 'LIMIT', 0, batch)
+    for i = 1, #due, 2 do
+        redis.call('ZREM', scheduled, due[i])
+        redis.call('ZADD', ready, score(due[i], tonumber(due[i + 1])), due[i])
+    end
+
+    -- Jobs dont le worker a disparu (visibilité expirée)
+    local expired = redis.call('ZRANGEBYSCORE', processing, '-inf', now, 'LIMIT', 0, batch)
+    for i = 1, #expired do
+        redis.call('ZREM', processing, expired[i])
+        redis.call('ZADD', ready, score(expired[i], now), expired[i])
+    end
+
+    local head = redis.call('ZRANGE', ready, 0, 0)
+    if #head == 0 then
+        return false
+    end
+    redis.call('ZREM', ready, head[1])
+    redis.call('ZADD', processing, deadline, head[1])
+    return head[1]
+    """
+
+    def __init__(self, redis_client):
+        self._redis = redis_client
+
+    @staticmethod
+    def _decode(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    def save_job(self, job: Dict, ttl: int = JOB_TTL):
+        self._redis.setex(f"{JOB_QUEUE_PREFIX}{job['id']}", ttl, json.dumps(job))
+
+    def load_job(self, job_id: str) -> Optional[Dict]:
+        data = self._redis.get(f"{JOB_QUEUE_PREFIX}{job_id}")
+        return json.loads(data) if data else None
+
+    def push(self, queue: str, job_id: str, priority: int, run_at: float, now: float):
+        """Ajoute un job prêt (run_at <= now) ou différé"""
+        ready, scheduled, _processing, priorities = queue_keys(queue)
+        pipe = self._redis.pipeline()
+        pipe.hset(priorities, job_id, priority)
+        if run_at > now:
+            pipe.zadd(scheduled, {job_id: run_at})
+        else:
+            pipe.zadd(ready, {job_id: ready_score(priority, run_at)})
+        pipe.execute()
+
+    def claim(self, queue: str, now: float, visibility_timeout: int) -> Optional[str]:
+        """Réclame atomiquement le job prêt le plus prioritaire"""
+        job_id = self._redis.eval(
+            self.CLAIM_SCRIPT, 4, *queue_keys(queue),
+            now, now + visibility_timeout, PRIORITY_SCORE_SPAN,
+            JobPriority.CRITICAL.value, JobPriority.NORMAL.value, CLAIM_BATCH,
+        )
+        return self._decode(job_id) if job_id else None
+
+    def extend(self, queue: str, job_id: str, deadline: float) -> bool:
+        """Repousse l'échéance de visibilité d'un job encore détenu"""
+        processing = queue_keys(queue)[2]
+        return bool(self._redis.zadd(processing, {job_id: deadline}, xx=True, ch=True))
+
+    def ack(self, queue: str, job_id: str) -> bool:
+        """Retire un job terminé ; False s'il avait déjà été repris par un autre worker"""
+        _ready, _scheduled, processing, priorities = queue_keys(queue)
+        removed = self._redis.zrem(processing, job_id)
+        self._redis.hdel(priorities, job_id)
+        return bool(removed)
+
+    def remove(self, queue: str, job_id: str) -> bool:
+        """Retire un job en attente (prêt ou différé)"""
+        ready, scheduled, _processing, priorities = queue_keys(queue)
+        pipe = self._redis.pipeline()
+        pipe.zrem(ready, job_id)
+        pipe.zrem(scheduled, job_id)
+        pipe.hdel(priorities, job_id)
+        removed_ready, removed_scheduled, _ = pipe.execute()
+        return bool(removed_ready or removed_scheduled)
+
+    def counts(self, queue: str) -> Dict[str, int]:
+        ready, scheduled, processing, _priorities = queue_keys(queue)
+        return {
+            'pending': self._redis.zcard(ready),
+            'scheduled': self._redis.zcard(scheduled),
+            'processing': self._redis.zcard(processing),
+        }
+
+
+class MemoryJobBackend:
+    """
+    Files de jobs en mémoire, même sémantique que RedisJobBackend.
+    Pour les tests et le développement local (un seul processus).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._ready = {}        # queue -> {job_id: score}
+        self._scheduled = {}    # queue -> {job_id: run_at}
+        self._processing = {}   # queue -> {job_id: deadline}
+        self._priorities = {}   # queue -> {job_id: priority}
+
+    def save_job(self, job: Dict, ttl: int = JOB_TTL):
+        with self._lock:
+            self._jobs[job['id']] = json.dumps(job)
+
+    def load_job(self, job_id: str) -> Optional[Dict]:
+        data = self._jobs.get(job_id)
+        return json.loads(data) if data else None
+
+    def push(self, queue: str, job_id: str, priority: int, run_at: float, now: float):
+        with self._lock:
+            self._priorities.setdefault(queue, {})[job_id] = priority
+            if run_at > now:
+                self._scheduled.setdefault(queue, {})[job_id] = run_at
+            else:
+                self._ready.setdefault(queue, {})[job_id] = ready_score(priority, run_at)
+
+    def claim(self, queue: str, now: float, visibility_timeout: int) -> Optional[str]:
+        with self._lock:
+            ready = self._ready.setdefault(queue, {})
+            scheduled = self._scheduled.setdefault(queue, {})
+            processing = self._processing.setdefault(queue, {})
+            priorities = self._priorities.setdefault(queue, {})
+
+            def score(job_id, timestamp):
+                return ready_score(priorities.get(job_id, JobPriority.NORMAL.value), timestamp)
+
+            for job_id, run_at in sorted(scheduled.items(), key=lambda item: item[1])[:CLAIM_BATCH]:
+                if run_at > now:
+                    break
+                del scheduled[job_id]
+                ready[job_id] = score(job_id, run_at)
+
+            for job_id, deadline in sorted(processing.items(), key=lambda item: item[1])[:CLAIM_BATCH]:
+                if deadline > now:
+                    break
+                del processing[job_id]
+                ready[job_id] = score(job_id, now)
+
+            if not ready:
+                return None
+            job_id = min(ready, key=lambda key: (ready[key], key))
+            del ready[job_id]
+            processing[job_id] = now + visibility_timeout
+            return job_id
+
+    def extend(self, queue: str, job_id: str, deadline: float) -> bool:
+        with self._lock:
+            processing = self._processing.setdefault(queue, {})
+            if job_id not in processing:
+                return False
+            processing[job_id] = deadline
+            return True
+
+    def ack(self, queue: str, job_id: str) -> bool:
+        with self._lock:
+            self._priorities.setdefault(queue, {}).pop(job_id, None)
+            return self._processing.setdefault(queue, {}).pop(job_id, None) is not None
+
+    def remove(self, queue: str, job_id: str) -> bool:
+        with self._lock:
+            self._priorities.setdefault(queue, {}).pop(job_id, None)
+            removed_ready = self._ready.setdefault(queue, {}).pop(job_id, None)
+            removed_scheduled = self._scheduled.setdefault(queue, {}).pop(job_id, None)
+            return removed_ready is not None or removed_scheduled is not None
+
+    def counts(self, queue: str) -> Dict[str, int]:
+        return {
+            'pending': len(self._ready.get(queue, {})),
+            'scheduled': len(self._scheduled.get(queue, {})),
+            'processing': len(self._processing.get(queue, {})),
+        }
+
+
 # =============================================================================
 # JOB QUEUE SERVICE
 # =============================================================================
@@ -85,6 +309,7 @@ job_handler = JobRegistry.register
 class JobQueue:
     """
     Service de file d'attente de jobs.
+    Les jobs sont consommés par lib/job_worker.py (scripts/job-worker.py).
 
     Usage:
         queue = JobQueue()
@@ -101,11 +326,16 @@ class JobQueue:
 
         # Annuler un job
         queue.cancel(job_id)
+
+        # Tests : files en mémoire
+        queue = JobQueue(backend=MemoryJobBackend())
     """
 
-    def __init__(self):
+    def __init__(self, backend=None):
         self._redis = None
-        self._init_redis()
+        self._backend = backend
+        if backend is None:
+            self._init_redis()
 
     def _init_redis(self):
         """Initialise la connexion Redis"""
@@ -113,11 +343,16 @@ class JobQueue:
             import redis
             self._redis = redis.from_url(REDIS_URL)
             self._redis.ping()
+            self._backend = RedisJobBackend(self._redis)
             _logger.info("Job queue connected to Redis")
         except Exception as e:
             _logger.warning(f"Redis not available for job queue: {e}")
             self._redis = None
 
+    @property
+    def backend(self):
+        return self._backend
+
     def enqueue(
         self,
         job_type: str,
@@ -144,6 +379,7 @@ class JobQueue:
             ID du job créé
         """
         job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
 
         job_data = {
             'id': job_id,
@@ -151,25 +387,21 @@ class JobQueue:
             'payload': payload,
             'priority': priority.value,
             'status': JobStatus.PENDING.value,
-            'created_at': datetime.utcnow().isoformat(),
-            'scheduled_at': (datetime.utcnow() + timedelta(seconds=delay)).isoformat(),
+            'created_at': now.isoformat(),
+            'scheduled_at': (now + timedelta(seconds=delay)).isoformat(),
             'max_retries': max_retries,
             'retry_count': 0,
+            'attempts': 0,
             'timeout': timeout,
             'queue': queue,
             'result': None,
             'error': None,
         }
 
-        if self._redis:
-            # Stocker le job
-            key = f"{JOB_QUEUE_PREFIX}{job_id}"
-            self._redis.setex(key, 86400 * 7, json.dumps(job_data))  # TTL 7 jours
-
-            # Ajouter à la file avec score = timestamp + (100 - priority)
-            score = datetime.utcnow().timestamp() + delay - priority.value
-            self._redis.zadd(f"{JOB_QUEUE_PREFIX}queue:{queue}", {job_id: score})
-
+        if self._backend:
+            self._backend.save_job(job_data)
+            timestamp = time.time()
+            self._backend.push(queue, job_id, priority.value, timestamp + delay, timestamp)
             _logger.info(f"Job enqueued: {job_id} ({job_type})")
         else:
             # Fallback: exécution synchrone
@@ -180,19 +412,13 @@ class JobQueue:
 
     def get_status(self, job_id: str) -> Optional[Dict]:
         """Récupère le statut d'un job"""
-        if not self._redis:
+        if not self._backend:
             return None
-
-        key = f"{JOB_QUEUE_PREFIX}{job_id}"
-        data = self._redis.get(key)
-
-        if data:
-            return json.loads(data)
-        return None
+        return self._backend.load_job(job_id)
 
     def cancel(self, job_id: str) -> bool:
         """Annule un job en attente"""
-        if not self._redis:
+        if not self._backend:
             return False
 
         job = self.get_status(job_id)
@@ -202,21 +428,22 @@ class JobQueue:
         if job['status'] not in [JobStatus.PENDING.value, JobStatus.RETRYING.value]:
             return False
 
-        # Mettre à jour le statut
+        # Retirer de la file (échoue si un worker vient de le réclamer)
+        if not self._backend.remove(job['queue'], job_id):
+            return False
+
         job['status'] = JobStatus.CANCELLED.value
         job['cancelled_at'] = datetime.utcnow().isoformat()
-
-        key = f"{JOB_QUEUE_PREFIX}{job_id}"
-        self._redis.setex(key, 86400, json.dumps(job))
-
-        # Retirer de la file
-        self._redis.zrem(f"{JOB_QUEUE_PREFIX}queue:{job['queue']}", job_id)
+        self._backend.save_job(job, ttl=86400)
 
         _logger.info(f"Job cancelled: {job_id}")
         return True
 
     def retry(self, job_id: str) -> bool:
         """Remet un job échoué en file d'attente"""
+        if not self._backend:
+            return False
+
         job = self.get_status(job_id)
         if not job:
             return False
@@ -227,31 +454,27 @@ class JobQueue:
         # Remettre en file
         job['status'] = JobStatus.PENDING.value
         job['retry_count'] = 0
+        job['attempts'] = 0
         job['error'] = None
+        self._backend.save_job(job)
 
-        key = f"{JOB_QUEUE_PREFIX}{job_id}"
-        self._redis.setex(key, 86400 * 7, json.dumps(job))
-
-        score = datetime.utcnow().timestamp()
-        self._redis.zadd(f"{JOB_QUEUE_PREFIX}queue:{job['queue']}", {job_id: score})
-
+        now = time.time()
+        self._backend.push(job['queue'], job_id, job['priority'], now, now)
         return True
 
     def get_queue_stats(self, queue: str = 'default') -> Dict:
         """Récupère les statistiques de la file"""
-        if not self._redis:
+        if not self._backend:
             return {'error': 'Redis unavailable'}
 
-        queue_key = f"{JOB_QUEUE_PREFIX}queue:{queue}"
-
-        return {
-            'queue': queue,
-            'pending': self._redis.zcard(queue_key),
-            'timestamp': datetime.utcnow().isoformat(),
-        }
+        return dict(
+            self._backend.counts(queue),
+            queue=queue,
+            timestamp=datetime.utcnow().isoformat(),
+        )
 
     def _execute_job(self, job_data: Dict) -> bool:
-        """Exécute un job (appelé par le worker)"""
+        """Exécute un job de manière synchrone (fallback sans Redis)"""
         job_type = job_data['type']
         handler = JobRegistry.get_handler(job_type)
 
@@ -260,7 +483,7 @@ class JobQueue:
             return False
 
         try:
-            result = handler(job_data['payload'])
+            result = call_handler(handler, job_data['payload'])
             job_data['status'] = JobStatus.COMPLETED.value
             job_data['result'] = result
             job_data['completed_at'] = datetime.utcnow().isoformat()
@@ -269,14 +492,15 @@ class JobQueue:
         except Exception as e:
             _logger.error(f"Job {job_data['id']} failed: {e}")
             job_data['error'] = str(e)
+            job_data['status'] = JobStatus.FAILED.value
+            return False
 
-            if job_data['retry_count'] < job_data['max_retries']:
-                job_data['status'] = JobStatus.RETRYING.value
-                job_data['retry_count'] += 1
-            else:
-                job_data['status'] = JobStatus.FAILED.value
 
-            return False
+def call_handler(handler: Callable, payload: Dict) -> Any:
+    """Appelle un handler (payload args/kwargs issu de @async_job, ou dict brut)"""
+    if isinstance(payload, dict) and set(payload) == {'args', 'kwargs'}:
+        return handler(*payload['args'], **payload['kwargs'])
+    return handler(payload)
 
 
 # =============================================================================
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Worker de jobs Quelyos ERP
+
+Consomme les files de lib/job_queue.py hors des workers HTTP :
+- Processus séparés, concurrence configurable par file
+- Réclamation atomique du job prêt le plus prioritaire
+- Retries différés avec backoff exponentiel (+ jitter)
+- Échéance de visibilité : un job détenu par un worker mort est repris
+- Arrêt propre : SIGTERM/SIGINT terminent les jobs en cours
+
+Garantie de livraison "au moins une fois" : un handler peut être rejoué
+après un crash, il doit donc être idempotent.
+
+Usage:
+    python scripts/job-worker.py --queue default:4 --queue reports:2
+"""
+
+import os
+import time
+import random
+import signal
+import logging
+import threading
+import multiprocessing
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+try:
+    from .job_queue import JobRegistry, JobStatus, RedisJobBackend, call_handler, REDIS_URL
+except ImportError:  # Chargé hors Odoo par scripts/job-worker.py
+    from job_queue import JobRegistry, JobStatus, RedisJobBackend, call_handler, REDIS_URL
+
+_logger = logging.getLogger(__name__)
+
+# Configuration
+POLL_INTERVAL = float(os.environ.get('QUELYOS_JOB_POLL_INTERVAL', 1.0))
+VISIBILITY_GRACE = 30           # Marge au-delà du timeout du job (secondes)
+RETRY_BACKOFF_BASE = 30         # 30s, 60s, 120s...
+RETRY_BACKOFF_MAX = 3600
+SHUTDOWN_TIMEOUT = 60           # Délai accordé aux jobs en cours à l'arrêt
+
+
+class JobTimeout(Exception):
+    """Job interrompu : durée d'exécution dépassée"""
+
+
+class JobAbandoned(Exception):
+    """Job non rejouable (handler inconnu, crashs worker répétés)"""
+
+
+def retry_delay(retry_count: int) -> float:
+    """Délai avant la tentative `retry_count` (backoff exponentiel plafonné, jitter ±20%)"""
+    delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** max(0, retry_count - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def redis_backend_factory(redis_url: str = REDIS_URL):
+    """Fabrique de backend Redis (une connexion par processus)"""
+    def factory():
+        import redis
+        return RedisJobBackend(redis.from_url(redis_url))
+    return factory
+
+
+# =============================================================================
+# WORKER (UN PROCESSUS, UN JOB À LA FOIS)
+# =============================================================================
+
+class JobWorker:
+    """
+    Consomme une file. Utilisable directement (tests, --once) ou dans un
+    processus lancé par WorkerSupervisor.
+    """
+
+    def __init__(self, queue: str, backend, handlers: Optional[Dict[str, Callable]] = None,
+                 clock: Callable[[], float] = time.time):
+        self.queue = queue
+        self.backend = backend
+        self.handlers = handlers if handlers is not None else JobRegistry._handlers
+        self.clock = clock
+        self.stopping = False
+
+    def run(self):
+        """Boucle de consommation jusqu'à demande d'arrêt"""
+        _logger.info(f"Worker {os.getpid()} consuming queue '{self.queue}'")
+        while not self.stopping:
+            try:
+                if not self.run_once():
+                    time.sleep(POLL_INTERVAL)
+            except Exception as e:
+                _logger.error(f"Worker error on queue '{self.queue}': {e}", exc_info=True)
+                time.sleep(POLL_INTERVAL)
+        _logger.info(f"Worker {os.getpid()} stopped")
+
+    def run_once(self) -> bool:
+        """Réclame et exécute un job. Retourne False si la file est vide."""
+        now = self.clock()
+        job_id = self.backend.claim(self.queue, now, VISIBILITY_GRACE)
+        if not job_id:
+            return False
+
+        job = self.backend.load_job(job_id)
+        if not job or job['status'] == JobStatus.CANCELLED.value:
+            self.backend.ack(self.queue, job_id)
+            return True
+
+        # Visibilité portée à la durée maximale du job
+        timeout = job.get('timeout') or 300
+        self.backend.extend(self.queue, job_id, now + timeout + VISIBILITY_GRACE)
+        self.process_job(job, timeout)
+        return True
+
+    def process_job(self, job: Dict, timeout: int):
+        job_id = job['id']
+        job['attempts'] = job.get('attempts', 0) + 1
+        job['status'] = JobStatus.RUNNING.value
+        job['started_at'] = datetime.utcnow().isoformat()
+        job['worker_pid'] = os.getpid()
+        self.backend.save_job(job)
+
+        handler = self.handlers.get(job['type'])
+        try:
+            if not handler:
+                raise JobAbandoned(f"No handler for job type: {job['type']}")
+            # Job déjà livré puis perdu (crash worker) trop de fois
+            if job['attempts'] > job['max_retries'] + 1:
+                raise JobAbandoned("Job abandoned after repeated worker crashes")
+            result = self._run_with_timeout(handler, job['payload'], timeout)
+        except Exception as e:
+            self._handle_failure(job, e, retryable=not isinstance(e, JobAbandoned))
+            return
+
+        job['status'] = JobStatus.COMPLETED.value
+        job['result'] = result
+        job['error'] = None
+        job['completed_at'] = datetime.utcnow().isoformat()
+        if not self.backend.ack(self.queue, job_id):
+            _logger.warning(f"Job {job_id} completed after its visibility timeout (may run twice)")
+        self.backend.save_job(job)
+        _logger.info(f"Job {job_id} ({job['type']}) completed")
+
+    def _handle_failure(self, job: Dict, error: Exception, retryable: bool = True):
+        job_id = job['id']
+        job['error'] = str(error)
+        self.backend.ack(self.queue, job_id)
+
+        if retryable and job['retry_count'] < job['max_retries']:
+            job['retry_count'] += 1
+            delay = retry_delay(job['retry_count'])
+            run_at = self.clock() + delay
+            job['status'] = JobStatus.RETRYING.value
+            job['scheduled_at'] = datetime.utcfromtimestamp(run_at).isoformat()
+            self.backend.save_job(job)
+            self.backend.push(self.queue, job_id, job['priority'], run_at, self.clock())
+            _logger.warning(f"Job {job_id} failed ({error}), retry {job['retry_count']} in {delay:.0f}s")
+        else:
+            job['status'] = JobStatus.FAILED.value
+            job['completed_at'] = datetime.utcnow().isoformat()
+            self.backend.save_job(job)
+            _logger.error(f"Job {job_id} failed permanently: {error}")
+
+    def _run_with_timeout(self, handler: Callable, payload: Dict, timeout: int):
+        # SIGALRM n'est disponible que dans le thread principal ; ailleurs
+        # (tests, threads) l'échéance de visibilité sert de garde-fou.
+        if threading.current_thread() is not threading.main_thread() or not hasattr(signal, 'SIGALRM'):
+            return call_handler(handler, payload)
+
+        def on_timeout(signum, frame):
+            raise JobTimeout(f"Job exceeded {timeout}s")
+
+        previous = signal.signal(signal.SIGALRM, on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return call_handler(handler, payload)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+# =============================================================================
+# SUPERVISEUR (PROCESSUS PAR FILE)
+# =============================================================================
+
+def _worker_main(queue: str, backend_factory: Callable):
+    """Point d'entrée d'un processus worker"""
+    worker = JobWorker(queue, backend_factory())
+
+    def stop(signum, frame):
+        worker.stopping = True
+
+    # Le job en cours se termine ; SIGINT (Ctrl+C) est géré par le superviseur
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker.run()
+
+
+class WorkerSupervisor:
+    """
+    Lance `concurrency` processus par file, les relance s'ils meurent et
+    orchestre l'arrêt propre.
+
+    Usage:
+        WorkerSupervisor({'default': 4, 'reports': 2}).run()
+    """
+
+    def __init__(self, queues: Dict[str, int], backend_factory: Optional[Callable] = None,
+                 shutdown_timeout: int = SHUTDOWN_TIMEOUT):
+        self.queues = queues
+        self.backend_factory = backend_factory or redis_backend_factory()
+        self.shutdown_timeout = shutdown_timeout
+        self.running = False
+        self._context = multiprocessing.get_context('fork')
+        self._processes = []  # [(queue, Process)]
+
+    def _spawn(self, queue: str):
+        process = self._context.Process(
+            target=_worker_main, args=(queue, self.backend_factory),
+            name=f'quelyos-job-worker-{queue}', daemon=False,
+        )
+        process.start()
+        return process
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_shutdown)
+        signal.signal(signal.SIGINT, self._handle_shutdown)
+
+        self.running = True
+        for queue, concurrency in self.queues.items():
+            for _ in range(concurrency):
+                self._processes.append((queue, self._spawn(queue)))
+        _logger.info(f"Job workers started: {self.queues}")
+
+        while self.running:
+            for index, (queue, process) in enumerate(self._processes):
+                if not process.is_alive() and self.running:
+                    _logger.warning(f"Worker {process.pid} ({queue}) exited with {process.exitcode}, respawning")
+                    self._processes[index] = (queue, self._spawn(queue))
+            time.sleep(POLL_INTERVAL)
+
+        self._shutdown()
+
+    def _handle_shutdown(self, signum, frame):
+        _logger.info("Shutdown signal received, finishing current jobs...")
+        self.running = False
+
+    def _shutdown(self):
+        for _queue, process in self._processes:
+            if process.is_alive():
+                process.terminate()  # SIGTERM : fin du job en cours
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        for _queue, process in self._processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                # Job non terminé : repris par un autre worker après l'échéance de visibilité
+                _logger.warning(f"Worker {process.pid} did not stop in time, killing")
+                process.kill()
+                process.join()
+        _logger.info("Job workers stopped")
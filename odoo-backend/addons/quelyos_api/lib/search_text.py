@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Normalisation et construction des requêtes de recherche produits.
+
+Les documents indexés (product.template.x_search_document) et les termes
+saisis passent par la même normalisation (minuscules, sans accents) : la
+recherche PostgreSQL n'a besoin ni de l'extension unaccent ni d'un
+dictionnaire de langue, et les index restent utilisables tels quels.
+"""
+
+import re
+import unicodedata
+
+# Dictionnaire de synonymes français (clés et valeurs normalisées)
+SYNONYMS = {
+    'telephone': ['smartphone', 'mobile', 'portable', 'gsm', 'iphone', 'samsung'],
+    'smartphone': ['telephone', 'mobile', 'portable', 'gsm'],
+    'ordinateur': ['pc', 'laptop', 'portable', 'ordi', 'macbook', 'chromebook'],
+    'pc': ['ordinateur', 'laptop', 'desktop'],
+    'ecouteurs': ['casque', 'airpods', 'earbuds', 'audio'],
+    'casque': ['ecouteurs', 'headphones', 'audio'],
+    'montre': ['smartwatch', 'bracelet', 'connectee'],
+    'tablette': ['ipad', 'tab', 'slate'],
+    'television': ['tv', 'ecran', 'tele'],
+    'tv': ['television', 'ecran', 'tele'],
+    'chaussures': ['sneakers', 'baskets', 'tennis', 'souliers'],
+    'vetements': ['habits', 'fringues', 'textile'],
+    'sac': ['sacoche', 'valise', 'bagage'],
+    'accessoires': ['bijoux', 'montres', 'ceintures'],
+    'beaute': ['cosmetiques', 'maquillage', 'soins'],
+    'enfant': ['bebe', 'junior', 'kids'],
+    'femme': ['feminin', 'ladies', 'dame'],
+    'homme': ['masculin', 'men', 'monsieur'],
+    'sport': ['fitness', 'gym', 'running', 'athletisme'],
+    'maison': ['deco', 'decoration', 'interieur', 'meuble'],
+    'cuisine': ['cuisson', 'electromenager', 'ustensiles'],
+    'jardin': ['exterieur', 'plantes', 'terrasse'],
+    'pas cher': ['discount', 'promo', 'soldes', 'economique', 'abordable'],
+    'luxe': ['premium', 'haut de gamme', 'prestige'],
+    'nouveau': ['nouveaute', 'recent', 'dernier'],
+}
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize_text(text):
+    """Minuscules, sans accents, espaces réduits"""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+def tokenize(text):
+    """Mots alphanumériques d'un texte normalisé"""
+    return _WORD_RE.findall(normalize_text(text))
+
+
+def expand_synonyms(query):
+    """
+    Synonymes de la requête (hors requête elle-même).
+    Une clé présente dans la requête apporte ses synonymes ; un synonyme
+    présent apporte sa clé et les autres synonymes de la clé.
+    """
+    query = normalize_text(query)
+    words = set(tokenize(query))
+
+    def contains(term):
+        # Terme multi-mots : sous-chaîne ; sinon mot entier
+        return term in query if ' ' in term else term in words
+
+    expanded = []
+    for key, synonyms in SYNONYMS.items():
+        if contains(key):
+            expanded.extend(synonyms)
+        for synonym in synonyms:
+            if contains(synonym):
+                expanded.append(key)
+                expanded.extend(s for s in synonyms if s != synonym)
+
+    seen = {query}
+    result = []
+    for term in expanded:
+        if term not in seen:
+            seen.add(term)
+            result.append(term)
+    return result
+
+
+def build_tsquery(query, synonyms=()):
+    """
+    Construit une expression to_tsquery('simple', ...) :
+    les mots de la requête en ET avec préfixe (saisie en cours),
+    chaque synonyme en OU (phrase pour les synonymes multi-mots).
+
+    Returns: str ('' si aucun mot exploitable)
+    """
+    alternatives = []
+    words = tokenize(query)
+    if words:
+        alternatives.append(' & '.join(f'{word}:*' for word in words))
+    for synonym in synonyms:
+        synonym_words = tokenize(synonym)
+        if synonym_words:
+            alternatives.append(' <-> '.join(synonym_words))
+    return ' | '.join(f'({alternative})' for alternative in alternatives)
@@ -6,18 +6,22 @@ Permet d'envoyer des notifications webhook aux systèmes externes lors
 d'événements métier (commande créée, paiement reçu, stock mis à jour, etc.)
 
 Features:
-- Retry automatique avec exponential backoff
+- Livraison par le worker de jobs (emit ne bloque pas)
+- Retries planifiés dans Redis avec exponential backoff
+- Connexions HTTP keep-alive poolées par hôte
+- Concurrence limitée et envoi par lots par abonné
 - Signature HMAC pour sécurité
-- Queue asynchrone
-- Logging des tentatives
+- Historique des livraisons persistant (streams Redis)
 """
 
 import os
 import json
+import time
+import uuid
 import hmac
 import hashlib
 import logging
-import time
+from collections import deque
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 from dataclasses import dataclass, asdict
@@ -25,12 +29,19 @@ from functools import wraps
 from concurrent.futures import ThreadPoolExecutor
 import threading
 
+try:
+    from .job_queue import job_handler, get_job_queue, REDIS_URL
+except ImportError:  # Chargé hors Odoo par scripts/job-worker.py
+    from job_queue import job_handler, get_job_queue, REDIS_URL
+
 _logger = logging.getLogger(__name__)
 
 # Configuration
 WEBHOOK_TIMEOUT = int(os.environ.get('WEBHOOK_TIMEOUT', 10))
 WEBHOOK_MAX_RETRIES = int(os.environ.get('WEBHOOK_MAX_RETRIES', 5))
 WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', 'quelyos-webhook-secret')
+WEBHOOK_POOL_HOSTS = int(os.environ.get('WEBHOOK_POOL_HOSTS', 50))   # Hôtes gardés en pool
+WEBHOOK_POOL_SIZE = int(os.environ.get('WEBHOOK_POOL_SIZE', 10))     # Connexions par hôte
 
 
 # =============================================================================
@@ -49,7 +60,6 @@ class WebhookEvent:
         if self.timestamp is None:
             self.timestamp = datetime.utcnow().isoformat() + 'Z'
         if self.event_id is None:
-            import uuid
             self.event_id = str(uuid.uuid4())
 
     def to_dict(self) -> Dict:
@@ -68,6 +78,8 @@ class WebhookSubscription:
     secret: str = None
     active: bool = True
     headers: Dict[str, str] = None
+    max_concurrency: int = 2  # Livraisons simultanées max vers cet abonné
+    batch_size: int = 1       # > 1 : événements groupés {"events": [...]}
 
     def matches_event(self, event_type: str) -> bool:
         """Vérifie si cet abonnement correspond à l'événement"""
@@ -98,6 +110,8 @@ class WebhookDelivery:
     attempts: int = 0
     delivered_at: str = None
     success: bool = False
+    retryable: bool = False
+    event_count: int = 1
 
 
 # =============================================================================
@@ -136,43 +150,153 @@ class WebhookEvents:
 # =============================================================================
 # SERVICE WEBHOOK
 # =============================================================================
+#
+# Pipeline (Redis + lib/job_queue, file `webhooks`) :
+#   emit()            -> événement ajouté à webhooks:pending:{sub}, job `webhook_flush`
+#   webhook_flush     -> lots de batch_size événements -> jobs `webhook_deliver`
+#   webhook_deliver   -> POST via session HTTP poolée ; 5xx/timeout : exception,
+#                        le job est replanifié par le worker (backoff durable)
+#
+# Abonnements, files d'attente et historique sont dans Redis : ils sont
+# partagés entre workers HTTP et processus worker. Sans Redis, livraison
+# directe en une tentative (développement).
+
+WEBHOOK_QUEUE = 'webhooks'
+WEBHOOK_BATCH_WINDOW = 1            # Secondes d'accumulation avant envoi d'un lot
+WEBHOOK_HISTORY_MAX = 100000        # Entrées conservées dans l'historique global
+WEBHOOK_SUBSCRIPTION_HISTORY_MAX = 1000
+WEBHOOK_SLOT_RETRY_DELAY = 2        # Secondes avant nouvel essai si l'abonné est saturé
+WEBHOOK_MAX_DEFERRALS = int(os.environ.get('WEBHOOK_MAX_DEFERRALS', 30))  # Report max avant retry compté
+WEBHOOK_KEY_PREFIX = 'quelyos:webhooks:'
+
+
+class WebhookDeliveryError(Exception):
+    """Échec temporaire de livraison (5xx, timeout, connexion) : à retenter"""
+
+
+_http_session = None
+_http_session_pid = None
+
+
+def get_http_session():
+    """
+    Session HTTP du processus : connexions keep-alive poolées par hôte.
+    Recréée après un fork (les sockets ne se partagent pas entre processus).
+    """
+    global _http_session, _http_session_pid
+    if _http_session is None or _http_session_pid != os.getpid():
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=WEBHOOK_POOL_HOSTS, pool_maxsize=WEBHOOK_POOL_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _http_session, _http_session_pid = session, os.getpid()
+    return _http_session
+
 
 class WebhookService:
     """Service de gestion des webhooks"""
 
-    def __init__(self):
+    # Slots de livraison : ZSET inflight:{sub}, membre = bail, score = échéance.
+    # Les bails échus (worker mort en cours de livraison) sont purgés avant
+    # le comptage : un slot perdu se libère seul, même sous trafic continu.
+    SLOT_SCRIPT = """
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+    if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+        return 0
+    end
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+    """
+
+    def __init__(self, redis_client=None, job_queue=None, key_prefix=WEBHOOK_KEY_PREFIX, clock=time.time):
+        self._key_prefix = key_prefix
+        self._clock = clock
         self._subscriptions: Dict[int, WebhookSubscription] = {}
-        self._executor = ThreadPoolExecutor(max_workers=5)
-        self._deliveries: List[WebhookDelivery] = []
         self._lock = threading.Lock()
+        self._redis = redis_client
+        self._job_queue = job_queue
+        # Sans Redis : livraison directe et historique en mémoire
+        self._executor = None
+        self._deliveries = deque(maxlen=WEBHOOK_SUBSCRIPTION_HISTORY_MAX)
+        if redis_client is None:
+            self._init_redis()
+
+    def _init_redis(self):
+        """Initialise la connexion Redis"""
+        try:
+            import redis
+            self._redis = redis.from_url(REDIS_URL)
+            self._redis.ping()
+            _logger.info("Webhook service connected to Redis")
+        except Exception as e:
+            _logger.warning(f"Redis not available for webhooks, direct delivery: {e}")
+            self._redis = None
+            self._executor = ThreadPoolExecutor(max_workers=5)
+
+    def _key(self, *parts) -> str:
+        return self._key_prefix + ':'.join(str(part) for part in parts)
+
+    def _get_job_queue(self):
+        if self._job_queue is None:
+            self._job_queue = get_job_queue()
+        return self._job_queue
+
+    # -------------------------------------------------------------------------
+    # Abonnements
+    # -------------------------------------------------------------------------
 
     def register_subscription(self, subscription: WebhookSubscription) -> None:
         """Enregistre un abonnement webhook"""
         with self._lock:
             self._subscriptions[subscription.id] = subscription
-            _logger.info(f"Webhook subscription registered: {subscription.id} -> {subscription.url}")
+        if self._redis:
+            self._redis.hset(self._key('subscriptions'), subscription.id, json.dumps(asdict(subscription)))
+        _logger.info(f"Webhook subscription registered: {subscription.id} -> {subscription.url}")
 
     def unregister_subscription(self, subscription_id: int) -> None:
         """Supprime un abonnement"""
         with self._lock:
-            if subscription_id in self._subscriptions:
-                del self._subscriptions[subscription_id]
-                _logger.info(f"Webhook subscription unregistered: {subscription_id}")
+            self._subscriptions.pop(subscription_id, None)
+        if self._redis:
+            self._redis.hdel(self._key('subscriptions'), subscription_id)
+        _logger.info(f"Webhook subscription unregistered: {subscription_id}")
+
+    def get_subscription(self, subscription_id: int) -> Optional[WebhookSubscription]:
+        if self._redis:
+            data = self._redis.hget(self._key('subscriptions'), subscription_id)
+            return WebhookSubscription(**json.loads(data)) if data else None
+        with self._lock:
+            return self._subscriptions.get(subscription_id)
 
     def get_subscriptions(self, event_type: str) -> List[WebhookSubscription]:
         """Récupère les abonnements correspondant à un événement"""
-        with self._lock:
-            return [s for s in self._subscriptions.values() if s.matches_event(event_type)]
-
-    def emit(self, event: WebhookEvent) -> List[WebhookDelivery]:
+        if self._redis:
+            subscriptions = [
+                WebhookSubscription(**json.loads(data))
+                for data in self._redis.hvals(self._key('subscriptions'))
+            ]
+        else:
+            with self._lock:
+                subscriptions = list(self._subscriptions.values())
+        return [s for s in subscriptions if s.matches_event(event_type)]
+
+    # -------------------------------------------------------------------------
+    # Émission
+    # -------------------------------------------------------------------------
+
+    def emit(self, event: WebhookEvent) -> List[int]:
         """
-        Émet un événement vers tous les abonnements correspondants.
+        Met l'événement en file pour tous les abonnements correspondants.
+        Ne bloque pas : la livraison est faite par le worker de jobs.
 
         Args:
             event: L'événement à émettre
 
         Returns:
-            Liste des résultats de livraison
+            IDs des abonnements concernés
         """
         subscriptions = self.get_subscriptions(event.event_type)
 
@@ -182,116 +306,189 @@ class WebhookService:
 
         _logger.info(f"Emitting {event.event_type} to {len(subscriptions)} subscribers")
 
-        # Livrer de manière asynchrone
-        futures = []
         for subscription in subscriptions:
-            future = self._executor.submit(
-                self._deliver_with_retry,
-                subscription,
-                event
+            if not self._redis:
+                self._executor.submit(self.deliver, subscription, [event.to_dict()], 1)
+                continue
+
+            self._redis.rpush(self._key('pending', subscription.id), event.to_json())
+            # Un seul job de vidage planifié à la fois par abonnement
+            if self._redis.set(self._key('flush_scheduled', subscription.id), 1, nx=True, ex=3600):
+                self._get_job_queue().enqueue(
+                    'webhook_flush', {'subscription_id': subscription.id},
+                    delay=WEBHOOK_BATCH_WINDOW if subscription.batch_size > 1 else 0,
+                    queue=WEBHOOK_QUEUE, max_retries=0,
+                )
+
+        return [subscription.id for subscription in subscriptions]
+
+    def emit_async(self, event: WebhookEvent) -> None:
+        """Émet un événement (alias : emit ne bloque plus)"""
+        self.emit(event)
+
+    def flush(self, subscription_id: int) -> int:
+        """Découpe les événements en attente en lots, un job de livraison par lot"""
+        subscription = self.get_subscription(subscription_id)
+        self._redis.delete(self._key('flush_scheduled', subscription_id))
+        pending_key = self._key('pending', subscription_id)
+        if not subscription:
+            self._redis.delete(pending_key)
+            return 0
+
+        batches = 0
+        while True:
+            pipe = self._redis.pipeline()
+            pipe.lrange(pending_key, 0, subscription.batch_size - 1)
+            pipe.ltrim(pending_key, subscription.batch_size, -1)
+            events, _ = pipe.execute()
+            if not events:
+                return batches
+            self._get_job_queue().enqueue(
+                'webhook_deliver',
+                {'subscription_id': subscription_id, 'events': [json.loads(data) for data in events]},
+                queue=WEBHOOK_QUEUE, max_retries=WEBHOOK_MAX_RETRIES, timeout=WEBHOOK_TIMEOUT * 3,
             )
-            futures.append(future)
+            batches += 1
 
-        # Collecter les résultats
-        deliveries = []
-        for future in futures:
-            try:
-                delivery = future.result(timeout=60)
-                deliveries.append(delivery)
-            except Exception as e:
-                _logger.error(f"Webhook delivery failed: {e}")
+    # -------------------------------------------------------------------------
+    # Livraison
+    # -------------------------------------------------------------------------
 
-        return deliveries
+    def _acquire_slot(self, subscription: WebhookSubscription) -> Optional[str]:
+        """
+        Limite de livraisons simultanées par abonné : bail expirant par livraison.
 
-    def emit_async(self, event: WebhookEvent) -> None:
-        """Émet un événement de manière asynchrone (fire and forget)"""
-        self._executor.submit(self.emit, event)
-
-    def _deliver_with_retry(
-        self,
-        subscription: WebhookSubscription,
-        event: WebhookEvent
-    ) -> WebhookDelivery:
-        """Livre un webhook avec retry automatique"""
+        Returns:
+            Jeton du bail, None si l'abonné est saturé
+        """
+        lease = str(uuid.uuid4())
+        now = self._clock()
+        lease_time = WEBHOOK_TIMEOUT * 3
+        acquired = self._redis.eval(
+            self.SLOT_SCRIPT, 1, self._key('inflight', subscription.id),
+            now, now + lease_time, subscription.max_concurrency, lease, lease_time * 2,
+        )
+        return lease if acquired else None
+
+    def _release_slot(self, subscription: WebhookSubscription, lease: str):
+        self._redis.zrem(self._key('inflight', subscription.id), lease)
+
+    def deliver_job(self, subscription_id: int, events: List[Dict], attempt: int = 1, deferrals: int = 0) -> Dict:
+        """Livraison d'un lot depuis le worker (concurrence limitée par abonné)"""
+        subscription = self.get_subscription(subscription_id)
+        if not subscription or not subscription.active:
+            return {'skipped': True}
+
+        lease = self._acquire_slot(subscription)
+        if not lease:
+            if deferrals >= WEBHOOK_MAX_DEFERRALS:
+                # Saturation durable : le worker replanifie avec backoff et
+                # décompte une tentative (max_retries borne l'ensemble)
+                raise WebhookDeliveryError(
+                    f"Subscriber {subscription_id} saturated after {deferrals} deferrals"
+                )
+            # Abonné saturé : replanifié sans consommer de tentative
+            self._get_job_queue().enqueue(
+                'webhook_deliver',
+                {'subscription_id': subscription_id, 'events': events,
+                 'attempt': attempt, 'deferrals': deferrals + 1},
+                delay=WEBHOOK_SLOT_RETRY_DELAY, queue=WEBHOOK_QUEUE,
+                max_retries=WEBHOOK_MAX_RETRIES, timeout=WEBHOOK_TIMEOUT * 3,
+            )
+            return {'deferred': True}
+
+        try:
+            delivery = self.deliver(subscription, events, attempt)
+        finally:
+            self._release_slot(subscription, lease)
+
+        if not delivery.success and delivery.retryable:
+            raise WebhookDeliveryError(delivery.error)
+        return {'success': delivery.success, 'status_code': delivery.status_code}
+
+    def deliver(self, subscription: WebhookSubscription, events: List[Dict], attempt: int = 1) -> WebhookDelivery:
+        """Une tentative de livraison d'un lot (un seul événement : format inchangé)"""
         import requests
 
+        if len(events) == 1:
+            event_id, event_type, timestamp = events[0]['event_id'], events[0]['event_type'], events[0]['timestamp']
+            payload = json.dumps(events[0], ensure_ascii=False, default=str)
+        else:
+            event_id = f"batch-{events[0]['event_id']}"
+            event_type, timestamp = 'batch', datetime.utcnow().isoformat() + 'Z'
+            payload = json.dumps({'events': events}, ensure_ascii=False, default=str)
+
         delivery = WebhookDelivery(
             subscription_id=subscription.id,
-            event_id=event.event_id,
+            event_id=event_id,
             url=subscription.url,
+            attempts=attempt,
+            event_count=len(events),
         )
 
-        payload = event.to_json()
-        signature = self._sign_payload(payload, subscription.secret or WEBHOOK_SECRET)
-
         headers = {
             'Content-Type': 'application/json',
-            'X-Webhook-Event': event.event_type,
-            'X-Webhook-ID': event.event_id,
-            'X-Webhook-Timestamp': event.timestamp,
-            'X-Webhook-Signature': signature,
+            'X-Webhook-Event': event_type,
+            'X-Webhook-ID': event_id,
+            'X-Webhook-Timestamp': timestamp,
+            'X-Webhook-Signature': self._sign_payload(payload, subscription.secret or WEBHOOK_SECRET),
         }
+        if len(events) > 1:
+            headers['X-Webhook-Batch-Size'] = str(len(events))
         if subscription.headers:
             headers.update(subscription.headers)
 
-        # Retry avec exponential backoff
-        for attempt in range(1, WEBHOOK_MAX_RETRIES + 1):
-            delivery.attempts = attempt
-
-            try:
-                response = requests.post(
-                    subscription.url,
-                    data=payload,
-                    headers=headers,
-                    timeout=WEBHOOK_TIMEOUT,
-                )
-
-                delivery.status_code = response.status_code
-                delivery.response_body = response.text[:1000]  # Limiter la taille
-
-                if response.status_code < 400:
-                    delivery.success = True
-                    delivery.delivered_at = datetime.utcnow().isoformat() + 'Z'
-                    _logger.info(
-                        f"Webhook delivered: {event.event_type} -> {subscription.url} "
-                        f"(attempt {attempt}, status {response.status_code})"
-                    )
-                    break
+        try:
+            response = get_http_session().post(
+                subscription.url,
+                data=payload.encode('utf-8'),
+                headers=headers,
+                timeout=WEBHOOK_TIMEOUT,
+            )
+            delivery.status_code = response.status_code
+            delivery.response_body = response.text[:1000]  # Limiter la taille
 
+            if response.status_code < 400:
+                delivery.success = True
+                delivery.delivered_at = datetime.utcnow().isoformat() + 'Z'
+            elif response.status_code < 500:
                 # Erreur client (4xx) - ne pas retrier
-                if 400 <= response.status_code < 500:
-                    delivery.error = f"Client error: {response.status_code}"
-                    _logger.warning(f"Webhook client error: {delivery.error}")
-                    break
-
-                # Erreur serveur (5xx) - retrier
+                delivery.error = f"Client error: {response.status_code}"
+            else:
                 delivery.error = f"Server error: {response.status_code}"
+                delivery.retryable = True
+
+        except requests.Timeout:
+            delivery.error, delivery.retryable = "Timeout", True
+        except requests.ConnectionError as e:
+            delivery.error, delivery.retryable = f"Connection error: {str(e)[:100]}", True
+        except Exception as e:
+            delivery.error = str(e)[:200]
+
+        if delivery.success:
+            _logger.info(
+                f"Webhook delivered: {event_type} -> {subscription.url} "
+                f"(attempt {attempt}, status {delivery.status_code}, {len(events)} event(s))"
+            )
+        else:
+            _logger.warning(f"Webhook delivery failed (attempt {attempt}) -> {subscription.url}: {delivery.error}")
 
-            except requests.Timeout:
-                delivery.error = "Timeout"
-            except requests.ConnectionError as e:
-                delivery.error = f"Connection error: {str(e)[:100]}"
-            except Exception as e:
-                delivery.error = str(e)[:200]
-
-            # Attendre avant retry (exponential backoff)
-            if attempt < WEBHOOK_MAX_RETRIES:
-                delay = min(2 ** attempt, 60)  # Max 60 secondes
-                _logger.warning(
-                    f"Webhook delivery failed (attempt {attempt}), "
-                    f"retrying in {delay}s: {delivery.error}"
-                )
-                time.sleep(delay)
-
-        # Stocker la livraison
-        with self._lock:
-            self._deliveries.append(delivery)
-            # Garder seulement les 1000 dernières
-            if len(self._deliveries) > 1000:
-                self._deliveries = self._deliveries[-1000:]
-
+        self._record_delivery(delivery)
         return delivery
 
+    def _record_delivery(self, delivery: WebhookDelivery):
+        """Historique persistant (streams Redis plafonnés) ou mémoire sans Redis"""
+        if not self._redis:
+            with self._lock:
+                self._deliveries.append(delivery)
+            return
+        data = {'data': json.dumps(asdict(delivery))}
+        pipe = self._redis.pipeline()
+        pipe.xadd(self._key('deliveries'), data, maxlen=WEBHOOK_HISTORY_MAX, approximate=True)
+        pipe.xadd(self._key('deliveries', delivery.subscription_id), data,
+                  maxlen=WEBHOOK_SUBSCRIPTION_HISTORY_MAX, approximate=True)
+        pipe.execute()
+
     def _sign_payload(self, payload: str, secret: str) -> str:
         """Génère une signature HMAC pour le payload"""
         return hmac.new(
@@ -300,10 +497,14 @@ class WebhookService:
             hashlib.sha256
         ).hexdigest()
 
-    def get_recent_deliveries(self, limit: int = 100) -> List[Dict]:
-        """Récupère les livraisons récentes"""
-        with self._lock:
-            return [asdict(d) for d in self._deliveries[-limit:]]
+    def get_recent_deliveries(self, limit: int = 100, subscription_id: int = None) -> List[Dict]:
+        """Récupère les livraisons récentes (plus récentes d'abord)"""
+        if not self._redis:
+            with self._lock:
+                return [asdict(d) for d in reversed(self._deliveries)][:limit]
+        key = self._key('deliveries', subscription_id) if subscription_id else self._key('deliveries')
+        entries = self._redis.xrevrange(key, '+', '-', count=limit)
+        return [json.loads(fields[b'data']) for _entry_id, fields in entries]
 
 
 # Instance singleton
@@ -318,6 +519,25 @@ def get_webhook_service() -> WebhookService:
     return _webhook_service
 
 
+# =============================================================================
+# JOBS
+# =============================================================================
+
+@job_handler('webhook_flush')
+def handle_webhook_flush(payload: Dict) -> Dict:
+    """Découpe les événements en attente d'un abonné en lots à livrer"""
+    return {'batches': get_webhook_service().flush(payload['subscription_id'])}
+
+
+@job_handler('webhook_deliver')
+def handle_webhook_deliver(payload: Dict) -> Dict:
+    """Livre un lot ; WebhookDeliveryError => retry planifié par le worker"""
+    return get_webhook_service().deliver_job(
+        payload['subscription_id'], payload['events'], payload.get('attempt', 1),
+        payload.get('deferrals', 0),
+    )
+
+
 # =============================================================================
 # HELPERS
 # =============================================================================
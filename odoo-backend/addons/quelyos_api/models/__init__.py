@@ -7,12 +7,17 @@ from . import cache
 from . import job_queue
 from . import product_image
 from . import product_template
+from . import product_facet
 from . import product_product
 from . import stock_quant
 from . import stock_location
 from . import stock_scrap
 from . import stock_reservation
 from . import sale_order
+from . import cart
+from . import analytics_stats
+from . import sales_rollup
+from . import inventory_analytics
 from . import subscription_quota_mixin
 from . import subscription_plan
 from . import subscription
@@ -74,6 +79,8 @@ from . import pos_payment_method
 from . import pos_config
 from . import pos_session
 from . import pos_order
+from . import pos_sync_job
+from . import pos_catalog
 # CRM Multi-tenant
 from . import crm_lead
 # Multi-tenant pour tous les modèles custom
@@ -7,6 +7,7 @@ pour permettre à chaque tenant d'avoir ses propres factures.
 """
 
 from odoo import models, fields
+from odoo.tools.sql import create_index
 
 
 class AccountMove(models.Model):
@@ -25,6 +26,23 @@ class AccountMove(models.Model):
         help='Tenant propriétaire de cette écriture comptable',
     )
 
+    # ═══════════════════════════════════════════════════════════════════════════
+    # MÉTRIQUES CFO ET CONSOLIDATION
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _post(self, soft=True):
+        posted = super()._post(soft)
+        self.env['quelyos.finance.metric']._mark_moves_dirty(posted)
+        self.env['quelyos.consolidation.cache']._invalidate_companies(posted.company_id.ids)
+        return posted
+
+    def button_draft(self):
+        # Écritures dé-validées : leur mois est à recalculer
+        posted = self.filtered(lambda move: move.state == 'posted')
+        self.env['quelyos.finance.metric']._mark_moves_dirty(posted)
+        self.env['quelyos.consolidation.cache']._invalidate_companies(posted.company_id.ids)
+        return super().button_draft()
+
 
 class AccountMoveLine(models.Model):
     """Extension account.move.line pour multi-tenant (hérité)"""
@@ -37,3 +55,14 @@ class AccountMoveLine(models.Model):
         store=True,
         index=True,
     )
+
+    def init(self):
+        """Index composite pour les rapports agrégés (balance, grand livre, âgée)"""
+        super().init()
+        create_index(
+            self.env.cr,
+            'account_move_line_tenant_account_date_posted_idx',
+            self._table,
+            ['tenant_id', 'account_id', 'date'],
+            where="parent_state = 'posted'",
+        )
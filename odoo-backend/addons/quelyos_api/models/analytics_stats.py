@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Statistiques du dashboard e-commerce (/api/ecommerce/analytics/stats).
+
+Tout est calculé par agrégats SQL (comptages et sommes groupés, stock
+sommé sur stock.quant) : aucun recordset de commandes, de lignes ou de
+produits n'est chargé. Le résultat est matérialisé par société dans
+quelyos.analytics.stats ; la ligne est marquée périmée à chaque changement
+d'état d'une commande (confirmation, annulation...) et recalculée au plus
+tard après STATS_MAX_AGE secondes (le stock évolue sans passer par les
+commandes).
+"""
+
+import json
+import logging
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.tools.sql import create_unique_index
+
+_logger = logging.getLogger(__name__)
+
+CONFIRMED_STATES = ('sale', 'done')
+STOCK_ALERT_THRESHOLD = 5
+STATS_MAX_AGE = 60  # secondes
+
+
+class AnalyticsStats(models.Model):
+    _name = 'quelyos.analytics.stats'
+    _description = 'Statistiques dashboard e-commerce (cache matérialisé)'
+    _log_access = False
+
+    company_id = fields.Many2one('res.company', string='Société', index=True, ondelete='cascade')
+    data = fields.Json(string='Statistiques')
+    computed_at = fields.Datetime(string='Calculé le')
+    stale = fields.Boolean(string='Périmé', default=False)
+
+    _sql_constraints = [
+        ('company_uniq', 'unique(company_id)', 'Une seule ligne de statistiques par société'),
+    ]
+
+    def init(self):
+        super().init()
+        # Ligne globale (company_id NULL) unique elle aussi : cible de l'upsert
+        self.env.cr.execute("""
+            DELETE FROM quelyos_analytics_stats s
+            USING quelyos_analytics_stats d
+            WHERE s.company_id IS NULL AND d.company_id IS NULL AND s.id < d.id
+        """)
+        create_unique_index(
+            self.env.cr, 'quelyos_analytics_stats_company_key_uniq', self._table,
+            ['(COALESCE(company_id, 0))'],
+        )
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # LECTURE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def get_stats(self, company=None, use_cache=True):
+        """
+        Statistiques du dashboard (société du tenant, ou toutes sociétés).
+
+        Returns:
+            dict: {'totals', 'recent_orders', 'top_products', 'stock_alerts'}
+        """
+        company_id = company.id if company else False
+        data = None
+
+        if use_cache:
+            self.flush_model()
+            self.env.cr.execute("""
+                SELECT data, computed_at, stale
+                FROM quelyos_analytics_stats
+                WHERE company_id IS NOT DISTINCT FROM %s
+            """, (company_id or None,))
+            row = self.env.cr.fetchone()
+            if row and not row[2] and row[1] > fields.Datetime.now() - timedelta(seconds=STATS_MAX_AGE):
+                data = row[0]
+
+        if data is None:
+            data = self._compute_stats(company)
+            if use_cache:
+                self._store_stats(company_id, data)
+
+        # Dernières commandes : toujours à jour (requête indexée, 5 lignes)
+        return dict(data, recent_orders=self._get_recent_orders(company))
+
+    def _store_stats(self, company_id, data):
+        """Upsert en une requête : deux lectures à froid concurrentes ne se heurtent pas"""
+        self.flush_model()
+        self.env.cr.execute("""
+            INSERT INTO quelyos_analytics_stats (company_id, data, computed_at, stale)
+            VALUES (%s, %s::jsonb, %s, FALSE)
+            ON CONFLICT ((COALESCE(company_id, 0))) DO UPDATE
+            SET data = EXCLUDED.data, computed_at = EXCLUDED.computed_at, stale = FALSE
+        """, (company_id or None, json.dumps(data), fields.Datetime.now()))
+        self.invalidate_model()
+
+    @api.model
+    def _mark_stale(self, company_ids):
+        """Commandes modifiées : statistiques de la société (et globales) à recalculer"""
+        self.flush_model()
+        self.env.cr.execute("""
+            UPDATE quelyos_analytics_stats
+            SET stale = TRUE
+            WHERE NOT stale AND (company_id IS NULL OR company_id = ANY(%s))
+        """, (list(company_ids),))
+        if self.env.cr.rowcount:
+            self.invalidate_model(['stale'])
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # CALCUL (AGRÉGATS SQL)
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def _compute_stats(self, company=None):
+        totals = self._get_order_totals(company)
+        totals.update(self._get_catalog_totals(company))
+        stock = self._get_stock_summary(company)
+        totals['out_of_stock_products'] = stock['out_of_stock']
+        totals['low_stock_products'] = stock['low_stock']
+
+        return {
+            'totals': totals,
+            'top_products': self._get_top_products(company),
+            'stock_alerts': stock['alerts'],
+        }
+
+    def _company_domain(self, company):
+        return [('company_id', '=', company.id)] if company else []
+
+    def _get_order_totals(self, company):
+        """Commandes par état en un GROUP BY"""
+        by_state = {
+            state: (count, amount or 0.0)
+            for state, count, amount in self.env['sale.order'].sudo()._read_group(
+                self._company_domain(company), ['state'], ['__count', 'amount_total:sum'],
+            )
+        }
+        return {
+            'orders': sum(count for count, _amount in by_state.values()),
+            'confirmed_orders': sum(by_state.get(state, (0, 0))[0] for state in CONFIRMED_STATES),
+            'pending_orders': by_state.get('draft', (0, 0))[0],
+            'revenue': sum(by_state.get(state, (0, 0.0))[1] for state in CONFIRMED_STATES),
+        }
+
+    def _get_catalog_totals(self, company):
+        shared_domain = [('company_id', 'in', [company.id, False])] if company else []
+        return {
+            'products': self.env['product.product'].sudo().search_count(shared_domain),
+            'customers': self.env['res.partner'].sudo().search_count(
+                [('customer_rank', '>', 0)] + shared_domain
+            ),
+        }
+
+    def _get_top_products(self, company, limit=5):
+        """Produits les plus vendus (quantité) sur les lignes confirmées, groupés en SQL"""
+        groups = self.env['sale.order.line'].sudo()._read_group(
+            self._company_domain(company) + [
+                ('state', 'in', list(CONFIRMED_STATES)),
+                ('product_id', '!=', False),
+            ],
+            ['product_id'],
+            ['product_uom_qty:sum', 'price_total:sum'],
+            order='product_uom_qty:sum desc',
+            limit=limit,
+        )
+        return [{
+            'id': product.id,
+            'name': product.name,
+            'qty_sold': qty or 0.0,
+            'revenue': revenue or 0.0,
+        } for product, qty, revenue in groups]
+
+    def _get_stock_summary(self, company):
+        """
+        Ruptures (variantes stockables) et alertes de stock (templates vendables),
+        stock interne sommé sur stock.quant en une requête.
+        """
+        self.env['stock.quant'].flush_model(['product_id', 'location_id', 'quantity', 'company_id'])
+        self.env['product.product'].flush_model(['active', 'product_tmpl_id'])
+        self.env['product.template'].flush_model(['is_storable', 'sale_ok', 'company_id'])
+
+        company_id = company.id if company else None
+        self.env.cr.execute("""
+            WITH quant_stock AS (
+                SELECT sq.product_id, SUM(sq.quantity) AS qty
+                FROM stock_quant sq
+                JOIN stock_location sl ON sl.id = sq.location_id
+                WHERE sl.usage = 'internal'
+                  AND (%(company_id)s IS NULL OR sq.company_id = %(company_id)s)
+                GROUP BY sq.product_id
+            ),
+            variant_stock AS (
+                SELECT pp.product_tmpl_id, pt.sale_ok, COALESCE(qs.qty, 0) AS qty
+                FROM product_product pp
+                JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                LEFT JOIN quant_stock qs ON qs.product_id = pp.id
+                WHERE pp.active
+                  AND pt.is_storable
+                  AND (%(company_id)s IS NULL OR pt.company_id IS NULL OR pt.company_id = %(company_id)s)
+            ),
+            template_stock AS (
+                SELECT product_tmpl_id AS id, SUM(qty) AS qty
+                FROM variant_stock
+                WHERE sale_ok
+                GROUP BY product_tmpl_id
+            )
+            SELECT
+                (SELECT count(*) FROM variant_stock WHERE qty <= 0),
+                (SELECT count(*) FROM template_stock WHERE qty > 0 AND qty <= %(threshold)s),
+                (SELECT COALESCE(json_agg(json_build_array(id, qty)), '[]'::json) FROM (
+                    SELECT id, qty FROM template_stock
+                    WHERE qty <= %(threshold)s
+                    ORDER BY qty, id
+                    LIMIT 10
+                ) alerts)
+        """, {'company_id': company_id, 'threshold': STOCK_ALERT_THRESHOLD})
+        out_of_stock, low_stock, alert_rows = self.env.cr.fetchone()
+
+        templates = self.env['product.template'].sudo().browse([template_id for template_id, _qty in alert_rows])
+        alerts = []
+        for template, (_template_id, qty) in zip(templates, alert_rows):
+            if qty <= 0:
+                alert_level = 'critical'
+                alert_message = 'Rupture de stock'
+            else:
+                alert_level = 'warning'
+                alert_message = f'Stock faible ({int(qty)} restants)'
+
+            alerts.append({
+                'id': template.id,
+                'name': template.name,
+                'default_code': template.default_code or '',
+                'qty_available': qty,
+                'alert_level': alert_level,
+                'alert_message': alert_message,
+                'image': f'/web/image/product.template/{template.id}/image_128' if template.image_128 else None,
+            })
+
+        return {'out_of_stock': out_of_stock, 'low_stock': low_stock, 'alerts': alerts}
+
+    def _get_recent_orders(self, company, limit=5):
+        orders = self.env['sale.order'].sudo().search(
+            self._company_domain(company), limit=limit, order='date_order desc',
+        )
+        return [{
+            'id': o.id,
+            'name': o.name,
+            'date_order': o.date_order.isoformat() if o.date_order else None,
+            'state': o.state,
+            'amount_total': o.amount_total,
+            'customer': {
+                'id': o.partner_id.id,
+                'name': o.partner_id.name,
+            } if o.partner_id else None,
+        } for o in orders]
@@ -3,9 +3,12 @@
 Modèle Backup pour la gestion des sauvegardes
 """
 
-from odoo import models, fields, api
+from odoo import models, fields, api, Command, SUPERUSER_ID
 from odoo.exceptions import ValidationError
-from datetime import datetime
+from odoo.tools import split_every
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, date, timedelta
+from decimal import Decimal
 import subprocess
 import os
 import logging
@@ -13,15 +16,90 @@ import json
 import zipfile
 import shutil
 import base64
+import uuid
 
 _logger = logging.getLogger(__name__)
 
+BACKUP_FORMAT_VERSION = '2.0'
+
+# Modèles tenant exportés/restaurés (ordre des dépendances)
+TENANT_BACKUP_MODELS = [
+    'res.partner',
+    'product.category',
+    'product.template',
+    'product.product',
+    'product.pricelist',
+    'product.pricelist.item',
+    'account.tax',
+    'sale.order',
+    'sale.order.line',
+    'account.move',
+    'account.move.line',
+    'stock.location',
+    'stock.warehouse',
+    'stock.quant',
+    'stock.picking',
+    'stock.move',
+    'crm.lead',
+    'crm.stage',
+]
+
+# Champs techniques non exportés
+BACKUP_SKIPPED_FIELDS = {'create_uid', 'write_uid', 'message_ids', 'activity_ids', 'message_follower_ids'}
+# Champs non restaurés (gérés par l'ORM)
+RESTORE_SKIPPED_FIELDS = BACKUP_SKIPPED_FIELDS | {'id', 'create_date', 'write_date'}
+
+
+# Marge sous le high-water mark write_date d'un delta (transactions encore en cours)
+BACKUP_WATERMARK_OVERLAP = timedelta(minutes=5)
+
+# Verrou consultatif (session) du magasin de fichiers : partagé par les backups
+# tenant en cours, exclusif pour le ramasse-miettes
+BACKUP_BLOB_LOCK = 0x51B10B
+
+
+def _subtract_ranges(ranges, removed):
+    """Ids de `ranges` absents de `removed` (listes triées de plages [début, fin] incluses)"""
+    result = []
+    index = 0
+    for start, end in ranges:
+        while index < len(removed) and removed[index][1] < start:
+            index += 1
+        cursor = start
+        probe = index
+        while probe < len(removed) and removed[probe][0] <= end:
+            removed_start, removed_end = removed[probe]
+            if removed_start > cursor:
+                result.append([cursor, removed_start - 1])
+            cursor = max(cursor, removed_end + 1)
+            probe += 1
+        if cursor <= end:
+            result.append([cursor, end])
+    return result
+
+
+def _backup_json_default(value):
+    """Sérialisation JSON des valeurs SQL (dates, numeric, bytea)"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    return str(value)
+
 
 class QuelyosBackup(models.Model):
     _name = 'quelyos.backup'
     _description = 'Database Backup'
     _order = 'create_date desc'
 
+    # Export tenant : lignes lues par requête / lignes par fichier NDJSON
+    _backup_chunk_size = 5000
+    _backup_part_rows = 100000
+    # Restauration tenant : enregistrements par lot (existence, create, write)
+    _restore_chunk_size = 1000
+
     filename = fields.Char(
         string='Filename',
         compute='_compute_filename',
@@ -66,15 +144,36 @@ class QuelyosBackup(models.Model):
         default=0,
         help='Total records exported in tenant backup'
     )
+    progress = fields.Float(
+        string='Progress (%)',
+        default=0,
+        help='Export progress of a running tenant backup'
+    )
+    checkpoint = fields.Text(
+        string='Checkpoint',
+        help='JSON resume point of an interrupted tenant backup'
+    )
 
-    @api.depends('type', 'tenant_id', 'create_date')
+    parent_backup_id = fields.Many2one(
+        'quelyos.backup',
+        string='Parent Backup',
+        ondelete='restrict',
+        help='Previous backup of the chain: set for incremental (delta) tenant backups'
+    )
+    watermarks = fields.Text(
+        string='Watermarks',
+        help='JSON per-model write_date high-water marks of a tenant backup'
+    )
+
+    @api.depends('type', 'tenant_id', 'create_date', 'parent_backup_id')
     def _compute_filename(self):
         for record in self:
             date_str = record.create_date.strftime('%Y%m%d_%H%M%S') if record.create_date else datetime.now().strftime('%Y%m%d_%H%M%S')
             if record.tenant_id:
                 # Tenant backup = ZIP (JSON + filestore)
                 extension = 'zip' if record.type == 'tenant' else 'dump'
-                record.filename = f"backup_{record.tenant_id.code}_{date_str}.{extension}"
+                suffix = '_delta' if record.parent_backup_id else ''
+                record.filename = f"backup_{record.tenant_id.code}_{date_str}{suffix}.{extension}"
             else:
                 record.filename = f"backup_{record.type}_{date_str}.dump"
 
@@ -233,20 +332,37 @@ class QuelyosBackup(models.Model):
     # =========================================================================
 
     def execute_tenant_backup(self):
-        """Exécute backup tenant (export JSON + filestore)"""
+        """
+        Exécute backup tenant (export NDJSON + filestore, assemblés dans le ZIP).
+
+        Reprise : un backup interrompu (crash, timeout) garde son checkpoint et
+        ses fichiers NDJSON terminés ; relancer execute_tenant_backup() repart
+        du dernier fichier validé.
+
+        Incrémental : avec parent_backup_id, seuls les enregistrements modifiés
+        depuis les high-water marks write_date du parent, les suppressions et
+        les fichiers nouveaux ou modifiés sont exportés. La restauration rejoue
+        la chaîne depuis le backup complet (voir execute_tenant_restore).
+        """
         self.ensure_one()
 
         if not self.tenant_id:
             raise ValidationError("Tenant requis pour backup tenant")
 
-        self.status = 'running'
+        self.write({'status': 'running', 'error_message': False})
         self.env.cr.commit()
 
+        # Verrou de session : conservé par les commits de l'export, libéré en fin de backup
+        self.env.cr.execute("SELECT pg_advisory_lock_shared(%s)", (BACKUP_BLOB_LOCK,))
         try:
             tenant = self.tenant_id
             company = tenant.company_id
 
-            _logger.info(f"Starting tenant backup: {tenant.code}")
+            parent = self.parent_backup_id
+            if parent and (parent.status != 'completed' or not parent.file_path or not os.path.exists(parent.file_path)):
+                raise ValidationError("Backup parent indisponible pour backup incrémental")
+
+            _logger.info(f"Starting tenant backup: {tenant.code}" + (f" (delta of {parent.filename})" if parent else ""))
 
             # Répertoire backup tenant
             backup_dir = self.env['ir.config_parameter'].sudo().get_param(
@@ -256,172 +372,382 @@ class QuelyosBackup(models.Model):
             tenant_backup_dir = os.path.join(backup_dir, 'tenants')
             os.makedirs(tenant_backup_dir, exist_ok=True)
 
-            # Répertoire temporaire pour construction backup
-            temp_dir = os.path.join(tenant_backup_dir, f'temp_{tenant.code}_{datetime.now().strftime("%Y%m%d_%H%M%S")}')
-            os.makedirs(temp_dir, exist_ok=True)
+            # ZIP en construction (renommé une fois complet) et fichiers NDJSON de l'export
+            zip_path = os.path.join(tenant_backup_dir, self.filename)
+            part_path = zip_path + '.part'
+            work_dir = zip_path + '.parts'
 
-            try:
-                # 1. Export données (JSON)
-                exported_data, total_records = self._export_tenant_data(company, temp_dir)
+            # 1. Export données (NDJSON par modèle, par lots)
+            checkpoint = self._export_tenant_data(company, work_dir)
+            total_records = checkpoint['records']
+            exported_models = [name for name, count in checkpoint['models'].items() if count]
+
+            with zipfile.ZipFile(part_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                for root, _dirs, files in os.walk(work_dir):
+                    for name in sorted(files):
+                        if name.endswith('.tmp'):
+                            continue
+                        path = os.path.join(root, name)
+                        zipf.write(path, os.path.relpath(path, work_dir))
 
-                # 2. Export filestore
-                self._export_filestore(company, temp_dir)
+                # 2. Ids présents (détection des suppressions par le delta suivant)
+                deleted = self._export_id_ranges(company, zipf, list(checkpoint['totals']), parent)
 
-                # 3. Créer metadata
+                # 3. Export filestore
+                filestore_stats = self._export_filestore(company, zipf, parent)
+
+                # 4. Créer metadata
                 metadata = {
                     'tenant_code': tenant.code,
                     'tenant_name': tenant.name,
                     'company_id': company.id,
                     'export_date': fields.Datetime.now().isoformat(),
                     'records_count': total_records,
-                    'models': list(exported_data.keys()),
-                    'version': '1.0',
+                    'models': exported_models,
+                    'counts': checkpoint['models'],
+                    'incremental': bool(parent),
+                    'parent': parent.filename if parent else None,
+                    'since': checkpoint['since'],
+                    'watermarks': checkpoint['watermarks'],
+                    'deleted': deleted,
+                    'deleted_attachments': filestore_stats['deleted'],
+                    'filestore': 'blobs',
+                    'blobs_written': filestore_stats['written'],
+                    'blobs_reused': filestore_stats['reused'],
+                    'format': 'ndjson',
+                    'version': BACKUP_FORMAT_VERSION,
                 }
+                zipf.writestr('metadata.json', json.dumps(metadata, indent=2, ensure_ascii=False))
 
-                with open(os.path.join(temp_dir, 'metadata.json'), 'w', encoding='utf-8') as f:
-                    json.dump(metadata, f, indent=2, ensure_ascii=False)
-
-                # 4. Créer ZIP
-                zip_path = os.path.join(tenant_backup_dir, self.filename)
-                self._create_backup_zip(temp_dir, zip_path)
-
-                # 5. MAJ backup record
-                size_mb = os.path.getsize(zip_path) / (1024 * 1024)
-                self.write({
-                    'status': 'completed',
-                    'completed_at': fields.Datetime.now(),
-                    'file_path': zip_path,
-                    'size_mb': size_mb,
-                    'data_models': json.dumps(list(exported_data.keys())),
-                    'records_count': total_records,
-                })
+            # 5. ZIP final
+            os.replace(part_path, zip_path)
+            shutil.rmtree(work_dir, ignore_errors=True)
 
-                _logger.info(
-                    f"Tenant backup completed: {tenant.code} | "
-                    f"{total_records} records | {size_mb:.2f} MB"
-                )
+            # 6. MAJ backup record
+            size_mb = os.path.getsize(zip_path) / (1024 * 1024)
+            self.write({
+                'status': 'completed',
+                'completed_at': fields.Datetime.now(),
+                'file_path': zip_path,
+                'size_mb': size_mb,
+                'data_models': json.dumps(exported_models),
+                'records_count': total_records,
+                'watermarks': json.dumps(checkpoint['watermarks']),
+                'progress': 100,
+                'checkpoint': False,
+            })
 
-            finally:
-                # Nettoyer temp dir
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
+            _logger.info(
+                f"Tenant backup completed: {tenant.code} | "
+                f"{total_records} records | {size_mb:.2f} MB"
+            )
 
         except Exception as e:
             _logger.error(f"Tenant backup failed: {e}", exc_info=True)
+            self.env.cr.rollback()
             self.write({
                 'status': 'failed',
                 'error_message': str(e),
             })
-
-    def _export_tenant_data(self, company, temp_dir):
-        """Export données tenant en JSON"""
-        # Modèles critiques à exporter (ordre important)
-        models_to_export = [
-            'res.partner',
-            'product.category',
-            'product.template',
-            'product.product',
-            'product.pricelist',
-            'product.pricelist.item',
-            'account.tax',
-            'sale.order',
-            'sale.order.line',
-            'account.move',
-            'account.move.line',
-            'stock.location',
-            'stock.warehouse',
-            'stock.quant',
-            'stock.picking',
-            'stock.move',
-            'crm.lead',
-            'crm.stage',
-        ]
-
-        exported_data = {}
-        total_records = 0
-
-        for model_name in models_to_export:
-            try:
-                if model_name not in self.env:
-                    _logger.warning(f"Model {model_name} not found, skipping")
-                    continue
-
-                Model = self.env[model_name].sudo()
-
-                # Filtrer par company_id
-                domain = [('company_id', '=', company.id)]
-                records = Model.search(domain)
-
-                if not records:
-                    continue
-
-                model_data = []
-                for record in records:
-                    record_data = self._export_record_json(record)
-                    if record_data:
-                        model_data.append(record_data)
-                        total_records += 1
-
-                if model_data:
-                    exported_data[model_name] = model_data
-                    _logger.info(f"Exported {len(model_data)} records from {model_name}")
-
-            except Exception as e:
-                _logger.error(f"Error exporting {model_name}: {e}")
+        finally:
+            self.env.cr.execute("SELECT pg_advisory_unlock_shared(%s)", (BACKUP_BLOB_LOCK,))
+
+    def _export_tenant_data(self, company, work_dir):
+        """
+        Export données tenant en NDJSON, un fichier par lot dans `work_dir`.
+
+        Une ligne JSON par enregistrement (colonnes stockées + relations
+        many2many), lue par plages d'ids de `_backup_chunk_size` lignes :
+        la mémoire consommée ne dépend pas de la taille du tenant.
+        Chaque modèle est découpé en fichiers data/<modèle>/<n>.ndjson de
+        `_backup_part_rows` lignes, assemblés dans le ZIP en fin de backup.
+        Un fichier n'est renommé qu'une fois complet, puis le checkpoint est
+        enregistré (et committé) : la reprise réécrit le fichier interrompu
+        sans toucher aux précédents.
+
+        Le high-water mark d'un modèle est l'heure de début de son export ;
+        un delta exporte les lignes dont write_date est postérieure à celui
+        du parent (moins BACKUP_WATERMARK_OVERLAP).
+
+        Returns:
+            dict: checkpoint final ({'records': int, 'models': {modèle: nb}, ...})
+        """
+        checkpoint = json.loads(self.checkpoint) if self.checkpoint else None
+
+        if checkpoint and 'zip_size' not in checkpoint and os.path.isdir(work_dir):
+            _logger.info(
+                f"Resuming tenant backup at {checkpoint['model']} "
+                f"(id > {checkpoint['last_id']}, {checkpoint['records']} records done)"
+            )
+        else:
+            # Nouveau backup (ou checkpoint d'un ZIP écrit en place, non repris)
+            shutil.rmtree(work_dir, ignore_errors=True)
+            os.makedirs(work_dir)
+            since = {}
+            if self.parent_backup_id.watermarks:
+                since = {
+                    model_name: (fields.Datetime.from_string(watermark) - BACKUP_WATERMARK_OVERLAP).isoformat()
+                    for model_name, watermark in json.loads(self.parent_backup_id.watermarks).items()
+                }
+            checkpoint = {
+                'model': None,
+                'model_index': 0,
+                'last_id': 0,
+                'part': 0,
+                'records': 0,
+                'models': {},
+                'since': since,
+                'watermarks': {},
+                'totals': self._count_tenant_records(company, since),
+            }
+            self._save_backup_checkpoint(checkpoint)
+
+        models_to_export = self._get_backup_models()
+
+        for index in range(checkpoint['model_index'], len(models_to_export)):
+            model_name = models_to_export[index]
+            Model = self.env[model_name].sudo()
+            Model.flush_model()
+            columns = self._get_backup_columns(Model)
+            m2m_fields = self._get_backup_m2m_fields(Model)
+            checkpoint['model'] = model_name
+            checkpoint['models'].setdefault(model_name, 0)
+            if model_name not in checkpoint['watermarks']:
+                self.env.cr.execute("SELECT now() AT TIME ZONE 'UTC'")
+                checkpoint['watermarks'][model_name] = self.env.cr.fetchone()[0].isoformat()
+            since = checkpoint['since'].get(model_name)
+            model_dir = os.path.join(work_dir, 'data', model_name)
+            os.makedirs(model_dir, exist_ok=True)
+
+            while True:
+                rows = self._read_backup_chunk(Model, company, columns, m2m_fields, checkpoint['last_id'], since)
+                if not rows:
+                    break
+
+                part_path = os.path.join(model_dir, f"{checkpoint['part']:05d}.ndjson")
+                part_rows = 0
+                with open(part_path + '.tmp', 'wb') as stream:
+                    while rows:
+                        for row in rows:
+                            stream.write(json.dumps(
+                                row, ensure_ascii=False, default=_backup_json_default
+                            ).encode('utf-8'))
+                            stream.write(b'\n')
+                        part_rows += len(rows)
+                        checkpoint['last_id'] = rows[-1]['id']
+                        if part_rows >= self._backup_part_rows:
+                            break
+                        rows = self._read_backup_chunk(
+                            Model, company, columns, m2m_fields, checkpoint['last_id'], since
+                        )
+                os.replace(part_path + '.tmp', part_path)
+
+                checkpoint['part'] += 1
+                checkpoint['records'] += part_rows
+                checkpoint['models'][model_name] += part_rows
+                self._save_backup_checkpoint(checkpoint)
+
+            _logger.info(f"Exported {checkpoint['models'][model_name]} records from {model_name}")
+            checkpoint.update(model_index=index + 1, last_id=0, part=0)
+            self._save_backup_checkpoint(checkpoint)
+
+        return checkpoint
+
+    def _get_backup_models(self):
+        """Modèles exportables : installés et filtrables par company_id"""
+        backup_models = []
+        for model_name in TENANT_BACKUP_MODELS:
+            if model_name not in self.env:
+                _logger.warning(f"Model {model_name} not found, skipping")
                 continue
+            company_field = self.env[model_name]._fields.get('company_id')
+            if not company_field or not company_field.store or not company_field.column_type:
+                _logger.warning(f"Model {model_name} has no stored company_id, skipping")
+                continue
+            backup_models.append(model_name)
+        return backup_models
+
+    def _get_backup_columns(self, Model):
+        """Colonnes SQL exportées (champs stockés, hors champs techniques)"""
+        return [
+            name for name, field in Model._fields.items()
+            if field.store and field.column_type and name not in BACKUP_SKIPPED_FIELDS
+        ]
 
-        # Sauvegarder data.json
-        data_path = os.path.join(temp_dir, 'data.json')
-        with open(data_path, 'w', encoding='utf-8') as f:
-            json.dump(exported_data, f, indent=2, ensure_ascii=False, default=str)
+    def _get_backup_m2m_fields(self, Model):
+        """Champs many2many stockés (table de relation)"""
+        return [
+            field for name, field in Model._fields.items()
+            if field.type == 'many2many' and field.store and name not in BACKUP_SKIPPED_FIELDS
+        ]
 
-        return exported_data, total_records
+    def _read_backup_chunk(self, Model, company, columns, m2m_fields, after_id, since=None):
+        """Lot suivant (id > after_id, modifié depuis `since`) d'un modèle, en SQL sans passer par l'ORM"""
+        cr = self.env.cr
+        select = ', '.join(f'"{column}"' for column in columns)
+        since_clause = 'AND write_date >= %(since)s ' if since else ''
+        cr.execute(
+            f'SELECT {select} FROM "{Model._table}" '
+            f'WHERE company_id = %(company_id)s AND id > %(after_id)s {since_clause}'
+            f'ORDER BY id LIMIT %(limit)s',
+            {'company_id': company.id, 'after_id': after_id, 'since': since, 'limit': self._backup_chunk_size},
+        )
+        rows = cr.dictfetchall()
+        if not rows or not m2m_fields:
+            return rows
+
+        ids = [row['id'] for row in rows]
+        for field in m2m_fields:
+            cr.execute(
+                f'SELECT "{field.column1}", "{field.column2}" FROM "{field.relation}" '
+                f'WHERE "{field.column1}" = ANY(%(ids)s) ORDER BY "{field.column1}", "{field.column2}"',
+                {'ids': ids},
+            )
+            related = {}
+            for record_id, related_id in cr.fetchall():
+                related.setdefault(record_id, []).append(related_id)
+            for row in rows:
+                row[field.name] = related.get(row['id'], [])
+        return rows
+
+    def _count_tenant_records(self, company, since=None):
+        """Volume par modèle à exporter (calcul de la progression)"""
+        since = since or {}
+        totals = {}
+        for model_name in self._get_backup_models():
+            Model = self.env[model_name].sudo()
+            Model.flush_model(['company_id', 'write_date'])
+            since_clause = 'AND write_date >= %(since)s' if since.get(model_name) else ''
+            self.env.cr.execute(
+                f'SELECT count(*) FROM "{Model._table}" WHERE company_id = %(company_id)s {since_clause}',
+                {'company_id': company.id, 'since': since.get(model_name)},
+            )
+            totals[model_name] = self.env.cr.fetchone()[0]
+        return totals
+
+    def _save_backup_checkpoint(self, checkpoint):
+        """Enregistre l'avancement et le committe (point de reprise)"""
+        total = sum(checkpoint['totals'].values())
+        progress = min(99.0, checkpoint['records'] * 100.0 / total) if total else 0.0
+        self.write({
+            'checkpoint': json.dumps(checkpoint),
+            'progress': progress,
+            'records_count': checkpoint['records'],
+        })
+        self.env.cr.commit()
 
-    def _export_record_json(self, record):
-        """Export un record Odoo en dict JSON"""
+    def _export_id_ranges(self, company, zipf, model_names, parent=None):
+        """
+        Ids présents par modèle, en plages [début, fin] : ids/<modèle>.json.
+        Delta : ids présents dans le backup parent et disparus depuis,
+        écrits dans deleted/<modèle>.json.
+
+        Returns:
+            dict: {modèle: nombre d'enregistrements supprimés}
+        """
+        deleted_counts = {}
+        parent_zip = zipfile.ZipFile(parent.file_path, 'r') if parent else None
         try:
-            data = {}
-
-            for field_name, field in record._fields.items():
-                # Ignorer champs techniques
-                if field_name in ['__last_update', 'display_name', 'create_uid', 'write_uid', 'message_ids', 'activity_ids']:
+            for model_name in model_names:
+                table = self.env[model_name]._table
+                # Îlots d'ids consécutifs (id - rang constant)
+                self.env.cr.execute(f"""
+                    SELECT min(id), max(id)
+                    FROM (
+                        SELECT id, id - row_number() OVER (ORDER BY id) AS island
+                        FROM "{table}"
+                        WHERE company_id = %s
+                    ) ids
+                    GROUP BY island
+                    ORDER BY 1
+                """, (company.id,))
+                ranges = [list(row) for row in self.env.cr.fetchall()]
+                zipf.writestr(f'ids/{model_name}.json', json.dumps(ranges))
+
+                if parent_zip is None:
                     continue
-
-                # Ignorer champs compute sans store
-                if field.compute and not field.store:
+                try:
+                    previous = json.loads(parent_zip.read(f'ids/{model_name}.json'))
+                except KeyError:
                     continue
-
-                value = record[field_name]
-
-                # Gérer types spéciaux
-                if field.type == 'many2one':
-                    data[field_name] = value.id if value else False
-                elif field.type in ['one2many', 'many2many']:
-                    data[field_name] = value.ids if value else []
-                elif field.type == 'binary':
-                    # Stocker binary en base64 (limité pour éviter gros JSON)
-                    if value and len(value) < 1024 * 1024:  # Max 1MB
-                        data[field_name] = base64.b64encode(value).decode('utf-8')
-                    else:
-                        data[field_name] = False
-                elif field.type == 'datetime':
-                    data[field_name] = value.isoformat() if value else False
-                elif field.type == 'date':
-                    data[field_name] = value.isoformat() if value else False
-                else:
-                    data[field_name] = value
-
-            return data
-
-        except Exception as e:
-            _logger.error(f"Error exporting record {record}: {e}")
-            return None
-
-    def _export_filestore(self, company, temp_dir):
-        """Export filestore tenant (images, PDF, etc.)"""
+                deleted = _subtract_ranges(previous, ranges)
+                if deleted:
+                    zipf.writestr(f'deleted/{model_name}.json', json.dumps(deleted))
+                    deleted_counts[model_name] = sum(end - start + 1 for start, end in deleted)
+        finally:
+            if parent_zip is not None:
+                parent_zip.close()
+
+        return deleted_counts
+
+    def _get_blob_store_dir(self):
+        """Magasin de fichiers partagé par tous les backups (adressé par checksum)"""
+        backup_dir = self.env['ir.config_parameter'].sudo().get_param(
+            'quelyos.backup.directory',
+            '/var/lib/odoo/backups'
+        )
+        return os.path.join(backup_dir, 'blobs')
+
+    def _get_blob_path(self, checksum):
+        return os.path.join(self._get_blob_store_dir(), checksum[:2], checksum)
+
+    def _store_backup_blob(self, checksum, source_path=None, raw=None):
+        """
+        Copie un fichier dans le magasin s'il n'y est pas déjà.
+        Lien physique si possible (même disque que le filestore), sinon copie en flux.
+
+        Returns:
+            bool: True si le fichier a été ajouté, False s'il existait déjà
+        """
+        blob_path = self._get_blob_path(checksum)
+        if os.path.exists(blob_path):
+            return False
+
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        # Nom propre à l'appel : crons en threads d'un même processus
+        temp_path = f'{blob_path}.{uuid.uuid4().hex}.tmp'
         try:
-            filestore_dir = os.path.join(temp_dir, 'filestore')
-            os.makedirs(filestore_dir, exist_ok=True)
+            if source_path:
+                try:
+                    os.link(source_path, temp_path)
+                except OSError:
+                    shutil.copyfile(source_path, temp_path)
+            else:
+                with open(temp_path, 'wb') as f:
+                    f.write(raw)
+            os.replace(temp_path, blob_path)
+        except (FileExistsError, FileNotFoundError):
+            # Même contenu stocké en parallèle par un autre backup
+            if not os.path.exists(blob_path):
+                raise
+            return False
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return True
+
+    def _export_filestore(self, company, zipf, parent=None):
+        """
+        Export filestore tenant (images, PDF, etc.) vers le magasin adressé par checksum.
+
+        Le ZIP ne contient que le manifeste attachments.json (métadonnées +
+        checksum de chaque attachment) : un fichier déjà présent dans le
+        magasin (autre backup, autre tenant) n'est ni recopié ni dupliqué.
+        Delta : les attachments supprimés depuis le parent sont listés dans
+        deleted/ir.attachment.json.
+
+        Returns:
+            dict: {'written': int, 'reused': int, 'deleted': int}
+        """
+        stats = {'written': 0, 'reused': 0, 'deleted': 0}
+        try:
+            previous = {}
+            if parent:
+                with zipfile.ZipFile(parent.file_path, 'r') as parent_zip:
+                    if 'attachments.json' in parent_zip.namelist():
+                        previous = json.loads(parent_zip.read('attachments.json'))
+                if isinstance(previous, list):
+                    previous = {str(entry['id']): entry['checksum'] for entry in previous}
 
             # Récupérer attachments liés au tenant
             Attachment = self.env['ir.attachment'].sudo()
@@ -431,47 +757,66 @@ class QuelyosBackup(models.Model):
                 ('res_model', 'in', ['product.template', 'product.product', 'res.partner'])
             ])
 
-            exported_count = 0
+            manifest = []
             for attachment in attachments:
                 try:
-                    if not attachment.datas:
+                    if attachment.type != 'binary' or not attachment.checksum:
                         continue
 
-                    # Créer sous-dossier par type
-                    subdir = os.path.join(filestore_dir, attachment.res_model or 'misc')
-                    os.makedirs(subdir, exist_ok=True)
-
-                    # Sauvegarder fichier
-                    filename = f"{attachment.id}_{attachment.name}" if attachment.name else str(attachment.id)
-                    filepath = os.path.join(subdir, filename)
-
-                    with open(filepath, 'wb') as f:
-                        f.write(base64.b64decode(attachment.datas))
+                    if attachment.store_fname:
+                        full_path = Attachment._full_path(attachment.store_fname)
+                        if not os.path.exists(full_path):
+                            continue
+                        written = self._store_backup_blob(attachment.checksum, source_path=full_path)
+                    elif attachment.db_datas:
+                        written = self._store_backup_blob(attachment.checksum, raw=attachment.raw)
+                    else:
+                        continue
 
-                    exported_count += 1
+                    stats['written' if written else 'reused'] += 1
+                    manifest.append({
+                        'id': attachment.id,
+                        'checksum': attachment.checksum,
+                        'name': attachment.name,
+                        'res_model': attachment.res_model,
+                        'res_id': attachment.res_id,
+                        'res_field': attachment.res_field,
+                        'mimetype': attachment.mimetype,
+                        'public': attachment.public,
+                        'file_size': attachment.file_size,
+                    })
 
                 except Exception as e:
                     _logger.error(f"Error exporting attachment {attachment.id}: {e}")
                     continue
 
-            _logger.info(f"Exported {exported_count} attachments to filestore")
+            zipf.writestr('attachments.json', json.dumps(manifest))
+            exported_ids = {str(entry['id']) for entry in manifest}
+            deleted = [
+                {'id': int(key), 'checksum': checksum}
+                for key, checksum in previous.items() if key not in exported_ids
+            ]
+            if deleted:
+                zipf.writestr('deleted/ir.attachment.json', json.dumps(deleted))
+            stats['deleted'] = len(deleted)
+
+            _logger.info(
+                f"Exported {len(manifest)} attachments to filestore "
+                f"({stats['written']} new files, {stats['reused']} deduplicated, {stats['deleted']} deleted)"
+            )
 
         except Exception as e:
             _logger.error(f"Error exporting filestore: {e}")
 
-    def _create_backup_zip(self, source_dir, zip_path):
-        """Crée ZIP final du backup"""
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, _dirs, files in os.walk(source_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, source_dir)
-                    zipf.write(file_path, arcname)
-
-        _logger.info(f"Backup ZIP created: {zip_path}")
+        return stats
 
     def execute_tenant_restore(self):
-        """Restaure backup tenant"""
+        """
+        Restaure backup tenant.
+
+        Backup incrémental : rejoue le backup complet de base puis chaque
+        delta de la chaîne, dans l'ordre (upserts puis suppressions).
+        """
         self.ensure_one()
 
         if not self.tenant_id:
@@ -486,33 +831,67 @@ class QuelyosBackup(models.Model):
             tenant = self.tenant_id
             company = tenant.company_id
 
-            # Extraire ZIP
-            temp_dir = os.path.join(
-                os.path.dirname(self.file_path),
-                f'restore_{tenant.code}_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
-            )
-            os.makedirs(temp_dir, exist_ok=True)
+            chain = self._get_backup_chain()
+            # Anciens ids -> nouveaux ids, partagés par toute la chaîne
+            id_map = {}
+            for backup in chain:
+                backup._restore_tenant_archive(company, id_map)
 
-            try:
-                with zipfile.ZipFile(self.file_path, 'r') as zipf:
-                    zipf.extractall(temp_dir)
-
-                # Lire metadata
-                metadata_path = os.path.join(temp_dir, 'metadata.json')
-                if not os.path.exists(metadata_path):
-                    raise ValidationError("Metadata manquantes dans backup")
-
-                with open(metadata_path, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-
-                # Vérifier compatibilité
-                if metadata['tenant_code'] != tenant.code:
-                    _logger.warning(
-                        f"Tenant mismatch: backup={metadata['tenant_code']} "
-                        f"target={tenant.code} - Proceeding anyway"
-                    )
+            _logger.info(f"Tenant restore completed: {tenant.code} ({len(chain)} backup(s) replayed)")
 
-                # Lire data.json
+        except Exception as e:
+            _logger.error(f"Tenant restore failed: {e}", exc_info=True)
+            raise
+
+    def _get_backup_chain(self):
+        """Backups à rejouer : backup complet de base puis deltas jusqu'à self"""
+        self.ensure_one()
+        chain = []
+        backup = self
+        while backup:
+            if backup.status != 'completed' or not backup.file_path or not os.path.exists(backup.file_path):
+                raise ValidationError(f"Backup {backup.filename} de la chaîne indisponible pour restauration")
+            if backup in chain:
+                raise ValidationError("Chaîne de backups incrémentaux cyclique")
+            chain.append(backup)
+            backup = backup.parent_backup_id
+        return chain[::-1]
+
+    def _restore_tenant_archive(self, company, id_map):
+        """Restaure un ZIP de la chaîne (données, suppressions, filestore)"""
+        self.ensure_one()
+        tenant = self.tenant_id
+
+        # Extraire ZIP
+        temp_dir = os.path.join(
+            os.path.dirname(self.file_path),
+            f'restore_{tenant.code}_{self.id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+        )
+        os.makedirs(temp_dir, exist_ok=True)
+
+        try:
+            with zipfile.ZipFile(self.file_path, 'r') as zipf:
+                zipf.extractall(temp_dir)
+
+            # Lire metadata
+            metadata_path = os.path.join(temp_dir, 'metadata.json')
+            if not os.path.exists(metadata_path):
+                raise ValidationError("Metadata manquantes dans backup")
+
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+
+            # Vérifier compatibilité
+            if metadata['tenant_code'] != tenant.code:
+                _logger.warning(
+                    f"Tenant mismatch: backup={metadata['tenant_code']} "
+                    f"target={tenant.code} - Proceeding anyway"
+                )
+
+            # Lire données : NDJSON par modèle (v2) ou data.json (v1)
+            if metadata.get('format') == 'ndjson':
+                data = self._read_ndjson_data(os.path.join(temp_dir, 'data'))
+            else:
                 data_path = os.path.join(temp_dir, 'data.json')
                 if not os.path.exists(data_path):
                     raise ValidationError("data.json manquant dans backup")
@@ -520,95 +899,546 @@ class QuelyosBackup(models.Model):
                 with open(data_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
 
-                # Restaurer données (ordre critique)
-                self._restore_tenant_data(data, company)
+            # Restaurer données (ordre critique)
+            self._restore_tenant_data(data, company, id_map=id_map)
 
-                # Restaurer filestore
-                filestore_dir = os.path.join(temp_dir, 'filestore')
-                if os.path.exists(filestore_dir):
-                    self._restore_filestore(filestore_dir, company)
+            # Suppressions du delta
+            deleted_dir = os.path.join(temp_dir, 'deleted')
+            if os.path.isdir(deleted_dir):
+                self._restore_deletions(deleted_dir, company, id_map)
 
-                _logger.info(f"Tenant restore completed: {tenant.code}")
+            # Restaurer filestore : manifeste + magasin de fichiers, ou fichiers du ZIP (anciens backups)
+            manifest_path = os.path.join(temp_dir, 'attachments.json')
+            filestore_dir = os.path.join(temp_dir, 'filestore')
+            if metadata.get('filestore') == 'blobs' and os.path.exists(manifest_path):
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    self._restore_filestore_manifest(json.load(f), company, id_map)
+            elif os.path.exists(filestore_dir):
+                self._restore_filestore(filestore_dir, company)
+
+            _logger.info(f"Backup replayed: {self.filename}")
+
+        finally:
+            # Nettoyer temp dir
+            if os.path.exists(temp_dir):
+                shutil.rmtree(temp_dir)
+
+    def _restore_deletions(self, deleted_dir, company, id_map):
+        """Supprime les enregistrements disparus depuis le backup parent (enfants d'abord)"""
+        for model_name in reversed(TENANT_BACKUP_MODELS):
+            path = os.path.join(deleted_dir, f'{model_name}.json')
+            if not os.path.exists(path) or model_name not in self.env:
+                continue
 
-            finally:
-                # Nettoyer temp dir
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
+            with open(path, 'r', encoding='utf-8') as f:
+                ranges = json.load(f)
+
+            Model = self.env[model_name].sudo().with_context(active_test=False)
+            mapping = id_map.get(model_name, {})
+            old_ids = (record_id for start, end in ranges for record_id in range(start, end + 1))
+            deleted_count = 0
+            for chunk in split_every(self._restore_chunk_size, old_ids):
+                ids = [mapping.get(record_id, record_id) for record_id in chunk]
+                self.env.cr.execute(
+                    f'SELECT id FROM "{Model._table}" WHERE id = ANY(%s) AND company_id = %s',
+                    (ids, company.id),
+                )
+                records = Model.browse([row[0] for row in self.env.cr.fetchall()])
+                if not records:
+                    continue
+                try:
+                    with self.env.cr.savepoint():
+                        records.unlink()
+                    deleted_count += len(records)
+                except Exception as e:
+                    _logger.error(f"Error deleting records in {model_name}: {e}")
 
-        except Exception as e:
-            _logger.error(f"Tenant restore failed: {e}", exc_info=True)
-            raise
+            _logger.info(f"Deleted {deleted_count} records in {model_name}")
 
-    def _restore_tenant_data(self, data, company):
-        """Restaure données tenant (mode UPSERT)"""
-        # Ordre restauration (respecter dépendances)
-        models_order = [
-            'res.partner',
-            'product.category',
-            'product.template',
-            'product.product',
-            'product.pricelist',
-            'product.pricelist.item',
-            'account.tax',
-            'sale.order',
-            'sale.order.line',
-            'account.move',
-            'account.move.line',
-            'stock.location',
-            'stock.warehouse',
-            'stock.quant',
-            'stock.picking',
-            'stock.move',
-            'crm.lead',
-            'crm.stage',
-        ]
+        # Attachments supprimés (même id et même contenu)
+        path = os.path.join(deleted_dir, 'ir.attachment.json')
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                deleted = json.load(f)
+            Attachment = self.env['ir.attachment'].sudo()
+            checksums = {entry['id']: entry['checksum'] for entry in deleted}
+            attachments = Attachment.browse(list(checksums)).exists().filtered(
+                lambda attachment: attachment.checksum == checksums[attachment.id]
+            )
+            attachments.unlink()
+            _logger.info(f"Deleted {len(attachments)} attachments")
+
+    def _read_ndjson_data(self, data_dir):
+        """{modèle: itérateur d'enregistrements} depuis data/<modèle>/*.ndjson (lecture paresseuse)"""
+        def iter_records(model_dir):
+            for part in sorted(os.listdir(model_dir)):
+                with open(os.path.join(model_dir, part), 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            yield json.loads(line)
+
+        if not os.path.isdir(data_dir):
+            return {}
+        return {
+            model_name: iter_records(os.path.join(data_dir, model_name))
+            for model_name in os.listdir(data_dir)
+            if os.path.isdir(os.path.join(data_dir, model_name))
+        }
+
+    def _restore_tenant_data(self, data, company, workers=None, id_map=None):
+        """
+        Restaure données tenant (mode UPSERT, par lots).
+
+        Pour chaque lot de `_restore_chunk_size` enregistrements : une requête
+        d'existence, un create() multi-vals pour les nouveaux, des write()
+        groupés (valeurs identiques) pour les existants modifiés. Les champs
+        calculés sont recalculés une fois par lot, au flush.
+
+        workers=1 (défaut) : restauration séquentielle dans la transaction
+        courante, atomique (une erreur annule toute la chaîne rejouée).
+
+        workers>1 : les modèles indépendants (aucun many2one/many2many entre
+        eux) sont restaurés en parallèle, un curseur par modèle ; chaque niveau
+        de dépendance est committé avant le suivant. Non atomique : après un
+        échec, les niveaux déjà committés restent en base. La restauration
+        étant un upsert par id, la relancer complète la restauration.
+
+        id_map : correspondance {modèle: {ancien id: nouvel id}} à partager
+        entre les backups d'une chaîne incrémentale.
+
+        Returns:
+            dict: {modèle: {'created', 'updated', 'unchanged', 'failed'}}
+        """
+        if workers is None:
+            workers = int(self.env['ir.config_parameter'].sudo().get_param(
+                'quelyos.backup.restore_workers', 1
+            ))
+
+        models_order = []
+        for model_name in TENANT_BACKUP_MODELS:
+            if model_name not in data:
+                continue
+            if model_name not in self.env:
+                _logger.warning(f"Model {model_name} not found, skipping")
+                continue
+            models_order.append(model_name)
 
+        # Anciens ids -> nouveaux ids des enregistrements recréés
+        id_map = id_map if id_map is not None else {}
         for model_name in models_order:
-            if model_name not in data:
+            id_map.setdefault(model_name, {})
+        stats = {}
+
+        for level in self._get_restore_levels(models_order):
+            if workers <= 1 or len(level) == 1:
+                for model_name in level:
+                    stats[model_name] = self._restore_model(model_name, data[model_name], company, id_map)
                 continue
 
-            try:
-                if model_name not in self.env:
-                    _logger.warning(f"Model {model_name} not found, skipping")
+            # Niveaux précédents visibles des curseurs parallèles
+            self.env.cr.commit()
+            with ThreadPoolExecutor(max_workers=min(workers, len(level))) as executor:
+                futures = {
+                    executor.submit(self._restore_model_thread, model_name, data[model_name], company.id, id_map): model_name
+                    for model_name in level
+                }
+                try:
+                    for future in as_completed(futures):
+                        model_name = futures[future]
+                        stats[model_name], id_map[model_name] = future.result()
+                except Exception:
+                    _logger.error(
+                        "Parallel restore failed: levels before %s are committed, "
+                        "re-run the restore to complete it", level,
+                    )
+                    raise
+            self.env.invalidate_all()
+
+        return stats
+
+    def _restore_model_thread(self, model_name, records_data, company_id, id_map):
+        """
+        Restaure un modèle dans son propre curseur (thread du pool).
+
+        Le thread remplit une copie de la correspondance de son modèle, fusionnée
+        par l'appelant : id_map n'est jamais modifié depuis plusieurs threads.
+
+        Returns:
+            tuple: (stats, {ancien id: nouvel id} du modèle)
+        """
+        local_map = dict(id_map, **{model_name: dict(id_map[model_name])})
+        with self.env.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, dict(self.env.context))
+            backup = env['quelyos.backup'].browse(self.id)
+            stats = backup._restore_model(model_name, records_data, env['res.company'].browse(company_id), local_map)
+        return stats, local_map[model_name]
+
+    def _get_restore_levels(self, models_order):
+        """
+        Niveaux de dépendance : un modèle référençant un modèle précédent
+        (dans l'ordre de restauration) passe au niveau suivant.
+
+        Returns:
+            list: [[modèle, ...], ...] niveau par niveau
+        """
+        levels = {}
+        for index, model_name in enumerate(models_order):
+            previous = set(models_order[:index])
+            dependencies = {
+                field.comodel_name
+                for field in self._get_restore_fields(self.env[model_name]).values()
+                if field.type in ('many2one', 'many2many') and field.comodel_name in previous
+            }
+            levels[model_name] = 1 + max((levels[name] for name in dependencies), default=-1)
+
+        grouped = [[] for _level in range(max(levels.values(), default=-1) + 1)]
+        for model_name in models_order:
+            grouped[levels[model_name]].append(model_name)
+        return grouped
+
+    def _get_restore_fields(self, Model):
+        """Champs restaurables : stockés, modifiables, hors champs techniques"""
+        return {
+            name: field for name, field in Model._fields.items()
+            if field.store
+            and field.type != 'one2many'
+            and name not in RESTORE_SKIPPED_FIELDS
+            and not (field.compute and field.readonly)
+        }
+
+    def _restore_model(self, model_name, records_data, company, id_map):
+        """Restaure les enregistrements d'un modèle par lots"""
+        Model = self.env[model_name].sudo().with_context(
+            tracking_disable=True,
+            mail_notrack=True,
+            mail_create_nolog=True,
+            defer_parent_store_computation=True,
+            active_test=False,
+        )
+        restore_fields = self._get_restore_fields(Model)
+        # many2one vers le modèle lui-même (parent_id...) : écrits une fois tous les ids connus
+        self_refs = [
+            name for name, field in restore_fields.items()
+            if field.type == 'many2one' and field.comodel_name == model_name
+        ]
+        stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+        deferred = []
+
+        for chunk in split_every(self._restore_chunk_size, records_data):
+            self._restore_chunk(Model, chunk, company, restore_fields, self_refs, id_map, stats, deferred)
+
+        if deferred:
+            mapping = id_map[model_name]
+            groups = {}
+            for record_id, refs in deferred:
+                vals = {name: mapping.get(ref, ref) for name, ref in refs.items()}
+                groups.setdefault(tuple(sorted(vals.items())), []).append(record_id)
+            for key, record_ids in groups.items():
+                self._restore_write(Model.browse(record_ids), dict(key), stats, count=False)
+
+        if Model._parent_store:
+            Model._parent_store_compute()
+        self.env.flush_all()
+        self.env.invalidate_all()
+
+        _logger.info(
+            f"Restored {model_name}: {stats['created']} created, {stats['updated']} updated, "
+            f"{stats['unchanged']} unchanged, {stats['failed']} failed"
+        )
+        return stats
+
+    def _restore_chunk(self, Model, chunk, company, restore_fields, self_refs, id_map, stats, deferred):
+        """
+        Un lot : existence en une requête, create multi-vals, write groupés.
+
+        Les ids du backup sont lus à travers id_map : un enregistrement recréé
+        par une étape précédente de la chaîne est mis à jour, pas dupliqué.
+        """
+        mapping = id_map[Model._name]
+        ids = [mapping.get(record_data['id'], record_data['id']) for record_data in chunk if record_data.get('id')]
+        existing_ids = set()
+        if ids:
+            self.env.cr.execute(
+                f'SELECT id FROM "{Model._table}" WHERE id = ANY(%s) AND company_id = %s',
+                (ids, company.id),
+            )
+            existing_ids = {row[0] for row in self.env.cr.fetchall()}
+
+        to_create = []
+        to_update = []
+        # Colonnes traduites : {lang: valeur} réécrites telles quelles après l'ORM
+        translated = [name for name, field in restore_fields.items() if field.translate]
+        translations = []
+        for record_data in chunk:
+            vals = self._prepare_restore_vals(record_data, restore_fields, id_map, company)
+            refs = {name: vals.pop(name) for name in self_refs if vals.get(name)}
+            raw = {name: record_data[name] for name in translated if isinstance(record_data.get(name), dict)}
+            record_id = mapping.get(record_data.get('id'), record_data.get('id'))
+            if record_id in existing_ids:
+                to_update.append((record_id, vals))
+                if refs:
+                    deferred.append((record_id, refs))
+                if raw:
+                    translations.append((record_id, raw))
+            else:
+                to_create.append((record_data.get('id'), vals, refs, raw))
+
+        # Création : un create() pour le lot, enregistrement par enregistrement en cas d'erreur
+        if to_create:
+            created = self._restore_create(Model, [vals for _old_id, vals, _refs, _raw in to_create], stats)
+            for (old_id, _vals, refs, raw), record in zip(to_create, created):
+                if not record:
+                    continue
+                if old_id:
+                    mapping[old_id] = record.id
+                if refs:
+                    deferred.append((record.id, refs))
+                if raw:
+                    translations.append((record.id, raw))
+
+        # Mise à jour : uniquement les champs modifiés, write() groupés par valeurs identiques
+        if to_update:
+            records = Model.browse([record_id for record_id, _vals in to_update])
+            records.fetch([name for name in restore_fields if name not in self_refs])
+            groups = {}
+            for record, (_record_id, vals) in zip(records, to_update):
+                diff = self._restore_diff(record, vals, restore_fields)
+                if not diff:
+                    stats['unchanged'] += 1
                     continue
+                key = json.dumps(diff, sort_keys=True, default=str)
+                groups.setdefault(key, (diff, []))[1].append(record.id)
+            for diff, record_ids in groups.values():
+                self._restore_write(Model.browse(record_ids), diff, stats)
+
+        # Recalcul des champs calculés une fois par lot
+        self.env.flush_all()
+        if translations:
+            self._restore_translations(Model, translations)
+        self.env.invalidate_all()
+
+    def _restore_translations(self, Model, translations):
+        """
+        Colonnes jsonb traduites restaurées telles quelles, toutes langues.
+
+        L'ORM n'écrit que la langue du contexte : sans cette étape, les autres
+        traductions exportées seraient perdues. Lignes inchangées non réécrites.
+        """
+        by_field = {}
+        for record_id, values in translations:
+            for name, value in values.items():
+                by_field.setdefault(name, ([], []))
+                by_field[name][0].append(record_id)
+                by_field[name][1].append(json.dumps(value))
+        for name, (record_ids, values) in by_field.items():
+            self.env.cr.execute(f'''
+                UPDATE "{Model._table}" AS t
+                SET "{name}" = v.value::jsonb
+                FROM unnest(%s::int[], %s::text[]) AS v(id, value)
+                WHERE t.id = v.id AND t."{name}" IS DISTINCT FROM v.value::jsonb
+            ''', (record_ids, values))
+
+    def _prepare_restore_vals(self, record_data, restore_fields, id_map, company):
+        """Valeurs exportées -> vals ORM (références remappées, company forcée)"""
+        vals = {}
+        for name, value in record_data.items():
+            field = restore_fields.get(name)
+            if field is None:
+                continue
+            if field.type == 'many2one':
+                vals[name] = id_map.get(field.comodel_name, {}).get(value, value) if value else False
+            elif field.type == 'many2many':
+                mapping = id_map.get(field.comodel_name, {})
+                vals[name] = [Command.set([mapping.get(ref, ref) for ref in value or []])]
+            elif field.translate and isinstance(value, dict):
+                # Colonne jsonb {lang: valeur} (export NDJSON) : valeur de la langue
+                # courante pour l'ORM, toutes les langues via _restore_translations
+                vals[name] = value.get(self.env.lang or 'en_US') or value.get('en_US') or next(iter(value.values()), False)
+            else:
+                vals[name] = value
+        vals['company_id'] = company.id
+        return vals
+
+    def _restore_diff(self, record, vals, restore_fields):
+        """Champs dont la valeur restaurée diffère de la valeur actuelle"""
+        diff = {}
+        for name, value in vals.items():
+            field = restore_fields[name]
+            try:
+                current = field.convert_to_write(record[name], record)
+                restored = field.convert_to_write(
+                    field.convert_to_record(field.convert_to_cache(value, record), record), record
+                )
+            except Exception:
+                diff[name] = value
+                continue
+            if current != restored:
+                diff[name] = value
+        return diff
 
-                Model = self.env[model_name].sudo()
-                records_data = data[model_name]
+    def _restore_create(self, Model, vals_list, stats):
+        """create() multi-vals ; repli unitaire pour isoler les enregistrements invalides"""
+        try:
+            with self.env.cr.savepoint():
+                records = Model.create(vals_list)
+            stats['created'] += len(records)
+            return list(records)
+        except Exception as e:
+            _logger.warning(f"Batch create failed in {Model._name} ({e}), falling back to single creates")
 
-                restored_count = 0
-                for record_data in records_data:
-                    try:
-                        # Mode UPSERT : chercher existing
-                        record_id = record_data.get('id')
-                        existing = Model.search([
-                            ('id', '=', record_id),
-                            ('company_id', '=', company.id)
-                        ], limit=1)
-
-                        # Forcer company_id
-                        record_data['company_id'] = company.id
-
-                        if existing:
-                            # Update
-                            existing.write(record_data)
-                        else:
-                            # Create
-                            Model.create(record_data)
+        records = []
+        for vals in vals_list:
+            try:
+                with self.env.cr.savepoint():
+                    records.append(Model.create(vals))
+                stats['created'] += 1
+            except Exception as e:
+                _logger.error(f"Error restoring record in {Model._name}: {e}")
+                stats['failed'] += 1
+                records.append(None)
+        return records
 
-                        restored_count += 1
+    def _restore_write(self, records, vals, stats, count=True):
+        """write() groupé ; repli unitaire pour isoler les enregistrements invalides"""
+        try:
+            with self.env.cr.savepoint():
+                records.write(vals)
+            if count:
+                stats['updated'] += len(records)
+            return
+        except Exception as e:
+            _logger.warning(f"Grouped write failed in {records._name} ({e}), falling back to single writes")
 
-                    except Exception as e:
-                        _logger.error(f"Error restoring record in {model_name}: {e}")
-                        continue
+        for record in records:
+            try:
+                with self.env.cr.savepoint():
+                    record.write(vals)
+                if count:
+                    stats['updated'] += 1
+            except Exception as e:
+                _logger.error(f"Error restoring record {record} : {e}")
+                stats['failed'] += 1
+
+    def _restore_filestore_manifest(self, manifest, company, id_map):
+        """
+        Restaure les attachments d'un manifeste depuis le magasin de fichiers.
+
+        Contenu passé à l'ORM en binaire (sans base64), un fichier à la fois :
+        avec le stockage fichier d'Odoo (lui aussi adressé par checksum), un
+        fichier déjà présent dans le filestore n'est pas réécrit. Un attachment
+        identique (même contenu, même document) n'est pas recréé.
+        """
+        Attachment = self.env['ir.attachment'].sudo()
+        stats = {'created': 0, 'skipped': 0, 'failed': 0}
+
+        for chunk in split_every(self._restore_chunk_size, manifest):
+            entries = []
+            for entry in chunk:
+                res_model = entry.get('res_model')
+                res_id = entry.get('res_id')
+                if res_model and res_id:
+                    res_id = id_map.get(res_model, {}).get(res_id, res_id)
+                entries.append(dict(entry, res_id=res_id))
+
+            self.env.cr.execute("""
+                SELECT checksum, res_model, res_id, name
+                FROM ir_attachment
+                WHERE checksum = ANY(%s)
+            """, ([entry['checksum'] for entry in entries],))
+            existing = {tuple(row) for row in self.env.cr.fetchall()}
+
+            for entry in entries:
+                key = (entry['checksum'], entry.get('res_model') or None, entry.get('res_id') or None, entry.get('name'))
+                if key in existing:
+                    stats['skipped'] += 1
+                    continue
 
-                _logger.info(f"Restored {restored_count}/{len(records_data)} records in {model_name}")
+                blob_path = self._get_blob_path(entry['checksum'])
+                if not os.path.exists(blob_path):
+                    _logger.error(f"Missing blob {entry['checksum']} for attachment {entry.get('name')}")
+                    stats['failed'] += 1
+                    continue
 
-            except Exception as e:
-                _logger.error(f"Error restoring model {model_name}: {e}")
+                vals = {
+                    'name': entry.get('name') or entry['checksum'],
+                    'res_model': entry.get('res_model') or False,
+                    'res_id': entry.get('res_id') or False,
+                    'res_field': entry.get('res_field') or False,
+                    'mimetype': entry.get('mimetype'),
+                    'public': entry.get('public', False),
+                    'company_id': company.id,
+                }
+                try:
+                    with self.env.cr.savepoint():
+                        with open(blob_path, 'rb') as f:
+                            Attachment.create(dict(vals, raw=f.read()))
+                    existing.add(key)
+                    stats['created'] += 1
+                except Exception as e:
+                    _logger.error(f"Error restoring attachment {entry.get('name')}: {e}")
+                    stats['failed'] += 1
+
+        _logger.info(
+            f"Restored attachments: {stats['created']} created, "
+            f"{stats['skipped']} already present, {stats['failed']} failed"
+        )
+        return stats
+
+    def gc_backup_blobs(self):
+        """
+        Supprime du magasin les fichiers qui ne sont plus référencés par aucun
+        manifeste de backup tenant (après suppression de backups).
+
+        Reporté si un backup tenant est en cours (verrou BACKUP_BLOB_LOCK) :
+        ses fichiers ne sont pas encore dans un manifeste. Le verrou exclusif
+        bloque aussi les backups qui démarreraient pendant le nettoyage.
+        Curseur dédié : la liste des manifestes est lue après la prise du verrou.
+
+        Returns:
+            int: nombre de fichiers supprimés
+        """
+        with self.env.registry.cursor() as cr:
+            cr.execute("SELECT pg_try_advisory_lock(%s)", (BACKUP_BLOB_LOCK,))
+            if not cr.fetchone()[0]:
+                _logger.info("Tenant backup running, blob garbage collection postponed")
+                return 0
+            try:
+                # Instantané postérieur au verrou (backups terminés juste avant visibles)
+                cr.commit()
+                return self.with_env(self.env(cr=cr))._gc_backup_blobs_locked()
+            finally:
+                cr.execute("SELECT pg_advisory_unlock(%s)", (BACKUP_BLOB_LOCK,))
+
+    def _gc_backup_blobs_locked(self):
+        """Nettoyage du magasin, verrou BACKUP_BLOB_LOCK détenu"""
+        referenced = set()
+        backups = self.sudo().search([('type', '=', 'tenant'), ('status', '=', 'completed')])
+        for backup in backups:
+            if not backup.file_path or not os.path.exists(backup.file_path):
                 continue
+            with zipfile.ZipFile(backup.file_path, 'r') as zipf:
+                if 'attachments.json' not in zipf.namelist():
+                    continue
+                manifest = json.loads(zipf.read('attachments.json'))
+            if isinstance(manifest, list):
+                referenced.update(entry['checksum'] for entry in manifest)
+
+        removed = 0
+        blob_dir = self._get_blob_store_dir()
+        if not os.path.isdir(blob_dir):
+            return 0
+        for prefix in os.listdir(blob_dir):
+            prefix_dir = os.path.join(blob_dir, prefix)
+            for checksum in os.listdir(prefix_dir):
+                if checksum not in referenced:
+                    os.remove(os.path.join(prefix_dir, checksum))
+                    removed += 1
+
+        _logger.info(f"Backup blob store: {removed} unreferenced files removed")
+        return removed
 
     def _restore_filestore(self, filestore_dir, company):
-        """Restaure filestore tenant"""
+        """Restaure filestore tenant (anciens backups : fichiers dans le ZIP)"""
         try:
             Attachment = self.env['ir.attachment'].sudo()
             restored_count = 0
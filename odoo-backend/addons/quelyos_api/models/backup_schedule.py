@@ -71,6 +71,13 @@ class QuelyosBackupSchedule(models.Model):
         help='Nombre de backups à conserver (les plus anciens sont supprimés)'
     )
 
+    full_backup_interval = fields.Integer(
+        string='Backups incrémentaux entre deux complets',
+        required=True,
+        default=7,
+        help='Nombre de backups incrémentaux (delta) après un backup complet (0 = toujours complet)'
+    )
+
     last_run = fields.Datetime(
         string='Dernière exécution',
         readonly=True
@@ -209,9 +216,11 @@ class QuelyosBackupSchedule(models.Model):
         try:
             # Créer le backup
             Backup = self.env['quelyos.backup'].sudo()
+            parent = self._get_incremental_parent()
             backup = Backup.create({
                 'type': 'tenant',
                 'tenant_id': self.tenant_id.id,
+                'parent_backup_id': parent.id if parent else False,
                 'status': 'pending',
                 'triggered_by': self.env.ref('base.user_admin').id,  # System user
             })
@@ -280,8 +289,32 @@ class QuelyosBackupSchedule(models.Model):
             })
             self._send_notification('failed', None, str(e))
 
+    def _get_incremental_parent(self):
+        """
+        Parent du prochain backup : dernier backup complété du tenant, tant que
+        sa chaîne compte moins de full_backup_interval deltas (sinon complet).
+        """
+        self.ensure_one()
+        if self.full_backup_interval <= 0:
+            return False
+
+        last = self.env['quelyos.backup'].sudo().search([
+            ('tenant_id', '=', self.tenant_id.id),
+            ('type', '=', 'tenant'),
+            ('status', '=', 'completed'),
+        ], order='create_date desc', limit=1)
+        if not last or not last.watermarks:
+            return False
+
+        deltas = 0
+        backup = last
+        while backup.parent_backup_id:
+            deltas += 1
+            backup = backup.parent_backup_id
+        return last if deltas < self.full_backup_interval else False
+
     def _cleanup_old_backups(self):
-        """Supprime les backups anciens selon retention_count"""
+        """Supprime les backups anciens selon retention_count (bases des deltas conservés gardées)"""
         self.ensure_one()
 
         Backup = self.env['quelyos.backup'].sudo()
@@ -291,8 +324,14 @@ class QuelyosBackupSchedule(models.Model):
             ('status', '=', 'completed')
         ], order='create_date desc')
 
-        # Garder seulement retention_count backups
-        backups_to_delete = backups[self.retention_count:]
+        # Garder retention_count backups et les backups dont ils dépendent
+        kept = backups[:self.retention_count]
+        required = Backup
+        for backup in kept:
+            while backup:
+                required |= backup
+                backup = backup.parent_backup_id
+        backups_to_delete = backups - required
 
         if backups_to_delete:
             _logger.info(
@@ -313,6 +352,12 @@ class QuelyosBackupSchedule(models.Model):
                 # Supprimer record
                 backup.unlink()
 
+            # Fichiers du magasin référencés uniquement par les backups supprimés
+            try:
+                Backup.gc_backup_blobs()
+            except Exception as e:
+                _logger.warning(f"Could not clean backup blob store: {e}")
+
     def _send_notification(self, status, backup=None, error_message=None):
         """Envoie notification email"""
         self.ensure_one()
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+Panier e-commerce (/api/ecommerce/cart/*) sur le store éphémère lib/cart_store.py
+
+Cycle de vie :
+- ajout / modification / suppression : document du store uniquement ;
+  prix et taxes calculés à la modification de la ligne et conservés dans
+  le document (recalcul complet au plus tard après CART_PRICE_TTL secondes) ;
+- sauvegarde, checkout, paiement, coupon : le panier est matérialisé en
+  commande brouillon (sale.order, x_cart_owner = propriétaire) synchronisée
+  ligne à ligne ;
+- panier inactif depuis CART_PERSIST_AFTER secondes : matérialisé par le
+  cron, pour que la relance et le reporting des paniers abandonnés
+  (commandes brouillon) continuent de fonctionner ;
+- confirmation de la commande : panier supprimé du store.
+
+Un panier absent du store (expiré, store redémarré) est rechargé depuis sa
+dernière commande brouillon.
+
+Toute lecture suivie d'une écriture du document se fait sous le verrou du
+propriétaire (_lock) : des requêtes simultanées (double clic, appels
+parallèles du front) s'appliquent l'une après l'autre.
+"""
+
+import logging
+import time
+
+from odoo import models, api
+
+from ..lib.cache import CacheTTL
+from ..lib.cart_store import get_cart_store
+
+_logger = logging.getLogger(__name__)
+
+CART_PRICE_TTL = CacheTTL.CART
+CART_PERSIST_AFTER = 3600  # secondes d'inactivité avant matérialisation
+
+
+class QuelyosCart(models.AbstractModel):
+    _name = 'quelyos.cart'
+    _description = 'Panier e-commerce (store éphémère)'
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # LECTURE / ÉCRITURE DU STORE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def get_cart(self, owner, for_checkout=False):
+        """
+        Panier du propriétaire ('partner:<id>' ou 'guest:<email>'), prix à jour.
+
+        for_checkout : panier matérialisé au préalable, cart['order_id'] est
+        la commande brouillon à payer.
+        """
+        if for_checkout:
+            self.materialize(owner)
+        with self._lock(owner):
+            return self._load(owner)
+
+    def _lock(self, owner):
+        """Verrou de modification du panier (context manager)"""
+        return get_cart_store().lock(self.env.cr.dbname, owner)
+
+    def _load(self, owner):
+        """Panier du store, hydraté ou re-tarifé au besoin ; appelé sous _lock"""
+        cart = get_cart_store().get(self.env.cr.dbname, owner)
+        if cart is None:
+            cart = self._hydrate(owner)
+            self._price(cart)
+            self._save(owner, cart, pending=False)
+        elif cart['priced_at'] < time.time() - CART_PRICE_TTL:
+            self._price(cart)
+            self._save(owner, cart, pending=cart.get('pending', False))
+        return cart
+
+    def _save(self, owner, cart, pending=True):
+        cart['pending'] = pending
+        get_cart_store().save(self.env.cr.dbname, owner, cart, pending=pending)
+
+    def _touch(self, owner, cart, line_ids=None):
+        """Modification du panier : recalcul des lignes modifiées et des totaux"""
+        cart['updated_at'] = time.time()
+        self._price(cart, line_ids)
+        self._save(owner, cart, pending=bool(cart['lines']) or cart['order_id'] is not None)
+        return cart
+
+    def _new_cart(self, owner):
+        return {
+            'owner': owner,
+            'partner_id': int(owner.split(':', 1)[1]) if owner.startswith('partner:') else None,
+            'email': owner.split(':', 1)[1] if owner.startswith('guest:') else None,
+            'order_id': None,
+            'pricelist_id': None,
+            'lines': [],
+            'next_line_id': 1,
+            'amount_untaxed': 0.0,
+            'amount_tax': 0.0,
+            'amount_total': 0.0,
+            'priced_at': 0.0,
+            'updated_at': time.time(),
+        }
+
+    def _hydrate(self, owner):
+        """Panier absent du store : dernière commande brouillon du propriétaire, sinon panier vide"""
+        cart = self._new_cart(owner)
+        order = self.env['sale.order'].sudo().search([
+            ('x_cart_owner', '=', owner),
+            ('state', '=', 'draft'),
+        ], limit=1, order='id desc')
+        if order:
+            self._load_order_lines(cart, order)
+        return cart
+
+    def _load_order_lines(self, cart, order):
+        cart['order_id'] = order.id
+        cart['pricelist_id'] = order.pricelist_id.id or None
+        cart['lines'] = []
+        for line in order.order_line.filtered(lambda line: line.product_id and not line.display_type):
+            cart['lines'].append({'id': cart['next_line_id'], 'product_id': line.product_id.id, 'quantity': line.product_uom_qty})
+            cart['next_line_id'] += 1
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # OPÉRATIONS
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def add_product(self, owner, product_id, quantity):
+        """Ajoute (ou incrémente) un produit ; None si le produit n'existe pas"""
+        with self._lock(owner):
+            cart = self._load(owner)
+            line = next((line for line in cart['lines'] if line['product_id'] == product_id), None)
+            if line:
+                line['quantity'] += quantity
+            else:
+                if not self.env['product.product'].sudo().browse(product_id).exists():
+                    return None
+                line = {'id': cart['next_line_id'], 'product_id': product_id, 'quantity': quantity}
+                cart['next_line_id'] += 1
+                cart['lines'].append(line)
+            return self._touch(owner, cart, {line['id']})
+
+    @api.model
+    def set_quantity(self, owner, line_id, quantity):
+        """Modifie la quantité d'une ligne (suppression si <= 0) ; None si la ligne n'existe pas"""
+        with self._lock(owner):
+            cart = self._load(owner)
+            line = next((line for line in cart['lines'] if line['id'] == line_id), None)
+            if not line:
+                return None
+            if quantity <= 0:
+                cart['lines'].remove(line)
+            else:
+                line['quantity'] = quantity
+            return self._touch(owner, cart, {line_id})
+
+    @api.model
+    def clear(self, owner):
+        with self._lock(owner):
+            cart = self._load(owner)
+            cart['lines'] = []
+            return self._touch(owner, cart, set())
+
+    @api.model
+    def load_order(self, owner, order):
+        """Remplace le panier du propriétaire par une commande brouillon (lien de récupération)"""
+        cart = self._new_cart(owner)
+        self._load_order_lines(cart, order)
+        if order.x_cart_owner != owner:
+            order.x_cart_owner = owner
+        self._price(cart)
+        with self._lock(owner):
+            self._save(owner, cart, pending=False)
+        return cart
+
+    @api.model
+    def set_pricelist(self, owner, pricelist_id):
+        with self._lock(owner):
+            cart = self._load(owner)
+            cart['pricelist_id'] = pricelist_id
+            return self._touch(owner, cart)
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # PRIX ET TAXES
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _price(self, cart, line_ids=None):
+        """
+        Prix unitaire (liste de prix) et taxes des lignes `line_ids`
+        (toutes si None), puis totaux du panier.
+        """
+        lines = [line for line in cart['lines'] if line_ids is None or line['id'] in line_ids]
+        if lines:
+            partner = self.env['res.partner'].sudo().browse(cart['partner_id']) if cart['partner_id'] else None
+            pricelist = self._get_pricelist(cart, partner)
+            company = self.env.company
+            currency = pricelist.currency_id if pricelist else company.currency_id
+            fiscal_position = self.env['account.fiscal.position'].sudo()._get_fiscal_position(partner) if partner else None
+
+            products = self.env['product.product'].sudo().browse([line['product_id'] for line in lines])
+            for line, product in zip(lines, products):
+                price = pricelist._get_product_price(product, line['quantity']) if pricelist else product.lst_price
+                taxes = product.taxes_id.filtered(lambda tax: tax.company_id == company)
+                if fiscal_position:
+                    taxes = fiscal_position.map_tax(taxes)
+                amounts = taxes.compute_all(price, currency, line['quantity'], product=product, partner=partner)
+                line.update({
+                    'name': product.name,
+                    'price_unit': price,
+                    'price_subtotal': amounts['total_excluded'],
+                    'price_total': amounts['total_included'],
+                })
+
+        cart['amount_untaxed'] = round(sum(line.get('price_subtotal', 0.0) for line in cart['lines']), 2)
+        cart['amount_total'] = round(sum(line.get('price_total', 0.0) for line in cart['lines']), 2)
+        cart['amount_tax'] = round(cart['amount_total'] - cart['amount_untaxed'], 2)
+        if line_ids is None:
+            cart['priced_at'] = time.time()
+
+    def _get_pricelist(self, cart, partner):
+        """Liste de prix du panier (résolue une fois puis conservée dans le document)"""
+        Pricelist = self.env['product.pricelist'].sudo()
+        if cart['pricelist_id']:
+            pricelist = Pricelist.browse(cart['pricelist_id']).exists()
+            if pricelist:
+                return pricelist
+        if partner:
+            pricelist = partner.property_product_pricelist
+        else:
+            pricelist = Pricelist.search([('company_id', 'in', [False, self.env.company.id])], limit=1)
+        cart['pricelist_id'] = pricelist.id or None
+        return pricelist
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # MATÉRIALISATION EN COMMANDE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def materialize(self, owner):
+        """
+        Commande brouillon synchronisée avec le panier (créée au besoin).
+
+        Returns:
+            sale.order: commande brouillon, vide si le panier n'a ni ligne ni commande
+        """
+        with self._lock(owner):
+            return self._materialize(owner)
+
+    def _materialize(self, owner):
+        Order = self.env['sale.order'].sudo()
+        cart = self._load(owner)
+        order = Order.browse(cart['order_id']).exists() if cart['order_id'] else Order
+        if order and order.state != 'draft':
+            order = Order
+        if not order and not cart['lines']:
+            return Order
+
+        if not order:
+            vals = {'partner_id': self._get_partner(cart).id, 'x_cart_owner': owner}
+            if cart['pricelist_id']:
+                vals['pricelist_id'] = cart['pricelist_id']
+            order = Order.create(vals)
+        elif cart['pricelist_id'] and order.pricelist_id.id != cart['pricelist_id']:
+            order.pricelist_id = cart['pricelist_id']
+
+        # Synchronisation ligne à ligne (une ligne de commande par produit)
+        quantities = {line['product_id']: line['quantity'] for line in cart['lines']}
+        existing = order.order_line.filtered(lambda line: line.product_id and not line.display_type)
+        for line in existing:
+            quantity = quantities.pop(line.product_id.id, None)
+            if quantity is None:
+                line.unlink()
+            elif line.product_uom_qty != quantity:
+                line.product_uom_qty = quantity
+        if quantities:
+            self.env['sale.order.line'].sudo().create([
+                {'order_id': order.id, 'product_id': product_id, 'product_uom_qty': quantity}
+                for product_id, quantity in quantities.items()
+            ])
+
+        cart['order_id'] = order.id
+        self._save(owner, cart, pending=False)
+        return order
+
+    def _get_partner(self, cart):
+        """Client de la commande ; un invité est retrouvé (ou créé) par email"""
+        Partner = self.env['res.partner'].sudo()
+        if cart['partner_id']:
+            return Partner.browse(cart['partner_id'])
+        partner = Partner.search([('email', '=', cart['email'])], limit=1)
+        if not partner:
+            partner = Partner.create({'name': 'Guest', 'email': cart['email'], 'customer_rank': 1})
+        return partner
+
+    @api.model
+    def cron_persist_idle_carts(self, limit=500):
+        """Matérialise les paniers inactifs (relance et reporting des paniers abandonnés)"""
+        store = get_cart_store()
+        owners = store.idle_owners(self.env.cr.dbname, time.time() - CART_PERSIST_AFTER, limit)
+        persisted = 0
+        for owner in owners:
+            try:
+                with self.env.cr.savepoint():
+                    self.materialize(owner)
+                persisted += 1
+            except Exception as e:
+                _logger.error(f"Cart persist error ({owner}): {e}")
+        _logger.info("[CartStore] %d/%d idle carts persisted", persisted, len(owners))
+        return persisted
+
+    @api.model
+    def _discard_orders(self, orders):
+        """Commandes confirmées : paniers correspondants retirés du store"""
+        store = get_cart_store()
+        for order in orders.filtered('x_cart_owner'):
+            with self._lock(order.x_cart_owner):
+                cart = store.get(self.env.cr.dbname, order.x_cart_owner)
+                if cart and cart.get('order_id') == order.id:
+                    store.delete(self.env.cr.dbname, order.x_cart_owner)
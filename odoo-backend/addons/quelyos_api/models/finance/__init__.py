@@ -2,3 +2,10 @@
 """Modèles Finance Quelyos"""
 
 from . import oca
+
+# Prévision de trésorerie et KPIs CFO
+from . import cashflow_forecast
+from . import cfo_metric
+
+# Consolidation multi-sociétés
+from . import consolidation
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Prévision de trésorerie - Quelyos Native
+
+Flux de trésorerie net quotidien (lignes validées des comptes de liquidité
+et des comptes d'attente de paiement) agrégé pour tous les tenants en une
+requête groupée, puis modèle additif ajusté en NumPy :
+
+    y(t) = a + b·t + Σ Fourier hebdomadaire (ordre 3) + Σ Fourier annuel (ordre 4)
+
+Moindres carrés régularisés (ridge sur les termes saisonniers), résolus en
+une équation normale : quelques millisecondes pour plusieurs années
+d'historique. La saisonnalité annuelle n'est utilisée qu'à partir d'un an
+d'historique. Les paramètres ajustés sont conservés par tenant dans
+quelyos.cashflow.forecast ; les prédictions 30/60/90 jours sont une seule
+multiplication matricielle.
+"""
+
+import logging
+from datetime import timedelta
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+WEEKLY_ORDER = 3  # 7 jours entièrement décrits (1 + 2×3 degrés de liberté)
+YEARLY_ORDER = 4
+YEARLY_MIN_DAYS = 365
+SEASONAL_RIDGE = 1.0
+HOLDOUT_DAYS = 30
+MIN_HISTORY_DAYS = 28
+FORECAST_HORIZONS = (30, 60, 90)
+INTERVAL_Z = 1.96  # intervalle de prédiction à 95 %
+
+# Comptes de trésorerie : banque/caisse et comptes d'attente des paiements
+CASH_ACCOUNTS_QUERY = """
+    SELECT id FROM account_account WHERE account_type = 'asset_cash'
+    UNION
+    SELECT DISTINCT outstanding_account_id FROM account_payment
+    WHERE outstanding_account_id IS NOT NULL
+"""
+
+
+def _design_matrix(days, span, weekly_order, yearly_order):
+    """Matrice des régresseurs (constante, tendance, Fourier) pour des jours depuis l'origine"""
+    days = np.asarray(days, dtype=float)
+    columns = [np.ones_like(days), days / span]
+    for order, period in ((weekly_order, 7.0), (yearly_order, 365.25)):
+        if order:
+            angles = 2 * np.pi * np.outer(days, np.arange(1, order + 1)) / period
+            columns += [np.sin(angles), np.cos(angles)]
+    return np.column_stack(columns)
+
+
+def fit_cashflow_model(values):
+    """
+    Ajuste le modèle sur une série quotidienne dense (jour 0 = origine).
+
+    Returns:
+        dict: paramètres sérialisables {'coef', 'span', 'weekly_order', 'yearly_order', 'sigma'}
+    """
+    values = np.asarray(values, dtype=float)
+    span = float(len(values))
+    yearly_order = YEARLY_ORDER if len(values) >= YEARLY_MIN_DAYS else 0
+    design = _design_matrix(np.arange(len(values)), span, WEEKLY_ORDER, yearly_order)
+
+    # Ridge sur les termes saisonniers uniquement (constante et tendance libres)
+    penalty = np.full(design.shape[1], SEASONAL_RIDGE)
+    penalty[:2] = 0.0
+    coef = np.linalg.solve(design.T @ design + np.diag(penalty), design.T @ values)
+
+    residuals = values - design @ coef
+    return {
+        'coef': coef.tolist(),
+        'span': span,
+        'weekly_order': WEEKLY_ORDER,
+        'yearly_order': yearly_order,
+        'sigma': float(np.sqrt(np.mean(residuals ** 2))),
+    }
+
+
+def predict_cashflow_model(params, days):
+    """Prédictions vectorisées pour des jours depuis l'origine de l'historique"""
+    design = _design_matrix(days, params['span'], params['weekly_order'], params['yearly_order'])
+    return design @ np.asarray(params['coef'])
+
+
+def evaluate_cashflow_model(values, holdout=HOLDOUT_DAYS):
+    """
+    Validation hors échantillon : ajustement sans les `holdout` derniers jours,
+    erreurs sur ces jours.
+
+    Returns:
+        dict: {'mae', 'rmse', 'mape', 'r2'} (mape/r2 à None si non définis)
+    """
+    values = np.asarray(values, dtype=float)
+    holdout = min(holdout, len(values) // 5)
+    if holdout < 7:
+        return {'mae': None, 'rmse': None, 'mape': None, 'r2': None}
+
+    params = fit_cashflow_model(values[:-holdout])
+    actual = values[-holdout:]
+    errors = actual - predict_cashflow_model(params, np.arange(len(values) - holdout, len(values)))
+
+    # MAPE sur les jours avec flux (un jour sans mouvement rend l'erreur relative infinie)
+    nonzero = np.abs(actual) > 0.01
+    total_variance = np.sum((actual - actual.mean()) ** 2)
+    return {
+        'mae': float(np.mean(np.abs(errors))),
+        'rmse': float(np.sqrt(np.mean(errors ** 2))),
+        'mape': float(np.mean(np.abs(errors[nonzero] / actual[nonzero])) * 100) if nonzero.any() else None,
+        'r2': float(1 - np.sum(errors ** 2) / total_variance) if total_variance else None,
+    }
+
+
+class CashflowForecast(models.Model):
+    """Modèle de prévision de trésorerie entraîné (un par tenant)"""
+
+    _name = 'quelyos.cashflow.forecast'
+    _description = 'Prévision de trésorerie Quelyos'
+
+    tenant_id = fields.Many2one('quelyos.tenant', string='Tenant', required=True, ondelete='cascade')
+    model_params = fields.Json(string='Paramètres du modèle')
+    trained_at = fields.Datetime(string='Entraîné le')
+    months_history = fields.Integer(string="Mois d'historique")
+    history_start = fields.Date(string='Début historique')
+    history_end = fields.Date(string='Fin historique')
+    data_points = fields.Integer(string='Jours observés')
+    mae = fields.Float(string='MAE')
+    rmse = fields.Float(string='RMSE')
+    mape = fields.Float(string='MAPE (%)')
+    r2 = fields.Float(string='R²')
+
+    _sql_constraints = [
+        ('tenant_uniq', 'unique(tenant_id)', 'Un seul modèle de prévision par tenant'),
+    ]
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # ENTRAÎNEMENT
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def train(self, tenants, months_history=12):
+        """
+        Entraîne (ou ré-entraîne) le modèle des tenants donnés.
+
+        Returns:
+            quelyos.cashflow.forecast: modèles mis à jour (tenants avec assez d'historique)
+        """
+        months_history = min(max(int(months_history), 6), 60)
+        date_to = fields.Date.context_today(self) - timedelta(days=1)
+        date_from = date_to - relativedelta(months=months_history) + timedelta(days=1)
+
+        histories = self._load_daily_history(tenants.ids, date_from, date_to)
+        existing = {forecast.tenant_id.id: forecast for forecast in self.search([('tenant_id', 'in', tenants.ids)])}
+
+        trained = self.browse()
+        for tenant in tenants:
+            history = histories.get(tenant.id)
+            if not history:
+                continue
+
+            # Série dense depuis le premier mouvement (jours sans flux = 0)
+            start = min(history)
+            values = np.zeros((date_to - start).days + 1)
+            offsets = np.fromiter(((day - start).days for day in history), dtype=int, count=len(history))
+            values[offsets] = np.fromiter(history.values(), dtype=float, count=len(history))
+            if len(values) < MIN_HISTORY_DAYS:
+                continue
+
+            metrics = evaluate_cashflow_model(values)
+            params = fit_cashflow_model(values)
+            # Intervalle basé sur l'erreur hors échantillon quand elle est disponible
+            params['sigma'] = max(params['sigma'], metrics['rmse'] or 0.0)
+
+            vals = {
+                'model_params': params,
+                'trained_at': fields.Datetime.now(),
+                'months_history': months_history,
+                'history_start': start,
+                'history_end': date_to,
+                'data_points': len(history),
+                'mae': metrics['mae'] or 0.0,
+                'rmse': metrics['rmse'] or 0.0,
+                'mape': metrics['mape'] or 0.0,
+                'r2': metrics['r2'] or 0.0,
+            }
+            forecast = existing.get(tenant.id)
+            if forecast:
+                forecast.write(vals)
+            else:
+                forecast = self.create(dict(vals, tenant_id=tenant.id))
+            trained |= forecast
+
+        return trained
+
+    def _load_daily_history(self, tenant_ids, date_from, date_to):
+        """
+        Flux net quotidien (encaissements - décaissements) de tous les tenants
+        en une requête groupée : comptes de banque/caisse et comptes d'attente
+        des paiements (paiements validés non encore rapprochés).
+
+        Returns:
+            dict: {tenant_id: {date: montant net}}
+        """
+        if not tenant_ids:
+            return {}
+        self.env['account.move.line'].flush_model(['tenant_id', 'account_id', 'date', 'parent_state', 'balance'])
+        self.env['account.payment'].flush_model(['outstanding_account_id'])
+
+        self.env.cr.execute(f"""
+            WITH cash_accounts AS ({CASH_ACCOUNTS_QUERY})
+            SELECT aml.tenant_id, aml.date, SUM(aml.balance)
+            FROM account_move_line aml
+            WHERE aml.tenant_id = ANY(%(tenant_ids)s)
+              AND aml.account_id IN (SELECT id FROM cash_accounts)
+              AND aml.parent_state = 'posted'
+              AND aml.date BETWEEN %(date_from)s AND %(date_to)s
+            GROUP BY aml.tenant_id, aml.date
+        """, {'tenant_ids': list(tenant_ids), 'date_from': date_from, 'date_to': date_to})
+
+        histories = {}
+        for tenant_id, day, amount in self.env.cr.fetchall():
+            histories.setdefault(tenant_id, {})[day] = amount
+        return histories
+
+    @api.model
+    def cron_train_all(self, batch_size=200):
+        """Ré-entraînement quotidien de tous les tenants actifs (historique chargé par lot)"""
+        tenants = self.env['quelyos.tenant'].search([('active', '=', True)])
+        trained = 0
+        for start in range(0, len(tenants), batch_size):
+            trained += len(self.train(tenants[start:start + batch_size]))
+        _logger.info("[CashflowForecast] %d/%d tenants trained", trained, len(tenants))
+        return trained
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # PRÉDICTION
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def predict(self, days_ahead=90):
+        """
+        Prédictions quotidiennes à partir de demain, avec intervalle à 95 %
+        et synthèse 30/60/90 jours.
+
+        Returns:
+            dict: {'predictions': [...], 'summary': {'days30': {...}, ...}}
+        """
+        self.ensure_one()
+        params = self.model_params
+        days_ahead = max(int(days_ahead), 1)
+        horizon = max(days_ahead, *FORECAST_HORIZONS)
+
+        today = fields.Date.context_today(self)
+        first = (today - self.history_start).days + 1
+        predicted = predict_cashflow_model(params, np.arange(first, first + horizon))
+        margin = INTERVAL_Z * params['sigma']
+
+        predictions = [{
+            'date': (today + timedelta(days=offset + 1)).isoformat(),
+            'predicted': round(float(value), 2),
+            'lowerBound': round(float(value - margin), 2),
+            'upperBound': round(float(value + margin), 2),
+        } for offset, value in enumerate(predicted[:days_ahead])]
+
+        summary = {}
+        for days in FORECAST_HORIZONS:
+            window = predicted[:days]
+            summary[f'days{days}'] = {
+                'avgCashFlow': round(float(window.mean()), 2),
+                'minCashFlow': round(float(window.min()), 2),
+                'maxCashFlow': round(float(window.max()), 2),
+                'totalCashFlow': round(float(window.sum()), 2),
+                'trend': self._trend_label(window, params['sigma']),
+            }
+
+        return {'predictions': predictions, 'summary': summary}
+
+    @staticmethod
+    def _trend_label(window, sigma):
+        """Tendance sur l'horizon : variation de la droite ajustée comparée au bruit"""
+        slope = np.polyfit(np.arange(len(window)), window, 1)[0]
+        change = slope * len(window)
+        if abs(change) < 0.1 * max(abs(float(window.mean())), sigma, 1.0):
+            return 'stable'
+        return 'increasing' if change > 0 else 'decreasing'
@@ -0,0 +1,543 @@
+# -*- coding: utf-8 -*-
+"""
+Indicateurs CFO - Quelyos Native
+
+Une ligne par (tenant, mois) dans quelyos.finance.metric : flux du mois
+(chiffre d'affaires, charges, facturation clients/fournisseurs,
+encaissements/décaissements) et variation des soldes (créances, dettes,
+stocks, actif/passif circulant, trésorerie), agrégés en SQL depuis les
+écritures validées.
+
+Maintenance incrémentale : la validation (ou remise en brouillon) d'une
+écriture inscrit son mois dans quelyos_finance_metric_pending. Le cron vide
+cette file ; une lecture ne rattrape que METRIC_READ_CATCHUP mois en attente
+de son tenant. Les KPIs
+(DSO, DPO, DIO, CCC, ratios de liquidité, marges) et leurs tendances sur 24
+mois se calculent ensuite depuis une seule lecture indexée de l'historique
+mensuel (soldes de clôture cumulés par fenêtre SQL).
+"""
+
+import calendar
+import logging
+from datetime import date
+
+from odoo import models, fields, api
+from odoo.tools.sql import column_exists
+
+from .cashflow_forecast import CASH_ACCOUNTS_QUERY
+
+_logger = logging.getLogger(__name__)
+
+CURRENT_ASSET_TYPES = ('asset_receivable', 'asset_cash', 'asset_current', 'asset_prepayments')
+CURRENT_LIABILITY_TYPES = ('liability_current', 'liability_payable', 'liability_credit_card')
+EXPENSE_TYPES = ('expense', 'expense_direct_cost', 'expense_depreciation')
+
+# Flux du mois (sommés sur la fenêtre) et soldes (variation du mois, cumulée à la lecture)
+FLOW_MEASURES = (
+    'revenue', 'other_income', 'expenses', 'cogs', 'depreciation',
+    'receivable_billed', 'payable_billed',
+    'cash_in', 'cash_out', 'customer_payments', 'supplier_payments',
+)
+BALANCE_MEASURES = (
+    'receivable', 'payable', 'inventory', 'current_assets', 'current_liabilities', 'cash', 'total_assets',
+)
+
+# Mois en attente recalculés au plus par lecture (le reste par le cron)
+METRIC_READ_CATCHUP = 24
+
+# KPI : (unité, objectif, plus haut = meilleur)
+KPI_DEFINITIONS = {
+    'dso': ('days', 30, False),
+    'dpo': ('days', 45, True),
+    'dio': ('days', 30, False),
+    'cashConversionCycle': ('days', 25, False),
+    'workingCapital': ('amount', 0, True),
+    'workingCapitalRatio': ('ratio', 0.2, True),
+    'currentRatio': ('ratio', 2.0, True),
+    'quickRatio': ('ratio', 1.0, True),
+    'ebitdaMargin': ('percentage', 15, True),
+    'netProfitMargin': ('percentage', 10, True),
+}
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _period_window(period, current_month):
+    """Nombre de mois de la période en cours (mois, trimestre ou année civile)"""
+    if period == 'current_quarter':
+        return (current_month.month - 1) % 3 + 1
+    if period == 'current_year':
+        return current_month.month
+    return 1
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+
+class FinanceMetric(models.Model):
+    """Métriques financières mensuelles par tenant (base des KPIs CFO)"""
+
+    _name = 'quelyos.finance.metric'
+    _description = 'Métriques financières mensuelles Quelyos'
+    _log_access = False
+    _order = 'period'
+
+    tenant_id = fields.Many2one('quelyos.tenant', string='Tenant', required=True, ondelete='cascade')
+    period = fields.Date(string='Mois', required=True)
+
+    revenue = fields.Float(string="Chiffre d'affaires")
+    other_income = fields.Float(string='Autres produits')
+    expenses = fields.Float(string='Charges')
+    cogs = fields.Float(string='Coût des ventes')
+    depreciation = fields.Float(string='Dotations amortissements')
+    receivable_billed = fields.Float(string='Facturé clients')
+    payable_billed = fields.Float(string='Facturé fournisseurs')
+    cash_in = fields.Float(string='Encaissements')
+    cash_out = fields.Float(string='Décaissements')
+    customer_payments = fields.Float(string='Règlements clients')
+    supplier_payments = fields.Float(string='Règlements fournisseurs')
+
+    receivable = fields.Float(string='Variation créances clients')
+    payable = fields.Float(string='Variation dettes fournisseurs')
+    inventory = fields.Float(string='Variation stocks')
+    current_assets = fields.Float(string='Variation actif circulant')
+    current_liabilities = fields.Float(string='Variation passif circulant')
+    cash = fields.Float(string='Variation trésorerie')
+    total_assets = fields.Float(string='Variation total actif')
+
+    _sql_constraints = [
+        ('tenant_period_uniq', 'unique(tenant_id, period)', 'Une seule ligne de métriques par tenant et par mois'),
+    ]
+
+    def _auto_init(self):
+        # Nouvelle mesure : mois existants à recalculer (par le cron)
+        new_total_assets = not column_exists(self.env.cr, self._table, 'total_assets')
+        res = super()._auto_init()
+        if new_total_assets:
+            self.env.cr.execute("""
+                CREATE TABLE IF NOT EXISTS quelyos_finance_metric_pending (
+                    tenant_id integer NOT NULL,
+                    period date NOT NULL
+                )
+            """)
+            self.env.cr.execute("""
+                INSERT INTO quelyos_finance_metric_pending (tenant_id, period)
+                SELECT DISTINCT tenant_id, period FROM quelyos_finance_metric
+            """)
+        return res
+
+    def init(self):
+        super().init()
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS quelyos_finance_metric_pending (
+                tenant_id integer NOT NULL,
+                period date NOT NULL
+            )
+        """)
+        # Un mois en attente une seule fois (doublons des versions précédentes supprimés)
+        self.env.cr.execute("""
+            DELETE FROM quelyos_finance_metric_pending a
+            USING quelyos_finance_metric_pending b
+            WHERE a.ctid < b.ctid AND a.tenant_id = b.tenant_id AND a.period = b.period
+        """)
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS quelyos_finance_metric_pending_uniq
+            ON quelyos_finance_metric_pending (tenant_id, period)
+        """)
+        # Première installation : métriques de tout l'historique validé
+        self.env.cr.execute("SELECT 1 FROM quelyos_finance_metric LIMIT 1")
+        if not self.env.cr.fetchone():
+            self.env.cr.execute("""
+                SELECT DISTINCT tenant_id, date_trunc('month', date)::date
+                FROM account_move_line
+                WHERE parent_state = 'posted' AND tenant_id IS NOT NULL
+            """)
+            buckets = self.env.cr.fetchall()
+            if buckets:
+                self._refresh_buckets(buckets)
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # MAINTENANCE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def _mark_moves_dirty(self, moves):
+        """Inscrit les mois des écritures à recalculer"""
+        if not moves:
+            return
+        moves.flush_recordset(['tenant_id', 'date'])
+        self.env.cr.execute("""
+            INSERT INTO quelyos_finance_metric_pending (tenant_id, period)
+            SELECT DISTINCT am.tenant_id, date_trunc('month', am.date)::date
+            FROM account_move am
+            WHERE am.id = ANY(%s)
+              AND am.tenant_id IS NOT NULL
+            ON CONFLICT DO NOTHING
+        """, (moves.ids,))
+
+    @api.model
+    def _refresh_pending(self, tenant=None, limit=METRIC_READ_CATCHUP):
+        """
+        Recalcule les mois en attente du tenant (au plus `limit`, tous si None).
+
+        Mois verrouillés par une autre transaction ignorés (SKIP LOCKED) :
+        lectures concurrentes et cron ne s'attendent pas.
+
+        Returns:
+            int: nombre de mois recalculés
+        """
+        self.env['account.move.line'].flush_model()
+        self.env.cr.execute("""
+            DELETE FROM quelyos_finance_metric_pending
+            WHERE ctid IN (
+                SELECT ctid FROM quelyos_finance_metric_pending
+                WHERE %(tenant_id)s IS NULL OR tenant_id = %(tenant_id)s
+                ORDER BY period DESC
+                LIMIT %(limit)s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING tenant_id, period
+        """, {'tenant_id': tenant.id if tenant else None, 'limit': limit})
+        buckets = set(self.env.cr.fetchall())
+        if buckets:
+            self._refresh_buckets(buckets)
+        return len(buckets)
+
+    @api.model
+    def cron_refresh_pending(self):
+        """Cron : vidage de la file des mois en attente"""
+        refreshed = self._refresh_pending(limit=None)
+        _logger.info(f"Finance metrics: {refreshed} month(s) refreshed")
+
+    @api.model
+    def _refresh_buckets(self, buckets):
+        """Recalcule les métriques des mois `buckets` ({(tenant_id, premier jour du mois)})"""
+        self.flush_model()
+        tenant_ids, periods = zip(*buckets)
+        # Comptes de stocks : classe 3 du plan comptable (code dépendant de la société)
+        inventory_accounts = self.env['account.account'].sudo().with_context(active_test=False).search([
+            ('code', '=like', '3%'),
+        ])
+        params = {
+            'tenant_ids': list(tenant_ids),
+            'periods': list(periods),
+            'inventory_accounts': inventory_accounts.ids,
+            'current_assets': list(CURRENT_ASSET_TYPES),
+            'current_liabilities': list(CURRENT_LIABILITY_TYPES),
+            'expenses': list(EXPENSE_TYPES),
+        }
+
+        self.env.cr.execute("""
+            DELETE FROM quelyos_finance_metric m
+            USING unnest(%(tenant_ids)s::int[], %(periods)s::date[]) AS b(tenant_id, period)
+            WHERE m.tenant_id = b.tenant_id AND m.period = b.period
+        """, params)
+
+        self.env.cr.execute(f"""
+            WITH cash_accounts AS ({CASH_ACCOUNTS_QUERY}),
+            lines AS (
+                SELECT b.tenant_id, b.period, aml.move_id, aa.account_type,
+                       aml.debit, aml.credit, aml.balance,
+                       aml.account_id IN (SELECT id FROM cash_accounts) AS is_cash,
+                       aml.account_id = ANY(%(inventory_accounts)s) AS is_inventory
+                FROM unnest(%(tenant_ids)s::int[], %(periods)s::date[]) AS b(tenant_id, period)
+                JOIN account_move_line aml
+                  ON aml.tenant_id = b.tenant_id
+                 AND aml.date >= b.period AND aml.date < b.period + interval '1 month'
+                 AND aml.parent_state = 'posted'
+                JOIN account_account aa ON aa.id = aml.account_id
+            ),
+            cash_moves AS (
+                -- Flux de trésorerie net par écriture : les virements internes s'annulent
+                SELECT tenant_id, period,
+                       SUM(balance) FILTER (WHERE is_cash) AS net,
+                       -SUM(balance) FILTER (WHERE account_type = 'asset_receivable') AS customer_payments,
+                       SUM(balance) FILTER (WHERE account_type = 'liability_payable') AS supplier_payments
+                FROM lines
+                GROUP BY tenant_id, period, move_id
+                HAVING bool_or(is_cash)
+            ),
+            cash_totals AS (
+                SELECT tenant_id, period,
+                       SUM(net) FILTER (WHERE net > 0) AS cash_in,
+                       -SUM(net) FILTER (WHERE net < 0) AS cash_out,
+                       SUM(customer_payments) AS customer_payments,
+                       SUM(supplier_payments) AS supplier_payments
+                FROM cash_moves
+                GROUP BY tenant_id, period
+            ),
+            totals AS (
+                SELECT tenant_id, period,
+                       -SUM(balance) FILTER (WHERE account_type = 'income') AS revenue,
+                       -SUM(balance) FILTER (WHERE account_type = 'income_other') AS other_income,
+                       SUM(balance) FILTER (WHERE account_type = ANY(%(expenses)s)) AS expenses,
+                       SUM(balance) FILTER (WHERE account_type = 'expense_direct_cost') AS cogs,
+                       SUM(balance) FILTER (WHERE account_type = 'expense_depreciation') AS depreciation,
+                       SUM(debit) FILTER (WHERE account_type = 'asset_receivable') AS receivable_billed,
+                       SUM(credit) FILTER (WHERE account_type = 'liability_payable') AS payable_billed,
+                       SUM(balance) FILTER (WHERE account_type = 'asset_receivable') AS receivable,
+                       -SUM(balance) FILTER (WHERE account_type = 'liability_payable') AS payable,
+                       SUM(balance) FILTER (WHERE is_inventory) AS inventory,
+                       SUM(balance) FILTER (WHERE account_type = ANY(%(current_assets)s)) AS current_assets,
+                       -SUM(balance) FILTER (WHERE account_type = ANY(%(current_liabilities)s)) AS current_liabilities,
+                       SUM(balance) FILTER (WHERE is_cash) AS cash,
+                       SUM(balance) FILTER (WHERE account_type LIKE 'asset%%') AS total_assets
+                FROM lines
+                GROUP BY tenant_id, period
+            )
+            INSERT INTO quelyos_finance_metric (
+                tenant_id, period, {', '.join(FLOW_MEASURES + BALANCE_MEASURES)}
+            )
+            SELECT t.tenant_id, t.period,
+                   {', '.join(f'COALESCE({measure}, 0)' for measure in FLOW_MEASURES + BALANCE_MEASURES)}
+            FROM totals t
+            LEFT JOIN cash_totals c USING (tenant_id, period)
+        """, params)
+        self.invalidate_model()
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # LECTURE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def _get_monthly_series(self, tenant, month_to):
+        """
+        Historique mensuel du tenant jusqu'à `month_to` (inclus) en une lecture :
+        flux du mois et soldes de clôture cumulés. Les mois sans écriture sont
+        complétés (flux nuls, soldes reportés).
+
+        Returns:
+            list: [{'period': date, <mesure>: float, ...}, ...] du premier mois au mois demandé
+        """
+        self._refresh_pending(tenant)
+        self.env.cr.execute(f"""
+            SELECT period,
+                   {', '.join(FLOW_MEASURES)},
+                   {', '.join(f'SUM({measure}) OVER (ORDER BY period)' for measure in BALANCE_MEASURES)}
+            FROM quelyos_finance_metric
+            WHERE tenant_id = %s AND period <= %s
+            ORDER BY period
+        """, (tenant.id, month_to))
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return []
+
+        measures = FLOW_MEASURES + BALANCE_MEASURES
+        by_period = {row[0]: dict(zip(measures, row[1:])) for row in rows}
+
+        series = []
+        month = rows[0][0]
+        previous = dict.fromkeys(measures, 0.0)
+        while month <= month_to:
+            values = by_period.get(month) or dict(previous, **dict.fromkeys(FLOW_MEASURES, 0.0))
+            series.append(dict(values, period=month))
+            previous = values
+            month = _add_months(month, 1)
+        return series
+
+    def _window_days(self, first_month, last_month, today):
+        """Jours couverts par la fenêtre (mois en cours : jusqu'à aujourd'hui)"""
+        last_day = date(last_month.year, last_month.month, calendar.monthrange(last_month.year, last_month.month)[1])
+        return (min(last_day, today) - first_month).days + 1
+
+    def _compute_kpis(self, series, end, window, today):
+        """KPIs de la fenêtre de `window` mois se terminant à l'index `end` de la série"""
+        if end < 0:
+            return dict.fromkeys(KPI_DEFINITIONS)
+
+        months = series[max(end - window + 1, 0):end + 1]
+        flows = {measure: sum(month[measure] for month in months) for measure in FLOW_MEASURES}
+        closing = series[end]
+        days = self._window_days(months[0]['period'], closing['period'], today)
+
+        dso = _ratio(closing['receivable'] * days, flows['receivable_billed'])
+        dpo = _ratio(closing['payable'] * days, flows['payable_billed'])
+        dio = _ratio(closing['inventory'] * days, flows['cogs'])
+        net_profit = flows['revenue'] + flows['other_income'] - flows['expenses']
+
+        return {
+            'dso': dso,
+            'dpo': dpo,
+            'dio': dio,
+            'cashConversionCycle': (dso or 0.0) + (dio or 0.0) - (dpo or 0.0) if dso is not None else None,
+            'workingCapital': closing['current_assets'] - closing['current_liabilities'],
+            # Fonds de roulement rapporté au total de l'actif (distinct du ratio de liquidité générale)
+            'workingCapitalRatio': _ratio(
+                closing['current_assets'] - closing['current_liabilities'], closing['total_assets'],
+            ),
+            'currentRatio': _ratio(closing['current_assets'], closing['current_liabilities']),
+            'quickRatio': _ratio(closing['current_assets'] - closing['inventory'], closing['current_liabilities']),
+            'ebitdaMargin': _ratio((net_profit + flows['depreciation']) * 100, flows['revenue']),
+            'netProfitMargin': _ratio(net_profit * 100, flows['revenue']),
+        }
+
+    @staticmethod
+    def _kpi_status(value, benchmark, higher_is_better):
+        if value is None:
+            return 'unknown'
+        if not benchmark:
+            return 'good' if (value >= 0) == higher_is_better else 'critical'
+        score = value / benchmark if higher_is_better else (benchmark / value if value > 0 else 2.0)
+        if score >= 1.2:
+            return 'excellent'
+        if score >= 1.0:
+            return 'good'
+        if score >= 0.8:
+            return 'warning'
+        return 'critical'
+
+    @staticmethod
+    def _kpi_trend(value, previous):
+        if value is None or previous is None:
+            return 'stable'
+        if abs(value - previous) <= 0.02 * max(abs(previous), 1.0):
+            return 'stable'
+        return 'increasing' if value > previous else 'decreasing'
+
+    @api.model
+    def get_kpis(self, tenant, period='current_month'):
+        """
+        KPIs de la période en cours comparés à la période précédente de même durée.
+
+        Returns:
+            dict: {kpi: {'value', 'unit', 'trend', 'previousValue', 'benchmark', 'status'}}
+        """
+        today = fields.Date.context_today(self)
+        current_month = _month_start(today)
+        window = _period_window(period, current_month)
+
+        series = self._get_monthly_series(tenant, current_month)
+        end = len(series) - 1
+        current = self._compute_kpis(series, end, window, today)
+        previous = self._compute_kpis(series, end - window, window, today)
+
+        kpis = {}
+        for code, (unit, benchmark, higher_is_better) in KPI_DEFINITIONS.items():
+            value, previous_value = current[code], previous[code]
+            kpis[code] = {
+                'value': round(value, 2) if value is not None else None,
+                'unit': unit,
+                'trend': self._kpi_trend(value, previous_value),
+                'previousValue': round(previous_value, 2) if previous_value is not None else None,
+                'benchmark': benchmark,
+                'status': self._kpi_status(value, benchmark, higher_is_better),
+            }
+        return kpis
+
+    @api.model
+    def get_kpi_codes(self):
+        return list(KPI_DEFINITIONS)
+
+    @api.model
+    def get_trends(self, tenant, kpi='dso', months=12):
+        """Valeur mensuelle d'un KPI sur les `months` derniers mois"""
+        today = fields.Date.context_today(self)
+        current_month = _month_start(today)
+        series = self._get_monthly_series(tenant, current_month)
+        index = {month['period']: position for position, month in enumerate(series)}
+
+        trends = []
+        for offset in range(months - 1, -1, -1):
+            month = _add_months(current_month, -offset)
+            position = index.get(month, -1)
+            value = self._compute_kpis(series, position, 1, today)[kpi] if position >= 0 else None
+            trends.append({
+                'month': month.strftime('%Y-%m'),
+                'value': round(value, 1) if value is not None else None,
+            })
+        return trends
+
+    @api.model
+    def get_cashflow_summary(self, tenant, period='current_month'):
+        """Encaissements, décaissements et solde de trésorerie de la période"""
+        today = fields.Date.context_today(self)
+        current_month = _month_start(today)
+        window = _period_window(period, current_month)
+        first_month = _add_months(current_month, -(window - 1))
+
+        series = self._get_monthly_series(tenant, current_month)
+        before = [month for month in series if month['period'] < first_month]
+        months = [month for month in series if month['period'] >= first_month]
+
+        opening = before[-1]['cash'] if before else 0.0
+        inflows = sum(month['cash_in'] for month in months)
+        outflows = sum(month['cash_out'] for month in months)
+        customer_payments = min(sum(month['customer_payments'] for month in months), inflows)
+        supplier_payments = min(sum(month['supplier_payments'] for month in months), outflows)
+        closing = opening + inflows - outflows
+        days = self._window_days(first_month, current_month, today)
+        burn_rate = outflows / days if days else 0.0
+
+        return {
+            'openingBalance': round(opening, 2),
+            'inflows': {
+                'customerPayments': round(customer_payments, 2),
+                'otherRevenue': round(inflows - customer_payments, 2),
+                'total': round(inflows, 2),
+            },
+            'outflows': {
+                'supplierPayments': round(-supplier_payments, 2),
+                'other': round(-(outflows - supplier_payments), 2),
+                'total': round(-outflows, 2),
+            },
+            'netCashFlow': round(inflows - outflows, 2),
+            'closingBalance': round(closing, 2),
+            'burnRate': round(burn_rate, 2),  # Décaissements par jour
+            'runway': round(closing / burn_rate, 1) if burn_rate else None,  # Jours d'autonomie
+        }
+
+    @api.model
+    def get_alerts(self, tenant):
+        """Alertes CFO déduites des KPIs du mois et de la trésorerie"""
+        kpis = self.get_kpis(tenant)
+        cash = self.get_cashflow_summary(tenant)
+        now = fields.Datetime.now().isoformat()
+        alerts = []
+
+        def add(severity, alert_type, title, message, recommendation):
+            alerts.append({
+                'id': len(alerts) + 1,
+                'severity': severity,
+                'type': alert_type,
+                'title': title,
+                'message': message,
+                'recommendation': recommendation,
+                'createdAt': now,
+            })
+
+        dso = kpis['dso']
+        if dso['status'] in ('warning', 'critical'):
+            add('warning' if dso['status'] == 'warning' else 'critical', 'dso_high', 'DSO élevé',
+                f"Le DSO ({dso['value']}j) dépasse l'objectif de {dso['benchmark']}j",
+                'Intensifier relances clients ou revoir conditions paiement')
+
+        current_ratio = kpis['currentRatio']['value']
+        if current_ratio is not None and current_ratio < 1:
+            add('critical', 'liquidity_low', 'Liquidité insuffisante',
+                f'Le ratio de liquidité générale ({current_ratio}) est inférieur à 1',
+                'Renégocier les échéances fournisseurs ou renforcer le fonds de roulement')
+
+        if cash['closingBalance'] < 0:
+            add('critical', 'cash_negative', 'Trésorerie négative',
+                f"Solde de trésorerie de {cash['closingBalance']:.2f}",
+                'Mobiliser une ligne de financement court terme')
+        elif cash['runway'] is not None and cash['runway'] < 30:
+            add('warning', 'cash_low', 'Trésorerie à surveiller',
+                f"Autonomie de trésorerie estimée à {cash['runway']:.0f} jours",
+                'Anticiper besoins financement ou accélérer encaissements')
+
+        margin = kpis['netProfitMargin']['value']
+        if margin is not None and margin < 0:
+            add('warning', 'margin_negative', 'Marge nette négative',
+                f'La marge nette du mois est de {margin}%',
+                'Analyser la structure de coûts et la politique tarifaire')
+
+        return alerts
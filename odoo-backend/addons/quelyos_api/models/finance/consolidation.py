@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+"""
+Consolidation multi-sociétés - Quelyos Native
+
+Groupe = société du tenant et ses filiales (res.company.parent_id).
+
+1. Agrégation : une requête groupée par société (soldes par type de compte
+   et par société partenaire du groupe), exécutées en parallèle, un curseur
+   par société.
+2. Conversion : devise de chaque société vers la devise de la société mère
+   au taux de la date de clôture (table de taux chargée en une requête et
+   mise en cache par version des taux) ; devise sans taux signalée.
+3. Intégration proportionnelle : soldes × pourcentage de consolidation.
+4. Éliminations : soldes réciproques des paires de sociétés (créances /
+   dettes, prêts, ventes / achats) rapprochés en bloc ; le montant éliminé
+   est le plus petit des deux côtés, l'écart est signalé.
+
+Les résultats sont conservés dans quelyos.consolidation.cache par (rapport,
+dates, entités, versions des sociétés et des taux) : la validation d'une
+écriture d'une des sociétés concernées change leur version.
+"""
+
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from odoo import models, fields, api, tools, SUPERUSER_ID
+
+from .cfo_metric import CURRENT_ASSET_TYPES, CURRENT_LIABILITY_TYPES
+
+_logger = logging.getLogger(__name__)
+
+# Durée de validité d'un résultat en cache (secondes), paramètre quelyos.consolidation.cache_ttl
+CONSOLIDATION_CACHE_TTL = 24 * 3600
+
+RESULT_TYPES = ('income', 'income_other', 'expense', 'expense_direct_cost', 'expense_depreciation')
+
+# Sections : (clé, libellé, types de compte, signe appliqué au solde débit - crédit)
+BALANCE_SHEET_SECTIONS = {
+    'assets': [
+        ('fixed', 'Actif Immobilisé', ('asset_non_current', 'asset_fixed'), 1),
+        ('current', 'Actif Circulant', CURRENT_ASSET_TYPES, 1),
+    ],
+    'liabilities': [
+        # Résultat non affecté inclus dans les capitaux propres
+        ('equity', 'Capitaux Propres', ('equity', 'equity_unaffected') + RESULT_TYPES, -1),
+        ('longTerm', 'Dettes Long Terme', ('liability_non_current',), -1),
+        ('current', 'Dettes Court Terme', CURRENT_LIABILITY_TYPES, -1),
+    ],
+}
+
+PROFIT_LOSS_SECTIONS = [
+    ('revenue', "Chiffre d'Affaires", ('income',)),
+    ('costOfSales', 'Coût des Ventes', ('expense_direct_cost',)),
+    ('operatingExpenses', 'Charges Opérationnelles', ('expense',)),
+    ('depreciation', 'Dotations aux Amortissements', ('expense_depreciation',)),
+    ('otherIncome', 'Autres Produits', ('income_other',)),
+]
+
+# Éliminations : (type, libellé, types côté vendeur/prêteur, types côté acheteur/emprunteur)
+ELIMINATION_RULES = {
+    'balance_sheet': [
+        ('inter_company_receivables', 'Créances / dettes inter-sociétés', ('asset_receivable',), ('liability_payable',)),
+        ('inter_company_loans', 'Prêts inter-sociétés', ('asset_non_current',), ('liability_non_current',)),
+    ],
+    'profit_loss': [
+        ('inter_company_sales', 'Ventes inter-sociétés', ('income',), ('expense', 'expense_direct_cost')),
+    ],
+}
+
+
+class ResCompany(models.Model):
+    _inherit = 'res.company'
+
+    consolidation_percent = fields.Float(
+        string='Pourcentage de consolidation',
+        default=100.0,
+        help="Part de la société intégrée dans les comptes consolidés du groupe (intégration proportionnelle)",
+    )
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'consolidation_percent' in vals or 'parent_id' in vals or 'currency_id' in vals:
+            self.env['quelyos.consolidation.cache']._invalidate_companies(self.ids)
+        return res
+
+
+class ConsolidationCache(models.Model):
+    """
+    Résultats consolidés par (rapport, dates, entités, versions).
+
+    La clé inclut la version de chaque société du groupe et celle des taux de
+    change : une validation d'écriture ajoute une version à ses sociétés
+    (journal `quelyos_consolidation_version`, numérotée par séquence, sans
+    ligne partagée entre transactions). Un rapport calculé avant le commit
+    d'une validation garde l'ancienne version dans sa clé et n'est plus lu
+    une fois la validation visible. Les lignes expirées ou devenues
+    inaccessibles sont purgées par cron.
+    """
+
+    _name = 'quelyos.consolidation.cache'
+    _description = 'Cache des rapports consolidés'
+    _log_access = False
+
+    cache_key = fields.Char(string='Clé', required=True, index=True)
+    company_key = fields.Char(string='Sociétés', required=True)  # ",1,4,7,"
+    data = fields.Json(string='Résultat')
+    computed_at = fields.Datetime(string='Calculé le', index=True)
+
+    _sql_constraints = [
+        ('cache_key_uniq', 'unique(cache_key)', 'Clé de cache unique'),
+    ]
+
+    def init(self):
+        super().init()
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS quelyos_consolidation_version (
+                company_id integer NOT NULL,
+                version bigint NOT NULL
+            )
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS quelyos_consolidation_version_company_idx
+            ON quelyos_consolidation_version (company_id, version)
+        """)
+        self.env.cr.execute("CREATE SEQUENCE IF NOT EXISTS quelyos_consolidation_version_seq")
+
+    @api.model
+    def _invalidate_companies(self, company_ids):
+        """Écritures validées : nouvelle version des sociétés, les résultats qui les incluent ne sont plus lus"""
+        if not company_ids:
+            return
+        self.env.cr.execute("""
+            INSERT INTO quelyos_consolidation_version (company_id, version)
+            SELECT company_id, nextval('quelyos_consolidation_version_seq')
+            FROM unnest(%s::int[]) AS company_id
+        """, (list(company_ids),))
+
+    @api.model
+    def _get_versions_key(self, company_ids):
+        """Versions visibles des sociétés : "1-42,4-17" (0 si jamais invalidée)"""
+        self.env.cr.execute("""
+            SELECT company_id, max(version)
+            FROM quelyos_consolidation_version
+            WHERE company_id = ANY(%s)
+            GROUP BY company_id
+        """, (list(company_ids),))
+        versions = dict(self.env.cr.fetchall())
+        return ','.join(f'{company_id}-{versions.get(company_id, 0)}' for company_id in sorted(company_ids))
+
+    @api.model
+    def _lookup(self, cache_key):
+        """Résultat en cache non expiré, None sinon"""
+        ttl = int(self.env['ir.config_parameter'].sudo().get_param(
+            'quelyos.consolidation.cache_ttl', CONSOLIDATION_CACHE_TTL,
+        ))
+        cached = self.search([
+            ('cache_key', '=', cache_key),
+            ('computed_at', '>=', fields.Datetime.now() - timedelta(seconds=ttl)),
+        ], limit=1)
+        return cached.data if cached else None
+
+    @api.model
+    def _store(self, cache_key, company_key, data):
+        """Upsert : deux calculs concurrents de la même clé écrivent le même résultat"""
+        self.flush_model()
+        self.env.cr.execute("""
+            INSERT INTO quelyos_consolidation_cache (cache_key, company_key, data, computed_at)
+            VALUES (%s, %s, %s::jsonb, %s)
+            ON CONFLICT (cache_key) DO UPDATE
+            SET data = EXCLUDED.data, computed_at = EXCLUDED.computed_at
+        """, (cache_key, company_key, json.dumps(data), fields.Datetime.now()))
+        self.invalidate_model()
+
+    @api.model
+    def cron_purge(self):
+        """Supprime les résultats expirés et les versions dépassées"""
+        ttl = int(self.env['ir.config_parameter'].sudo().get_param(
+            'quelyos.consolidation.cache_ttl', CONSOLIDATION_CACHE_TTL,
+        ))
+        self.flush_model()
+        self.env.cr.execute(
+            "DELETE FROM quelyos_consolidation_cache WHERE computed_at < %s",
+            (fields.Datetime.now() - timedelta(seconds=ttl),),
+        )
+        purged = self.env.cr.rowcount
+        # Seule la dernière version de chaque société sert aux clés
+        self.env.cr.execute("""
+            DELETE FROM quelyos_consolidation_version v
+            USING (
+                SELECT company_id, max(version) AS version
+                FROM quelyos_consolidation_version
+                GROUP BY company_id
+            ) latest
+            WHERE v.company_id = latest.company_id AND v.version < latest.version
+        """)
+        self.invalidate_model()
+        _logger.info("Consolidation cache purge: %d results, %d versions removed", purged, self.env.cr.rowcount)
+        return purged
+
+
+class FinanceConsolidation(models.AbstractModel):
+    """Moteur de consolidation (bilan, compte de résultat, éliminations)"""
+
+    _name = 'quelyos.finance.consolidation'
+    _description = 'Consolidation financière Quelyos'
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # PÉRIMÈTRE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def get_group_companies(self, tenant, entity_ids=None):
+        """Société du tenant et filiales, éventuellement restreintes à `entity_ids`"""
+        domain = [('id', 'child_of', tenant.company_id.id)]
+        if entity_ids:
+            domain.append(('id', 'in', [int(entity_id) for entity_id in entity_ids]))
+        return self.env['res.company'].sudo().search(domain, order='parent_path')
+
+    @api.model
+    def get_entities(self, tenant):
+        root = tenant.company_id
+        return [{
+            'id': company.id,
+            'name': company.name,
+            'code': company.company_registry or company.name[:8].upper(),
+            'currency': company.currency_id.name,
+            'consolidationPercent': company.consolidation_percent,
+            'parent': company.parent_id.id or None,
+            'type': 'parent' if company == root else 'subsidiary',
+        } for company in self.get_group_companies(tenant)]
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # RAPPORTS
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def get_balance_sheet(self, tenant, date_at, entity_ids=None, workers=None):
+        return self._get_report('balance_sheet', tenant, None, date_at, entity_ids, workers)
+
+    @api.model
+    def get_profit_loss(self, tenant, date_from, date_to, entity_ids=None, workers=None):
+        return self._get_report('profit_loss', tenant, date_from, date_to, entity_ids, workers)
+
+    @api.model
+    def get_eliminations(self, tenant, date_from, date_to, entity_ids=None, workers=None):
+        """Éliminations de bilan à la clôture et de résultat sur la période"""
+        balance_sheet = self._get_report('balance_sheet', tenant, None, date_to, entity_ids, workers)
+        profit_loss = self._get_report('profit_loss', tenant, date_from, date_to, entity_ids, workers)
+        eliminations = [dict(elimination) for elimination in balance_sheet['eliminations'] + profit_loss['eliminations']]
+        for index, elimination in enumerate(eliminations, 1):
+            elimination['id'] = index
+        return eliminations
+
+    def _get_report(self, report, tenant, date_from, date_to, entity_ids, workers):
+        companies = self.get_group_companies(tenant, entity_ids)
+        if not companies:
+            return {'entities': [], 'report': {}, 'eliminations': [], 'missingRates': []}
+
+        company_key = f",{','.join(str(company_id) for company_id in sorted(companies.ids))},"
+        root = tenant.company_id
+        currency_ids = tuple(sorted(set(companies.currency_id.ids) | {root.currency_id.id}))
+        rate_version = self._get_rate_version(currency_ids)
+        Cache = self.env['quelyos.consolidation.cache'].sudo()
+        cache_key = (
+            f'{report}:{tenant.id}:{date_from or ""}:{date_to}:{company_key}'
+            f':{Cache._get_versions_key(companies.ids)}:{rate_version}'
+        )
+        cached = Cache._lookup(cache_key)
+        if cached is not None:
+            return cached
+
+        result = self._consolidate(report, root, companies, date_from, date_to, workers, rate_version)
+        Cache._store(cache_key, company_key, result)
+        return result
+
+    def _consolidate(self, report, root, companies, date_from, date_to, workers=None, rate_version=None):
+        """Agrège, convertit, pondère et élimine ; retourne le rapport JSON-sérialisable"""
+        if workers is None:
+            workers = int(self.env['ir.config_parameter'].sudo().get_param('quelyos.consolidation.workers', 4))
+
+        raw = self._aggregate_entities(companies, date_from, date_to, workers)
+
+        # Conversion devise société -> devise mère, puis pondération
+        currency_ids = tuple(sorted(set(companies.currency_id.ids) | {root.currency_id.id}))
+        if rate_version is None:
+            rate_version = self._get_rate_version(currency_ids)
+        rates = self._get_rate_table(root.id, date_to, currency_ids, rate_version)
+        group_rate = rates.get(root.currency_id.id, 1.0)
+        # Devise de filiale sans taux à la date : convertie à 1.0, signalée
+        missing_rates = sorted({
+            company.currency_id.name for company in companies
+            if company.currency_id != root.currency_id and company.currency_id.id not in rates
+        })
+        if missing_rates:
+            _logger.warning(
+                "Consolidation %s of company %s at %s: no rate for %s, converted at 1.0",
+                report, root.id, date_to, ', '.join(missing_rates),
+            )
+        balances = {}
+        for company in companies:
+            factor = group_rate / rates.get(company.currency_id.id, 1.0) * company.consolidation_percent / 100.0
+            balances[company.id] = {key: amount * factor for key, amount in raw[company.id].items()}
+
+        eliminated, eliminations = self._compute_eliminations(companies, balances, ELIMINATION_RULES[report])
+
+        entities = [{'id': company.id, 'name': company.name, 'currency': company.currency_id.name} for company in companies]
+        builder = self._build_profit_loss if report == 'profit_loss' else self._build_balance_sheet
+        return {
+            'entities': entities,
+            'currency': root.currency_id.name,
+            'report': builder(companies, balances, eliminated),
+            'eliminations': eliminations,
+            'missingRates': missing_rates,
+        }
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # AGRÉGATION PARALLÈLE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _aggregate_entities(self, companies, date_from, date_to, workers):
+        """
+        Soldes de chaque société, une requête groupée par société.
+
+        En parallèle (workers > 1), chaque requête tourne dans son propre
+        curseur et ne voit que les données committées ; workers=1 : requêtes
+        séquentielles dans la transaction courante.
+
+        Returns:
+            dict: {company_id: {(account_type, société partenaire ou None): solde}}
+        """
+        self.env['account.move.line'].flush_model()
+        group_ids = companies.ids
+        if workers <= 1 or len(companies) == 1:
+            return {
+                company_id: self._aggregate_entity(company_id, group_ids, date_from, date_to)
+                for company_id in group_ids
+            }
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(companies))) as executor:
+            futures = {
+                executor.submit(self._aggregate_entity_thread, company_id, group_ids, date_from, date_to): company_id
+                for company_id in group_ids
+            }
+            return {futures[future]: future.result() for future in as_completed(futures)}
+
+    def _aggregate_entity_thread(self, company_id, group_ids, date_from, date_to):
+        """Agrège une société dans son propre curseur (thread du pool)"""
+        with self.env.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, dict(self.env.context))
+            return env[self._name]._aggregate_entity(company_id, group_ids, date_from, date_to)
+
+    def _aggregate_entity(self, company_id, group_ids, date_from, date_to):
+        self.env.cr.execute("""
+            SELECT aa.account_type, pc.id, SUM(aml.balance)
+            FROM account_move_line aml
+            JOIN account_account aa ON aa.id = aml.account_id
+            LEFT JOIN res_partner rp ON rp.id = aml.partner_id
+            LEFT JOIN res_company pc
+                   ON pc.partner_id = rp.commercial_partner_id
+                  AND pc.id = ANY(%(group_ids)s)
+                  AND pc.id <> %(company_id)s
+            WHERE aml.company_id = %(company_id)s
+              AND aml.parent_state = 'posted'
+              AND aml.date <= %(date_to)s
+              AND (%(date_from)s::date IS NULL OR aml.date >= %(date_from)s)
+            GROUP BY aa.account_type, pc.id
+        """, {'company_id': company_id, 'group_ids': group_ids, 'date_from': date_from, 'date_to': date_to})
+        return {(account_type, partner_company_id): amount for account_type, partner_company_id, amount in self.env.cr.fetchall()}
+
+    @api.model
+    def _get_rate_version(self, currency_ids):
+        """Version des taux des devises : change à chaque création, modification ou suppression"""
+        self.env['res.currency.rate'].flush_model()
+        self.env.cr.execute("""
+            SELECT count(*), max(write_date)
+            FROM res_currency_rate
+            WHERE currency_id = ANY(%s)
+        """, (list(currency_ids),))
+        count, last_write = self.env.cr.fetchone()
+        return f'{count}-{last_write.isoformat() if last_write else ""}'
+
+    @api.model
+    @tools.ormcache('company_id', 'date', 'currency_ids', 'rate_version')
+    def _get_rate_table(self, company_id, date, currency_ids, rate_version):
+        """Dernier taux connu à `date` de chaque devise (taux de la société prioritaire), par version des taux"""
+        self.env.cr.execute("""
+            SELECT DISTINCT ON (currency_id) currency_id, rate
+            FROM res_currency_rate
+            WHERE currency_id = ANY(%s)
+              AND name <= %s
+              AND (company_id IS NULL OR company_id = %s)
+            ORDER BY currency_id, name DESC, company_id NULLS LAST
+        """, (list(currency_ids), date, company_id))
+        return dict(self.env.cr.fetchall())
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # ÉLIMINATIONS ET MISE EN FORME
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _compute_eliminations(self, companies, balances, rules):
+        """
+        Rapproche en bloc les soldes réciproques des paires de sociétés.
+
+        Returns:
+            tuple: ({(company_id, account_type): ajustement de solde}, [écritures d'élimination])
+        """
+        names = {company.id: company.name for company in companies}
+        eliminated = {}
+        entries = []
+
+        # Soldes inter-sociétés indexés par (société, partenaire, type)
+        intercompany = {}
+        for company_id, company_balances in balances.items():
+            for (account_type, partner_company_id), amount in company_balances.items():
+                if partner_company_id:
+                    intercompany[(company_id, partner_company_id, account_type)] = amount
+
+        for elimination_type, label, seller_types, buyer_types in rules:
+            pairs = {(seller, buyer) for seller, buyer, account_type in intercompany if account_type in seller_types}
+            for seller, buyer in sorted(pairs):
+                seller_side = {t: intercompany.get((seller, buyer, t), 0.0) for t in seller_types}
+                buyer_side = {t: intercompany.get((buyer, seller, t), 0.0) for t in buyer_types}
+                # Créance / produit : solde débiteur côté vendeur ; dette / charge : solde créditeur côté acheteur
+                seller_total = abs(sum(seller_side.values()))
+                buyer_total = abs(sum(buyer_side.values()))
+                matched = min(seller_total, buyer_total)
+                if not matched:
+                    continue
+
+                for company_id, side, total in ((seller, seller_side, seller_total), (buyer, buyer_side, buyer_total)):
+                    for account_type, amount in side.items():
+                        key = (company_id, account_type)
+                        eliminated[key] = eliminated.get(key, 0.0) - amount * matched / total
+
+                entries.append({
+                    'type': elimination_type,
+                    'label': label,
+                    'debit': round(matched, 2),
+                    'credit': round(matched, 2),
+                    'difference': round(abs(seller_total - buyer_total), 2),
+                    'entities': [names[seller], names[buyer]],
+                })
+
+        for index, entry in enumerate(entries, 1):
+            entry['id'] = index
+        return eliminated, entries
+
+    @staticmethod
+    def _sum_types(company_balances, account_types):
+        return sum(amount for (account_type, _partner), amount in company_balances.items() if account_type in account_types)
+
+    def _section(self, label, companies, balances, eliminated, account_types, sign):
+        per_entity = {
+            str(company.id): round(sign * self._sum_types(balances[company.id], account_types), 2)
+            for company in companies
+        }
+        elimination = sign * sum(
+            amount for (_company_id, account_type), amount in eliminated.items() if account_type in account_types
+        )
+        return {
+            'label': label,
+            'entities': per_entity,
+            'eliminations': round(elimination, 2),
+            'consolidated': round(sum(per_entity.values()) + elimination, 2),
+        }
+
+    def _build_balance_sheet(self, companies, balances, eliminated):
+        balance_sheet = {}
+        for side, sections in BALANCE_SHEET_SECTIONS.items():
+            lines = {
+                key: self._section(label, companies, balances, eliminated, account_types, sign)
+                for key, label, account_types, sign in sections
+            }
+            lines['total'] = {
+                'label': 'Total Actif' if side == 'assets' else 'Total Passif',
+                'consolidated': round(sum(line['consolidated'] for line in lines.values()), 2),
+            }
+            balance_sheet[side] = lines
+        return balance_sheet
+
+    def _build_profit_loss(self, companies, balances, eliminated):
+        lines = {
+            key: self._section(label, companies, balances, eliminated, account_types, -1)
+            for key, label, account_types in PROFIT_LOSS_SECTIONS
+        }
+
+        def total(label, *keys):
+            return {'label': label, 'consolidated': round(sum(lines[key]['consolidated'] for key in keys), 2)}
+
+        lines['grossProfit'] = total('Marge Brute', 'revenue', 'costOfSales')
+        lines['ebitda'] = total('EBITDA', 'revenue', 'costOfSales', 'operatingExpenses')
+        lines['netProfit'] = total('Résultat Net', 'revenue', 'costOfSales', 'operatingExpenses', 'depreciation', 'otherIncome')
+        return lines
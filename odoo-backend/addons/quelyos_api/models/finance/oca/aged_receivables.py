@@ -17,6 +17,12 @@ class QuelyosAgedReceivables(models.TransientModel):
     
     _name = 'quelyos.finance.aged_receivables'
     _description = 'Balance Âgée Créances Quelyos'
+
+    # Type de compte Odoo correspondant au type de rapport
+    _ACCOUNT_TYPE_MAP = {
+        'receivable': 'asset_receivable',
+        'payable': 'liability_payable',
+    }
     
     # Champs de filtrage
     tenant_id = fields.Many2one('quelyos.tenant', string='Tenant', required=True)
@@ -38,59 +44,84 @@ class QuelyosAgedReceivables(models.TransientModel):
             'period3': (None, date_at - timedelta(days=91)),  # >90 jours
         }
     
+    def _compute_aging_buckets(self, partner_ids=None):
+        """
+        Calcule le vieillissement de tous les partenaires en une requête groupée.
+        Les tranches 0-30/31-60/61-90/>90 sont calculées en SQL (CASE).
+
+        Returns: dict {partner_id: {'current', 'period1', 'period2', 'period3'}}
+        """
+        self.env['account.move.line'].flush_model([
+            'tenant_id', 'partner_id', 'account_id', 'reconciled',
+            'parent_state', 'date', 'debit', 'credit',
+        ])
+
+        sign = 1 if self.account_type == 'receivable' else -1
+        params = {
+            'tenant_id': self.tenant_id.id,
+            'date_at': self.date_at,
+            'account_type': self._ACCOUNT_TYPE_MAP[self.account_type],
+            'sign': sign,
+            'limit1': self.date_at - timedelta(days=30),
+            'limit2': self.date_at - timedelta(days=60),
+            'limit3': self.date_at - timedelta(days=90),
+        }
+
+        partner_filter = "AND aml.partner_id IS NOT NULL"
+        if partner_ids is not None:
+            partner_filter = "AND aml.partner_id = ANY(%(partner_ids)s)"
+            params['partner_ids'] = list(partner_ids)
+
+        self.env.cr.execute(f"""
+            SELECT aml.partner_id,
+                   CASE
+                       WHEN aml.date >= %(limit1)s THEN 'current'
+                       WHEN aml.date >= %(limit2)s THEN 'period1'
+                       WHEN aml.date >= %(limit3)s THEN 'period2'
+                       ELSE 'period3'
+                   END AS bucket,
+                   SUM(aml.debit - aml.credit) * %(sign)s AS amount
+            FROM account_move_line aml
+            JOIN account_account acc ON acc.id = aml.account_id
+            WHERE aml.tenant_id = %(tenant_id)s
+              AND acc.account_type = %(account_type)s
+              AND aml.reconciled IS NOT TRUE
+              AND aml.parent_state = 'posted'
+              AND aml.date <= %(date_at)s
+              {partner_filter}
+            GROUP BY aml.partner_id, bucket
+        """, params)
+
+        aging_by_partner = {}
+        for partner_id, bucket, amount in self.env.cr.fetchall():
+            aging = aging_by_partner.setdefault(partner_id, {
+                'current': 0.0,
+                'period1': 0.0,
+                'period2': 0.0,
+                'period3': 0.0,
+            })
+            aging[bucket] = float(amount)
+
+        return aging_by_partner
+
     def _compute_partner_aging(self, partner):
         """Calcule le vieillissement des créances pour un partenaire"""
-        AccountMoveLine = self.env['account.move.line'].sudo()
-        periods = self._get_aged_periods()
-        
-        # Récupérer toutes les lignes non lettrées du partenaire
-        domain = [
-            ('tenant_id', '=', self.tenant_id.id),
-            ('partner_id', '=', partner.id),
-            ('account_id.account_type', '=', self.account_type),
-            ('reconciled', '=', False),  # Non lettré
-            ('parent_state', '=', 'posted'),  # Écriture validée
-            ('date', '<=', self.date_at),
-        ]
-        
-        lines = AccountMoveLine.search(domain)
-        
-        aging = {
+        return self._compute_aging_buckets([partner.id]).get(partner.id, {
             'current': 0.0,
             'period1': 0.0,
             'period2': 0.0,
             'period3': 0.0,
-        }
-        
-        for line in lines:
-            amount = line.debit - line.credit if self.account_type == 'receivable' else line.credit - line.debit
-            
-            # Déterminer dans quelle période tombe cette ligne
-            line_date = line.date
-            
-            if periods['current'][0] <= line_date <= periods['current'][1]:
-                aging['current'] += amount
-            elif periods['period1'][0] <= line_date <= periods['period1'][1]:
-                aging['period1'] += amount
-            elif periods['period2'][0] <= line_date <= periods['period2'][1]:
-                aging['period2'] += amount
-            else:  # period3
-                aging['period3'] += amount
-        
-        return aging
+        })
     
     def generate_report(self):
         """Génère le rapport de balance âgée"""
         self.ensure_one()
         
-        # Récupérer tous les partenaires concernés
-        if self.partner_ids:
-            partners = self.partner_ids
-        else:
-            # Tous les partenaires avec des lignes non lettrées
-            Partner = self.env['res.partner'].sudo()
-            domain = [('tenant_id', '=', self.tenant_id.id)]
-            partners = Partner.search(domain)
+        # Vieillissement de tous les partenaires concernés en une seule requête
+        aging_by_partner = self._compute_aging_buckets(
+            self.partner_ids.ids if self.partner_ids else None
+        )
+        partners = self.env['res.partner'].sudo().browse(list(aging_by_partner))
         
         partners_data = []
         totals = {
@@ -102,7 +133,7 @@ class QuelyosAgedReceivables(models.TransientModel):
         }
         
         for partner in partners:
-            aging = self._compute_partner_aging(partner)
+            aging = aging_by_partner[partner.id]
             partner_total = sum(aging.values())
             
             # Ne garder que les partenaires avec un solde non nul
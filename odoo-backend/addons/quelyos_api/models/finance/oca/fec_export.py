@@ -12,16 +12,38 @@ from odoo import models, fields, api
 from datetime import datetime
 import csv
 import io
-import base64
+import os
+import hashlib
+import shutil
+import tempfile
 
 _logger = logging.getLogger(__name__)
 
 
+class _HashingFile(io.RawIOBase):
+    """Flux binaire qui calcule le SHA-1 de ce qui est écrit dans `raw`"""
+
+    def __init__(self, raw):
+        super().__init__()
+        self.raw = raw
+        self.sha1 = hashlib.sha1()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.sha1.update(data)
+        return self.raw.write(data)
+
+
 class QuelyosFECExport(models.TransientModel):
     """Export FEC - Fichier Écritures Comptables"""
     
     _name = 'quelyos.finance.fec_export'
     _description = 'Export FEC Quelyos'
+
+    # Nombre de lignes lues/écrites par lot (mémoire bornée par ce lot)
+    _fec_chunk_size = 5000
     
     tenant_id = fields.Many2one('quelyos.tenant', string='Tenant', required=True)
     date_from = fields.Date(string='Date début', required=True)
@@ -71,89 +93,202 @@ class QuelyosFECExport(models.TransientModel):
             return ''
         return date_obj.strftime('%Y%m%d')
     
-    def _get_move_lines_for_export(self):
-        """Récupère toutes les lignes d'écriture pour l'export FEC"""
-        AccountMoveLine = self.env['account.move.line'].sudo()
-        
-        domain = [
-            ('tenant_id', '=', self.tenant_id.id),
-            ('date', '>=', self.date_from),
-            ('date', '<=', self.date_to),
-            ('parent_state', '=', 'posted'),  # Seulement écritures validées
-        ]
-        
-        # Ordre: Journal, Date, Numéro écriture, Ligne
-        return AccountMoveLine.search(domain, order='journal_id, date, move_id, id')
-    
-    def _line_to_fec_row(self, line):
+    def _iter_move_line_chunks(self):
         """
-        Convertit une ligne d'écriture en ligne FEC
-        Returns: dict avec colonnes FEC
+        Parcourt les lignes à exporter par lots, dans l'ordre FEC
+        (journal, date, écriture, ligne), via pagination par clé (keyset).
+        Seules les colonnes utiles au FEC sont lues ; aucune requête ne
+        charge plus de `_fec_chunk_size` lignes.
         """
-        move = line.move_id
-        journal = move.journal_id
-        account = line.account_id
-        partner = line.partner_id
-        
-        return {
-            'JournalCode': journal.code or '',
-            'JournalLib': journal.name or '',
-            'EcritureNum': move.name or '',
-            'EcritureDate': self._format_fec_date(line.date),
-            'CompteNum': account.code or '',
-            'CompteLib': account.name or '',
-            'CompAuxNum': partner.ref or '' if partner else '',
-            'CompAuxLib': partner.name or '' if partner else '',
-            'PieceRef': move.ref or '',
-            'PieceDate': self._format_fec_date(move.invoice_date or move.date),
-            'EcritureLib': line.name or '',
-            'Debit': self._format_fec_amount(line.debit),
-            'Credit': self._format_fec_amount(line.credit),
-            'EcritureLet': line.matching_number or '',
-            'DateLet': self._format_fec_date(line.date) if line.reconciled else '',
-            'ValidDate': self._format_fec_date(move.date),
-            'Montantdevise': self._format_fec_amount(line.amount_currency) if line.currency_id else '',
-            'Idevise': line.currency_id.name if line.currency_id else '',
-        }
-    
-    def generate_fec_file(self):
+        self.env['account.move.line'].flush_model([
+            'tenant_id', 'date', 'parent_state', 'journal_id', 'move_id', 'account_id', 'partner_id',
+            'name', 'debit', 'credit', 'amount_currency', 'currency_id', 'matching_number', 'reconciled',
+        ])
+        cr = self.env.cr
+        last_key = None
+
+        while True:
+            keyset_filter = ""
+            params = {
+                'tenant_id': self.tenant_id.id,
+                'date_from': self.date_from,
+                'date_to': self.date_to,
+                'limit': self._fec_chunk_size,
+            }
+            if last_key:
+                keyset_filter = "AND (aml.journal_id, aml.date, aml.move_id, aml.id) > %(last_key)s"
+                params['last_key'] = last_key
+
+            cr.execute(f"""
+                SELECT aml.journal_id, aml.date, aml.move_id, aml.id,
+                       aml.account_id, aml.partner_id, aml.name, aml.debit, aml.credit,
+                       aml.amount_currency, aml.currency_id, aml.matching_number, aml.reconciled
+                FROM account_move_line aml
+                WHERE aml.tenant_id = %(tenant_id)s
+                  AND aml.date >= %(date_from)s
+                  AND aml.date <= %(date_to)s
+                  AND aml.parent_state = 'posted'
+                  {keyset_filter}
+                ORDER BY aml.journal_id, aml.date, aml.move_id, aml.id
+                LIMIT %(limit)s
+            """, params)
+            lines = cr.dictfetchall()
+            if not lines:
+                return
+
+            yield lines
+
+            if len(lines) < self._fec_chunk_size:
+                return
+            last = lines[-1]
+            last_key = (last['journal_id'], last['date'], last['move_id'], last['id'])
+
+    def _read_fec_refs(self, model, ids, fnames, cache=None):
         """
-        Génère le fichier FEC et le stocke dans fec_data
-        Returns: dict avec success et filename
+        Lit uniquement `fnames` des enregistrements `ids` (many2one en ids).
+        `cache` permet de conserver entre lots les petits référentiels
+        (journaux, comptes, devises).
         """
-        self.ensure_one()
-        
-        lines = self._get_move_lines_for_export()
-        
-        if not lines:
-            raise ValueError("Aucune écriture comptable trouvée pour la période sélectionnée")
-        
-        # Générer fichier CSV
-        output = io.StringIO()
-        columns = self._get_fec_columns_official()
-        
+        cache = {} if cache is None else cache
+        missing = [record_id for record_id in ids if record_id and record_id not in cache]
+        if missing:
+            for vals in self.env[model].sudo().browse(missing).read(fnames, load=False):
+                cache[vals['id']] = vals
+        return cache
+
+    def _iter_fec_rows(self):
+        """
+        Génère les lignes FEC lot par lot.
+        Le cache ORM est vidé après chaque lot pour garder une mémoire constante.
+        """
+        journals, accounts, currencies = {}, {}, {}
+
+        for lines in self._iter_move_line_chunks():
+            self._read_fec_refs('account.journal', {line['journal_id'] for line in lines}, ['code', 'name'], journals)
+            self._read_fec_refs('account.account', {line['account_id'] for line in lines}, ['code', 'name'], accounts)
+            self._read_fec_refs('res.currency', {line['currency_id'] for line in lines}, ['name'], currencies)
+            moves = self._read_fec_refs(
+                'account.move', {line['move_id'] for line in lines}, ['name', 'ref', 'invoice_date', 'date'],
+            )
+            partners = self._read_fec_refs('res.partner', {line['partner_id'] for line in lines}, ['ref', 'name'])
+
+            for line in lines:
+                yield self._line_to_fec_row(
+                    line,
+                    moves[line['move_id']],
+                    journals[line['journal_id']],
+                    accounts[line['account_id']],
+                    partners.get(line['partner_id']),
+                    currencies.get(line['currency_id']),
+                )
+            self.env.invalidate_all(flush=False)
+
+    def _write_fec_stream(self, binary_file):
+        """
+        Écrit le FEC ligne à ligne dans un fichier binaire ouvert.
+        Returns: tuple (nombre de lignes, sha1 hexdigest)
+        """
+        hashing_file = _HashingFile(binary_file)
+        text_stream = io.TextIOWrapper(
+            io.BufferedWriter(hashing_file), encoding='utf-8', newline='',
+        )
         writer = csv.DictWriter(
-            output,
-            fieldnames=columns,
+            text_stream,
+            fieldnames=self._get_fec_columns_official(),
             delimiter='|',  # Séparateur pipe (norme FEC)
             quoting=csv.QUOTE_NONE,
             escapechar='\\',
         )
-        
+
         # Pas d'en-tête dans le FEC officiel
-        # writer.writeheader()
-        
-        # Écrire les lignes
-        for line in lines:
-            row = self._line_to_fec_row(line)
+        lines_count = 0
+        for row in self._iter_fec_rows():
             writer.writerow(row)
-        
-        # Encoder en bytes
-        fec_content = output.getvalue()
-        output.close()
-        
-        fec_bytes = fec_content.encode('utf-8')
-        fec_b64 = base64.b64encode(fec_bytes)
+            lines_count += 1
+
+        text_stream.flush()
+        text_stream.detach()
+        return lines_count, hashing_file.sha1.hexdigest()
+
+    def _store_fec_attachment(self, file_path, checksum, filename):
+        """
+        Attache le fichier FEC au champ fec_data sans le charger en mémoire :
+        en stockage fichier, il est déplacé tel quel dans le filestore.
+        """
+        IrAttachment = self.env['ir.attachment'].sudo()
+        IrAttachment.search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('res_field', '=', 'fec_data'),
+        ]).unlink()
+
+        vals = {
+            'name': filename,
+            'res_model': self._name,
+            'res_id': self.id,
+            'res_field': 'fec_data',
+            'type': 'binary',
+            'mimetype': 'text/plain',
+        }
+
+        if IrAttachment._storage() == 'file':
+            store_fname = f"{checksum[:2]}/{checksum}"
+            full_path = IrAttachment._full_path(store_fname)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            file_size = os.path.getsize(file_path)
+            if os.path.exists(full_path):
+                os.unlink(file_path)
+            else:
+                shutil.move(file_path, full_path)
+                # Comme ir.attachment._file_write : si la transaction est
+                # annulée, le ramasse-miettes du filestore supprime le fichier
+                IrAttachment._mark_for_gc(store_fname)
+            vals.update({
+                'store_fname': store_fname,
+                'checksum': checksum,
+                'file_size': file_size,
+            })
+        else:
+            # Stockage en base : pas d'alternative au chargement en mémoire
+            with open(file_path, 'rb') as fec_file:
+                vals['raw'] = fec_file.read()
+            os.unlink(file_path)
+
+        return IrAttachment.create(vals)
+
+    def _line_to_fec_row(self, line, move, journal, account, partner, currency):
+        """
+        Convertit une ligne d'écriture (colonnes lues en SQL) en ligne FEC
+        Returns: dict avec colonnes FEC
+        """
+        return {
+            'JournalCode': journal['code'] or '',
+            'JournalLib': journal['name'] or '',
+            'EcritureNum': move['name'] or '',
+            'EcritureDate': self._format_fec_date(line['date']),
+            'CompteNum': account['code'] or '',
+            'CompteLib': account['name'] or '',
+            'CompAuxNum': partner['ref'] or '' if partner else '',
+            'CompAuxLib': partner['name'] or '' if partner else '',
+            'PieceRef': move['ref'] or '',
+            'PieceDate': self._format_fec_date(move['invoice_date'] or move['date']),
+            'EcritureLib': line['name'] or '',
+            'Debit': self._format_fec_amount(line['debit']),
+            'Credit': self._format_fec_amount(line['credit']),
+            'EcritureLet': line['matching_number'] or '',
+            'DateLet': self._format_fec_date(line['date']) if line['reconciled'] else '',
+            'ValidDate': self._format_fec_date(move['date']),
+            'Montantdevise': self._format_fec_amount(line['amount_currency']) if currency else '',
+            'Idevise': currency['name'] if currency else '',
+        }
+
+    def generate_fec_file(self):
+        """
+        Génère le fichier FEC en flux (lots de lignes, fichier temporaire)
+        et le stocke dans fec_data
+        Returns: dict avec success et filename
+        """
+        self.ensure_one()
         
         # Nom de fichier FEC : SIREN + FEC + YYYYMMDD (date clôture)
         # Ex: 123456789FEC20261231.txt
@@ -161,17 +296,29 @@ class QuelyosFECExport(models.TransientModel):
         siren = company.company_registry or '000000000'  # À remplacer par vrai SIREN
         date_str = self.date_to.strftime('%Y%m%d')
         filename = f"{siren}FEC{date_str}.txt"
-        
+
+        fd, tmp_path = tempfile.mkstemp(prefix='quelyos_fec_', suffix='.txt')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                lines_count, checksum = self._write_fec_stream(tmp_file)
+
+            if not lines_count:
+                raise ValueError("Aucune écriture comptable trouvée pour la période sélectionnée")
+
+            self._store_fec_attachment(tmp_path, checksum, filename)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
         # Stocker résultat
         self.write({
-            'fec_data': fec_b64,
             'fec_filename': filename,
         })
         
         return {
             'success': True,
             'filename': filename,
-            'lines_count': len(lines),
+            'lines_count': lines_count,
             'date_from': self.date_from.isoformat(),
             'date_to': self.date_to.isoformat(),
         }
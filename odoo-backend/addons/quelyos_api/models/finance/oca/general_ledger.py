@@ -27,80 +27,160 @@ class QuelyosGeneralLedger(models.TransientModel):
     centralize = fields.Boolean(string='Centraliser par compte', default=False)
     show_analytic = fields.Boolean(string='Afficher analytique', default=False)
     
-    def _get_account_lines(self, account):
-        """Récupère toutes les lignes d'un compte pour la période"""
-        AccountMoveLine = self.env['account.move.line'].sudo()
-        
-        domain = [
-            ('tenant_id', '=', self.tenant_id.id),
-            ('account_id', '=', account.id),
-            ('date', '>=', self.date_from),
-            ('date', '<=', self.date_to),
-            ('parent_state', '=', 'posted'),
-        ]
-        
+    # Taille de page par défaut pour la consultation paginée d'un compte
+    _page_size = 500
+
+    def _ledger_filters(self, params):
+        """Filtres SQL communs (période, journaux, partenaires) ; complète params"""
+        params.update({
+            'tenant_id': self.tenant_id.id,
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+        })
+        filters = """
+            aml.tenant_id = %(tenant_id)s
+            AND aml.parent_state = 'posted'
+            AND aml.date >= %(date_from)s
+            AND aml.date <= %(date_to)s
+        """
         if self.journal_ids:
-            domain.append(('journal_id', 'in', self.journal_ids.ids))
-        
+            filters += " AND aml.journal_id = ANY(%(journal_ids)s)"
+            params['journal_ids'] = self.journal_ids.ids
         if self.partner_ids:
-            domain.append(('partner_id', 'in', self.partner_ids.ids))
-        
-        return AccountMoveLine.search(domain, order='date, move_id, id')
-    
-    def _get_initial_balance(self, account):
-        """Solde initial du compte avant la période"""
-        AccountMoveLine = self.env['account.move.line'].sudo()
-        
-        domain = [
-            ('tenant_id', '=', self.tenant_id.id),
-            ('account_id', '=', account.id),
-            ('date', '<', self.date_from),
-            ('parent_state', '=', 'posted'),
-        ]
-        
-        lines = AccountMoveLine.search(domain)
-        
-        initial_debit = sum(line.debit for line in lines)
-        initial_credit = sum(line.credit for line in lines)
-        
-        return initial_debit - initial_credit
-    
-    def _format_account_data(self, account):
-        """Formate les données d'un compte pour le rapport"""
-        initial_balance = self._get_initial_balance(account)
-        lines = self._get_account_lines(account)
-        
+            filters += " AND aml.partner_id = ANY(%(partner_ids)s)"
+            params['partner_ids'] = self.partner_ids.ids
+        return filters
+
+    def _flush_ledger_fields(self):
+        self.env['account.move.line'].flush_model([
+            'tenant_id', 'account_id', 'date', 'parent_state', 'debit', 'credit',
+            'journal_id', 'partner_id', 'move_id', 'name', 'reconciled', 'analytic_distribution',
+        ])
+        self.env['account.move'].flush_model(['name'])
+
+    def _compute_initial_balances(self, account_ids=None):
+        """
+        Soldes initiaux (avant date_from) de tous les comptes en une requête.
+        Returns: dict {account_id: initial_balance}
+        """
+        self._flush_ledger_fields()
+        params = {'tenant_id': self.tenant_id.id, 'date_from': self.date_from}
+        account_filter = ""
+        if account_ids is not None:
+            account_filter = "AND aml.account_id = ANY(%(account_ids)s)"
+            params['account_ids'] = list(account_ids)
+
+        self.env.cr.execute(f"""
+            SELECT aml.account_id, SUM(aml.debit - aml.credit)
+            FROM account_move_line aml
+            WHERE aml.tenant_id = %(tenant_id)s
+              AND aml.parent_state = 'posted'
+              AND aml.date < %(date_from)s
+              {account_filter}
+            GROUP BY aml.account_id
+        """, params)
+        return {account_id: float(balance) for account_id, balance in self.env.cr.fetchall()}
+
+    def _fetch_ledger_lines(self, account_ids=None, after=None, limit=None):
+        """
+        Lignes de la période avec solde progressif calculé en SQL
+        (fonction fenêtre partitionnée par compte).
+
+        Le solde retourné est cumulé depuis le début de la période, ou depuis
+        la position `after` (pagination par clé) : l'appelant y ajoute le solde
+        initial ou le solde du curseur.
+
+        after: dict {'date', 'moveId', 'id'} - dernière ligne déjà lue (un seul compte)
+        """
+        self._flush_ledger_fields()
+        params = {}
+        filters = self._ledger_filters(params)
+
+        if account_ids is not None:
+            filters += " AND aml.account_id = ANY(%(account_ids)s)"
+            params['account_ids'] = list(account_ids)
+        if after:
+            filters += " AND (aml.date, aml.move_id, aml.id) > (%(after_date)s::date, %(after_move)s, %(after_id)s)"
+            params.update({
+                'after_date': after['date'],
+                'after_move': after['moveId'],
+                'after_id': after['id'],
+            })
+
+        limit_clause = ""
+        if limit:
+            limit_clause = "LIMIT %(limit)s"
+            params['limit'] = limit
+
+        self.env.cr.execute(f"""
+            SELECT aml.id, aml.account_id, aml.date, aml.move_id, am.name AS move_name,
+                   aj.code AS journal_code, rp.name AS partner_name, aml.name AS label,
+                   aml.debit, aml.credit, aml.reconciled, aml.analytic_distribution,
+                   SUM(aml.debit - aml.credit) OVER (
+                       PARTITION BY aml.account_id
+                       ORDER BY aml.date, aml.move_id, aml.id
+                   ) AS cumulative_balance
+            FROM account_move_line aml
+            JOIN account_move am ON am.id = aml.move_id
+            LEFT JOIN account_journal aj ON aj.id = aml.journal_id
+            LEFT JOIN res_partner rp ON rp.id = aml.partner_id
+            WHERE {filters}
+            ORDER BY aml.account_id, aml.date, aml.move_id, aml.id
+            {limit_clause}
+        """, params)
+        return self.env.cr.dictfetchall()
+
+    def _analytic_names(self, rows):
+        """Noms des comptes analytiques référencés par les lignes (une requête)"""
+        analytic_ids = set()
+        for row in rows:
+            for key in (row['analytic_distribution'] or {}):
+                analytic_ids.update(int(analytic_id) for analytic_id in key.split(','))
+        if not analytic_ids:
+            return {}
+        analytics = self.env['account.analytic.account'].sudo().browse(list(analytic_ids))
+        return {analytic.id: analytic.name for analytic in analytics}
+
+    def _format_line(self, row, balance, analytic_names=None):
+        """Formate une ligne SQL du grand livre"""
+        debit = float(row['debit'] or 0.0)
+        credit = float(row['credit'] or 0.0)
+        line_data = {
+            'id': row['id'],
+            'date': row['date'].isoformat() if row['date'] else None,
+            'moveId': row['move_id'],
+            'moveName': row['move_name'] or '',
+            'journalCode': row['journal_code'] or '',
+            'partner': row['partner_name'] or '',
+            'label': row['label'] or '',
+            'debit': debit,
+            'credit': credit,
+            'balance': balance,
+            'reconciled': bool(row['reconciled']),
+        }
+
+        if self.show_analytic and row['analytic_distribution'] and analytic_names is not None:
+            names = []
+            for key in row['analytic_distribution']:
+                names.extend(analytic_names.get(int(analytic_id), '') for analytic_id in key.split(','))
+            line_data['analyticAccount'] = ', '.join(name for name in names if name)
+
+        return line_data
+
+    def _build_account_data(self, account, initial_balance, rows, analytic_names=None):
+        """Assemble les données d'un compte à partir de ses lignes SQL"""
         formatted_lines = []
-        running_balance = initial_balance
         total_debit = 0.0
         total_credit = 0.0
-        
-        for line in lines:
-            debit = line.debit or 0.0
-            credit = line.credit or 0.0
-            running_balance += debit - credit
-            total_debit += debit
-            total_credit += credit
-            
-            line_data = {
-                'id': line.id,
-                'date': line.date.isoformat() if line.date else None,
-                'moveId': line.move_id.id,
-                'moveName': line.move_id.name or '',
-                'journalCode': line.journal_id.code or '',
-                'partner': line.partner_id.name if line.partner_id else '',
-                'label': line.name or '',
-                'debit': debit,
-                'credit': credit,
-                'balance': running_balance,
-                'reconciled': line.reconciled,
-            }
-            
-            if self.show_analytic and line.analytic_account_id:
-                line_data['analyticAccount'] = line.analytic_account_id.name
-            
+        running_balance = initial_balance
+
+        for row in rows:
+            running_balance = initial_balance + float(row['cumulative_balance'])
+            line_data = self._format_line(row, running_balance, analytic_names)
+            total_debit += line_data['debit']
+            total_credit += line_data['credit']
             formatted_lines.append(line_data)
-        
+
         return {
             'accountId': account.id,
             'code': account.code or '',
@@ -111,19 +191,77 @@ class QuelyosGeneralLedger(models.TransientModel):
             'totalCredit': total_credit,
             'endBalance': running_balance,
         }
+
+    def _format_account_data(self, account):
+        """Formate les données d'un compte pour le rapport"""
+        initial_balance = self._compute_initial_balances([account.id]).get(account.id, 0.0)
+        rows = self._fetch_ledger_lines([account.id])
+        analytic_names = self._analytic_names(rows) if self.show_analytic else None
+        return self._build_account_data(account, initial_balance, rows, analytic_names)
+
+    def get_account_lines_page(self, account_id, cursor=None, limit=None):
+        """
+        Page de lignes d'un compte (pagination par clé) avec solde progressif.
+
+        cursor: dict retourné comme 'nextCursor' par la page précédente
+                ({'date', 'moveId', 'id', 'balance'}), None pour la première page
+        Returns: dict {'accountId', 'initialBalance', 'lines', 'nextCursor'}
+        """
+        self.ensure_one()
+        limit = min(int(limit or self._page_size), 5000)
+
+        if cursor:
+            start_balance = float(cursor['balance'])
+            initial_balance = None
+        else:
+            initial_balance = self._compute_initial_balances([account_id]).get(account_id, 0.0)
+            start_balance = initial_balance
+
+        rows = self._fetch_ledger_lines([account_id], after=cursor, limit=limit)
+        analytic_names = self._analytic_names(rows) if self.show_analytic else None
+
+        lines = [
+            self._format_line(row, start_balance + float(row['cumulative_balance']), analytic_names)
+            for row in rows
+        ]
+
+        next_cursor = None
+        if len(rows) == limit:
+            last = lines[-1]
+            next_cursor = {
+                'date': last['date'],
+                'moveId': last['moveId'],
+                'id': last['id'],
+                'balance': last['balance'],
+            }
+
+        return {
+            'accountId': account_id,
+            'initialBalance': initial_balance,
+            'lines': lines,
+            'nextCursor': next_cursor,
+        }
     
     def generate_report(self):
         """Génère le grand livre général"""
         self.ensure_one()
         
         Account = self.env['account.account'].sudo()
+        account_filter = self.account_ids.ids if self.account_ids else None
+
+        # Deux requêtes pour tout le rapport : soldes initiaux + lignes fenêtrées
+        initial_balances = self._compute_initial_balances(account_filter)
+        rows_by_account = {}
+        all_rows = self._fetch_ledger_lines(account_filter)
+        for row in all_rows:
+            rows_by_account.setdefault(row['account_id'], []).append(row)
+        analytic_names = self._analytic_names(all_rows) if self.show_analytic else None
         
-        # Récupérer comptes
+        # Récupérer comptes (account.account n'a pas de tenant_id)
         if self.account_ids:
             accounts = self.account_ids
         else:
-            domain = [('tenant_id', '=', self.tenant_id.id)]
-            accounts = Account.search(domain, order='code')
+            accounts = Account.browse(list(set(initial_balances) | set(rows_by_account))).sorted('code')
         
         accounts_data = []
         grand_totals = {
@@ -134,7 +272,12 @@ class QuelyosGeneralLedger(models.TransientModel):
         }
         
         for account in accounts:
-            account_data = self._format_account_data(account)
+            account_data = self._build_account_data(
+                account,
+                initial_balances.get(account.id, 0.0),
+                rows_by_account.get(account.id, []),
+                analytic_names,
+            )
             
             # Ne garder que comptes avec mouvements ou solde
             if account_data['lines'] or account_data['initialBalance'] != 0:
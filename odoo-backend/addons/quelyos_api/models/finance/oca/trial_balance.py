@@ -27,62 +27,87 @@ class QuelyosTrialBalance(models.TransientModel):
     hide_zero_balance = fields.Boolean(string='Masquer soldes nuls', default=True)
     show_partner_details = fields.Boolean(string='Détails partenaires', default=False)
     
+    def _compute_account_balances(self, account_ids=None):
+        """
+        Agrège soldes initiaux et mouvements de période de tous les comptes
+        en une seule requête groupée (au lieu de 2 recherches par compte).
+
+        Les filtres journaux/partenaires ne s'appliquent qu'aux mouvements de
+        la période, comme le solde initial historique.
+
+        Returns: dict {account_id: (initial_balance, period_debit, period_credit)}
+        """
+        AccountMoveLine = self.env['account.move.line']
+        AccountMoveLine.flush_model([
+            'tenant_id', 'account_id', 'date', 'parent_state',
+            'debit', 'credit', 'journal_id', 'partner_id',
+        ])
+
+        params = {
+            'tenant_id': self.tenant_id.id,
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+        }
+
+        period_filter = "aml.date >= %(date_from)s"
+        if self.journal_ids:
+            period_filter += " AND aml.journal_id = ANY(%(journal_ids)s)"
+            params['journal_ids'] = self.journal_ids.ids
+        if self.partner_ids:
+            period_filter += " AND aml.partner_id = ANY(%(partner_ids)s)"
+            params['partner_ids'] = self.partner_ids.ids
+
+        account_filter = ""
+        if account_ids is not None:
+            account_filter = "AND aml.account_id = ANY(%(account_ids)s)"
+            params['account_ids'] = list(account_ids)
+
+        self.env.cr.execute(f"""
+            SELECT aml.account_id,
+                   COALESCE(SUM(aml.debit - aml.credit) FILTER (WHERE aml.date < %(date_from)s), 0) AS initial_balance,
+                   COALESCE(SUM(aml.debit) FILTER (WHERE {period_filter}), 0) AS period_debit,
+                   COALESCE(SUM(aml.credit) FILTER (WHERE {period_filter}), 0) AS period_credit
+            FROM account_move_line aml
+            WHERE aml.tenant_id = %(tenant_id)s
+              AND aml.parent_state = 'posted'
+              AND aml.date <= %(date_to)s
+              {account_filter}
+            GROUP BY aml.account_id
+        """, params)
+
+        return {
+            account_id: (float(initial), float(debit), float(credit))
+            for account_id, initial, debit, credit in self.env.cr.fetchall()
+        }
+
     def _get_initial_balance(self, account):
         """Calcule le solde initial d'un compte avant date_from"""
-        AccountMoveLine = self.env['account.move.line'].sudo()
-        
-        domain = [
-            ('tenant_id', '=', self.tenant_id.id),
-            ('account_id', '=', account.id),
-            ('date', '<', self.date_from),
-            ('parent_state', '=', 'posted'),
-        ]
-        
-        lines = AccountMoveLine.search(domain)
-        
-        initial_debit = sum(line.debit for line in lines)
-        initial_credit = sum(line.credit for line in lines)
-        
-        return initial_debit - initial_credit
-    
+        balances = self._compute_account_balances([account.id])
+        return balances.get(account.id, (0.0, 0.0, 0.0))[0]
+
     def _get_period_movements(self, account):
         """Calcule les mouvements de la période pour un compte"""
-        AccountMoveLine = self.env['account.move.line'].sudo()
-        
-        domain = [
-            ('tenant_id', '=', self.tenant_id.id),
-            ('account_id', '=', account.id),
-            ('date', '>=', self.date_from),
-            ('date', '<=', self.date_to),
-            ('parent_state', '=', 'posted'),
-        ]
-        
-        if self.journal_ids:
-            domain.append(('journal_id', 'in', self.journal_ids.ids))
-        
-        if self.partner_ids:
-            domain.append(('partner_id', 'in', self.partner_ids.ids))
-        
-        lines = AccountMoveLine.search(domain)
-        
-        period_debit = sum(line.debit for line in lines)
-        period_credit = sum(line.credit for line in lines)
-        
+        balances = self._compute_account_balances([account.id])
+        _initial, period_debit, period_credit = balances.get(account.id, (0.0, 0.0, 0.0))
         return period_debit, period_credit
-    
+
     def generate_report(self):
         """Génère la balance générale"""
         self.ensure_one()
         
         Account = self.env['account.account'].sudo()
         
+        # Un seul passage agrégé pour tous les comptes
+        balances = self._compute_account_balances(
+            self.account_ids.ids if self.account_ids else None
+        )
+        
         # Récupérer les comptes
         if self.account_ids:
             accounts = self.account_ids
         else:
-            # Tous les comptes du tenant
-            domain = [('tenant_id', '=', self.tenant_id.id)]
-            accounts = Account.search(domain, order='code')
+            # Tous les comptes mouvementés du tenant (account.account n'a pas de tenant_id)
+            accounts = Account.browse(list(balances)).sorted('code')
         
         balance_lines = []
         totals = {
@@ -93,8 +118,7 @@ class QuelyosTrialBalance(models.TransientModel):
         }
         
         for account in accounts:
-            initial_balance = self._get_initial_balance(account)
-            period_debit, period_credit = self._get_period_movements(account)
+            initial_balance, period_debit, period_credit = balances.get(account.id, (0.0, 0.0, 0.0))
             end_balance = initial_balance + period_debit - period_credit
             
             # Masquer soldes nuls si demandé
@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+"""
+Analyse de stock du catalogue (/api/ecommerce/stock/abc-analysis et /forecast).
+
+Les ventes quotidiennes (mouvements done stock interne -> client) de tous
+les produits sont lues en une requête groupée (produit, jour), puis
+réduites en NumPy sans matrice dense : chaque statistique (moyennes
+mobiles, régression linéaire, coefficient de variation) est une somme
+pondérée par produit calculée par np.bincount sur les triplets
+(produit, jour, quantité). Le catalogue entier tient en quelques
+opérations vectorielles, quel que soit le nombre d'articles.
+
+Le résultat (stock, valeur, statistiques de demande, classe XYZ) est
+matérialisé par (tenant, entrepôt, période) dans quelyos.inventory.analytics
+et recalculé au plus tard après ANALYTICS_MAX_AGE secondes. La
+classification ABC (seuils et filtre catégorie variables) est appliquée à
+la lecture.
+"""
+
+import json
+import logging
+from datetime import timedelta
+
+import numpy as np
+
+from odoo import models, fields, api
+from odoo.tools.sql import create_unique_index
+
+_logger = logging.getLogger(__name__)
+
+MOVING_AVERAGE_WINDOWS = (7, 30, 90)
+MIN_TREND_DAYS = 10  # régression linéaire à partir de 10 jours d'historique
+TREND_SLOPE_EPSILON = 0.01
+XYZ_THRESHOLDS = (0.5, 1.0)  # coefficient de variation de la demande quotidienne
+SAFETY_MARGIN = 1.2  # +20 % sur les quantités à commander
+ANALYTICS_MAX_AGE = 3600  # secondes
+
+
+def demand_statistics(rows, days, quantities, n_products, n_days):
+    """
+    Statistiques de demande par produit à partir des triplets creux
+    (indice produit, indice jour, quantité) d'une période de `n_days` jours.
+
+    Returns:
+        dict: tableaux de longueur n_products : 'total', 'ma_7', 'ma_30',
+        'ma_90', 'slope', 'intercept', 'cv' (nan si aucune demande)
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    days = np.asarray(days, dtype=float)
+    quantities = np.asarray(quantities, dtype=float)
+
+    def per_product(weights):
+        return np.bincount(rows, weights=weights, minlength=n_products)
+
+    total = per_product(quantities)
+    stats = {'total': total}
+    for window in MOVING_AVERAGE_WINDOWS:
+        if n_days >= window:
+            stats[f'ma_{window}'] = per_product(quantities * (days >= n_days - window)) / window
+        else:
+            stats[f'ma_{window}'] = np.zeros(n_products)
+
+    # Moindres carrés y = a·t + b sur t = 0..n-1 (sommes centrées en forme fermée)
+    mean = total / n_days
+    if n_days > MIN_TREND_DAYS:
+        t_mean = (n_days - 1) / 2.0
+        sxx = n_days * (n_days ** 2 - 1) / 12.0
+        slope = (per_product(quantities * days) - t_mean * total) / sxx
+        intercept = mean - slope * t_mean
+    else:
+        slope = np.zeros(n_products)
+        intercept = stats['ma_7'].copy()
+    stats['slope'] = slope
+    stats['intercept'] = intercept
+
+    variance = np.maximum(per_product(quantities ** 2) / n_days - mean ** 2, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats['cv'] = np.where(mean > 0, np.sqrt(variance) / mean, np.nan)
+    return stats
+
+
+def forecast_demand(stats, n_days, horizon, method='moving_average'):
+    """
+    Prévision quotidienne sur `horizon` jours pour tous les produits.
+
+    Returns:
+        np.ndarray: matrice (produits × horizon)
+    """
+    if method == 'linear_trend':
+        steps = np.arange(n_days, n_days + horizon, dtype=float)
+        return np.maximum(stats['intercept'][:, None] + stats['slope'][:, None] * steps, 0.0)
+    level = np.where(stats['ma_7'] > 0, stats['ma_7'], stats['ma_30'])
+    return np.repeat(level[:, None], horizon, axis=1)
+
+
+def abc_classes(values, threshold_a=80.0, threshold_b=95.0):
+    """
+    Classification de Pareto : produits triés par valeur décroissante.
+
+    Returns:
+        tuple: (ordre de tri, % cumulé dans cet ordre, classes 'A'/'B'/'C' dans cet ordre)
+    """
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(-values, kind='stable')
+    total = values.sum()
+    cumulative_pct = np.cumsum(values[order]) / total * 100 if total > 0 else np.zeros(len(values))
+    classes = np.where(cumulative_pct <= threshold_a, 'A', np.where(cumulative_pct <= threshold_b, 'B', 'C'))
+    return order, cumulative_pct, classes
+
+
+def xyz_classes(cv):
+    """Régularité de la demande : X stable, Y variable, Z erratique ou sans vente"""
+    cv = np.nan_to_num(np.asarray(cv, dtype=float), nan=np.inf)
+    return np.where(cv <= XYZ_THRESHOLDS[0], 'X', np.where(cv <= XYZ_THRESHOLDS[1], 'Y', 'Z'))
+
+
+class InventoryAnalytics(models.Model):
+    _name = 'quelyos.inventory.analytics'
+    _description = 'Analyse de stock du catalogue (cache matérialisé)'
+    _log_access = False
+
+    tenant_id = fields.Many2one('quelyos.tenant', string='Tenant', index=True, ondelete='cascade')
+    warehouse_id = fields.Many2one('stock.warehouse', string='Entrepôt', ondelete='cascade')
+    period_days = fields.Integer(string='Période (jours)')
+    data = fields.Json(string='Analyse')
+    computed_at = fields.Datetime(string='Calculé le')
+
+    _sql_constraints = [
+        ('scope_uniq', 'unique(tenant_id, warehouse_id, period_days)', 'Une seule analyse par tenant, entrepôt et période'),
+    ]
+
+    def init(self):
+        super().init()
+        # Portées sans tenant ou sans entrepôt (NULL) uniques elles aussi : cible de l'upsert
+        self.env.cr.execute("""
+            DELETE FROM quelyos_inventory_analytics a
+            USING quelyos_inventory_analytics b
+            WHERE a.id < b.id
+              AND a.tenant_id IS NOT DISTINCT FROM b.tenant_id
+              AND a.warehouse_id IS NOT DISTINCT FROM b.warehouse_id
+              AND a.period_days IS NOT DISTINCT FROM b.period_days
+        """)
+        create_unique_index(
+            self.env.cr, 'quelyos_inventory_analytics_scope_key_uniq', self._table,
+            ['(COALESCE(tenant_id, 0))', '(COALESCE(warehouse_id, 0))', '(COALESCE(period_days, 0))'],
+        )
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # CATALOGUE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def get_catalog(self, tenant=None, warehouse=None, period_days=90, use_cache=True):
+        """
+        Analyse colonne par colonne du catalogue stockable (produits actifs).
+
+        Returns:
+            dict: listes alignées 'ids', 'names', 'skus', 'categ_ids', 'qty',
+            'standard_price', 'value', 'ma_7', 'ma_30', 'ma_90', 'slope',
+            'intercept', 'cv', 'xyz' + 'period_days' et 'date_to'
+        """
+        tenant_id = tenant.id if tenant else None
+        warehouse_id = warehouse.id if warehouse else None
+
+        if use_cache:
+            self.flush_model()
+            self.env.cr.execute("""
+                SELECT data, computed_at
+                FROM quelyos_inventory_analytics
+                WHERE tenant_id IS NOT DISTINCT FROM %s
+                  AND warehouse_id IS NOT DISTINCT FROM %s
+                  AND period_days = %s
+            """, (tenant_id, warehouse_id, period_days))
+            row = self.env.cr.fetchone()
+            if row and row[1] > fields.Datetime.now() - timedelta(seconds=ANALYTICS_MAX_AGE):
+                return row[0]
+
+        catalog = self._compute_catalog(tenant, warehouse, period_days)
+        if use_cache:
+            self._store_catalog(tenant_id, warehouse_id, period_days, catalog)
+        return catalog
+
+    def _store_catalog(self, tenant_id, warehouse_id, period_days, data):
+        """Upsert en une requête : deux analyses à froid concurrentes ne se heurtent pas"""
+        self.flush_model()
+        self.env.cr.execute("""
+            INSERT INTO quelyos_inventory_analytics (tenant_id, warehouse_id, period_days, data, computed_at)
+            VALUES (%s, %s, %s, %s::jsonb, %s)
+            ON CONFLICT ((COALESCE(tenant_id, 0)), (COALESCE(warehouse_id, 0)), (COALESCE(period_days, 0))) DO UPDATE
+            SET data = EXCLUDED.data, computed_at = EXCLUDED.computed_at
+        """, (tenant_id or None, warehouse_id or None, period_days, json.dumps(data), fields.Datetime.now()))
+        self.invalidate_model()
+
+    def _compute_catalog(self, tenant, warehouse, period_days):
+        products = self._load_products(tenant, warehouse)
+        date_to = fields.Date.context_today(self)
+        stats = self._load_demand(products['ids'], date_to, period_days, warehouse)
+
+        def rounded(array, digits=4):
+            return np.round(array, digits).tolist()
+
+        return dict(
+            products,
+            value=rounded(np.asarray(products['qty']) * np.asarray(products['standard_price']), 2),
+            ma_7=rounded(stats['ma_7']),
+            ma_30=rounded(stats['ma_30']),
+            ma_90=rounded(stats['ma_90']),
+            slope=rounded(stats['slope']),
+            intercept=rounded(stats['intercept']),
+            cv=[None if np.isnan(cv) else round(float(cv), 4) for cv in stats['cv']],
+            xyz=xyz_classes(stats['cv']).tolist(),
+            period_days=period_days,
+            date_to=date_to.isoformat(),
+        )
+
+    def _load_products(self, tenant, warehouse, product_ids=None):
+        """
+        Produits stockables actifs avec stock interne (quants sommés) et coût
+        standard de la société du tenant, en une requête.
+
+        Returns:
+            dict: listes alignées 'ids', 'names', 'skus', 'categ_ids', 'qty', 'standard_price'
+        """
+        self.env['stock.quant'].flush_model(['product_id', 'location_id', 'quantity'])
+        self.env['stock.location'].flush_model(['usage', 'warehouse_id'])
+        self.env['product.product'].flush_model(['active', 'product_tmpl_id', 'default_code', 'standard_price'])
+        self.env['product.template'].flush_model(['is_storable', 'name', 'categ_id', 'tenant_id'])
+
+        company = tenant.company_id if tenant else self.env.company
+        self.env.cr.execute("""
+            WITH quant_stock AS (
+                SELECT sq.product_id, SUM(sq.quantity) AS qty
+                FROM stock_quant sq
+                JOIN stock_location sl ON sl.id = sq.location_id
+                WHERE sl.usage = 'internal'
+                  AND (%(warehouse_id)s::int IS NULL OR sl.warehouse_id = %(warehouse_id)s)
+                GROUP BY sq.product_id
+            )
+            SELECT pp.id,
+                   COALESCE(pt.name->>%(lang)s, pt.name->>'en_US'),
+                   COALESCE(pp.default_code, ''),
+                   pt.categ_id,
+                   COALESCE(qs.qty, 0),
+                   COALESCE((pp.standard_price->>%(company_key)s)::float, 0)
+            FROM product_product pp
+            JOIN product_template pt ON pt.id = pp.product_tmpl_id
+            LEFT JOIN quant_stock qs ON qs.product_id = pp.id
+            WHERE pp.active
+              AND pt.is_storable
+              AND (%(tenant_id)s::int IS NULL OR pt.tenant_id = %(tenant_id)s)
+              AND (%(product_ids)s::int[] IS NULL OR pp.id = ANY(%(product_ids)s))
+            ORDER BY pp.id
+        """, {
+            'warehouse_id': warehouse.id if warehouse else None,
+            'tenant_id': tenant.id if tenant else None,
+            'product_ids': list(product_ids) if product_ids is not None else None,
+            'lang': self.env.lang or 'en_US',
+            'company_key': str(company.id),
+        })
+        columns = list(zip(*self.env.cr.fetchall())) or [()] * 6
+        keys = ('ids', 'names', 'skus', 'categ_ids', 'qty', 'standard_price')
+        return {key: list(column) for key, column in zip(keys, columns)}
+
+    def _load_demand(self, product_ids, date_to, period_days, warehouse=None):
+        """
+        Ventes quotidiennes (mouvements done interne -> client) des produits
+        sur `period_days` jours jusqu'à `date_to` inclus, en une requête
+        groupée (produit, jour), réduites par demand_statistics.
+
+        Returns:
+            dict: statistiques alignées sur product_ids + 'series' (triplets creux)
+        """
+        date_from = date_to - timedelta(days=period_days - 1)
+        if product_ids:
+            self.env['stock.move'].flush_model(['product_id', 'state', 'location_id', 'location_dest_id', 'date', 'product_qty'])
+            self.env.cr.execute("""
+                SELECT sm.product_id, sm.date::date - %(date_from)s, SUM(sm.product_qty)
+                FROM stock_move sm
+                JOIN stock_location src ON src.id = sm.location_id
+                JOIN stock_location dest ON dest.id = sm.location_dest_id
+                WHERE sm.state = 'done'
+                  AND src.usage = 'internal'
+                  AND dest.usage = 'customer'
+                  AND sm.date >= %(date_from)s
+                  AND sm.date < %(date_end)s
+                  AND sm.product_id = ANY(%(product_ids)s)
+                  AND (%(warehouse_id)s::int IS NULL OR src.warehouse_id = %(warehouse_id)s)
+                GROUP BY sm.product_id, sm.date::date
+            """, {
+                'date_from': date_from,
+                'date_end': date_to + timedelta(days=1),
+                'product_ids': list(product_ids),
+                'warehouse_id': warehouse.id if warehouse else None,
+            })
+            records = self.env.cr.fetchall()
+        else:
+            records = []
+
+        if records:
+            product_col, days, quantities = (np.asarray(column) for column in zip(*records))
+            rows = np.searchsorted(np.asarray(product_ids), product_col.astype(np.int64))
+        else:
+            rows = days = quantities = np.zeros(0)
+
+        stats = demand_statistics(rows, days, quantities, len(product_ids), period_days)
+        stats['series'] = (rows, days, quantities)
+        return stats
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # ANALYSE ABC
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def get_abc_analysis(self, tenant=None, warehouse=None, category_id=None, threshold_a=80.0,
+                         threshold_b=95.0, period_days=90, use_cache=True):
+        """
+        Classification ABC (valeur de stock) et XYZ (régularité de la demande)
+        des produits avec une valeur de stock positive.
+
+        Returns:
+            dict: {'products', 'kpis', 'cumulative'}
+        """
+        catalog = self.get_catalog(tenant, warehouse, period_days, use_cache)
+        values = np.asarray(catalog['value'], dtype=float)
+        selected = values > 0
+        if category_id:
+            selected &= np.asarray(catalog['categ_ids']) == int(category_id)
+        indices = np.flatnonzero(selected)
+
+        order, cumulative_pct, classes = abc_classes(values[indices], threshold_a, threshold_b)
+        indices = indices[order]
+        sorted_values = values[indices]
+        cumulative_values = np.cumsum(sorted_values)
+        total_value = float(sorted_values.sum())
+
+        products = []
+        cumulative = []
+        for rank, (index, category, cumulative_value, pct) in enumerate(
+                zip(indices.tolist(), classes.tolist(), cumulative_values.tolist(), cumulative_pct.tolist()), 1):
+            value = catalog['value'][index]
+            products.append({
+                'id': catalog['ids'][index],
+                'name': catalog['names'][index],
+                'sku': catalog['skus'][index],
+                'qty': catalog['qty'][index],
+                'standard_price': catalog['standard_price'][index],
+                'value': value,
+                'category': category,
+                'xyz': catalog['xyz'][index],
+                'cumulative_value': round(cumulative_value, 2),
+                'cumulative_pct': round(pct, 2),
+                'value_pct': round(value / total_value * 100, 2) if total_value > 0 else 0,
+            })
+            cumulative.append({'product_index': rank, 'cumulative_pct': round(pct, 2), 'category': category})
+
+        kpis = {'total_value': round(total_value, 2), 'total_products': len(products)}
+        for category in ('A', 'B', 'C'):
+            mask = classes == category
+            count = int(mask.sum())
+            category_value = float(sorted_values[mask].sum())
+            kpis[f'category_{category.lower()}'] = {
+                'count': count,
+                'count_pct': round(count / len(products) * 100, 1) if products else 0,
+                'value': round(category_value, 2),
+                'value_pct': round(category_value / total_value * 100, 1) if total_value > 0 else 0,
+            }
+
+        return {'products': products, 'kpis': kpis, 'cumulative': cumulative}
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # PRÉVISIONS
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def get_forecast(self, product_ids, forecast_days=30, method='moving_average', period_days=90,
+                     warehouse=None, with_history=True):
+        """
+        Prévisions de demande de plusieurs produits, calculées ensemble.
+
+        Returns:
+            dict: {product_id: {'historical', 'forecast', 'metrics', 'recommendations'}}
+            (produits stockables actifs uniquement)
+        """
+        products = self._load_products(None, warehouse, sorted(set(product_ids)))
+        ids = products['ids']
+        date_to = fields.Date.context_today(self)
+        stats = self._load_demand(ids, date_to, period_days, warehouse)
+        daily = forecast_demand(stats, period_days, forecast_days, method)
+        totals = daily.sum(axis=1)
+        date_from = date_to - timedelta(days=period_days - 1)
+
+        if with_history:
+            rows, days, quantities = stats['series']
+            history = np.zeros((len(ids), period_days))
+            history[rows.astype(np.int64), days.astype(np.int64)] = quantities
+        forecast_dates = [(date_to + timedelta(days=offset + 1)).isoformat() for offset in range(forecast_days)]
+
+        result = {}
+        for index, product_id in enumerate(ids):
+            current_stock = products['qty'][index]
+            total_forecast = float(totals[index])
+            slope = float(stats['slope'][index])
+            metrics = {
+                'moving_averages': {f'ma_{window}': round(float(stats[f'ma_{window}'][index]), 2) for window in MOVING_AVERAGE_WINDOWS},
+                'trend': {
+                    'status': 'increasing' if slope > TREND_SLOPE_EPSILON else ('decreasing' if slope < -TREND_SLOPE_EPSILON else 'stable'),
+                    'slope': round(slope, 4),
+                },
+                'current_stock': current_stock,
+                'total_forecast': round(total_forecast, 2),
+                'avg_daily_forecast': round(total_forecast / forecast_days, 2),
+                'days_of_stock': round(current_stock / (total_forecast / forecast_days), 1) if total_forecast > 0 else 0,
+            }
+            result[product_id] = {
+                'product_name': products['names'][index],
+                'product_sku': products['skus'][index],
+                'historical': [{
+                    'date': (date_from + timedelta(days=day)).isoformat(),
+                    'qty_sold': float(qty),
+                } for day, qty in enumerate(history[index])] if with_history else [],
+                'forecast': [{
+                    'date': forecast_date,
+                    'qty_forecast': round(float(qty), 2),
+                } for forecast_date, qty in zip(forecast_dates, daily[index])],
+                'metrics': metrics,
+                'recommendations': self._get_recommendations(current_stock, total_forecast, forecast_days),
+            }
+        return result
+
+    @staticmethod
+    def _get_recommendations(current_stock, total_forecast, forecast_days):
+        if total_forecast > current_stock:
+            shortage = total_forecast - current_stock
+            return [{
+                'type': 'warning',
+                'message': f'Risque de rupture : {round(shortage, 2)} unités manquantes sur {forecast_days} jours',
+                'qty_to_order': round(shortage * SAFETY_MARGIN, 2),
+            }]
+        if current_stock > total_forecast * 3:
+            return [{
+                'type': 'info',
+                'message': f'Surstock détecté : {round(current_stock - total_forecast, 2)} unités en excès',
+            }]
+        return [{
+            'type': 'success',
+            'message': 'Stock adéquat pour la période prévue',
+        }]
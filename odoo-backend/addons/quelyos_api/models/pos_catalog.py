@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+Catalogue POS synchronisé par deltas (/api/pos/catalog/*).
+
+Un terminal télécharge une fois un instantané compact de son catalogue
+(colonnes POS_CATALOG_FIELDS : id, code-barres, prix de sa liste de prix,
+taxes, stock de son entrepôt), puis ne demande que les produits modifiés
+depuis son watermark : les scans de codes-barres se résolvent localement et
+la charge serveur ne dépend plus du nombre de scans.
+
+Journal des modifications (quelyos_pos_catalog_change) : une ligne par
+produit modifié (fiche, prix, taxes, stock, archivage, suppression), inscrite
+en SQL par les hooks d'écriture avec l'id de sa transaction (colonne `xid`).
+Le watermark est l'xmin de l'instantané de lecture : toute transaction
+d'id inférieur est terminée, ses lignes sont toutes visibles. Les deltas
+renvoient les lignes de transaction >= watermark et sont paginés par id de
+ligne (curseur `lastId`). Une règle de prix qui ne vise pas un produit
+précis inscrit une ligne `pricelist_id` : les terminaux de cette liste de
+prix rechargent l'instantané.
+
+Compactage quotidien : seule la dernière ligne par produit est conservée et
+les lignes de plus de POS_CATALOG_RETENTION_DAYS jours sont purgées (un
+terminal resté hors-ligne plus longtemps recharge l'instantané).
+"""
+
+import logging
+
+from odoo import models, fields, api
+from odoo.tools.sql import column_exists
+
+_logger = logging.getLogger(__name__)
+
+POS_CATALOG_FORMAT = 2  # 2 : watermark = id de transaction (1 : id de ligne)
+POS_CATALOG_FIELDS = [
+    'id', 'name', 'sku', 'barcode', 'price', 'listPrice', 'taxIds', 'categoryId', 'type', 'stock',
+]
+POS_CATALOG_PAGE_SIZE = 5000
+POS_CATALOG_RETENTION_DAYS = 30
+POS_CATALOG_HORIZON_PARAM = 'quelyos_api.pos_catalog_horizon'
+
+# Champs qui modifient une ligne du catalogue POS
+POS_CATALOG_PRODUCT_FIELDS = {'barcode', 'default_code', 'active', 'product_tmpl_id'}
+POS_CATALOG_TEMPLATE_FIELDS = {
+    'name', 'list_price', 'taxes_id', 'categ_id', 'sale_ok', 'active', 'company_id', 'type',
+    'barcode', 'default_code',
+}
+POS_CATALOG_PRICELIST_FIELDS = {'currency_id', 'active', 'company_id'}
+
+
+class POSCatalogChange(models.Model):
+    _name = 'quelyos.pos.catalog.change'
+    _description = 'Journal des modifications du catalogue POS'
+    _log_access = False
+    _order = 'id'
+
+    # Pas de clé étrangère : la ligne survit à la suppression du produit
+    product_id = fields.Integer(string='Produit', index=True)
+    company_id = fields.Integer(string='Société')
+    pricelist_id = fields.Integer(string='Liste de prix', index=True)
+    changed_at = fields.Datetime(string='Modifié le')
+    # + colonne `xid` (bigint, id de la transaction d'inscription), gérée en SQL : voir init()
+
+    def init(self):
+        super().init()
+        new_xid = not column_exists(self.env.cr, self._table, 'xid')
+        self.env.cr.execute("ALTER TABLE quelyos_pos_catalog_change ADD COLUMN IF NOT EXISTS xid bigint")
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS quelyos_pos_catalog_change_xid_idx
+            ON quelyos_pos_catalog_change (xid)
+        """)
+        if new_xid:
+            # Watermarks du format précédent (ids de ligne) : rechargement de l'instantané
+            self.env.cr.execute("SELECT pg_current_xact_id()::text::bigint")
+            self.env['ir.config_parameter'].sudo().set_param(POS_CATALOG_HORIZON_PARAM, self.env.cr.fetchone()[0])
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # JOURNAL
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def _log_products(self, products):
+        """Inscrit des produits modifiés (une requête, sans lecture ORM)"""
+        if not products:
+            return
+        self.env['product.template'].flush_model(['company_id'])
+        self.env.cr.execute("""
+            INSERT INTO quelyos_pos_catalog_change (product_id, company_id, changed_at, xid)
+            SELECT p.id, t.company_id, clock_timestamp() AT TIME ZONE 'UTC', pg_current_xact_id()::text::bigint
+            FROM product_product p
+            JOIN product_template t ON t.id = p.product_tmpl_id
+            WHERE p.id = ANY(%s)
+        """, (list(products.ids),))
+
+    @api.model
+    def _log_templates(self, templates):
+        self._log_products(templates.with_context(active_test=False).product_variant_ids)
+
+    @api.model
+    def _log_pricelists(self, pricelists):
+        """Liste de prix modifiée globalement : les terminaux concernés rechargent l'instantané"""
+        if not pricelists:
+            return
+        self.env.cr.execute("""
+            INSERT INTO quelyos_pos_catalog_change (pricelist_id, changed_at, xid)
+            SELECT unnest(%s::int[]), clock_timestamp() AT TIME ZONE 'UTC', pg_current_xact_id()::text::bigint
+        """, (list(pricelists.ids),))
+
+    @api.model
+    def _log_pricelist_items(self, items):
+        """Règles de prix : produits visés, sinon toute la liste de prix"""
+        products = items.filtered(lambda i: i.applied_on == '0_product_variant').product_id
+        templates = items.filtered(lambda i: i.applied_on == '1_product').product_tmpl_id
+        self._log_products(products | templates.with_context(active_test=False).product_variant_ids)
+        self._log_pricelists(items.filtered(lambda i: i.applied_on not in ('0_product_variant', '1_product')).pricelist_id)
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # WATERMARK
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def _current_watermark(self):
+        """
+        xmin de l'instantané de lecture : plus petit id de transaction encore
+        en cours.
+
+        Les lignes des transactions d'id inférieur sont toutes committées (ou
+        annulées) et visibles par cette lecture ; celles des transactions
+        plus récentes, visibles ou non, sont renvoyées au delta suivant (les
+        terminaux les appliquent de façon idempotente).
+        """
+        self.env.cr.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _get_horizon(self):
+        """Watermark minimal encore servi par les deltas (lignes de transactions antérieures purgées)"""
+        return int(self.env['ir.config_parameter'].sudo().get_param(POS_CATALOG_HORIZON_PARAM, 0))
+
+    @api.model
+    def _catalog_key(self, config):
+        """Format du watermark et paramètres du terminal qui déterminent prix et stock de l'instantané"""
+        return f"{POS_CATALOG_FORMAT}:{config.pricelist_id.id or 0}:{config.warehouse_id.id or 0}:{config.company_id.id}"
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # INSTANTANÉ ET DELTAS
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def get_snapshot(self, config, after_id=0, limit=POS_CATALOG_PAGE_SIZE):
+        """
+        Page de l'instantané du catalogue du terminal (pagination par id).
+
+        Le terminal conserve le watermark de la première page : les produits
+        modifiés pendant le téléchargement sont rattrapés par le premier delta.
+        """
+        watermark = self._current_watermark()
+        products = self.env['product.product'].sudo().search(
+            self._catalog_domain(config) + [('id', '>', after_id or 0)], order='id', limit=limit,
+        )
+        return {
+            'format': POS_CATALOG_FORMAT,
+            'catalogKey': self._catalog_key(config),
+            'watermark': watermark,
+            'fields': POS_CATALOG_FIELDS,
+            'products': self._serialize_products(config, products),
+            'nextAfterId': products[-1].id if len(products) == limit else None,
+        }
+
+    @api.model
+    def get_changes(self, config, since, catalog_key=None, limit=POS_CATALOG_PAGE_SIZE, after_id=0):
+        """
+        Produits modifiés par les transactions d'id >= watermark `since`.
+
+        Pagination : pages suivantes demandées avec le même `since` et
+        after_id = lastId ; le terminal conserve le watermark de la première
+        page (comme pour l'instantané).
+
+        Returns:
+            dict: products (lignes à jour), removed (ids à retirer), watermark
+                  (prochain `since`), lastId (curseur de la page suivante,
+                  None en dernière page), hasMore, et reset=True si le
+                  terminal doit recharger l'instantané
+        """
+        since = int(since or 0)
+        watermark = max(self._current_watermark(), since)
+        result = {
+            'format': POS_CATALOG_FORMAT,
+            'catalogKey': self._catalog_key(config),
+            'fields': POS_CATALOG_FIELDS,
+            'products': [],
+            'removed': [],
+            'watermark': watermark,
+            'lastId': None,
+            'hasMore': False,
+            'reset': False,
+        }
+
+        if (catalog_key and catalog_key != result['catalogKey']) or since < self._get_horizon():
+            return dict(result, reset=True)
+
+        self.env.cr.execute("""
+            SELECT 1 FROM quelyos_pos_catalog_change
+            WHERE xid >= %s AND pricelist_id = %s
+            LIMIT 1
+        """, (since, config.pricelist_id.id or 0))
+        if self.env.cr.fetchone():
+            return dict(result, reset=True)
+
+        self.env.cr.execute("""
+            SELECT product_id, MAX(id) AS last_id
+            FROM quelyos_pos_catalog_change
+            WHERE xid >= %s AND id > %s AND product_id IS NOT NULL
+              AND (company_id IS NULL OR company_id = %s)
+            GROUP BY product_id
+            ORDER BY last_id
+            LIMIT %s
+        """, (since, int(after_id or 0), config.company_id.id, limit + 1))
+        rows = self.env.cr.fetchall()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            result['hasMore'] = True
+            result['lastId'] = rows[-1][1]
+
+        changed_ids = [product_id for product_id, _last_id in rows]
+        products = self.env['product.product'].sudo().search(
+            self._catalog_domain(config) + [('id', 'in', changed_ids)], order='id',
+        )
+        result['products'] = self._serialize_products(config, products)
+        result['removed'] = sorted(set(changed_ids) - set(products.ids))
+        return result
+
+    def _catalog_domain(self, config):
+        return [
+            ('sale_ok', '=', True),
+            '|', ('company_id', '=', config.company_id.id), ('company_id', '=', False),
+        ]
+
+    @api.model
+    def _serialize_products(self, config, products):
+        """Lignes compactes (ordre POS_CATALOG_FIELDS), prix et stock calculés en lot"""
+        if not products:
+            return []
+        pricelist = config.pricelist_id
+        prices = pricelist._get_products_price(products, 1.0) if pricelist else {}
+        stock = self._get_stock_quantities(config, products)
+        company = config.company_id
+
+        return [[
+            product.id,
+            product.name,
+            product.default_code or '',
+            product.barcode or '',
+            prices.get(product.id, product.list_price),
+            product.list_price,
+            product.taxes_id.filtered(lambda t: t.company_id == company).ids,
+            product.categ_id.id,
+            product.type,
+            stock.get(product.id, 0.0),
+        ] for product in products]
+
+    @api.model
+    def _get_stock_quantities(self, config, products):
+        """Stock disponible par produit dans l'entrepôt du terminal (une requête)"""
+        warehouse = config.warehouse_id
+        if not warehouse:
+            return {}
+        self.env['stock.quant'].flush_model(['product_id', 'location_id', 'quantity'])
+        self.env.cr.execute("""
+            SELECT q.product_id, SUM(q.quantity)
+            FROM stock_quant q
+            JOIN stock_location l ON l.id = q.location_id
+            WHERE l.parent_path LIKE %s AND l.usage = 'internal'
+              AND q.product_id = ANY(%s)
+            GROUP BY q.product_id
+        """, (f"{warehouse.view_location_id.parent_path}%", list(products.ids)))
+        return dict(self.env.cr.fetchall())
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # COMPACTAGE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def cron_compact_changes(self):
+        """
+        Garde la dernière ligne par produit / liste de prix et purge l'historique ancien.
+
+        « Dernière » au sens de la transaction (xid) : une ligne d'id plus
+        grand peut venir d'une transaction plus ancienne, sous le watermark.
+        """
+        cr = self.env.cr
+        superseded = 0
+        for column in ('product_id', 'pricelist_id'):
+            cr.execute(f"""
+                DELETE FROM quelyos_pos_catalog_change
+                WHERE id IN (
+                    SELECT id FROM (
+                        SELECT id, row_number() OVER (
+                            PARTITION BY {column} ORDER BY COALESCE(xid, 0) DESC, id DESC
+                        ) AS rn
+                        FROM quelyos_pos_catalog_change
+                        WHERE {column} IS NOT NULL
+                    ) ranked
+                    WHERE rn > 1
+                )
+            """)
+            superseded += cr.rowcount
+
+        cr.execute("""
+            DELETE FROM quelyos_pos_catalog_change
+            WHERE changed_at < (now() AT TIME ZONE 'UTC') - make_interval(days => %s)
+            RETURNING xid
+        """, (POS_CATALOG_RETENTION_DAYS,))
+        purged = [row[0] for row in cr.fetchall()]
+        # Watermark <= dernière transaction purgée : lignes manquantes, rechargement
+        horizon = max((xid for xid in purged if xid is not None), default=0) + 1
+        if horizon > self._get_horizon():
+            self.env['ir.config_parameter'].sudo().set_param(POS_CATALOG_HORIZON_PARAM, horizon)
+
+        _logger.info(f"[POSCatalog] Compacted change log: {superseded} superseded, {len(purged)} purged")
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# HOOKS D'ÉCRITURE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        products = super().create(vals_list)
+        self.env['quelyos.pos.catalog.change']._log_products(products)
+        return products
+
+    def write(self, vals):
+        res = super().write(vals)
+        if POS_CATALOG_PRODUCT_FIELDS.intersection(vals):
+            self.env['quelyos.pos.catalog.change']._log_products(self)
+        return res
+
+    def unlink(self):
+        self.env['quelyos.pos.catalog.change']._log_products(self)
+        return super().unlink()
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    def write(self, vals):
+        Change = self.env['quelyos.pos.catalog.change']
+        if 'company_id' in vals:
+            # Retrait du catalogue de l'ancienne société
+            Change._log_templates(self)
+        res = super().write(vals)
+        if POS_CATALOG_TEMPLATE_FIELDS.intersection(vals):
+            Change._log_templates(self)
+        return res
+
+    def unlink(self):
+        self.env['quelyos.pos.catalog.change']._log_templates(self)
+        return super().unlink()
+
+
+class StockQuant(models.Model):
+    _inherit = 'stock.quant'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        quants = super().create(vals_list)
+        self.env['quelyos.pos.catalog.change']._log_products(quants.product_id)
+        return quants
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'quantity' in vals:
+            self.env['quelyos.pos.catalog.change']._log_products(self.product_id)
+        return res
+
+
+class ProductPricelist(models.Model):
+    _inherit = 'product.pricelist'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if POS_CATALOG_PRICELIST_FIELDS.intersection(vals):
+            self.env['quelyos.pos.catalog.change']._log_pricelists(self)
+        return res
+
+
+class ProductPricelistItem(models.Model):
+    _inherit = 'product.pricelist.item'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        items = super().create(vals_list)
+        self.env['quelyos.pos.catalog.change']._log_pricelist_items(items)
+        return items
+
+    def write(self, vals):
+        Change = self.env['quelyos.pos.catalog.change']
+        Change._log_pricelist_items(self)
+        res = super().write(vals)
+        Change._log_pricelist_items(self)
+        return res
+
+    def unlink(self):
+        self.env['quelyos.pos.catalog.change']._log_pricelist_items(self)
+        return super().unlink()
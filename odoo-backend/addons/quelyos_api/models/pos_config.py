@@ -113,6 +113,18 @@ class POSConfig(models.Model):
         domain="[('company_id', '=', company_id), ('account_type', '=', 'income')]",
         help="Compte de produits par défaut pour les ventes POS"
     )
+    posting_mode = fields.Selection(
+        selection=[
+            ('order', 'À chaque ticket'),
+            ('session', 'À la clôture de session'),
+        ],
+        string='Passation stock / compta',
+        required=True,
+        default='order',
+        help="À la clôture de session : le paiement d'un ticket n'enregistre que ses "
+             "lignes ; mouvements de stock et écritures sont agrégés et passés en une "
+             "fois à la fermeture de la session"
+    )
 
     # ═══════════════════════════════════════════════════════════════════════════
     # MÉTHODES DE PAIEMENT
@@ -343,6 +355,7 @@ class POSConfig(models.Model):
                 'allowOrderNotes': self.allow_order_notes,
                 'barcodeScanner': self.barcode_scanner,
                 'cashDrawer': self.cash_drawer,
+                'postingMode': self.posting_mode,
             },
             'receipt': {
                 'printer': self.receipt_printer,
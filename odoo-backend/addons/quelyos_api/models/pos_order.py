@@ -12,11 +12,18 @@ Représente une transaction de vente en caisse :
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools.sql import column_exists
+from collections import defaultdict
 from datetime import datetime
 import logging
 
+from .pos_session import POS_COUNTED_STATES, PAYMENT_TYPE_TOTAL_FIELDS, SESSION_TOTAL_FIELDS
+
 _logger = logging.getLogger(__name__)
 
+# Champs de commande qui modifient les compteurs de session
+SESSION_TOTALS_TRIGGER_FIELDS = {'state', 'session_id', 'amount_return'}
+
 
 class POSOrder(models.Model):
     _name = 'quelyos.pos.order'
@@ -247,6 +254,30 @@ class POSOrder(models.Model):
         'pos_order_id',
         string='Bons de sortie'
     )
+    is_posted = fields.Boolean(
+        string='Stock et compta passés',
+        default=False,
+        copy=False,
+        help="Mouvements de stock et écritures générés (au paiement, ou à la "
+             "clôture de session si le terminal passe par session ou si "
+             "l'écriture a échoué au paiement)"
+    )
+
+    _sql_constraints = [
+        ('offline_id_unique', 'unique(offline_id)',
+         'Cette commande offline a déjà été synchronisée.'),
+    ]
+
+    def _auto_init(self):
+        # Nouvelle colonne : les commandes déjà encaissées ont été passées au paiement
+        new_is_posted = not column_exists(self.env.cr, self._table, 'is_posted')
+        res = super()._auto_init()
+        if new_is_posted:
+            self.env.cr.execute("""
+                UPDATE quelyos_pos_order SET is_posted = TRUE
+                WHERE state NOT IN ('draft', 'cancelled')
+            """)
+        return res
 
     # ═══════════════════════════════════════════════════════════════════════════
     # COMPUTED FIELDS
@@ -288,15 +319,72 @@ class POSOrder(models.Model):
 
     @api.model_create_multi
     def create(self, vals_list):
+        next_numbers = {}
         for vals in vals_list:
             if vals.get('name', '/') == '/':
                 session = self.env['quelyos.pos.session'].browse(vals.get('session_id'))
                 prefix = session.config_id.code or 'POS'
                 date_str = datetime.now().strftime('%y%m%d')
                 # Séquence basée sur le nombre de commandes de la session
-                order_num = len(session.order_ids) + 1
+                # (+ commandes de la même session déjà numérotées dans ce lot)
+                if session.id not in next_numbers:
+                    next_numbers[session.id] = len(session.order_ids) + 1
+                order_num = next_numbers[session.id]
+                next_numbers[session.id] += 1
                 vals['name'] = f"{prefix}/{date_str}/{str(order_num).zfill(4)}"
-        return super().create(vals_list)
+        orders = super().create(vals_list)
+        self.env['quelyos.pos.session']._add_to_totals(orders._get_session_totals())
+        return orders
+
+    def write(self, vals):
+        if not SESSION_TOTALS_TRIGGER_FIELDS.intersection(vals):
+            return super().write(vals)
+        before = self._get_session_totals()
+        res = super().write(vals)
+        after = self._get_session_totals()
+        self.env['quelyos.pos.session']._add_to_totals({
+            session_id: {fname: after[session_id][fname] - before[session_id][fname] for fname in SESSION_TOTAL_FIELDS}
+            for session_id in set(before) | set(after)
+        })
+        return res
+
+    def unlink(self):
+        removed = self._get_session_totals()
+        self.env['quelyos.pos.session']._add_to_totals({
+            session_id: {fname: -value for fname, value in totals.items()}
+            for session_id, totals in removed.items()
+        })
+        return super().unlink()
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # COMPTEURS DE SESSION
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _get_session_totals(self, payments=None):
+        """
+        Part des commandes comptées (payées/terminées/facturées) dans les
+        compteurs de leur session ; ne lit que ces commandes et leurs paiements.
+
+        Args:
+            payments: Paiements à compter (défaut : tous ceux des commandes) ;
+                      seuls les paiements sont alors comptés
+
+        Returns:
+            dict: {session_id: {champ: valeur}}
+        """
+        totals = defaultdict(lambda: defaultdict(float))
+        counted = self.filtered(lambda o: o.state in POS_COUNTED_STATES)
+        if payments is None:
+            for order in counted:
+                session_totals = totals[order.session_id.id]
+                session_totals['order_count'] += 1
+                session_totals['total_amount'] += order.amount_total
+                session_totals['total_returns'] += order.amount_return
+            payments = counted.payment_ids
+        for payment in payments.filtered(lambda p: p.order_id in counted):
+            fname = PAYMENT_TYPE_TOTAL_FIELDS.get(payment.payment_method_id.type, 'total_other')
+            totals[payment.order_id.session_id.id][fname] += payment.amount
+        return totals
 
     # ═══════════════════════════════════════════════════════════════════════════
     # VALIDATION
@@ -365,11 +453,8 @@ class POSOrder(models.Model):
             'amount_return': amount_return,
         })
 
-        # Créer les mouvements de stock
-        self._create_stock_moves()
-
-        # Créer les écritures comptables
-        self._create_account_move()
+        # Mouvements de stock et écritures comptables (ou différés à la clôture)
+        self._post_stock_and_accounting()
 
         return True
 
@@ -452,60 +537,84 @@ class POSOrder(models.Model):
     # STOCK
     # ═══════════════════════════════════════════════════════════════════════════
 
-    def _create_stock_moves(self):
-        """Crée les mouvements de sortie de stock"""
-        self.ensure_one()
+    def _post_stock_and_accounting(self):
+        """
+        Stock et comptabilité des commandes payées.
 
-        if not self.config_id.warehouse_id or not self.config_id.picking_type_id:
-            _logger.warning(f"POS Order {self.name}: No warehouse configured, skipping stock moves")
-            return
+        Terminal en passation 'session' : les tickets n'enregistrent que leurs
+        lignes, agrégées à la clôture (quelyos.pos.session._post_session_moves).
+        Une commande dont l'écriture échoue reste non passée : elle est
+        repassée à la clôture.
+        """
+        orders = self.filtered(lambda order: order.config_id.posting_mode != 'session')
+        if orders:
+            orders._create_stock_moves()
+            failed = orders._create_account_move()
+            (orders - failed).write({'is_posted': True})
 
+    def _create_stock_moves(self):
+        """
+        Crée les bons de sortie des commandes (un par commande).
+
+        Les bons de tout le lot sont créés, confirmés et validés ensemble :
+        une synchronisation offline de plusieurs centaines de tickets ne
+        déclenche qu'une réservation et une validation.
+        """
         Picking = self.env['stock.picking'].sudo()
-        StockMove = self.env['stock.move'].sudo()
+        customers = self.env.ref('stock.stock_location_customers')
 
-        # Créer le bon de sortie
-        picking_vals = {
-            'partner_id': self.partner_id.id if self.partner_id else False,
-            'picking_type_id': self.config_id.picking_type_id.id,
-            'location_id': self.config_id.warehouse_id.lot_stock_id.id,
-            'location_dest_id': self.env.ref('stock.stock_location_customers').id,
-            'origin': self.name,
-            'pos_order_id': self.id,
-        }
-        picking = Picking.create(picking_vals)
+        picking_vals = []
+        for order in self:
+            if not order.config_id.warehouse_id or not order.config_id.picking_type_id:
+                _logger.warning(f"POS Order {order.name}: No warehouse configured, skipping stock moves")
+                continue
 
-        # Créer les mouvements pour chaque ligne
-        for line in self.line_ids:
-            if line.product_id.type != 'service' and line.quantity > 0:
-                move_vals = {
-                    'name': f"POS/{self.name}/{line.product_id.name}",
+            lines = order.line_ids.filtered(
+                lambda line: line.product_id.type != 'service' and line.quantity > 0
+            )
+            if not lines:
+                continue
+
+            location = order.config_id.warehouse_id.lot_stock_id
+            picking_vals.append({
+                'partner_id': order.partner_id.id if order.partner_id else False,
+                'picking_type_id': order.config_id.picking_type_id.id,
+                'location_id': location.id,
+                'location_dest_id': customers.id,
+                'origin': order.name,
+                'pos_order_id': order.id,
+                'move_ids': [(0, 0, {
+                    'name': f"POS/{order.name}/{line.product_id.name}",
                     'product_id': line.product_id.id,
                     'product_uom_qty': line.quantity,
                     'product_uom': line.product_id.uom_id.id,
-                    'picking_id': picking.id,
-                    'location_id': picking.location_id.id,
-                    'location_dest_id': picking.location_dest_id.id,
-                    'origin': self.name,
-                }
-                StockMove.create(move_vals)
+                    'location_id': location.id,
+                    'location_dest_id': customers.id,
+                    'origin': order.name,
+                }) for line in lines],
+            })
 
-        # Confirmer et valider le picking
-        picking.action_confirm()
-        picking.action_assign()
+        if not picking_vals:
+            return
+
+        # Confirmer et valider les bons
+        pickings = Picking.create(picking_vals)
+        pickings.action_confirm()
+        pickings.action_assign()
 
         # Essayer de valider immédiatement
-        for move in picking.move_ids:
+        for move in pickings.move_ids:
             move.quantity = move.product_uom_qty
 
-        picking.button_validate()
+        pickings.button_validate()
 
     # ═══════════════════════════════════════════════════════════════════════════
     # COMPTABILITÉ
     # ═══════════════════════════════════════════════════════════════════════════
 
-    def _create_account_move(self):
+    def _prepare_account_move_lines(self):
         """
-        Crée les écritures comptables pour la commande POS.
+        Lignes comptables de la commande POS (dicts debit/credit).
 
         Utilise les journaux natifs Odoo (account.move) pour :
         - Enregistrer les ventes (crédit compte produits)
@@ -513,12 +622,6 @@ class POSOrder(models.Model):
         - Enregistrer les paiements (débit compte caisse/banque)
         """
         self.ensure_one()
-
-        # Vérifier la configuration comptable
-        if not self.config_id.sale_journal_id:
-            _logger.warning(f"POS Order {self.name}: No sale journal configured, skipping accounting")
-            return
-
         journal = self.config_id.sale_journal_id
         move_lines = []
 
@@ -537,7 +640,7 @@ class POSOrder(models.Model):
 
             # Ligne de vente HT (crédit)
             if line.price_subtotal_untaxed:
-                move_lines.append((0, 0, {
+                move_lines.append({
                     'name': f"{self.name} - {line.product_id.name}",
                     'account_id': income_account.id,
                     'partner_id': self.partner_id.id if self.partner_id else False,
@@ -545,7 +648,7 @@ class POSOrder(models.Model):
                     'credit': abs(line.price_subtotal_untaxed),
                     'product_id': line.product_id.id,
                     'quantity': line.quantity,
-                }))
+                })
 
             # Lignes de taxes (crédit)
             for tax in line.tax_ids:
@@ -557,14 +660,14 @@ class POSOrder(models.Model):
                     ).account_id
 
                     if tax_account:
-                        move_lines.append((0, 0, {
+                        move_lines.append({
                             'name': f"{self.name} - TVA {tax.name}",
                             'account_id': tax_account.id,
                             'partner_id': self.partner_id.id if self.partner_id else False,
                             'debit': 0.0,
                             'credit': abs(tax_amount),
                             'tax_line_id': tax.id,
-                        }))
+                        })
 
         # === LIGNES DE PAIEMENT (Débit) ===
         for payment in self.payment_ids:
@@ -589,54 +692,94 @@ class POSOrder(models.Model):
                     amount = payment.amount - self.amount_return
 
                 if amount > 0:
-                    move_lines.append((0, 0, {
+                    move_lines.append({
                         'name': f"{self.name} - {payment.payment_method_id.name}",
                         'account_id': payment_account.id,
                         'partner_id': self.partner_id.id if self.partner_id else False,
                         'debit': abs(amount),
                         'credit': 0.0,
-                    }))
+                    })
 
         # === REMISE GLOBALE (Débit - réduction des produits) ===
         if self.discount_amount > 0 and self.config_id.income_account_id:
-            move_lines.append((0, 0, {
+            move_lines.append({
                 'name': f"{self.name} - Remise globale",
                 'account_id': self.config_id.income_account_id.id,
                 'partner_id': self.partner_id.id if self.partner_id else False,
                 'debit': abs(self.discount_amount),
                 'credit': 0.0,
-            }))
+            })
+
+        return move_lines
 
-        # === CRÉER LA PIÈCE COMPTABLE ===
+    def _prepare_account_move_vals(self):
+        """Valeurs de l'écriture comptable de la commande POS (None si rien à passer)"""
+        self.ensure_one()
+
+        # Vérifier la configuration comptable
+        if not self.config_id.sale_journal_id:
+            _logger.warning(f"POS Order {self.name}: No sale journal configured, skipping accounting")
+            return None
+
+        move_lines = self._prepare_account_move_lines()
         if not move_lines:
             _logger.warning(f"POS Order {self.name}: No accounting lines to create")
-            return
+            return None
 
-        try:
-            AccountMove = self.env['account.move'].sudo()
-            move_vals = {
-                'journal_id': journal.id,
-                'date': fields.Date.today(),
-                'ref': self.name,
-                'move_type': 'entry',
-                'partner_id': self.partner_id.id if self.partner_id else False,
-                'line_ids': move_lines,
-            }
+        return {
+            'journal_id': self.config_id.sale_journal_id.id,
+            'date': fields.Date.today(),
+            'ref': self.name,
+            'move_type': 'entry',
+            'partner_id': self.partner_id.id if self.partner_id else False,
+            'line_ids': [(0, 0, line) for line in move_lines],
+        }
+
+    def _create_account_move(self):
+        """
+        Crée et valide les écritures comptables des commandes POS.
+
+        Les pièces du lot sont créées et validées en une fois ; si le lot
+        échoue, chaque commande est repassée seule pour isoler la fautive.
 
-            account_move = AccountMove.create(move_vals)
+        Returns:
+            quelyos.pos.order: commandes dont l'écriture a échoué
+        """
+        orders = self.browse()
+        vals_list = []
+        for order in self:
+            vals = order._prepare_account_move_vals()
+            if vals:
+                orders |= order
+                vals_list.append(vals)
 
-            # Valider automatiquement l'écriture
-            account_move.action_post()
+        if not vals_list:
+            return self.browse()
 
-            # Lier à la commande POS
-            self.write({'invoice_id': account_move.id})
+        try:
+            with self.env.cr.savepoint():
+                account_moves = self.env['account.move'].sudo().create(vals_list)
 
-            _logger.info(f"POS Order {self.name}: Created account move {account_move.name}")
+                # Valider automatiquement les écritures
+                account_moves.action_post()
 
         except Exception as e:
-            _logger.error(f"POS Order {self.name}: Error creating account move: {e}", exc_info=True)
-            # Ne pas bloquer la vente si la compta échoue
-            # L'erreur sera visible dans les logs
+            if len(orders) > 1:
+                _logger.warning(f"POS accounting batch failed ({e}), posting orders one by one")
+                failed = self.browse()
+                for order in orders:
+                    failed |= order._create_account_move()
+                return failed
+            _logger.error(f"POS Order {orders.name}: Error creating account move: {e}", exc_info=True)
+            # Ne pas bloquer la vente si la compta échoue : commande repassée à la clôture
+            return orders
+
+        # Lier aux commandes POS
+        for order, account_move in zip(orders, account_moves):
+            order.invoice_id = account_move
+
+        _logger.info(f"POS: Created {len(account_moves)} account move(s) for {len(orders)} order(s)")
+        return self.browse()
 
     # ═══════════════════════════════════════════════════════════════════════════
     # MÉTHODES FRONTEND
@@ -857,6 +1000,32 @@ class POSPayment(models.Model):
         help="Lien vers la transaction de paiement Odoo"
     )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        payments = super().create(vals_list)
+        payments._add_to_session_totals()
+        return payments
+
+    def write(self, vals):
+        if not {'amount', 'payment_method_id', 'order_id'}.intersection(vals):
+            return super().write(vals)
+        self._add_to_session_totals(sign=-1)
+        res = super().write(vals)
+        self._add_to_session_totals()
+        return res
+
+    def unlink(self):
+        self._add_to_session_totals(sign=-1)
+        return super().unlink()
+
+    def _add_to_session_totals(self, sign=1):
+        """Paiement ajouté / retiré d'une commande déjà comptée dans sa session"""
+        totals = self.order_id._get_session_totals(payments=self)
+        self.env['quelyos.pos.session']._add_to_totals({
+            session_id: {fname: sign * value for fname, value in session_totals.items()}
+            for session_id, session_totals in totals.items()
+        })
+
     def to_frontend_dict(self):
         """Convertit pour le frontend"""
         self.ensure_one()
@@ -879,3 +1048,9 @@ class StockPicking(models.Model):
         string='Commande POS',
         help="Commande POS source de ce bon de sortie"
     )
+    pos_session_id = fields.Many2one(
+        'quelyos.pos.session',
+        string='Session POS',
+        index='btree_not_null',
+        help="Session POS dont les ventes sont agrégées dans ce bon de sortie"
+    )
@@ -10,7 +10,26 @@ Une session représente une période de travail sur un terminal :
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import float_is_zero
+from collections import defaultdict
 from datetime import datetime
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Commandes comptées dans les totaux de session
+POS_COUNTED_STATES = ('paid', 'done', 'invoiced')
+
+# Compteurs de session tenus à jour à chaque encaissement
+SESSION_TOTAL_FIELDS = (
+    'order_count', 'total_amount', 'total_returns',
+    'total_cash', 'total_card', 'total_digital', 'total_other',
+)
+PAYMENT_TYPE_TOTAL_FIELDS = {
+    'cash': 'total_cash',
+    'card': 'total_card',
+    'digital': 'total_digital',
+}
 
 
 class POSSession(models.Model):
@@ -115,49 +134,51 @@ class POSSession(models.Model):
     )
     theoretical_closing_cash = fields.Float(
         string='Encaisse théorique',
-        compute='_compute_totals',
+        compute='_compute_theoretical_closing_cash',
         store=True,
         help="Fond initial + paiements espèces - rendus"
     )
 
     # ═══════════════════════════════════════════════════════════════════════════
-    # TOTAUX (COMPUTED)
+    # TOTAUX (COMPTEURS)
     # ═══════════════════════════════════════════════════════════════════════════
 
+    # Tenus à jour à chaque encaissement (_add_to_totals), rapprochés à la clôture
+
     order_count = fields.Integer(
         string='Nombre de commandes',
-        compute='_compute_totals',
-        store=True
+        readonly=True,
+        default=0
     )
     total_amount = fields.Float(
         string='Total des ventes',
-        compute='_compute_totals',
-        store=True
+        readonly=True,
+        default=0.0
     )
     total_cash = fields.Float(
         string='Total espèces',
-        compute='_compute_totals',
-        store=True
+        readonly=True,
+        default=0.0
     )
     total_card = fields.Float(
         string='Total carte',
-        compute='_compute_totals',
-        store=True
+        readonly=True,
+        default=0.0
     )
     total_digital = fields.Float(
         string='Total digital',
-        compute='_compute_totals',
-        store=True
+        readonly=True,
+        default=0.0
     )
     total_other = fields.Float(
         string='Total autres',
-        compute='_compute_totals',
-        store=True
+        readonly=True,
+        default=0.0
     )
     total_returns = fields.Float(
         string='Total rendus monnaie',
-        compute='_compute_totals',
-        store=True
+        readonly=True,
+        default=0.0
     )
 
     # ═══════════════════════════════════════════════════════════════════════════
@@ -186,6 +207,23 @@ class POSSession(models.Model):
         readonly=True
     )
 
+    # ═══════════════════════════════════════════════════════════════════════════
+    # PASSATION STOCK / COMPTA (terminal en mode 'session')
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    picking_ids = fields.One2many(
+        'stock.picking',
+        'pos_session_id',
+        string='Bons de sortie',
+        readonly=True
+    )
+    account_move_ids = fields.One2many(
+        'account.move',
+        'pos_session_id',
+        string='Écritures',
+        readonly=True
+    )
+
     # ═══════════════════════════════════════════════════════════════════════════
     # NOTES
     # ═══════════════════════════════════════════════════════════════════════════
@@ -203,48 +241,12 @@ class POSSession(models.Model):
     # COMPUTED FIELDS
     # ═══════════════════════════════════════════════════════════════════════════
 
-    @api.depends('order_ids', 'order_ids.state', 'order_ids.amount_total',
-                 'order_ids.payment_ids', 'order_ids.amount_return', 'opening_cash')
-    def _compute_totals(self):
-        """Calcule tous les totaux de la session"""
+    @api.depends('opening_cash', 'total_cash', 'total_returns')
+    def _compute_theoretical_closing_cash(self):
+        """Encaisse théorique = Fond initial + espèces reçues - rendus"""
         for session in self:
-            # Filtrer les commandes payées/terminées
-            paid_orders = session.order_ids.filtered(
-                lambda o: o.state in ['paid', 'done', 'invoiced']
-            )
-
-            session.order_count = len(paid_orders)
-            session.total_amount = sum(paid_orders.mapped('amount_total'))
-            session.total_returns = sum(paid_orders.mapped('amount_return'))
-
-            # Totaux par type de paiement
-            total_cash = 0.0
-            total_card = 0.0
-            total_digital = 0.0
-            total_other = 0.0
-
-            for order in paid_orders:
-                for payment in order.payment_ids:
-                    amount = payment.amount
-                    payment_type = payment.payment_method_id.type
-
-                    if payment_type == 'cash':
-                        total_cash += amount
-                    elif payment_type == 'card':
-                        total_card += amount
-                    elif payment_type == 'digital':
-                        total_digital += amount
-                    else:
-                        total_other += amount
-
-            session.total_cash = total_cash
-            session.total_card = total_card
-            session.total_digital = total_digital
-            session.total_other = total_other
-
-            # Encaisse théorique = Fond initial + espèces reçues - rendus
             session.theoretical_closing_cash = (
-                session.opening_cash + total_cash - session.total_returns
+                session.opening_cash + session.total_cash - session.total_returns
             )
 
     @api.depends('closing_cash', 'theoretical_closing_cash')
@@ -258,6 +260,105 @@ class POSSession(models.Model):
             else:
                 session.cash_difference = 0.0
 
+    # ═══════════════════════════════════════════════════════════════════════════
+    # COMPTEURS DE SESSION
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def _add_to_totals(self, deltas):
+        """
+        Ajoute des deltas aux compteurs de session.
+
+        Incrément en SQL (SET x = x + delta) : deux encaissements concurrents
+        sur la même session ne s'écrasent pas et la lecture d'une session
+        reste O(1) quel que soit son nombre de tickets.
+
+        Args:
+            deltas: {session_id: {champ: delta}} (champs de SESSION_TOTAL_FIELDS)
+        """
+        deltas = {
+            session_id: delta for session_id, delta in deltas.items()
+            if session_id and any(delta.values())
+        }
+        if not deltas:
+            return
+
+        self.flush_model(list(SESSION_TOTAL_FIELDS))
+        assignments = ', '.join(f"{fname} = {fname} + %s" for fname in SESSION_TOTAL_FIELDS)
+        for session_id, delta in deltas.items():
+            self.env.cr.execute(
+                f"UPDATE quelyos_pos_session SET {assignments} WHERE id = %s",
+                [delta.get(fname, 0) for fname in SESSION_TOTAL_FIELDS] + [session_id],
+            )
+
+        sessions = self.browse(list(deltas))
+        sessions.invalidate_recordset(list(SESSION_TOTAL_FIELDS))
+        sessions.modified(list(SESSION_TOTAL_FIELDS))
+
+    def _get_orders_totals(self):
+        """
+        Totaux recalculés depuis les commandes et paiements (deux GROUP BY).
+
+        Returns:
+            dict: {session_id: {champ: valeur}} pour chaque session de self
+        """
+        result = {session.id: dict.fromkeys(SESSION_TOTAL_FIELDS, 0.0) for session in self}
+        for totals in result.values():
+            totals['order_count'] = 0
+
+        self.env['quelyos.pos.order'].flush_model(['session_id', 'state', 'amount_total', 'amount_return'])
+        self.env['quelyos.pos.payment'].flush_model(['order_id', 'payment_method_id', 'amount'])
+        self.env.cr.execute("""
+            SELECT session_id, COUNT(*), COALESCE(SUM(amount_total), 0), COALESCE(SUM(amount_return), 0)
+            FROM quelyos_pos_order
+            WHERE session_id = ANY(%s) AND state = ANY(%s)
+            GROUP BY session_id
+        """, (self.ids, list(POS_COUNTED_STATES)))
+        for session_id, count, amount, returns in self.env.cr.fetchall():
+            result[session_id].update(order_count=count, total_amount=amount, total_returns=returns)
+
+        self.env.cr.execute("""
+            SELECT o.session_id, m.type, SUM(p.amount)
+            FROM quelyos_pos_payment p
+            JOIN quelyos_pos_order o ON o.id = p.order_id
+            JOIN quelyos_pos_payment_method m ON m.id = p.payment_method_id
+            WHERE o.session_id = ANY(%s) AND o.state = ANY(%s)
+            GROUP BY o.session_id, m.type
+        """, (self.ids, list(POS_COUNTED_STATES)))
+        for session_id, payment_type, amount in self.env.cr.fetchall():
+            result[session_id][PAYMENT_TYPE_TOTAL_FIELDS.get(payment_type, 'total_other')] += amount or 0.0
+
+        return result
+
+    def _reconcile_totals(self):
+        """
+        Rapprochement à la clôture : compare les compteurs aux totaux
+        recalculés depuis les commandes. Un écart (commande modifiée hors
+        workflow) est corrigé et tracé dans le chatter.
+        """
+        expected_totals = self._get_orders_totals()
+        for session in self:
+            expected = expected_totals[session.id]
+            rounding = session.currency_id.rounding or 0.01
+            drift = {
+                fname: expected[fname] - session[fname]
+                for fname in SESSION_TOTAL_FIELDS
+                if not float_is_zero(expected[fname] - session[fname], precision_rounding=rounding)
+            }
+            if not drift:
+                continue
+
+            _logger.warning(
+                f"[POS] Session {session.name}: counters drifted from orders, corrected ({drift})"
+            )
+            session.write(expected)
+            session.message_post(
+                body=_("Compteurs de session corrigés au rapprochement : %s") % ', '.join(
+                    f"{session._fields[fname].string} {delta:+.2f}" for fname, delta in drift.items()
+                ),
+                message_type='notification',
+            )
+
     # ═══════════════════════════════════════════════════════════════════════════
     # SÉQUENCE
     # ═══════════════════════════════════════════════════════════════════════════
@@ -339,6 +440,9 @@ class POSSession(models.Model):
             if session.state != 'closing':
                 raise UserError(_("Cette session ne peut pas être fermée."))
 
+            session._reconcile_totals()
+            session._post_session_moves()
+
             session.write({
                 'state': 'closed',
                 'closed_at': fields.Datetime.now(),
@@ -382,6 +486,136 @@ class POSSession(models.Model):
                 message_type='notification',
             )
 
+    # ═══════════════════════════════════════════════════════════════════════════
+    # PASSATION AGRÉGÉE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _post_session_moves(self):
+        """
+        Passe le stock et la comptabilité des commandes payées non encore
+        passées, quel que soit le mode courant du terminal (il a pu changer
+        en cours de session) :
+        - commandes sans bon de sortie (mode 'session') : un bon de sortie,
+          un mouvement par produit ; une écriture, une ligne par compte / taxe ;
+        - commandes passées au ticket dont l'écriture a échoué au paiement :
+          écriture repassée par commande, le stock est déjà sorti.
+
+        Une session réouverte puis refermée ne passe que les nouvelles commandes.
+        """
+        for session in self:
+            orders = session.order_ids.filtered(
+                lambda o: o.state in ['paid', 'done', 'invoiced'] and not o.is_posted
+            )
+            if not orders:
+                continue
+
+            stock_posted = orders.filtered('picking_ids')
+            aggregated = orders - stock_posted
+            try:
+                with self.env.cr.savepoint():
+                    if aggregated:
+                        session._create_session_picking(aggregated)
+                        session._create_session_account_move(aggregated)
+                    failed = stock_posted._create_account_move()
+                    if failed:
+                        raise UserError(_("écritures des commandes %s non créées") % ', '.join(failed.mapped('name')))
+            except Exception as e:
+                _logger.error(f"POS Session {session.name}: posting failed: {e}", exc_info=True)
+                raise UserError(
+                    _("Passation stock / comptabilité de la session %s impossible : %s") % (session.name, e)
+                )
+
+            orders.write({'is_posted': True})
+
+    def _create_session_picking(self, orders):
+        """Bon de sortie de la session, quantités agrégées par produit"""
+        self.ensure_one()
+        config = self.config_id
+
+        if not config.warehouse_id or not config.picking_type_id:
+            _logger.warning(f"POS Session {self.name}: No warehouse configured, skipping stock moves")
+            return
+
+        quantities = defaultdict(float)
+        for line in orders.line_ids:
+            if line.product_id.type != 'service' and line.quantity > 0:
+                quantities[line.product_id] += line.quantity
+        if not quantities:
+            return
+
+        location = config.warehouse_id.lot_stock_id
+        customers = self.env.ref('stock.stock_location_customers')
+        picking = self.env['stock.picking'].sudo().create({
+            'picking_type_id': config.picking_type_id.id,
+            'location_id': location.id,
+            'location_dest_id': customers.id,
+            'origin': self.name,
+            'pos_session_id': self.id,
+            'move_ids': [(0, 0, {
+                'name': f"POS/{self.name}/{product.name}",
+                'product_id': product.id,
+                'product_uom_qty': quantity,
+                'product_uom': product.uom_id.id,
+                'location_id': location.id,
+                'location_dest_id': customers.id,
+                'origin': self.name,
+            }) for product, quantity in quantities.items()],
+        })
+
+        picking.action_confirm()
+        picking.action_assign()
+        for move in picking.move_ids:
+            move.quantity = move.product_uom_qty
+        picking.button_validate()
+
+    def _create_session_account_move(self, orders):
+        """Écriture de la session : lignes des tickets cumulées par compte / taxe"""
+        self.ensure_one()
+        journal = self.config_id.sale_journal_id
+
+        if not journal:
+            _logger.warning(f"POS Session {self.name}: No sale journal configured, skipping accounting")
+            return
+
+        balances = defaultdict(float)
+        for order in orders:
+            for line in order._prepare_account_move_lines():
+                balances[(line['account_id'], line.get('tax_line_id') or False)] += line['debit'] - line['credit']
+
+        currency = self.currency_id or self.company_id.currency_id
+        Account = self.env['account.account'].sudo()
+        Tax = self.env['account.tax'].sudo()
+        move_lines = []
+        for (account_id, tax_id), balance in balances.items():
+            balance = currency.round(balance)
+            if currency.is_zero(balance):
+                continue
+            label = f"TVA {Tax.browse(tax_id).name}" if tax_id else Account.browse(account_id).name
+            move_lines.append((0, 0, {
+                'name': f"{self.name} - {label}",
+                'account_id': account_id,
+                'tax_line_id': tax_id,
+                'debit': balance if balance > 0 else 0.0,
+                'credit': -balance if balance < 0 else 0.0,
+            }))
+
+        if not move_lines:
+            return
+
+        account_move = self.env['account.move'].sudo().create({
+            'journal_id': journal.id,
+            'date': fields.Date.today(),
+            'ref': self.name,
+            'move_type': 'entry',
+            'pos_session_id': self.id,
+            'line_ids': move_lines,
+        })
+        account_move.action_post()
+
+        _logger.info(
+            f"POS Session {self.name}: Created account move {account_move.name} for {len(orders)} order(s)"
+        )
+
     # ═══════════════════════════════════════════════════════════════════════════
     # MÉTHODES FRONTEND
     # ═══════════════════════════════════════════════════════════════════════════
@@ -433,49 +667,46 @@ class POSSession(models.Model):
     # ═══════════════════════════════════════════════════════════════════════════
 
     def get_z_report_data(self):
-        """Génère les données pour le rapport Z de clôture"""
+        """Génère les données pour le rapport Z de clôture (agrégats SQL)"""
         self.ensure_one()
+        counted_domain = [
+            ('order_id.session_id', '=', self.id),
+            ('order_id.state', 'in', list(POS_COUNTED_STATES)),
+        ]
 
         # Totaux par méthode de paiement
-        payments_by_method = {}
-        for order in self.order_ids.filtered(lambda o: o.state in ['paid', 'done', 'invoiced']):
-            for payment in order.payment_ids:
-                method_name = payment.payment_method_id.name
-                if method_name not in payments_by_method:
-                    payments_by_method[method_name] = {
-                        'count': 0,
-                        'amount': 0.0,
-                    }
-                payments_by_method[method_name]['count'] += 1
-                payments_by_method[method_name]['amount'] += payment.amount
-
-        # Top produits vendus
-        product_sales = {}
-        for order in self.order_ids.filtered(lambda o: o.state in ['paid', 'done', 'invoiced']):
-            for line in order.line_ids:
-                product_id = line.product_id.id
-                if product_id not in product_sales:
-                    product_sales[product_id] = {
-                        'name': line.product_id.name,
-                        'quantity': 0,
-                        'amount': 0.0,
-                    }
-                product_sales[product_id]['quantity'] += line.quantity
-                product_sales[product_id]['amount'] += line.price_subtotal
-
-        # Trier par montant décroissant
-        top_products = sorted(
-            product_sales.values(),
-            key=lambda x: x['amount'],
-            reverse=True
-        )[:10]
+        payments_by_method = self.env['quelyos.pos.payment']._read_group(
+            counted_domain, ['payment_method_id'], ['__count', 'amount:sum'],
+        )
+
+        # Top produits vendus (montant décroissant)
+        top_products = self.env['quelyos.pos.order.line']._read_group(
+            counted_domain, ['product_id'], ['quantity:sum', 'price_subtotal:sum'],
+            order='price_subtotal:sum desc',
+            limit=10,
+        )
 
         return {
             'session': self.to_frontend_dict(),
             'paymentsByMethod': [
-                {'method': name, **data}
-                for name, data in payments_by_method.items()
+                {'method': method.name, 'count': count, 'amount': amount or 0.0}
+                for method, count, amount in payments_by_method
+            ],
+            'topProducts': [
+                {'name': product.name, 'quantity': quantity or 0, 'amount': amount or 0.0}
+                for product, quantity, amount in top_products
             ],
-            'topProducts': top_products,
             'generatedAt': datetime.now().isoformat(),
         }
+
+
+# Lien inverse sur account.move
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+
+    pos_session_id = fields.Many2one(
+        'quelyos.pos.session',
+        string='Session POS',
+        index='btree_not_null',
+        help="Session POS dont les ventes sont agrégées dans cette écriture"
+    )
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+"""
+Synchronisation des commandes POS créées hors-ligne (/api/pos/sync).
+
+Après une coupure, un terminal peut renvoyer plusieurs milliers de tickets.
+Ils sont traités par lots de POS_SYNC_BATCH_SIZE :
+- déduplication ensembliste sur offline_id (une requête par lot) ;
+- création groupée des commandes, lignes et paiements ;
+- stock et comptabilité passés une fois par lot (bons validés et
+  écritures comptables créées ensemble), ou à la clôture de session si le
+  terminal passe par session.
+
+Au-delà de POS_SYNC_INLINE_MAX commandes, le job tourne dans un thread avec
+son propre curseur (commit par lot) ; le terminal suit sa progression via
+/api/pos/sync/<job_id>.
+
+L'exécutant d'un job tient un verrou consultatif de session sur le job. Un
+job en attente ou en cours sans progression depuis POS_SYNC_STALE_AFTER
+secondes et dont le verrou est libre (worker redémarré, processus tué) est
+repris par cron à partir du premier lot non committé.
+"""
+
+import logging
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+
+_logger = logging.getLogger(__name__)
+
+POS_SYNC_BATCH_SIZE = 200
+POS_SYNC_INLINE_MAX = 20  # Commandes traitées directement dans la requête
+POS_SYNC_STALE_AFTER = 300  # secondes sans progression avant reprise par le cron
+POS_SYNC_LOCK = 0x9055  # espace de verrous consultatifs (POS_SYNC_LOCK, id du job)
+
+
+class POSSyncJob(models.Model):
+    _name = 'quelyos.pos.sync.job'
+    _description = 'Job de synchronisation POS offline'
+    _order = 'create_date desc'
+
+    job_id = fields.Char(
+        string='Job ID',
+        required=True,
+        index=True,
+        readonly=True,
+        copy=False,
+        default=lambda self: str(uuid.uuid4()),
+        help="Identifiant de suivi renvoyé au terminal"
+    )
+    user_id = fields.Many2one(
+        'res.users',
+        string='Caissier',
+        required=True,
+        default=lambda self: self.env.user,
+        help="Utilisateur ayant envoyé les commandes"
+    )
+    company_id = fields.Many2one(
+        'res.company',
+        string='Société',
+        required=True,
+        default=lambda self: self.env.company
+    )
+
+    state = fields.Selection([
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('completed', 'Terminé'),
+        ('failed', 'Échoué'),
+    ], string='État', default='pending', required=True, index=True)
+
+    payload = fields.Json(
+        string='Commandes reçues',
+        help="Commandes offline telles qu'envoyées par le terminal"
+    )
+    results = fields.Json(
+        string='Résultats',
+        help="Résultat par commande, dans l'ordre du payload"
+    )
+
+    total_count = fields.Integer(string='Commandes')
+    processed_count = fields.Integer(string='Traitées', default=0)
+    synced_count = fields.Integer(string='Synchronisées', default=0)
+    duplicate_count = fields.Integer(string='Déjà synchronisées', default=0)
+    error_count = fields.Integer(string='Erreurs', default=0)
+
+    error_message = fields.Text(string='Message d\'erreur')
+    started_at = fields.Datetime(string='Démarré à')
+    completed_at = fields.Datetime(string='Terminé à')
+
+    _sql_constraints = [
+        ('job_id_unique', 'unique(job_id)', 'Le Job ID doit être unique.'),
+    ]
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # EXÉCUTION
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def create_job(self, orders):
+        """Crée le job pour une liste de commandes offline"""
+        return self.create({
+            'payload': orders,
+            'total_count': len(orders),
+        })
+
+    def action_start(self):
+        """Démarre le job en background (commit pour que le thread voie le job)"""
+        self.ensure_one()
+        self.env.cr.commit()
+
+        thread = threading.Thread(
+            target=self._run_sync_thread,
+            args=(self.id, self.env.cr.dbname, self.user_id.id),
+            daemon=True,
+        )
+        thread.start()
+        return True
+
+    def _run_sync_thread(self, job_id, dbname, uid):
+        """Exécute le job dans un thread séparé"""
+        from odoo.modules.registry import Registry
+
+        try:
+            with Registry(dbname).cursor() as cr:
+                env = api.Environment(cr, uid, {})
+                job = env['quelyos.pos.sync.job'].sudo().browse(job_id)
+                if job.exists():
+                    job._run_locked()
+
+        except Exception as e:
+            _logger.error(f"POS sync thread error: {e}")
+
+    def _run_locked(self):
+        """
+        Exécute le job (commit par lot) sous verrou consultatif de session,
+        libéré à la déconnexion si le processus meurt.
+
+        Returns:
+            bool: False si un autre exécutant tient le job
+        """
+        self.ensure_one()
+        self.env.cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (POS_SYNC_LOCK, self.id))
+        if not self.env.cr.fetchone()[0]:
+            return False
+        try:
+            # Nouvel instantané : état committé par l'exécutant précédent
+            self.env.cr.commit()
+            self.invalidate_recordset()
+            if self.state in ('pending', 'running'):
+                self._execute(commit=True)
+        finally:
+            self.env.cr.execute("SELECT pg_advisory_unlock(%s, %s)", (POS_SYNC_LOCK, self.id))
+        return True
+
+    @api.model
+    def cron_requeue_stale(self, limit=10):
+        """Reprend les jobs sans progression dont l'exécutant a disparu"""
+        stale = self.sudo().search([
+            ('state', 'in', ('pending', 'running')),
+            ('write_date', '<', fields.Datetime.now() - timedelta(seconds=POS_SYNC_STALE_AFTER)),
+        ], order='create_date', limit=limit)
+        resumed = 0
+        for job in stale:
+            if job._run_locked():
+                resumed += 1
+                _logger.warning("POS sync job %s resumed by cron: %s", job.job_id, job.state)
+        return resumed
+
+    def _execute(self, commit=False):
+        """
+        Traite les commandes du job lot par lot, à partir du premier lot sans
+        résultat (reprise d'un job interrompu).
+
+        Args:
+            commit: Commit après chaque lot (thread) pour que le terminal voie
+                    la progression et qu'un lot traité ne soit jamais rejoué
+        """
+        self.ensure_one()
+        orders = self.payload or []
+        results = list(self.results or [])
+        self.write({'state': 'running', 'started_at': self.started_at or fields.Datetime.now()})
+
+        try:
+            for start in range(len(results), len(orders), POS_SYNC_BATCH_SIZE):
+                batch_results = self._sync_batch(orders[start:start + POS_SYNC_BATCH_SIZE])
+                results.extend(batch_results)
+                self.write({
+                    'results': results,
+                    'processed_count': len(results),
+                    'synced_count': self.synced_count + sum(r['status'] == 'synced' for r in batch_results),
+                    'duplicate_count': self.duplicate_count + sum(r['status'] == 'already_synced' for r in batch_results),
+                    'error_count': self.error_count + sum(r['status'] == 'error' for r in batch_results),
+                })
+                if commit:
+                    self.env.cr.commit()
+
+            self.write({'state': 'completed', 'completed_at': fields.Datetime.now()})
+
+        except Exception as e:
+            _logger.error(f"POS sync job {self.job_id} failed: {e}\n{traceback.format_exc()}")
+            if commit:
+                self.env.cr.rollback()
+            self.write({
+                'state': 'failed',
+                'error_message': str(e),
+                'completed_at': fields.Datetime.now(),
+            })
+
+        if commit:
+            self.env.cr.commit()
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # TRAITEMENT PAR LOT
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _sync_batch(self, orders_data):
+        """
+        Synchronise un lot ; si le lot échoue, chaque commande est repassée
+        seule pour qu'un ticket invalide ne bloque pas les autres.
+        """
+        try:
+            with self.env.cr.savepoint():
+                return self._sync_orders(orders_data)
+
+        except Exception as e:
+            if len(orders_data) > 1:
+                _logger.warning(f"POS sync batch failed ({e}), syncing orders one by one")
+                results = []
+                for order_data in orders_data:
+                    results.extend(self._sync_batch([order_data]))
+                return results
+
+            offline_id = orders_data[0].get('offline_id')
+            existing = self.env['quelyos.pos.order'].sudo().search([('offline_id', '=', offline_id)], limit=1)
+            if offline_id and existing:
+                # Synchronisée entre-temps par une autre requête (contrainte d'unicité)
+                return [self._result(offline_id, 'already_synced', existing.id, existing.name)]
+
+            _logger.error(f"Error syncing offline order {offline_id}: {e}", exc_info=True)
+            return [{'offlineId': offline_id, 'status': 'error', 'error': 'Erreur serveur'}]
+
+    def _sync_orders(self, orders_data):
+        """Crée les commandes d'un lot ; renvoie un résultat par commande, dans l'ordre"""
+        Order = self.env['quelyos.pos.order'].sudo().with_context(tracking_disable=True, mail_create_nolog=True)
+        results = [None] * len(orders_data)
+
+        # 1. Déduplication : une requête pour tout le lot
+        offline_ids = [data.get('offline_id') for data in orders_data if data.get('offline_id')]
+        existing = {
+            order['offline_id']: order
+            for order in Order.search_read([('offline_id', 'in', offline_ids)], ['offline_id', 'name'])
+        }
+
+        first_index = {}
+        repeated = []
+        to_create = []
+        for index, data in enumerate(orders_data):
+            offline_id = data.get('offline_id')
+            if not offline_id:
+                results[index] = {'offlineId': None, 'status': 'error', 'error': 'offline_id manquant'}
+            elif offline_id in existing:
+                order = existing[offline_id]
+                results[index] = self._result(offline_id, 'already_synced', order['id'], order['name'])
+            elif offline_id in first_index:
+                repeated.append(index)
+            else:
+                first_index[offline_id] = index
+                to_create.append(index)
+
+        # 2. Validation (sessions et produits lus en une fois)
+        sessions = self.env['quelyos.pos.session'].sudo().browse(
+            {orders_data[index].get('session_id') for index in to_create} - {None}
+        ).exists()
+        products = self.env['product.product'].sudo().browse({
+            line.get('product_id')
+            for index in to_create for line in orders_data[index].get('lines') or []
+        } - {None}).exists()
+        open_sessions = {session.id: session for session in sessions if session.state in ['opening', 'opened']}
+        product_ids = set(products.ids)
+
+        valid = []
+        for index in to_create:
+            data = orders_data[index]
+            error = None
+            if data.get('session_id') not in sessions.ids:
+                error = 'Session non trouvée'
+            elif data['session_id'] not in open_sessions:
+                error = 'La session n\'est pas ouverte'
+            elif not data.get('lines'):
+                error = 'La commande doit contenir au moins un article'
+            else:
+                missing = [line.get('product_id') for line in data['lines'] if line.get('product_id') not in product_ids]
+                if missing:
+                    error = f"Produit {missing[0]} non trouvé"
+            if error:
+                results[index] = {'offlineId': data['offline_id'], 'status': 'error', 'error': error}
+            else:
+                valid.append(index)
+
+        # 3. Création groupée des commandes et lignes
+        now = fields.Datetime.now()
+        default_taxes = {}
+        vals_list = []
+        for index in valid:
+            data = orders_data[index]
+            session = open_sessions[data['session_id']]
+            order_lines = []
+            for line in data['lines']:
+                tax_ids = line.get('tax_ids')
+                if tax_ids is None:
+                    # Taxes par défaut, calculées une fois par produit et société
+                    key = (line['product_id'], session.company_id.id)
+                    if key not in default_taxes:
+                        default_taxes[key] = products.browse(line['product_id']).taxes_id.filtered(
+                            lambda t: t.company_id == session.company_id
+                        ).ids
+                    tax_ids = default_taxes[key]
+                order_lines.append((0, 0, {
+                    'product_id': line['product_id'],
+                    'quantity': line.get('quantity', 1),
+                    'price_unit': line.get('price_unit', products.browse(line['product_id']).list_price),
+                    'discount': line.get('discount', 0),
+                    'tax_ids': [(6, 0, tax_ids)],
+                    'note': line.get('note'),
+                    'offline_line_id': line.get('offline_line_id'),
+                }))
+            vals_list.append({
+                'session_id': session.id,
+                'partner_id': data.get('partner_id') or data.get('customer_id'),
+                'line_ids': order_lines,
+                'discount_type': data.get('discount_type'),
+                'discount_value': data.get('discount_value') or 0,
+                'note': data.get('note'),
+                'offline_id': data['offline_id'],
+                'is_offline_order': True,
+                'synced_at': now,
+            })
+        orders = Order.create(vals_list)
+
+        # 4. Paiements groupés
+        payment_vals = []
+        for index, order in zip(valid, orders):
+            data = orders_data[index]
+            if data.get('payments') and data.get('is_paid'):
+                payment_vals.extend({
+                    'order_id': order.id,
+                    'payment_method_id': payment['payment_method_id'],
+                    'amount': payment['amount'],
+                } for payment in data['payments'])
+        self.env['quelyos.pos.payment'].sudo().create(payment_vals)
+
+        paid = Order.browse()
+        for index, order in zip(valid, orders):
+            result = self._result(order.offline_id, 'synced', order.id, order.name)
+            if order.payment_ids:
+                if order.amount_paid < order.amount_total:
+                    # Comme pay_order : la commande reste en brouillon
+                    result['paymentError'] = _("Le montant payé (%s) est insuffisant. Total: %s") % (
+                        order.amount_paid, order.amount_total
+                    )
+                    order.payment_ids.unlink()
+                else:
+                    order.amount_return = order.amount_paid - order.amount_total
+                    paid |= order
+            results[index] = result
+
+        # 5. Stock et comptabilité, une fois pour le lot
+        if paid:
+            paid.write({'state': 'paid', 'paid_at': now})
+            paid._post_stock_and_accounting()
+
+        # Doublons dans le payload : résultat de la première occurrence
+        for index in repeated:
+            first = results[first_index[orders_data[index]['offline_id']]]
+            if first['status'] == 'synced':
+                results[index] = self._result(first['offlineId'], 'already_synced', first['orderId'], first['orderRef'])
+            else:
+                results[index] = dict(first)
+
+        return results
+
+    @staticmethod
+    def _result(offline_id, status, order_id, order_ref):
+        return {
+            'offlineId': offline_id,
+            'status': status,
+            'orderId': order_id,
+            'orderRef': order_ref,
+        }
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # MÉTHODES FRONTEND
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def to_frontend_dict(self):
+        """Progression du job ; résultats détaillés une fois le job terminé"""
+        self.ensure_one()
+        done = self.state in ['completed', 'failed']
+        return {
+            'jobId': self.job_id,
+            'state': self.state,
+            'progress': int(self.processed_count * 100 / self.total_count) if self.total_count else 100,
+            'totalCount': self.total_count,
+            'processedCount': self.processed_count,
+            'syncedCount': self.synced_count,
+            'duplicateCount': self.duplicate_count,
+            'errorCount': self.error_count,
+            'error': self.error_message,
+            'results': (self.results or []) if done else None,
+        }
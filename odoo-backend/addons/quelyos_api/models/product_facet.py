@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Index de facettes produits matérialisé.
+
+Une ligne par (produit, valeur de facette) : publication, catégories
+e-commerce, valeurs d'attributs, tranche de prix, suivi de stock. La table
+est mise à jour à l'écriture des produits ; les requêtes de facettes sont
+résolues par intersection de bitmaps en mémoire (voir lib/facet_index.py).
+"""
+
+import logging
+from odoo import models, fields, api
+
+from ..lib.cache import get_cache_service
+from ..lib.facet_index import (
+    FacetIndex, FacetIndexCache, facet_index_cache, price_bucket, to_bitmap,
+    FACET_PUBLISHED, FACET_CATEGORY, FACET_ATTRIBUTE, FACET_PRICE, FACET_UNTRACKED,
+)
+
+_logger = logging.getLogger(__name__)
+
+# Bitmap "produits en stock" : recalculé au plus toutes les 60 s
+_stock_bitmap_cache = FacetIndexCache(ttl=60)
+
+# Index construit au moins une fois (ensuite tenu à jour par les hooks) :
+# un index vide mais construit n'est pas reconstruit à la lecture
+FACET_INDEX_BUILT_PARAM = 'quelyos_api.facet_index_built'
+
+# Champs product.template qui modifient l'index
+FACET_TRIGGER_FIELDS = {
+    'active', 'website_published', 'is_published', 'public_categ_ids',
+    'attribute_line_ids', 'list_price', 'is_storable', 'tenant_id',
+}
+
+# Champs product.template.attribute.line qui modifient l'index
+FACET_ATTRIBUTE_LINE_FIELDS = {'value_ids', 'product_tmpl_id', 'attribute_id'}
+
+# Construction initiale déjà demandée au cron par ce processus
+_build_requested = set()
+
+
+class ProductFacet(models.Model):
+    _name = 'quelyos.product.facet'
+    _description = 'Index de facettes produits'
+    _log_access = False
+
+    tenant_id = fields.Many2one('quelyos.tenant', string='Tenant', index=True, ondelete='cascade')
+    product_tmpl_id = fields.Many2one(
+        'product.template', string='Produit', required=True, index=True, ondelete='cascade',
+    )
+    facet_type = fields.Char(string='Type', required=True)
+    facet_key = fields.Char(string='Valeur', required=True)
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # MAINTENANCE DE L'INDEX
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def _facet_rows_for_templates(self, templates):
+        """Lignes d'index des templates (uniquement produits actifs et publiés)"""
+        rows = []
+        for template in templates:
+            if not template.active or not template.website_published:
+                continue
+
+            def add(facet_type, key):
+                rows.append({
+                    'tenant_id': template.tenant_id.id,
+                    'product_tmpl_id': template.id,
+                    'facet_type': facet_type,
+                    'facet_key': str(key),
+                })
+
+            add(FACET_PUBLISHED, 1)
+            for category in template.public_categ_ids:
+                add(FACET_CATEGORY, category.id)
+            for value in template.attribute_line_ids.value_ids:
+                add(FACET_ATTRIBUTE, value.id)
+            bucket = price_bucket(template.list_price)
+            if bucket:
+                add(FACET_PRICE, bucket)
+            if not template.is_storable:
+                add(FACET_UNTRACKED, 1)
+        return rows
+
+    @api.model
+    def _refresh_templates(self, templates):
+        """Recalcule les lignes d'index de quelques templates"""
+        templates = templates.with_context(active_test=False).exists()
+        if not templates:
+            return
+        self.sudo().search([('product_tmpl_id', 'in', templates.ids)]).unlink()
+        self.sudo().create(self._facet_rows_for_templates(templates))
+        self._bump_versions(set(templates.mapped('tenant_id').ids) | {None})
+
+    @api.model
+    def _rebuild_index(self, tenant_id=None, batch_size=1000):
+        """Reconstruit l'index d'un tenant (ou de tous) par lots"""
+        Template = self.env['product.template'].sudo().with_context(active_test=False)
+        domain = [('tenant_id', '=', tenant_id)] if tenant_id else []
+        template_ids = Template.search(domain).ids
+
+        for start in range(0, len(template_ids), batch_size):
+            batch = Template.browse(template_ids[start:start + batch_size])
+            self.sudo().search([('product_tmpl_id', 'in', batch.ids)]).unlink()
+            self.sudo().create(self._facet_rows_for_templates(batch))
+            self.env.invalidate_all()
+
+        self._bump_versions({tenant_id, None})
+        if not tenant_id:
+            self.env['ir.config_parameter'].sudo().set_param(FACET_INDEX_BUILT_PARAM, '1')
+        _logger.info(f"Facet index rebuilt for tenant {tenant_id or 'all'}: {len(template_ids)} products")
+
+    @api.model
+    def _is_built(self):
+        return bool(self.env['ir.config_parameter'].sudo().get_param(FACET_INDEX_BUILT_PARAM))
+
+    @api.model
+    def cron_build_index(self):
+        """Construction initiale de l'index (installation, base existante) ; sans effet ensuite"""
+        if not self._is_built():
+            self._rebuild_index()
+
+    @api.model
+    def _request_build(self):
+        """Demande la construction au cron, une fois par processus (jamais dans la requête)"""
+        dbname = self.env.cr.dbname
+        if dbname in _build_requested:
+            return
+        cron = self.env.ref('quelyos_api.ir_cron_product_facet_build', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+            _build_requested.add(dbname)
+
+    @api.model
+    def _version_key(self, tenant_id):
+        return f"tenant:{tenant_id or 'all'}:facet_index:version"
+
+    @api.model
+    def _bump_versions(self, tenant_ids):
+        """Invalide les index des tenants (processus courant + autres workers via Redis après commit)"""
+        dbname = self.env.cr.dbname
+        keys = [self._version_key(tenant_id) for tenant_id in tenant_ids]
+
+        def invalidate_local():
+            for tenant_id in tenant_ids:
+                facet_index_cache.invalidate((dbname, tenant_id or 'all'))
+
+        def bump():
+            invalidate_local()
+            cache = get_cache_service()
+            if cache.enabled:
+                try:
+                    for key in keys:
+                        cache.redis_client.incr(key)
+                except Exception as e:
+                    _logger.warning(f"Facet index version bump failed: {e}")
+
+        # Immédiat pour la transaction courante, puis après commit pour les autres
+        invalidate_local()
+        self.env.cr.postcommit.add(bump)
+
+    @api.model
+    def _get_version(self, tenant_id):
+        """Version partagée de l'index (None sans Redis : le TTL s'applique seul)"""
+        cache = get_cache_service()
+        if not cache.enabled:
+            return None
+        try:
+            return cache.redis_client.get(self._version_key(tenant_id)) or '0'
+        except Exception:
+            return None
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # LECTURE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def _load_index(self, tenant_id):
+        self.flush_model()
+        if tenant_id:
+            self.env.cr.execute("""
+                SELECT product_tmpl_id, facet_type, facet_key
+                FROM quelyos_product_facet WHERE tenant_id = %s
+            """, (tenant_id,))
+        else:
+            self.env.cr.execute("SELECT product_tmpl_id, facet_type, facet_key FROM quelyos_product_facet")
+        return FacetIndex.from_rows(self.env.cr.fetchall())
+
+    @api.model
+    def _get_index(self, tenant_id):
+        key = (self.env.cr.dbname, tenant_id or 'all')
+        index = facet_index_cache.get(key, self._get_version(tenant_id), lambda: self._load_index(tenant_id))
+        if not index.bitmaps and not self._is_built():
+            # Index jamais construit (installation sur une base existante) : le
+            # cron le construit, les facettes restent vides d'ici là
+            self._request_build()
+        return index
+
+    @api.model
+    def _load_stocked_bitmap(self, tenant_id):
+        self.env['stock.quant'].flush_model(['product_id', 'location_id', 'quantity'])
+        tenant_filter = "AND pp.tenant_id = %(tenant_id)s" if tenant_id else ""
+        self.env.cr.execute(f"""
+            SELECT pp.product_tmpl_id
+            FROM stock_quant sq
+            JOIN product_product pp ON pp.id = sq.product_id
+            JOIN stock_location sl ON sl.id = sq.location_id
+            WHERE sl.usage = 'internal' {tenant_filter}
+            GROUP BY pp.product_tmpl_id
+            HAVING SUM(sq.quantity) > 0
+        """, {'tenant_id': tenant_id})
+        return to_bitmap(row[0] for row in self.env.cr.fetchall())
+
+    @api.model
+    def get_facets(self, tenant_id=None, category_id=None, search=None, attribute_value_ids=None, price_ranges=None):
+        """
+        Facettes pour une combinaison de filtres, par intersection de bitmaps.
+
+        Returns: dict au format de /api/ecommerce/products/facets
+        """
+        index = self._get_index(tenant_id)
+        stocked = _stock_bitmap_cache.get(
+            (self.env.cr.dbname, tenant_id or 'all'), None, lambda: self._load_stocked_bitmap(tenant_id),
+        )
+
+        restrict = None
+        if search:
+            domain = [('name', 'ilike', search), ('website_published', '=', True)]
+            if tenant_id:
+                domain.append(('tenant_id', '=', tenant_id))
+            restrict = to_bitmap(self.env['product.template'].sudo().search(domain).ids)
+
+        candidate = index.candidates(
+            category_id=category_id,
+            attribute_value_ids=attribute_value_ids,
+            price_labels=price_ranges,
+            restrict=restrict,
+        )
+        counts = index.compute_facets(candidate, stocked)
+
+        # Libellés résolus à la lecture (langue courante) : 2 requêtes au plus
+        categories = self.env['product.public.category'].sudo().browse(list(counts['categories']))
+        values = self.env['product.attribute.value'].sudo().browse(list(counts['attributes']))
+
+        attributes = {}
+        for value in values.exists():
+            attributes.setdefault(value.attribute_id.name, []).append({
+                'id': value.id,
+                'name': value.name,
+                'count': counts['attributes'][value.id],
+            })
+
+        return {
+            'categories': sorted(
+                [
+                    {'id': category.id, 'name': category.name, 'count': counts['categories'][category.id]}
+                    for category in categories.exists()
+                ],
+                key=lambda x: x['count'], reverse=True,
+            ),
+            'price_ranges': counts['price_ranges'],
+            'attributes': {
+                name: sorted(items, key=lambda x: x['count'], reverse=True)
+                for name, items in attributes.items()
+            },
+            'brands': [],
+            'in_stock': counts['in_stock'],
+        }
+
+
+class ProductTemplateAttributeLine(models.Model):
+    _inherit = 'product.template.attribute.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        self.env['quelyos.product.facet']._refresh_templates(lines.product_tmpl_id)
+        return lines
+
+    def write(self, vals):
+        templates = self.product_tmpl_id
+        res = super().write(vals)
+        if FACET_ATTRIBUTE_LINE_FIELDS.intersection(vals):
+            self.env['quelyos.product.facet']._refresh_templates(templates | self.product_tmpl_id)
+        return res
+
+    def unlink(self):
+        templates = self.product_tmpl_id
+        res = super().unlink()
+        self.env['quelyos.product.facet']._refresh_templates(templates)
+        return res
@@ -106,18 +106,25 @@ class ProductProduct(models.Model):
         reserved_qty = Somme des mouvements stock en état 'assigned' (prêt à livrer)
         pour ce produit depuis locations internes vers locations clients.
         """
-        for product in self:
-            # Récupérer les mouvements réservés (assigned) pour ce produit
-            # depuis emplacements internes vers emplacements clients
-            reserved_moves = self.env['stock.move'].search([
-                ('product_id', '=', product.id),
-                ('state', 'in', ['assigned', 'confirmed', 'waiting']),
-                ('location_id.usage', '=', 'internal'),
-                ('location_dest_id.usage', '=', 'customer'),
-            ])
+        # Quantités réservées de toutes les variantes en une requête groupée
+        reserved_by_product = {}
+        if self.ids:
+            reserved_by_product = {
+                product.id: qty
+                for product, qty in self.env['stock.move']._read_group(
+                    [
+                        ('product_id', 'in', self.ids),
+                        ('state', 'in', ['assigned', 'confirmed', 'waiting']),
+                        ('location_id.usage', '=', 'internal'),
+                        ('location_dest_id.usage', '=', 'customer'),
+                    ],
+                    ['product_id'],
+                    ['product_uom_qty:sum'],
+                )
+            }
 
-            # Sommer les quantités réservées
-            reserved_qty = sum(reserved_moves.mapped('product_uom_qty'))
+        for product in self:
+            reserved_qty = reserved_by_product.get(product.id, 0.0)
 
             # Calculer stock disponible hors réservations
             qty_unreserved = max(0, product.qty_available - reserved_qty)
@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api
 
+from odoo.tools.sql import create_index
+
+from .product_facet import FACET_TRIGGER_FIELDS
+from ..lib.search_text import normalize_text, tokenize, expand_synonyms, build_tsquery
+
+# Plafond du nombre total de résultats compté (COUNT borné)
+SEARCH_COUNT_CAP = 10000
+
 
 class ProductTemplate(models.Model):
     """Extension du modèle product.template pour les fonctionnalités e-commerce."""
@@ -100,3 +108,335 @@ class ProductTemplate(models.Model):
         size=500,
         help="URL d'une image externe (Unsplash, Pexels). Utilisée si pas d'image binaire."
     )
+
+    # Document de recherche (nom, référence, description normalisés)
+    x_search_document = fields.Text(
+        string='Document de recherche',
+        compute='_compute_search_document',
+        store=True,
+        index='trigram',
+        help='Texte normalisé (minuscules, sans accents) indexé pour la recherche boutique',
+    )
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # RECHERCHE BOUTIQUE (TRIGRAM + PLEIN TEXTE)
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def init(self):
+        super().init()
+        # Index plein texte sur le document normalisé (configuration 'simple')
+        create_index(
+            self.env.cr, 'product_template_search_document_tsv_idx', self._table,
+            ["to_tsvector('simple', coalesce(x_search_document, ''))"], method='gin',
+        )
+        # Index trigram GiST : candidats les plus proches de la requête (tri KNN <->>)
+        if self.env.registry.has_trigram:
+            create_index(
+                self.env.cr, 'product_template_search_document_trgm_gist_idx', self._table,
+                ['x_search_document gist_trgm_ops'], method='gist',
+            )
+
+    @api.depends('name', 'default_code', 'description_sale')
+    def _compute_search_document(self):
+        """Nom en tête (boost préfixe), puis référence et description, toutes langues installées"""
+        langs = [code for code, _name in self.env['res.lang'].get_installed()]
+        for template in self:
+            names, descriptions = [], []
+            for lang in langs:
+                translated = template.with_context(lang=lang)
+                names.append(normalize_text(translated.name))
+                descriptions.append(normalize_text(translated.description_sale))
+            parts = list(dict.fromkeys(names)) + [normalize_text(template.default_code)]
+            parts += list(dict.fromkeys(descriptions))
+            template.x_search_document = ' '.join(part for part in parts if part)
+
+    @api.model
+    def _search_storefront(self, query, limit=20, tenant_id=None, category_id=None, candidate_limit=500,
+                           with_total=True):
+        """
+        Recherche boutique classée en SQL sur x_search_document.
+
+        Correspondances : mots de la requête en préfixe ou synonymes (index
+        tsvector), ou proximité trigram pour les fautes de frappe (index
+        pg_trgm, si l'extension est disponible). Les candidats sont lus dans
+        l'ordre des index, au plus candidate_limit par source : les plus
+        proches en trigram (KNN GiST), les documents qui commencent par la
+        requête, les correspondances plein texte. Seuls ces candidats
+        reçoivent la pertinence textuelle (ts_rank_cd, proximité trigram,
+        préfixe) ; les candidate_limit meilleurs reçoivent le score complet
+        (boosts best-seller / mis en avant). Le coût ne dépend donc pas du
+        nombre de correspondances.
+
+        Le total est compté à part, plafonné à SEARCH_COUNT_CAP ; with_total=False
+        l'omet (autocomplétion).
+
+        Returns: tuple (list[(template_id, score)], total, synonymes utilisés)
+        """
+        normalized = ' '.join(tokenize(query))
+        synonyms = expand_synonyms(normalized)
+        tsquery = build_tsquery(normalized, synonyms)
+        if not tsquery:
+            return [], 0, synonyms
+
+        fuzzy = self.env.registry.has_trigram
+        self.flush_model(['x_search_document', 'is_published', 'active', 'tenant_id',
+                          'x_is_bestseller', 'x_is_featured', 'public_categ_ids'])
+
+        fulltext = "to_tsvector('simple', coalesce(pt.x_search_document, '')) @@ q.tsq"
+        trigram = "pt.x_search_document %%> %(query)s"
+        scope = ["pt.active", "pt.is_published"]
+        if tenant_id:
+            scope.append("pt.tenant_id = %(tenant_id)s")
+        if category_id:
+            scope.append("""EXISTS (
+                SELECT 1 FROM product_public_category_product_template_rel rel
+                WHERE rel.product_template_id = pt.id AND rel.product_public_category_id = %(category_id)s
+            )""")
+        scope = ' AND '.join(scope)
+        filters = [scope, f"({fulltext} OR {trigram})" if fuzzy else fulltext]
+
+        # Sources de candidats, chacune bornée et lue dans l'ordre d'un index
+        sources = [
+            f"SELECT pt.id FROM product_template pt WHERE {scope} "
+            f"AND pt.x_search_document LIKE %(prefix)s LIMIT %(candidate_limit)s",
+            f"SELECT pt.id FROM product_template pt, q WHERE {scope} "
+            f"AND {fulltext} LIMIT %(candidate_limit)s",
+        ]
+        if fuzzy:
+            sources.insert(0, (
+                f"SELECT pt.id FROM product_template pt WHERE {scope} AND {trigram} "
+                f"ORDER BY pt.x_search_document <->> %(query)s LIMIT %(candidate_limit)s"
+            ))
+        matches = '\n                UNION\n                '.join(f'({source})' for source in sources)
+        similarity = "word_similarity(%(query)s, coalesce(pt.x_search_document, ''))" if fuzzy else "0"
+        params = {
+            'tsquery': tsquery,
+            'query': normalized,
+            'prefix': normalized + '%',
+            'tenant_id': tenant_id,
+            'category_id': int(category_id) if category_id else None,
+            'candidate_limit': candidate_limit,
+            'limit': limit,
+            'count_cap': SEARCH_COUNT_CAP,
+        }
+
+        self.env.cr.execute(f"""
+            WITH q AS (SELECT to_tsquery('simple', %(tsquery)s) AS tsq),
+            matches AS (
+                {matches}
+            ),
+            candidates AS (
+                SELECT pt.id, pt.x_is_bestseller, pt.x_is_featured,
+                       ts_rank_cd(to_tsvector('simple', coalesce(pt.x_search_document, '')), q.tsq)
+                       + {similarity}
+                       + CASE WHEN pt.x_search_document LIKE %(prefix)s THEN 1.0 ELSE 0 END AS relevance
+                FROM matches m
+                JOIN product_template pt ON pt.id = m.id
+                CROSS JOIN q
+                ORDER BY relevance DESC, pt.id
+                LIMIT %(candidate_limit)s
+            )
+            SELECT c.id,
+                   c.relevance
+                   + CASE WHEN c.x_is_bestseller THEN 0.2 ELSE 0 END
+                   + CASE WHEN c.x_is_featured THEN 0.15 ELSE 0 END AS score
+            FROM candidates c
+            ORDER BY score DESC, c.id
+            LIMIT %(limit)s
+        """, params)
+        ranked = [(template_id, float(score)) for template_id, score in self.env.cr.fetchall()]
+
+        total = len(ranked)
+        if with_total and len(ranked) == limit:
+            self.env.cr.execute(f"""
+                WITH q AS (SELECT to_tsquery('simple', %(tsquery)s) AS tsq)
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM product_template pt, q
+                    WHERE {' AND '.join(filters)}
+                    LIMIT %(count_cap)s
+                ) matches
+            """, params)
+            total = self.env.cr.fetchone()[0]
+        return ranked, total, synonyms
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # INDEX DE FACETTES
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        templates = super().create(vals_list)
+        self.env['quelyos.product.facet']._refresh_templates(templates)
+        return templates
+
+    def write(self, vals):
+        res = super().write(vals)
+        if FACET_TRIGGER_FIELDS.intersection(vals):
+            self.env['quelyos.product.facet']._refresh_templates(self)
+        return res
+
+    def unlink(self):
+        # Les lignes d'index disparaissent en cascade : seule la version change
+        tenant_ids = set(self.mapped('tenant_id').ids) | {None}
+        res = super().unlink()
+        self.env['quelyos.product.facet']._bump_versions(tenant_ids)
+        return res
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # SÉRIALISATION LISTING (BATCH)
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _get_listing_stock_quantities(self):
+        """
+        Stock physique (emplacements internes) par template, toutes variantes
+        actives confondues, en une requête groupée.
+
+        Returns: dict {template_id: quantity}
+        """
+        if not self.ids:
+            return {}
+        self.env['stock.quant'].flush_model(['product_id', 'location_id', 'quantity'])
+        self.env.cr.execute("""
+            SELECT pp.product_tmpl_id, SUM(sq.quantity)
+            FROM stock_quant sq
+            JOIN product_product pp ON pp.id = sq.product_id
+            JOIN stock_location sl ON sl.id = sq.location_id
+            WHERE pp.product_tmpl_id = ANY(%s)
+              AND pp.active
+              AND sl.usage = 'internal'
+            GROUP BY pp.product_tmpl_id
+        """, (self.ids,))
+        return {template_id: qty or 0.0 for template_id, qty in self.env.cr.fetchall()}
+
+    def _get_listing_images(self):
+        """
+        Images de galerie par template (triées par séquence) en une requête.
+
+        Returns: dict {template_id: [{'id', 'sequence'}, ...]}
+        """
+        if not self.ids:
+            return {}
+        images_by_template = {}
+        images = self.env['product.image'].sudo().search_read(
+            [('product_tmpl_id', 'in', self.ids)],
+            ['product_tmpl_id', 'sequence'],
+            order='sequence, id',
+        )
+        for image in images:
+            images_by_template.setdefault(image['product_tmpl_id'][0], []).append({
+                'id': image['id'],
+                'sequence': image['sequence'],
+            })
+        return images_by_template
+
+    def _get_templates_with_main_image(self):
+        """Ids des templates ayant une image principale (sans lire le binaire)"""
+        if not self.ids:
+            return set()
+        attachments = self.env['ir.attachment'].sudo().search_read([
+            ('res_model', '=', 'product.template'),
+            ('res_field', '=', 'image_1920'),
+            ('res_id', 'in', self.ids),
+        ], ['res_id'])
+        return {attachment['res_id'] for attachment in attachments}
+
+    def _get_listing_data(self):
+        """
+        Sérialise une page de produits pour /api/ecommerce/products.
+
+        Le stock, les images et la présence d'image principale sont chargés
+        en trois requêtes groupées puis joints en mémoire : le coût d'une page
+        ne dépend pas du nombre de produits.
+
+        Returns: list[dict] (ordre de self conservé)
+        """
+        stock_by_template = self._get_listing_stock_quantities()
+        images_by_template = self._get_listing_images()
+        with_main_image = self._get_templates_with_main_image()
+
+        data = []
+        for p in self:
+            qty = stock_by_template.get(p.id, 0.0)
+            if qty <= 0:
+                p_stock_status = 'out_of_stock'
+            elif qty <= 5:
+                p_stock_status = 'low_stock'
+            else:
+                p_stock_status = 'in_stock'
+
+            main_image_url = f'/web/image/product.template/{p.id}/image_1920' if p.id in with_main_image else None
+            external_url = getattr(p, 'x_image_external_url', None) or None
+
+            # Images de galerie, sinon fallback sur l'image principale du template
+            images_list = [
+                {
+                    'id': img['id'],
+                    'url': f"/web/image/product.image/{img['id']}/image_1920",
+                    'is_main': idx == 0,
+                    'sequence': img['sequence'],
+                }
+                for idx, img in enumerate(images_by_template.get(p.id, []))
+            ]
+            if images_list:
+                image_url = images_list[0]['url']
+            elif main_image_url:
+                image_url = main_image_url
+                images_list = [{
+                    'id': 0,
+                    'url': image_url,
+                    'is_main': True,
+                    'sequence': 1,
+                }]
+            else:
+                image_url = None
+
+            # Ribbon (badge) du produit
+            ribbon_data = None
+            if p.website_ribbon_id:
+                ribbon = p.website_ribbon_id
+                ribbon_name = ribbon.name
+                if isinstance(ribbon_name, dict):
+                    ribbon_name = ribbon_name.get('fr_FR', ribbon_name.get('en_US', ''))
+                ribbon_data = {
+                    'id': ribbon.id,
+                    'name': ribbon_name,
+                    'bg_color': ribbon.bg_color,
+                    'text_color': ribbon.text_color,
+                    'position': ribbon.position,
+                    'style': ribbon.style,
+                }
+
+            data.append({
+                'id': p.id,
+                'name': p.name,
+                'price': p.list_price,
+                'standard_price': p.standard_price,
+                'default_code': p.default_code or '',
+                'barcode': p.barcode or '',
+                'image': main_image_url or external_url,
+                'image_url': image_url or external_url,
+                'images': images_list if images_list else None,
+                'slug': p.name.lower().replace(' ', '-'),
+                'qty_available': qty,
+                'qty_available_unreserved': p.qty_available_unreserved,
+                'virtual_available': p.virtual_available,
+                'stock_status': p_stock_status,
+                'in_stock': qty > 0,
+                'weight': p.weight or 0,
+                'active': p.active,
+                'create_date': p.create_date.isoformat() if p.create_date else None,
+                'category': {
+                    'id': p.categ_id.id,
+                    'name': p.categ_id.name,
+                } if p.categ_id else None,
+                'variant_count': p.product_variant_count,
+                'ribbon': ribbon_data,
+                # Champs marketing e-commerce
+                'is_featured': p.x_is_featured or False,
+                'is_new': p.x_is_new or False,
+                'is_bestseller': p.x_is_bestseller or False,
+                'compare_at_price': p.compare_list_price if hasattr(p, 'compare_list_price') and p.compare_list_price else None,
+                'offer_end_date': p.x_offer_end_date.isoformat() if p.x_offer_end_date else None,
+            })
+
+        return data
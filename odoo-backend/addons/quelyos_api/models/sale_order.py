@@ -4,6 +4,8 @@ from datetime import datetime, timedelta
 import logging
 import secrets
 
+from .sales_rollup import ROLLUP_TRIGGER_FIELDS
+
 _logger = logging.getLogger(__name__)
 
 
@@ -82,6 +84,14 @@ class SaleOrder(models.Model):
         help='Date d\'envoi de l\'email de récupération de panier abandonné'
     )
 
+    # Propriétaire du panier e-commerce matérialisé ('partner:<id>' ou 'guest:<email>')
+    x_cart_owner = fields.Char(
+        string='Propriétaire du panier',
+        copy=False,
+        index=True,
+        help='Panier du store éphémère synchronisé avec cette commande brouillon (voir models/cart.py)'
+    )
+
     # Late Availability (disponibilité future du stock)
     x_can_fulfill_now = fields.Boolean(
         string='Peut être honorée maintenant',
@@ -189,6 +199,42 @@ class SaleOrder(models.Model):
             else:
                 order.x_fulfillment_priority = 'backorder'
 
+    # ═══════════════════════════════════════════════════════════════════════════
+    # STATISTIQUES DASHBOARD
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        orders = super().create(vals_list)
+        confirmed = orders.filtered(lambda order: order.state != 'draft')
+        if confirmed:
+            self.env['quelyos.analytics.stats']._mark_stale(set(confirmed.company_id.ids))
+        self.env['quelyos.sales.rollup']._mark_orders_dirty(orders)
+        return orders
+
+    def write(self, vals):
+        # Jours quittés (date, société) et jours d'arrivée : agrégats à recalculer
+        rollup_dirty = bool(ROLLUP_TRIGGER_FIELDS.intersection(vals))
+        if rollup_dirty:
+            self.env['quelyos.sales.rollup']._mark_orders_dirty(self)
+        res = super().write(vals)
+        if 'state' in vals:
+            # Confirmation, annulation... : statistiques matérialisées à recalculer
+            self.env['quelyos.analytics.stats']._mark_stale(set(self.company_id.ids))
+        if rollup_dirty:
+            self.env['quelyos.sales.rollup']._mark_orders_dirty(self)
+        return res
+
+    def unlink(self):
+        self.env['quelyos.sales.rollup']._mark_orders_dirty(self)
+        return super().unlink()
+
+    def action_confirm(self):
+        res = super().action_confirm()
+        # Panier commandé : retiré du store éphémère
+        self.env['quelyos.cart']._discard_orders(self)
+        return res
+
     def _estimate_restock_days(self, product):
         """
         Estimer le nombre de jours avant réapprovisionnement.
@@ -432,3 +478,27 @@ class SaleOrder(models.Model):
         )
 
         _logger.info(f'Email de récupération envoyé pour le panier #{cart.id} ({cart.partner_id.email})')
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # STATISTIQUES DASHBOARD
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        # Panier modifié hors sale.order.write (API panier) : jour de la commande à recalculer
+        self.env['quelyos.sales.rollup']._mark_orders_dirty(lines.order_id)
+        return lines
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env['quelyos.sales.rollup']._mark_orders_dirty(self.order_id)
+        return res
+
+    def unlink(self):
+        self.env['quelyos.sales.rollup']._mark_orders_dirty(self.order_id)
+        return super().unlink()
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+Agrégat quotidien des ventes par société, canal, état et catégorie.
+
+Deux grains dans la même table :
+- categ_id vide : une ligne par (société, jour, canal, état) avec le nombre
+  de commandes, leur montant total et les unités vendues ;
+- categ_id renseigné : ventilation par catégorie produit (commandes
+  contenant la catégorie, montant des lignes, unités).
+
+Maintenance incrémentale : toute commande créée, modifiée (état, date,
+société, canal, lignes) ou supprimée inscrit son jour dans
+quelyos_sales_rollup_pending. Le cron vide cette file ; une lecture ne
+rattrape que ROLLUP_READ_CATCHUP jours en attente de son périmètre. Le cron
+inscrit aussi les commandes écrites hors write() (recalculs de champs
+stockés : montants, prix) d'après leur write_date. Les graphiques lisent
+ensuite une ligne par jour (365 pour 12 mois) quelle que soit la
+granularité (jour, semaine, mois).
+"""
+
+import logging
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+CONFIRMED_STATES = ('sale', 'done')
+ROLLUP_GRANULARITIES = ('day', 'week', 'month')
+
+# Champs sale.order qui déplacent une commande d'un agrégat à l'autre
+ROLLUP_TRIGGER_FIELDS = {'state', 'date_order', 'company_id', 'website_id', 'order_line'}
+
+# Jours en attente recalculés au plus par lecture (le reste par le cron)
+ROLLUP_READ_CATCHUP = 100
+# Dernier passage du cron : commandes écrites depuis (recalculs stockés) à recalculer
+ROLLUP_WATERMARK_PARAM = 'quelyos_api.sales_rollup_watermark'
+# Marge sous le watermark (transactions encore en cours au passage précédent)
+ROLLUP_WATERMARK_OVERLAP = timedelta(minutes=5)
+
+_BUCKET_ORDERS_SQL = """
+    SELECT so.id, so.company_id, so.date_order::date AS date,
+           CASE WHEN so.website_id IS NOT NULL THEN 'website' ELSE 'backoffice' END AS channel,
+           so.state, COALESCE(so.amount_total, 0) AS amount_total
+    FROM sale_order so
+    {bucket_join}
+    WHERE so.date_order IS NOT NULL
+"""
+
+
+class SalesRollup(models.Model):
+    _name = 'quelyos.sales.rollup'
+    _description = 'Agrégat quotidien des ventes'
+    _log_access = False
+    _order = 'date'
+
+    company_id = fields.Many2one('res.company', string='Société', required=True, ondelete='cascade')
+    date = fields.Date(string='Jour', required=True)
+    channel = fields.Selection([
+        ('website', 'Site e-commerce'),
+        ('backoffice', 'Back-office'),
+    ], string='Canal', required=True)
+    state = fields.Char(string='État commande', required=True)
+    categ_id = fields.Many2one('product.category', string='Catégorie', ondelete='cascade')
+    orders = fields.Integer(string='Commandes')
+    revenue = fields.Float(string="Chiffre d'affaires")
+    units = fields.Float(string='Unités')
+
+    def init(self):
+        super().init()
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS quelyos_sales_rollup_company_date_idx
+            ON quelyos_sales_rollup (company_id, date)
+        """)
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS quelyos_sales_rollup_pending (
+                company_id integer NOT NULL,
+                date date NOT NULL
+            )
+        """)
+        # Un jour en attente une seule fois (doublons des versions précédentes supprimés)
+        self.env.cr.execute("""
+            DELETE FROM quelyos_sales_rollup_pending a
+            USING quelyos_sales_rollup_pending b
+            WHERE a.ctid < b.ctid AND a.company_id = b.company_id AND a.date = b.date
+        """)
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS quelyos_sales_rollup_pending_uniq
+            ON quelyos_sales_rollup_pending (company_id, date)
+        """)
+        # Rattrapage du cron par write_date
+        create_index(self.env.cr, 'sale_order_write_date_idx', 'sale_order', ['write_date'])
+        create_index(self.env.cr, 'sale_order_line_write_date_idx', 'sale_order_line', ['write_date'])
+        # Première installation : agrégat complet de l'historique
+        self.env.cr.execute("SELECT 1 FROM quelyos_sales_rollup LIMIT 1")
+        if not self.env.cr.fetchone():
+            self._refresh_buckets()
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # MAINTENANCE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @api.model
+    def _mark_orders_dirty(self, orders):
+        """Inscrit les jours des commandes à recalculer (sans verrou ni recalcul immédiat)"""
+        if not orders:
+            return
+        orders.flush_recordset(['date_order', 'company_id'])
+        self.env.cr.execute("""
+            INSERT INTO quelyos_sales_rollup_pending (company_id, date)
+            SELECT DISTINCT so.company_id, so.date_order::date
+            FROM sale_order so
+            WHERE so.id = ANY(%s)
+              AND so.date_order IS NOT NULL
+            ON CONFLICT DO NOTHING
+        """, (orders.ids,))
+
+    @api.model
+    def _mark_written_since(self, since):
+        """Inscrit les jours des commandes (ou lignes) écrites depuis `since`, y compris par recalcul"""
+        self.env['sale.order'].flush_model()
+        self.env['sale.order.line'].flush_model()
+        self.env.cr.execute("""
+            INSERT INTO quelyos_sales_rollup_pending (company_id, date)
+            SELECT so.company_id, so.date_order::date
+            FROM sale_order so
+            WHERE so.write_date >= %(since)s AND so.date_order IS NOT NULL
+            UNION
+            SELECT so.company_id, so.date_order::date
+            FROM sale_order_line sol
+            JOIN sale_order so ON so.id = sol.order_id
+            WHERE sol.write_date >= %(since)s AND so.date_order IS NOT NULL
+            ON CONFLICT DO NOTHING
+        """, {'since': since})
+
+    @api.model
+    def _refresh_pending(self, company=None, date_from=None, date_to=None, limit=ROLLUP_READ_CATCHUP):
+        """
+        Recalcule les jours en attente du périmètre (au plus `limit`, tous si None).
+
+        Jours verrouillés par une autre transaction ignorés (SKIP LOCKED) :
+        lectures concurrentes et cron ne s'attendent pas.
+
+        Returns:
+            int: nombre de jours recalculés
+        """
+        self.env['sale.order'].flush_model()
+        self.env['sale.order.line'].flush_model()
+        self.env.cr.execute("""
+            DELETE FROM quelyos_sales_rollup_pending
+            WHERE ctid IN (
+                SELECT ctid FROM quelyos_sales_rollup_pending
+                WHERE (%(company_id)s IS NULL OR company_id = %(company_id)s)
+                  AND (%(date_from)s IS NULL OR date >= %(date_from)s)
+                  AND (%(date_to)s IS NULL OR date <= %(date_to)s)
+                LIMIT %(limit)s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING company_id, date
+        """, {
+            'company_id': company.id if company else None,
+            'date_from': date_from,
+            'date_to': date_to,
+            'limit': limit,
+        })
+        buckets = set(self.env.cr.fetchall())
+        if buckets:
+            self._refresh_buckets(buckets)
+        return len(buckets)
+
+    @api.model
+    def cron_refresh_pending(self):
+        """Cron : commandes écrites depuis le dernier passage, puis vidage de la file"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        self.env.cr.execute("SELECT now() AT TIME ZONE 'UTC'")
+        now = self.env.cr.fetchone()[0]
+        watermark = ICP.get_param(ROLLUP_WATERMARK_PARAM)
+        if watermark:
+            self._mark_written_since(fields.Datetime.from_string(watermark) - ROLLUP_WATERMARK_OVERLAP)
+        ICP.set_param(ROLLUP_WATERMARK_PARAM, fields.Datetime.to_string(now))
+
+        refreshed = self._refresh_pending(limit=None)
+        _logger.info(f"Sales rollup: {refreshed} day(s) refreshed")
+
+    @api.model
+    def _refresh_buckets(self, buckets=None):
+        """
+        Recalcule les agrégats des jours `buckets` ({(company_id, date)}),
+        ou de tout l'historique si None.
+        """
+        self.flush_model()
+        params = {}
+        if buckets is None:
+            self.env.cr.execute("DELETE FROM quelyos_sales_rollup")
+            bucket_join = ''
+        else:
+            companies, dates = zip(*buckets)
+            params.update(companies=list(companies), dates=list(dates))
+            self.env.cr.execute("""
+                DELETE FROM quelyos_sales_rollup r
+                USING unnest(%(companies)s::int[], %(dates)s::date[]) AS b(company_id, date)
+                WHERE r.company_id = b.company_id AND r.date = b.date
+            """, params)
+            bucket_join = """
+                JOIN unnest(%(companies)s::int[], %(dates)s::date[]) AS b(company_id, date)
+                  ON b.company_id = so.company_id
+                 AND so.date_order >= b.date AND so.date_order < b.date + 1
+            """
+
+        self.env.cr.execute(f"""
+            WITH bucket_orders AS ({_BUCKET_ORDERS_SQL.format(bucket_join=bucket_join)}),
+            order_lines AS (
+                SELECT bo.id AS order_id, pt.categ_id,
+                       sol.product_uom_qty, COALESCE(sol.price_total, 0) AS price_total
+                FROM bucket_orders bo
+                JOIN sale_order_line sol ON sol.order_id = bo.id AND sol.display_type IS NULL
+                JOIN product_product pp ON pp.id = sol.product_id
+                JOIN product_template pt ON pt.id = pp.product_tmpl_id
+            ),
+            order_units AS (
+                SELECT order_id, SUM(product_uom_qty) AS units
+                FROM order_lines
+                GROUP BY order_id
+            ),
+            order_rows AS (
+                INSERT INTO quelyos_sales_rollup (company_id, date, channel, state, orders, revenue, units)
+                SELECT bo.company_id, bo.date, bo.channel, bo.state,
+                       count(*), SUM(bo.amount_total), COALESCE(SUM(ou.units), 0)
+                FROM bucket_orders bo
+                LEFT JOIN order_units ou ON ou.order_id = bo.id
+                GROUP BY bo.company_id, bo.date, bo.channel, bo.state
+                RETURNING 1
+            )
+            INSERT INTO quelyos_sales_rollup (company_id, date, channel, state, categ_id, orders, revenue, units)
+            SELECT bo.company_id, bo.date, bo.channel, bo.state, ol.categ_id,
+                   count(DISTINCT bo.id), SUM(ol.price_total), SUM(ol.product_uom_qty)
+            FROM bucket_orders bo
+            JOIN order_lines ol ON ol.order_id = bo.id
+            WHERE ol.categ_id IS NOT NULL
+            GROUP BY bo.company_id, bo.date, bo.channel, bo.state, ol.categ_id
+        """, params)
+        self.invalidate_model()
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # LECTURE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _scope_clause(self, company, date_from, date_to, channel):
+        clauses = ['date >= %(date_from)s']
+        params = {'date_from': date_from, 'date_to': date_to, 'company_id': company.id if company else None,
+                  'channel': channel}
+        if date_to:
+            clauses.append('date <= %(date_to)s')
+        if company:
+            clauses.append('company_id = %(company_id)s')
+        if channel:
+            clauses.append('channel = %(channel)s')
+        return ' AND '.join(clauses), params
+
+    @api.model
+    def get_series(self, date_from, date_to=None, granularity='day', company=None, channel=None):
+        """
+        Commandes et chiffre d'affaires par période et par état.
+
+        Returns:
+            list: [{'period': str, 'states': {état: {'orders', 'revenue', 'units'}}}, ...]
+        """
+        if granularity not in ROLLUP_GRANULARITIES:
+            granularity = 'day'
+        self._refresh_pending(company, date_from, date_to)
+
+        where, params = self._scope_clause(company, date_from, date_to, channel)
+        params['granularity'] = granularity
+        self.env.cr.execute(f"""
+            SELECT date_trunc(%(granularity)s, date)::date AS period, state,
+                   SUM(orders), SUM(revenue), SUM(units)
+            FROM quelyos_sales_rollup
+            WHERE categ_id IS NULL AND {where}
+            GROUP BY period, state
+            ORDER BY period
+        """, params)
+
+        series = {}
+        for period, state, orders, revenue, units in self.env.cr.fetchall():
+            label = period.strftime('%Y-%m') if granularity == 'month' else period.isoformat()
+            series.setdefault(label, {})[state] = {
+                'orders': int(orders or 0),
+                'revenue': revenue or 0.0,
+                'units': units or 0.0,
+            }
+        return [{'period': label, 'states': states} for label, states in series.items()]
+
+    @api.model
+    def get_top_categories(self, limit=10, date_from=None, date_to=None, company=None, channel=None):
+        """Catégories les plus vendues (commandes confirmées) sur la période"""
+        self._refresh_pending(company, date_from, date_to)
+
+        where, params = self._scope_clause(company, date_from or '1970-01-01', date_to, channel)
+        params.update(states=list(CONFIRMED_STATES), limit=limit)
+        self.env.cr.execute(f"""
+            SELECT categ_id, SUM(revenue) AS revenue, SUM(units)
+            FROM quelyos_sales_rollup
+            WHERE categ_id IS NOT NULL AND state = ANY(%(states)s) AND {where}
+            GROUP BY categ_id
+            ORDER BY revenue DESC
+            LIMIT %(limit)s
+        """, params)
+        rows = self.env.cr.fetchall()
+
+        categories = self.env['product.category'].sudo().browse([row[0] for row in rows])
+        return [{
+            'id': category.id,
+            'name': category.complete_name or category.name,
+            'qty_sold': int(units or 0),
+            'revenue': round(revenue or 0.0, 2),
+        } for category, (_categ_id, revenue, units) in zip(categories, rows)]
@@ -1,2 +1,21 @@
 # -*- coding: utf-8 -*-
 from . import test_invoices_ctrl
+from . import test_finance_reports
+from . import test_products_listing
+from . import test_product_facets
+from . import test_product_search
+from . import test_job_worker
+from . import test_event_store
+from . import test_webhooks
+from . import test_backup_restore
+from . import test_analytics_stats
+from . import test_sales_rollup
+from . import test_inventory_analytics
+from . import test_cart_store
+from . import test_cashflow_forecast
+from . import test_cfo_metrics
+from . import test_consolidation
+from . import test_pos_sync
+from . import test_pos_posting
+from . import test_pos_catalog
+from . import test_pos_session_totals
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Outils communs aux tests Quelyos API
+
+- FinanceReportCase : tenant + journal + comptes + écritures validées
+- POSCase : terminal POS (journaux, entrepôt, espèces) + session ouverte
+- clone_rows : duplication SQL massive (benchmarks sur plusieurs millions de lignes)
+- measure_p95, BenchmarkMixin : latence au 95e centile des benchmarks
+"""
+
+import time
+
+from odoo.tests import TransactionCase
+
+
+def clone_rows(cr, table, template_ids, copies, overrides=None):
+    """
+    Duplique `copies` fois les lignes `template_ids` de `table` en une requête.
+
+    overrides: dict {colonne: expression SQL} ; l'expression peut utiliser
+    `t` (ligne modèle) et `gs` (index 1..copies de generate_series).
+    """
+    overrides = overrides or {}
+    cr.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = %s AND column_name <> 'id'
+        ORDER BY ordinal_position
+    """, (table,))
+    columns = [row[0] for row in cr.fetchall()]
+
+    column_list = ', '.join(f'"{col}"' for col in columns)
+    select_list = ', '.join(overrides.get(col, f't."{col}"') for col in columns)
+
+    cr.execute(f"""
+        INSERT INTO {table} ({column_list})
+        SELECT {select_list}
+        FROM {table} t
+        CROSS JOIN generate_series(1, %s) AS gs
+        WHERE t.id = ANY(%s)
+    """, (copies, list(template_ids)))
+    cr.execute(f"ANALYZE {table}")
+
+
+def measure_p95(fn, n):
+    """Appelle `n` fois `fn` (sans argument) ; retourne le 95e centile des durées, en secondes"""
+    durations = []
+    for _i in range(n):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    return durations[max(int(n * 0.95) - 1, 0)]
+
+
+class BenchmarkMixin:
+    """
+    Benchmarks de latence, combinés à un cas de test et tagués
+    ('post_install', '-at_install', '-standard', 'quelyos_benchmark').
+    """
+
+    def assertP95Less(self, fn, n, limit):
+        """Vérifie le 95e centile de `n` appels de `fn` sous `limit` secondes ; retourne ce p95"""
+        p95 = measure_p95(fn, n)
+        self.assertLess(p95, limit, f"p95 {p95 * 1000:.1f} ms")
+        return p95
+
+
+class FinanceReportCase(TransactionCase):
+    """Jeu de données comptable minimal pour les rapports Finance"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.tenant = cls.env['quelyos.tenant'].create({
+            'name': 'Tenant Finance Reports',
+            'code': 'tenant-finance-reports',
+            'domain': 'finance-reports.quelyos.test',
+            'company_id': cls.env.company.id,
+        })
+
+        cls.journal = cls.env['account.journal'].create({
+            'name': 'Opérations diverses test',
+            'code': 'QTST',
+            'type': 'general',
+        })
+
+        Account = cls.env['account.account']
+        cls.account_receivable = Account.create({
+            'name': 'Clients test',
+            'code': '411900',
+            'account_type': 'asset_receivable',
+            'reconcile': True,
+        })
+        cls.account_payable = Account.create({
+            'name': 'Fournisseurs test',
+            'code': '401900',
+            'account_type': 'liability_payable',
+            'reconcile': True,
+        })
+        cls.account_income = Account.create({
+            'name': 'Ventes test',
+            'code': '707900',
+            'account_type': 'income',
+        })
+        cls.account_bank = Account.create({
+            'name': 'Banque test',
+            'code': '512900',
+            'account_type': 'asset_cash',
+        })
+
+        cls.partner = cls.env['res.partner'].create({'name': 'Client Finance Test'})
+
+    @classmethod
+    def _create_posted_move(cls, date, debit_account, credit_account, amount, partner=None):
+        """Crée et valide une écriture équilibrée à deux lignes"""
+        move = cls.env['account.move'].create({
+            'move_type': 'entry',
+            'journal_id': cls.journal.id,
+            'date': date,
+            'tenant_id': cls.tenant.id,
+            'line_ids': [
+                (0, 0, {
+                    'name': 'Débit',
+                    'account_id': debit_account.id,
+                    'partner_id': partner.id if partner else False,
+                    'debit': amount,
+                    'credit': 0.0,
+                }),
+                (0, 0, {
+                    'name': 'Crédit',
+                    'account_id': credit_account.id,
+                    'partner_id': partner.id if partner else False,
+                    'debit': 0.0,
+                    'credit': amount,
+                }),
+            ],
+        })
+        move.action_post()
+        return move
+
+
+class POSCase(TransactionCase):
+    """Terminal POS avec session ouverte et deux articles stockables"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.tenant = cls.env['quelyos.tenant'].create({
+            'name': 'Tenant POS',
+            'code': 'tenant-pos',
+            'domain': 'pos.quelyos.test',
+            'company_id': cls.env.company.id,
+        })
+
+        Account = cls.env['account.account']
+        cls.account_income = Account.create({
+            'name': 'Ventes POS test',
+            'code': '707910',
+            'account_type': 'income',
+        })
+        cls.account_cash = Account.create({
+            'name': 'Caisse POS test',
+            'code': '531910',
+            'account_type': 'asset_cash',
+        })
+
+        Journal = cls.env['account.journal']
+        cls.sale_journal = Journal.create({
+            'name': 'Ventes POS test',
+            'code': 'QPOS',
+            'type': 'sale',
+            'default_account_id': cls.account_income.id,
+        })
+        cls.cash_journal = Journal.create({
+            'name': 'Caisse POS test',
+            'code': 'QCSH',
+            'type': 'cash',
+            'default_account_id': cls.account_cash.id,
+        })
+
+        cls.warehouse = cls.env['stock.warehouse'].search([('company_id', '=', cls.env.company.id)], limit=1)
+        cls.config = cls.env['quelyos.pos.config'].create({
+            'name': 'Caisse test',
+            'code': 'POS-T',
+            'tenant_id': cls.tenant.id,
+            'warehouse_id': cls.warehouse.id,
+            'pricelist_id': cls.env['product.pricelist'].create({'name': 'Tarif POS test'}).id,
+            'sale_journal_id': cls.sale_journal.id,
+            'income_account_id': cls.account_income.id,
+        })
+        cls.cash = cls.env['quelyos.pos.payment.method'].create({
+            'name': 'Espèces test',
+            'code': 'cash-test',
+            'type': 'cash',
+            'journal_id': cls.cash_journal.id,
+        })
+
+        cls.session = cls.env['quelyos.pos.session'].create({'config_id': cls.config.id})
+        cls.session.action_open()
+
+        Product = cls.env['product.product']
+        cls.coffee = Product.create({'name': 'Café POS', 'is_storable': True, 'list_price': 2.5, 'taxes_id': [(6, 0, [])]})
+        cls.croissant = Product.create({'name': 'Croissant POS', 'is_storable': True, 'list_price': 1.5, 'taxes_id': [(6, 0, [])]})
+        for product in cls.coffee | cls.croissant:
+            cls.env['stock.quant']._update_available_quantity(product, cls.warehouse.lot_stock_id, 100000)
+
+    @classmethod
+    def _offline_order(cls, offline_id, lines, paid=True):
+        """Commande offline telle qu'envoyée par le terminal ; lines : [(produit, quantité)]"""
+        total = sum(product.list_price * quantity for product, quantity in lines)
+        return {
+            'offline_id': offline_id,
+            'session_id': cls.session.id,
+            'lines': [
+                {'product_id': product.id, 'quantity': quantity, 'price_unit': product.list_price}
+                for product, quantity in lines
+            ],
+            'payments': [{'payment_method_id': cls.cash.id, 'amount': total}],
+            'is_paid': paid,
+        }
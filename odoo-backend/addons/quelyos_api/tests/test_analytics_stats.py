@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des statistiques du dashboard e-commerce (quelyos.analytics.stats)
+
+Benchmark dashboard (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_ORDER_LINES (défaut : 1 000 000 lignes).
+"""
+
+import logging
+import os
+import time
+
+from odoo.tests import TransactionCase, tagged
+
+from .common import BenchmarkMixin, clone_rows
+
+_logger = logging.getLogger(__name__)
+
+BENCH_ORDER_LINES = int(os.environ.get('QUELYOS_BENCH_ORDER_LINES', 1000000))
+
+
+class AnalyticsStatsCase(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.company = cls.env.company
+        cls.customer = cls.env['res.partner'].create({'name': 'Client Stats', 'customer_rank': 1})
+
+        Product = cls.env['product.product']
+        cls.chair = Product.create({'name': 'Chaise Stats', 'is_storable': True, 'list_price': 50})
+        cls.table = Product.create({'name': 'Table Stats', 'is_storable': True, 'list_price': 200})
+
+        stock = cls.env['stock.warehouse'].search([('company_id', '=', cls.company.id)], limit=1).lot_stock_id
+        cls.env['stock.quant']._update_available_quantity(cls.chair, stock, 3)
+        cls.env['stock.quant']._update_available_quantity(cls.table, stock, 40)
+
+        cls.order = cls._create_order([(cls.chair, 10), (cls.table, 1)])
+        cls.order.action_confirm()
+        cls.draft = cls._create_order([(cls.table, 5)])
+
+        cls.Stats = cls.env['quelyos.analytics.stats']
+
+    @classmethod
+    def _create_order(cls, lines):
+        return cls.env['sale.order'].create({
+            'partner_id': cls.customer.id,
+            'order_line': [(0, 0, {'product_id': product.id, 'product_uom_qty': qty}) for product, qty in lines],
+        })
+
+
+@tagged('post_install', '-at_install')
+class TestAnalyticsStats(AnalyticsStatsCase):
+    """Agrégats SQL et cache matérialisé"""
+
+    def test_totals_and_top_products(self):
+        data = self.Stats.get_stats(self.company, use_cache=False)
+        totals = data['totals']
+        self.assertGreaterEqual(totals['confirmed_orders'], 1)
+        self.assertGreaterEqual(totals['pending_orders'], 1)
+        self.assertGreaterEqual(totals['revenue'], self.order.amount_total)
+
+        top = {product['id']: product for product in data['top_products']}
+        self.assertEqual(top[self.chair.id]['qty_sold'], 10)
+        self.assertNotEqual(data['recent_orders'], [])
+
+    def test_stock_alerts(self):
+        data = self.Stats.get_stats(self.company, use_cache=False)
+        alerts = {alert['id']: alert for alert in data['stock_alerts']}
+        self.assertEqual(alerts[self.chair.product_tmpl_id.id]['alert_level'], 'warning')
+        self.assertNotIn(self.table.product_tmpl_id.id, alerts)
+
+    def test_cache_refreshed_on_confirmation(self):
+        before = self.Stats.get_stats(self.company)['totals']['confirmed_orders']
+        self.draft.action_confirm()
+        after = self.Stats.get_stats(self.company)['totals']['confirmed_orders']
+        self.assertEqual(after, before + 1)
+
+    def test_store_is_an_upsert(self):
+        for company_id in (self.company.id, False):
+            self.Stats._store_stats(company_id, {'totals': {'orders': 1}})
+            self.Stats._store_stats(company_id, {'totals': {'orders': 2}})
+            row = self.Stats.search([('company_id', '=', company_id)])
+            self.assertEqual(len(row), 1)
+            self.assertEqual(row.data, {'totals': {'orders': 2}})
+            self.assertFalse(row.stale)
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestAnalyticsStatsBenchmark(BenchmarkMixin, AnalyticsStatsCase):
+    """Temps de réponse du dashboard sur un tenant d'un million de lignes de commande"""
+
+    def test_stats_latency(self):
+        self.env.flush_all()
+        clone_rows(self.env.cr, 'sale_order_line', self.order.order_line.ids, BENCH_ORDER_LINES // 2)
+        self.env.invalidate_all()
+
+        start = time.perf_counter()
+        self.Stats.get_stats(self.company)
+        cold = time.perf_counter() - start
+
+        p95 = self.assertP95Less(lambda: self.Stats.get_stats(self.company), 20, 0.100)
+
+        _logger.info(
+            "Analytics stats benchmark: %d lines, cold %.1f ms, cached p95 %.1f ms",
+            BENCH_ORDER_LINES, cold * 1000, p95 * 1000,
+        )
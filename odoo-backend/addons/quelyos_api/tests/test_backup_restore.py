@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la restauration tenant par lots (quelyos.backup._restore_tenant_data),
+des backups incrémentaux (export delta, suppressions, rejeu de la chaîne), de
+la rétention des chaînes et du magasin de fichiers partagé (dédoublonnage,
+ramasse-miettes)
+
+Benchmark restauration (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_RESTORE_ROWS (défaut : 1 000 000 lignes).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from odoo.sql_db import db_connect
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.quelyos_api.models import backup as backup_module
+from odoo.addons.quelyos_api.models.backup import BACKUP_BLOB_LOCK, _subtract_ranges
+
+from .common import clone_rows
+
+_logger = logging.getLogger(__name__)
+
+BENCH_RESTORE_ROWS = int(os.environ.get('QUELYOS_BENCH_RESTORE_ROWS', 1000000))
+
+# Ids absents de la base : enregistrements recréés à la restauration
+MISSING_ID = 2000000000
+
+
+class BackupRestoreCase(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.company = cls.env.company
+        cls.backup = cls.env['quelyos.backup'].create({'type': 'tenant'})
+        cls.partner = cls.env['res.partner'].create({
+            'name': 'Client restauré',
+            'email': 'client@restore.test',
+            'company_id': cls.company.id,
+        })
+
+    def _restore(self, data):
+        return self.backup._restore_tenant_data(data, self.company, workers=1)
+
+
+@tagged('post_install', '-at_install')
+class TestBackupRestore(BackupRestoreCase):
+    """Upsert par lots : création, mise à jour groupée, remappage des références"""
+
+    def test_upsert_counts(self):
+        stats = self._restore({'res.partner': [
+            {'id': self.partner.id, 'name': 'Client restauré', 'email': 'client@restore.test'},
+            {'id': MISSING_ID, 'name': 'Nouveau client', 'email': 'nouveau@restore.test'},
+        ]})
+        self.assertEqual(stats['res.partner'], {'created': 1, 'updated': 0, 'unchanged': 1, 'failed': 0})
+
+        stats = self._restore({'res.partner': [
+            {'id': self.partner.id, 'name': 'Client renommé'},
+        ]})
+        self.assertEqual(stats['res.partner']['updated'], 1)
+        self.assertEqual(self.partner.name, 'Client renommé')
+
+        created = self.env['res.partner'].search([('email', '=', 'nouveau@restore.test')])
+        self.assertEqual(created.company_id, self.company)
+
+    def test_references_remapped(self):
+        self._restore({'res.partner': [
+            {'id': MISSING_ID + 1, 'name': 'Contact', 'parent_id': MISSING_ID},
+            {'id': MISSING_ID, 'name': 'Société mère', 'is_company': True},
+        ]})
+        Partner = self.env['res.partner']
+        parent = Partner.search([('name', '=', 'Société mère')])
+        contact = Partner.search([('name', '=', 'Contact')])
+        self.assertEqual(contact.parent_id, parent)
+
+    def test_invalid_record_isolated(self):
+        stats = self._restore({'res.partner': [
+            {'id': MISSING_ID, 'name': 'Valide'},
+            {'id': MISSING_ID + 1, 'name': 'Invalide', 'country_id': MISSING_ID},
+        ]})
+        self.assertEqual(stats['res.partner']['created'], 1)
+        self.assertEqual(stats['res.partner']['failed'], 1)
+
+    def test_translations_restored_raw(self):
+        name = {'en_US': 'Chair', 'fr_FR': 'Chaise', 'de_DE': 'Stuhl'}
+        self._restore({'product.template': [{'id': MISSING_ID, 'name': name, 'type': 'consu'}]})
+        template = self.env['product.template'].search([('name', '=', 'Chair')])
+        self.assertEqual(len(template), 1)
+
+        self.env.cr.execute("SELECT name FROM product_template WHERE id = %s", (template.id,))
+        self.assertEqual(self.env.cr.fetchone()[0], name)
+
+        # Delta : une traduction change, les autres sont conservées
+        name = dict(name, fr_FR='Fauteuil')
+        self._restore({'product.template': [{'id': template.id, 'name': name, 'type': 'consu'}]})
+        self.env.cr.execute("SELECT name FROM product_template WHERE id = %s", (template.id,))
+        self.assertEqual(self.env.cr.fetchone()[0], name)
+
+    def test_restore_levels(self):
+        levels = self.backup._get_restore_levels(['res.partner', 'product.category', 'product.template'])
+        self.assertEqual(levels[0], ['res.partner', 'product.category'])
+        self.assertIn('product.template', levels[1])
+
+
+class BackupChainCase(TransactionCase):
+    """Tenant sur sa propre société, répertoire de backups temporaire"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.company = cls.env['res.company'].create({'name': 'Tenant backup incrémental'})
+        cls.tenant = cls.env['quelyos.tenant'].create({
+            'name': 'Tenant Backup',
+            'code': 'tenant-backup',
+            'domain': 'backup.quelyos.test',
+            'company_id': cls.company.id,
+        })
+
+    def setUp(self):
+        super().setUp()
+        backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, backup_dir, True)
+        self.env['ir.config_parameter'].sudo().set_param('quelyos.backup.directory', backup_dir)
+
+
+@tagged('post_install', '-at_install')
+class TestIncrementalBackup(BackupChainCase):
+    """Backup complet puis delta : modifications, suppressions, rejeu de la chaîne"""
+
+    def setUp(self):
+        super().setUp()
+        # Export committé par fichier : la transaction de test est conservée
+        for patcher in (
+            patch.object(self.env.cr, 'commit'),
+            patch.object(backup_module, 'TENANT_BACKUP_MODELS', ['res.partner']),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        Partner = self.env['res.partner']
+        self.partners = {
+            name: Partner.create({'name': name, 'company_id': self.company.id})
+            for name in ('Client A', 'Client B', 'Client C')
+        }
+        # Antérieurs au watermark du backup complet (moins le recouvrement)
+        self.env.flush_all()
+        self.env.cr.execute(
+            "UPDATE res_partner SET write_date = now() - interval '1 day' WHERE company_id = %s",
+            (self.company.id,),
+        )
+
+    def _backup(self, parent=None):
+        backup = self.env['quelyos.backup'].create({
+            'type': 'tenant',
+            'tenant_id': self.tenant.id,
+            'parent_backup_id': parent.id if parent else False,
+        })
+        backup.execute_tenant_backup()
+        self.assertEqual(backup.status, 'completed', backup.error_message)
+        return backup
+
+    def _archive(self, backup):
+        """(noms des partenaires exportés, plages d'ids supprimés)"""
+        with zipfile.ZipFile(backup.file_path) as zipf:
+            names = zipf.namelist()
+            exported = {
+                json.loads(line)['name']
+                for member in names if member.startswith('data/res.partner/')
+                for line in zipf.read(member).decode('utf-8').splitlines() if line
+            }
+            deleted = json.loads(zipf.read('deleted/res.partner.json')) if 'deleted/res.partner.json' in names else []
+        return exported, deleted
+
+    def _change_after_base(self):
+        self.partners['Client A'].name = 'Client A2'
+        deleted_id = self.partners['Client C'].id
+        self.partners['Client C'].unlink()
+        self.partners['Client D'] = self.env['res.partner'].create({'name': 'Client D', 'company_id': self.company.id})
+        return deleted_id
+
+    def test_delta_exports_changes_and_deletions(self):
+        base = self._backup()
+        exported, deleted = self._archive(base)
+        self.assertLessEqual({'Client A', 'Client B', 'Client C'}, exported)
+        self.assertEqual(deleted, [])
+
+        deleted_id = self._change_after_base()
+        delta = self._backup(base)
+        self.assertEqual(delta.parent_backup_id, base)
+        self.assertTrue(delta.filename.endswith('_delta.zip'))
+
+        exported, deleted = self._archive(delta)
+        self.assertEqual(exported, {'Client A2', 'Client D'})
+        self.assertEqual(deleted, [[deleted_id, deleted_id]])
+        self.assertEqual(json.loads(zipfile.ZipFile(delta.file_path).read('metadata.json'))['deleted'], {'res.partner': 1})
+
+    def test_resume_after_crash_mid_part(self):
+        for name in ('Client E', 'Client F', 'Client G', 'Client H'):
+            self.env['res.partner'].create({'name': name, 'company_id': self.company.id})
+        expected = set(self.env['res.partner'].search([('company_id', '=', self.company.id)]).mapped('name'))
+
+        Backup = type(self.env['quelyos.backup'])
+        read_chunk = Backup._read_backup_chunk
+        calls = []
+
+        def crash_mid_part(backup, *args):
+            # 4e lecture : second lot du deuxième fichier
+            calls.append(args)
+            if len(calls) == 4:
+                raise OSError("Arrêt simulé")
+            return read_chunk(backup, *args)
+
+        backup = self.env['quelyos.backup'].create({'type': 'tenant', 'tenant_id': self.tenant.id})
+        with patch.object(Backup, '_backup_chunk_size', 2), patch.object(Backup, '_backup_part_rows', 4), \
+                patch.object(self.env.cr, 'rollback'):
+            with patch.object(Backup, '_read_backup_chunk', crash_mid_part):
+                backup.execute_tenant_backup()
+            self.assertEqual(backup.status, 'failed')
+            self.assertEqual(json.loads(backup.checkpoint)['part'], 1)
+
+            backup.execute_tenant_backup()
+        self.assertEqual(backup.status, 'completed', backup.error_message)
+
+        exported, _deleted = self._archive(backup)
+        self.assertEqual(exported, expected)
+        with zipfile.ZipFile(backup.file_path) as zipf:
+            parts = sorted(member for member in zipf.namelist() if member.startswith('data/res.partner/'))
+        self.assertEqual(len(parts), -(-len(expected) // 4))
+        self.assertEqual(parts[0], 'data/res.partner/00000.ndjson')
+        self.assertEqual(backup.records_count, len(expected))
+
+    def test_restore_chain_replays_base_delta_and_deletions(self):
+        base = self._backup()
+        self._change_after_base()
+        self.partners['Client B'].name = 'Client B2'
+        delta = self._backup(base)
+        self.assertEqual(delta._get_backup_chain(), [base, delta])
+
+        # État divergent, réaligné par le rejeu de la chaîne
+        self.partners['Client A'].name = 'Client altéré'
+        self.partners['Client B'].unlink()
+        self.partners['Client D'].unlink()
+
+        delta.execute_tenant_restore()
+        self.env.invalidate_all()
+        names = self.env['res.partner'].search([('company_id', '=', self.company.id)]).mapped('name')
+        self.assertIn('Client A2', names)
+        # Recréé par le backup complet, mis à jour (pas dupliqué) par le delta
+        self.assertEqual(names.count('Client B2'), 1)
+        self.assertNotIn('Client B', names)
+        self.assertIn('Client D', names)
+        self.assertNotIn('Client C', names)
+        self.assertNotIn('Client altéré', names)
+
+
+@tagged('post_install', '-at_install')
+class TestBackupRetention(BackupChainCase):
+    """Rétention : un delta conservé garde toute sa chaîne"""
+
+    def _backup(self, days_ago, parent=None):
+        backup = self.env['quelyos.backup'].create({
+            'type': 'tenant',
+            'tenant_id': self.tenant.id,
+            'status': 'completed',
+            'parent_backup_id': parent.id if parent else False,
+        })
+        self.env.cr.execute(
+            "UPDATE quelyos_backup SET create_date = now() - %s * interval '1 day' WHERE id = %s",
+            (days_ago, backup.id),
+        )
+        return backup
+
+    def test_retention_keeps_parents_of_kept_deltas(self):
+        full_1 = self._backup(5)
+        delta_1 = self._backup(4, full_1)
+        delta_2 = self._backup(3, delta_1)
+        full_2 = self._backup(2)
+        delta_3 = self._backup(1, full_2)
+        backups = full_1 | delta_1 | delta_2 | full_2 | delta_3
+        self.env.invalidate_all()
+
+        schedule = self.env['quelyos.backup.schedule'].create({
+            'tenant_id': self.tenant.id,
+            'retention_count': 3,
+        })
+        schedule._cleanup_old_backups()
+        self.assertEqual(backups.exists(), backups)
+
+        schedule.retention_count = 2
+        schedule._cleanup_old_backups()
+        self.assertEqual(backups.exists(), full_2 | delta_3)
+
+
+@tagged('post_install', '-at_install')
+class TestBackupBlobStore(BackupChainCase):
+    """Magasin adressé par checksum : dédoublonnage, nettoyage, restauration"""
+
+    def _blob(self, content):
+        checksum = hashlib.sha1(content).hexdigest()
+        self.env['quelyos.backup']._store_backup_blob(checksum, raw=content)
+        return checksum
+
+    def _completed_backup(self, checksums):
+        """Backup tenant terminé dont le manifeste référence `checksums`"""
+        backup = self.env['quelyos.backup'].create({
+            'type': 'tenant',
+            'tenant_id': self.tenant.id,
+            'status': 'completed',
+        })
+        zip_path = os.path.join(tempfile.mkdtemp(), 'backup.zip')
+        self.addCleanup(shutil.rmtree, os.path.dirname(zip_path), True)
+        with zipfile.ZipFile(zip_path, 'w') as zipf:
+            zipf.writestr('attachments.json', json.dumps([{'checksum': checksum} for checksum in checksums]))
+        backup.file_path = zip_path
+        return backup
+
+    def test_blob_deduplicated(self):
+        Backup = self.env['quelyos.backup']
+        checksum = hashlib.sha1(b'facture').hexdigest()
+        self.assertTrue(Backup._store_backup_blob(checksum, raw=b'facture'))
+        self.assertFalse(Backup._store_backup_blob(checksum, raw=b'facture'))
+        with open(Backup._get_blob_path(checksum), 'rb') as f:
+            self.assertEqual(f.read(), b'facture')
+
+    def test_blob_stored_concurrently(self):
+        Backup = self.env['quelyos.backup']
+        checksum = hashlib.sha1(b'devis').hexdigest()
+        blob_path = Backup._get_blob_path(checksum)
+
+        def concurrent_replace(src, dst):
+            # Autre backup (autre thread) : même contenu stocké juste avant
+            with open(dst, 'wb') as f:
+                f.write(b'devis')
+            raise FileNotFoundError(src)
+
+        with patch.object(os, 'replace', side_effect=concurrent_replace):
+            self.assertFalse(Backup._store_backup_blob(checksum, raw=b'devis'))
+        with open(blob_path, 'rb') as f:
+            self.assertEqual(f.read(), b'devis')
+        self.assertEqual(os.listdir(os.path.dirname(blob_path)), [checksum])
+
+    def test_gc_removes_only_unreferenced_blobs(self):
+        Backup = self.env['quelyos.backup']
+        kept = self._blob(b'conserve')
+        orphan = self._blob(b'orphelin')
+        self._completed_backup([kept])
+
+        self.assertEqual(Backup.gc_backup_blobs(), 1)
+        self.assertTrue(os.path.exists(Backup._get_blob_path(kept)))
+        self.assertFalse(os.path.exists(Backup._get_blob_path(orphan)))
+
+    def test_gc_postponed_while_backup_running(self):
+        Backup = self.env['quelyos.backup']
+        orphan = self._blob(b'pas encore dans un manifeste')
+
+        # Backup en cours dans une autre session : verrou partagé détenu
+        cr = db_connect(self.env.cr.dbname).cursor()
+        self.addCleanup(cr.close)
+        self.addCleanup(cr.execute, "SELECT pg_advisory_unlock_all()")
+        cr.execute("SELECT pg_advisory_lock_shared(%s)", (BACKUP_BLOB_LOCK,))
+        self.assertEqual(Backup.gc_backup_blobs(), 0)
+        self.assertTrue(os.path.exists(Backup._get_blob_path(orphan)))
+
+        cr.execute("SELECT pg_advisory_unlock_shared(%s)", (BACKUP_BLOB_LOCK,))
+        self.assertEqual(Backup.gc_backup_blobs(), 1)
+
+    def test_restore_manifest_through_orm(self):
+        partner = self.env['res.partner'].create({'name': 'Client pièce jointe', 'company_id': self.company.id})
+        checksum = self._blob(b'%PDF-1.4 test')
+        manifest = [{
+            'id': 1, 'checksum': checksum, 'name': 'facture.pdf', 'mimetype': 'application/pdf',
+            'res_model': 'res.partner', 'res_id': partner.id,
+        }]
+
+        backup = self.env['quelyos.backup'].create({'type': 'tenant', 'tenant_id': self.tenant.id})
+        stats = backup._restore_filestore_manifest(manifest, self.company, {})
+        self.assertEqual(stats, {'created': 1, 'skipped': 0, 'failed': 0})
+
+        attachment = self.env['ir.attachment'].search([('res_model', '=', 'res.partner'), ('res_id', '=', partner.id)])
+        self.assertEqual(attachment.raw, b'%PDF-1.4 test')
+        self.assertEqual(attachment.checksum, checksum)
+        self.assertEqual(attachment.company_id, self.company)
+
+        stats = backup._restore_filestore_manifest(manifest, self.company, {})
+        self.assertEqual(stats['skipped'], 1)
+
+
+class TestBackupIdRanges(unittest.TestCase):
+    """Détection des suppressions d'un delta (plages d'ids)"""
+
+    def test_subtract_ranges(self):
+        self.assertEqual(
+            _subtract_ranges([[1, 10], [20, 30]], [[3, 4], [8, 22], [30, 30]]),
+            [[1, 2], [5, 7], [23, 29]],
+        )
+        self.assertEqual(_subtract_ranges([[1, 5]], []), [[1, 5]])
+        self.assertEqual(_subtract_ranges([[1, 5]], [[0, 9]]), [])
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestBackupRestoreBenchmark(BackupRestoreCase):
+    """Débit de restauration (enregistrements/seconde) sur un million de lignes"""
+
+    def test_restore_throughput(self):
+        existing_count = BENCH_RESTORE_ROWS // 2
+        self.env.flush_all()
+        clone_rows(self.env.cr, 'res_partner', self.partner.ids, existing_count, {
+            'email': "'bench' || gs || '@restore.test'",
+        })
+        self.env.cr.execute(
+            "SELECT id FROM res_partner WHERE email LIKE 'bench%@restore.test' ORDER BY id"
+        )
+        existing_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.env.invalidate_all()
+
+        def records():
+            # Moitié mises à jour (une sur deux modifiée), moitié créations
+            for index, record_id in enumerate(existing_ids):
+                name = f'Client {index}' if index % 2 else self.partner.name
+                yield {'id': record_id, 'name': name, 'email': f'bench{index + 1}@restore.test'}
+            for index in range(BENCH_RESTORE_ROWS - len(existing_ids)):
+                yield {'id': MISSING_ID + index, 'name': f'Nouveau {index}', 'email': f'new{index}@restore.test'}
+
+        start = time.perf_counter()
+        stats = self._restore({'res.partner': records()})['res.partner']
+        duration = time.perf_counter() - start
+
+        rate = BENCH_RESTORE_ROWS / duration
+        _logger.info(
+            "Restore benchmark: %d rows in %.1f s (%.0f records/s) %s",
+            BENCH_RESTORE_ROWS, duration, rate, stats,
+        )
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(stats['created'] + stats['updated'] + stats['unchanged'], BENCH_RESTORE_ROWS)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Tests du panier e-commerce sur store éphémère (quelyos.cart, lib/cart_store.py)
+
+Le store (Redis ou mémoire) n'est pas transactionnel : chaque test utilise
+un propriétaire unique et le supprime du store en fin de test.
+
+Benchmark ajout au panier (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+
+from odoo.tests import HttpCase, TransactionCase, tagged
+
+from odoo.addons.quelyos_api.lib.cart_store import get_cart_store
+
+from .common import BenchmarkMixin
+
+_logger = logging.getLogger(__name__)
+
+
+class CartStoreCase(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Product = cls.env['product.product']
+        cls.chair = Product.create({'name': 'Chaise Panier', 'list_price': 100.0, 'taxes_id': [(6, 0, [])]})
+        cls.lamp = Product.create({'name': 'Lampe Panier', 'list_price': 30.0, 'taxes_id': [(6, 0, [])]})
+        cls.Cart = cls.env['quelyos.cart']
+
+    def setUp(self):
+        super().setUp()
+        self.owner = f'guest:cart-{uuid.uuid4().hex[:12]}@quelyos.test'
+        self.addCleanup(get_cart_store().delete, self.env.cr.dbname, self.owner)
+
+    def _order_count(self):
+        self.env.cr.execute("SELECT count(*) FROM sale_order")
+        return self.env.cr.fetchone()[0]
+
+
+@tagged('post_install', '-at_install')
+class TestCartStore(CartStoreCase):
+    """Panier hors base jusqu'à la matérialisation en commande brouillon"""
+
+    def test_cart_operations_without_orders(self):
+        orders_before = self._order_count()
+
+        cart = self.Cart.add_product(self.owner, self.chair.id, 2)
+        cart = self.Cart.add_product(self.owner, self.lamp.id, 1)
+        cart = self.Cart.add_product(self.owner, self.chair.id, 1)
+        self.assertEqual([line['quantity'] for line in cart['lines']], [3, 1])
+        self.assertEqual(cart['amount_total'], 330.0)
+
+        lamp_line = cart['lines'][1]['id']
+        cart = self.Cart.set_quantity(self.owner, lamp_line, 0)
+        self.assertEqual(len(cart['lines']), 1)
+        self.assertIsNone(self.Cart.set_quantity(self.owner, lamp_line, 2))
+        self.assertIsNone(self.Cart.add_product(self.owner, 0, 1))
+
+        self.assertEqual(self.Cart.get_cart(self.owner)['amount_total'], 300.0)
+        self.assertEqual(self._order_count(), orders_before)
+
+    def test_materialize_and_sync(self):
+        self.Cart.add_product(self.owner, self.chair.id, 2)
+        order = self.Cart.materialize(self.owner)
+        self.assertEqual(order.state, 'draft')
+        self.assertEqual(order.x_cart_owner, self.owner)
+        self.assertEqual(order.partner_id.email, self.owner.split(':', 1)[1])
+        self.assertEqual(order.order_line.product_uom_qty, 2)
+
+        cart = self.Cart.add_product(self.owner, self.lamp.id, 1)
+        self.Cart.set_quantity(self.owner, cart['lines'][0]['id'], 0)
+        self.assertEqual(self.Cart.materialize(self.owner), order)
+        self.assertEqual(order.order_line.product_id, self.lamp)
+
+    def test_hydrate_from_draft_order(self):
+        self.Cart.add_product(self.owner, self.chair.id, 4)
+        order = self.Cart.materialize(self.owner)
+        get_cart_store().delete(self.env.cr.dbname, self.owner)
+
+        cart = self.Cart.get_cart(self.owner)
+        self.assertEqual(cart['order_id'], order.id)
+        self.assertEqual([(line['product_id'], line['quantity']) for line in cart['lines']], [(self.chair.id, 4)])
+
+    def test_idle_cart_persisted_and_discarded_on_confirm(self):
+        cart = self.Cart.add_product(self.owner, self.chair.id, 1)
+        cart['updated_at'] = time.time() - 2 * 3600
+        self.Cart._save(self.owner, cart)
+
+        self.Cart.cron_persist_idle_carts()
+        order = self.env['sale.order'].search([('x_cart_owner', '=', self.owner)])
+        self.assertEqual(len(order), 1)
+        self.assertNotIn(self.owner, get_cart_store().idle_owners(self.env.cr.dbname, time.time()))
+
+        order.action_confirm()
+        self.assertIsNone(get_cart_store().get(self.env.cr.dbname, self.owner))
+
+    def test_concurrent_updates_serialized(self):
+        store = get_cart_store()
+        db = self.env.cr.dbname
+        store.save(db, self.owner, {'next_line_id': 1, 'updated_at': time.time()}, pending=False)
+
+        def add_line():
+            # Lecture-modification-écriture comme add_product, fenêtre élargie
+            with store.lock(db, self.owner):
+                cart = store.get(db, self.owner)
+                time.sleep(0.01)
+                cart['next_line_id'] += 1
+                store.save(db, self.owner, cart, pending=False)
+
+        threads = [threading.Thread(target=add_line) for _i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(store.get(db, self.owner)['next_line_id'], 11)
+
+    def test_checkout_read_materializes(self):
+        cart = self.Cart.add_product(self.owner, self.chair.id, 2)
+        self.assertIsNone(cart['order_id'])
+
+        cart = self.Cart.get_cart(self.owner, for_checkout=True)
+        order = self.env['sale.order'].browse(cart['order_id'])
+        self.assertEqual(order.x_cart_owner, self.owner)
+        self.assertEqual(order.amount_total, cart['amount_total'])
+
+
+@tagged('post_install', '-at_install')
+class TestCartPayment(HttpCase):
+    """Paiement d'un panier du store : commande brouillon créée ou resynchronisée"""
+
+    def setUp(self):
+        super().setUp()
+        self.chair = self.env['product.product'].create({
+            'name': 'Chaise Paiement', 'list_price': 100.0, 'taxes_id': [(6, 0, [])],
+        })
+        self.email = f'pay-{uuid.uuid4().hex[:12]}@quelyos.test'
+        self.owner = f'guest:{self.email}'
+        self.addCleanup(get_cart_store().delete, self.env.cr.dbname, self.owner)
+        self.Cart = self.env['quelyos.cart']
+
+    def _jsonrpc(self, route, params):
+        response = self.url_open(route, data=json.dumps({
+            'jsonrpc': '2.0', 'method': 'call', 'id': 1, 'params': params,
+        }), headers={'Content-Type': 'application/json'})
+        return response.json()['result']
+
+    def test_paypal_order_from_cart(self):
+        self.Cart.add_product(self.owner, self.chair.id, 2)
+        result = self._jsonrpc('/api/ecommerce/payment/paypal/create-order', {'guest_email': self.email})
+        self.assertTrue(result['success'])
+        order = self.env['sale.order'].browse(result['order']['id'])
+        self.assertEqual(order.x_cart_owner, self.owner)
+        self.assertEqual(order.order_line.product_uom_qty, 2)
+
+        # Panier modifié après matérialisation : resynchronisé avant paiement
+        self.Cart.add_product(self.owner, self.chair.id, 1)
+        result = self._jsonrpc('/api/ecommerce/payment/paypal/create-order', {'order_id': order.id})
+        self.assertEqual(result['order']['id'], order.id)
+        order.invalidate_recordset()
+        self.assertEqual(order.order_line.product_uom_qty, 3)
+
+    def test_stripe_without_cart(self):
+        result = self._jsonrpc('/api/ecommerce/payment/stripe/create-intent', {'guest_email': self.email})
+        self.assertFalse(result['success'])
+        self.assertFalse(self.env['sale.order'].search([('x_cart_owner', '=', self.owner)]))
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestCartStoreBenchmark(BenchmarkMixin, CartStoreCase):
+    """Latence d'ajout au panier (store + calcul prix/taxes de la ligne)"""
+
+    def test_add_latency(self):
+        p95 = self.assertP95Less(lambda: self.Cart.add_product(self.owner, self.chair.id, 1), 500, 0.020)
+        _logger.info("Cart store benchmark: add_to_cart p95 %.2f ms (%s)", p95 * 1000, type(get_cart_store()).__name__)
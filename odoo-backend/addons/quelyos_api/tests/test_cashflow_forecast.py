@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la prévision de trésorerie (quelyos.cashflow.forecast)
+
+Benchmark entraînement (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_FORECAST_LINES (défaut : 1 000 000 lignes).
+"""
+
+import logging
+import os
+import time
+import unittest
+from datetime import date, timedelta
+
+import numpy as np
+
+from odoo.tests import tagged
+
+from odoo.addons.quelyos_api.models.finance.cashflow_forecast import (
+    evaluate_cashflow_model,
+    fit_cashflow_model,
+    predict_cashflow_model,
+)
+
+from .common import FinanceReportCase, clone_rows
+
+_logger = logging.getLogger(__name__)
+
+BENCH_FORECAST_LINES = int(os.environ.get('QUELYOS_BENCH_FORECAST_LINES', 1000000))
+
+
+class TestCashflowModel(unittest.TestCase):
+    """Ajustement NumPy : tendance + saisonnalité hebdomadaire"""
+
+    WEEKLY = np.array([3000, 1000, 1000, 1000, 1000, -2000, -4000])
+
+    def _signal(self, days):
+        return 500 + 5 * days + self.WEEKLY[days % 7]
+
+    def setUp(self):
+        days = np.arange(400)
+        self.values = self._signal(days) + np.random.default_rng(7).normal(0, 100, len(days))
+
+    def test_fit_recovers_trend_and_seasonality(self):
+        params = fit_cashflow_model(self.values)
+        self.assertEqual(params['yearly_order'], 4)
+
+        future_days = np.arange(400, 407)
+        future = predict_cashflow_model(params, future_days)
+        np.testing.assert_allclose(future, self._signal(future_days), atol=300)
+
+    def test_holdout_metrics(self):
+        metrics = evaluate_cashflow_model(self.values)
+        self.assertLess(metrics['mae'], 300)
+        self.assertGreater(metrics['r2'], 0.5)
+        self.assertEqual(evaluate_cashflow_model(self.values[:20])['mae'], None)
+
+
+@tagged('post_install', '-at_install')
+class TestCashflowForecast(FinanceReportCase):
+    """Historique agrégé par tenant, modèle en cache, prédictions 30/60/90 jours"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Encaissement hebdomadaire sur dix semaines
+        cls.first_day = date.today() - timedelta(days=70)
+        for week in range(10):
+            cls._create_posted_move(cls.first_day + timedelta(weeks=week), cls.account_bank, cls.account_income, 1000.0)
+        cls.Forecast = cls.env['quelyos.cashflow.forecast']
+
+    def test_train_and_predict(self):
+        forecast = self.Forecast.train(self.tenant)
+        self.assertEqual(forecast.data_points, 10)
+        self.assertEqual(forecast.history_start, self.first_day)
+        self.assertEqual(self.Forecast.train(self.tenant), forecast)
+
+        result = forecast.predict(30)
+        self.assertEqual(len(result['predictions']), 30)
+        self.assertEqual(set(result['summary']), {'days30', 'days60', 'days90'})
+
+        # Pic de la semaine prédite le jour des encaissements
+        week = result['predictions'][:7]
+        peak = max(week, key=lambda prediction: prediction['predicted'])
+        self.assertEqual(date.fromisoformat(peak['date']).weekday(), self.first_day.weekday())
+
+    def test_insufficient_history(self):
+        other = self.env['quelyos.tenant'].create({
+            'name': 'Tenant Sans Historique',
+            'code': 'tenant-forecast-empty',
+            'domain': 'forecast-empty.quelyos.test',
+            'company_id': self.env.company.id,
+        })
+        self.assertFalse(self.Forecast.train(other))
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestCashflowForecastBenchmark(FinanceReportCase):
+    """Temps d'entraînement d'un tenant avec trois ans de trésorerie"""
+
+    def test_train_latency(self):
+        move = self._create_posted_move(date.today() - timedelta(days=1), self.account_bank, self.account_income, 100.0)
+        bank_line = move.line_ids.filtered(lambda line: line.account_id == self.account_bank)
+        self.env.flush_all()
+        clone_rows(self.env.cr, 'account_move_line', bank_line.ids, BENCH_FORECAST_LINES, {
+            'date': 't.date - (gs % 1095)',
+            'debit': '(gs % 500)',
+            'balance': '(gs % 500)',
+        })
+        self.env.invalidate_all()
+
+        start = time.perf_counter()
+        forecast = self.env['quelyos.cashflow.forecast'].train(self.tenant, 36)
+        duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        forecast.predict(90)
+        predict_duration = time.perf_counter() - start
+
+        _logger.info(
+            "Cash-flow forecast benchmark: %d lines, %d days, train %.2f s, predict %.1f ms",
+            BENCH_FORECAST_LINES, forecast.data_points, duration, predict_duration * 1000,
+        )
+        self.assertLess(duration, 5.0)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des KPIs CFO et du stock de métriques mensuelles (quelyos.finance.metric)
+
+Benchmark tendances (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_CFO_LINES (défaut : 1 000 000 lignes).
+"""
+
+import calendar
+import logging
+import os
+import time
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+
+from odoo.tests import tagged
+
+from .common import BenchmarkMixin, FinanceReportCase, clone_rows
+
+_logger = logging.getLogger(__name__)
+
+BENCH_CFO_LINES = int(os.environ.get('QUELYOS_BENCH_CFO_LINES', 1000000))
+
+
+class CFOMetricCase(FinanceReportCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.account_expense = cls.env['account.account'].create({
+            'name': 'Achats test',
+            'code': '607900',
+            'account_type': 'expense',
+        })
+        cls.today = date.today()
+        cls._create_posted_move(cls.today, cls.account_receivable, cls.account_income, 1200.0, cls.partner)
+        cls._create_posted_move(cls.today, cls.account_bank, cls.account_receivable, 200.0, cls.partner)
+        cls._create_posted_move(cls.today, cls.account_expense, cls.account_payable, 500.0, cls.partner)
+        cls.Metric = cls.env['quelyos.finance.metric']
+
+
+@tagged('post_install', '-at_install')
+class TestCFOMetrics(CFOMetricCase):
+    """KPIs calculés depuis les écritures validées, maintenus à la validation"""
+
+    def test_kpis(self):
+        kpis = self.Metric.get_kpis(self.tenant)
+        days = self.today.day
+        self.assertAlmostEqual(kpis['dso']['value'], round(1000.0 * days / 1200.0, 2))
+        self.assertAlmostEqual(kpis['dpo']['value'], float(days))
+        self.assertAlmostEqual(kpis['netProfitMargin']['value'], round(700.0 / 1200.0 * 100, 2))
+        self.assertAlmostEqual(kpis['workingCapital']['value'], 1200.0 - 500.0)
+        # Actif : créances 1000 + banque 200 ; fonds de roulement 700
+        self.assertAlmostEqual(kpis['workingCapitalRatio']['value'], round(700.0 / 1200.0, 2))
+        self.assertAlmostEqual(kpis['currentRatio']['value'], round(1200.0 / 500.0, 2))
+
+    def test_cashflow_summary(self):
+        summary = self.Metric.get_cashflow_summary(self.tenant)
+        self.assertEqual(summary['inflows']['total'], 200.0)
+        self.assertEqual(summary['inflows']['customerPayments'], 200.0)
+        self.assertEqual(summary['closingBalance'], 200.0)
+
+    def test_incremental_update(self):
+        before = self.Metric.get_kpis(self.tenant)['workingCapital']['value']
+        move = self._create_posted_move(self.today, self.account_bank, self.account_income, 300.0)
+        self.assertAlmostEqual(self.Metric.get_kpis(self.tenant)['workingCapital']['value'], before + 300.0)
+
+        move.button_draft()
+        self.assertAlmostEqual(self.Metric.get_kpis(self.tenant)['workingCapital']['value'], before)
+
+        incremental = self.Metric.get_trends(self.tenant, 'dso', 3)
+        self.Metric._refresh_buckets({(self.tenant.id, self.today.replace(day=1))})
+        self.assertEqual(self.Metric.get_trends(self.tenant, 'dso', 3), incremental)
+
+    def test_pending_month_recorded_once(self):
+        self.Metric._refresh_pending(limit=None)
+        moves = self.env['account.move'].search([('tenant_id', '=', self.tenant.id)])
+        self.Metric._mark_moves_dirty(moves)
+        self.Metric._mark_moves_dirty(moves)
+        self.env.cr.execute("SELECT tenant_id, period FROM quelyos_finance_metric_pending")
+        self.assertEqual(self.env.cr.fetchall(), [(self.tenant.id, self.today.replace(day=1))])
+
+        self.Metric.cron_refresh_pending()
+        self.env.cr.execute("SELECT count(*) FROM quelyos_finance_metric_pending")
+        self.assertEqual(self.env.cr.fetchone()[0], 0)
+
+    def test_trends_carry_balances(self):
+        last_month = self.today.replace(day=1) - relativedelta(months=1)
+        self._create_posted_move(last_month, self.account_receivable, self.account_income, 600.0, self.partner)
+
+        trends = self.Metric.get_trends(self.tenant, 'dso', 3)
+        self.assertEqual([point['month'] for point in trends][-2:], [
+            last_month.strftime('%Y-%m'), self.today.strftime('%Y-%m'),
+        ])
+        self.assertIsNone(trends[0]['value'])
+        # Mois clos : créances 600 / facturé 600 sur tout le mois
+        self.assertEqual(trends[-2]['value'], calendar.monthrange(last_month.year, last_month.month)[1])
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestCFOMetricsBenchmark(BenchmarkMixin, CFOMetricCase):
+    """Lecture des tendances 24 mois sur un tenant d'un million de lignes validées"""
+
+    def test_trends_latency(self):
+        self.env.flush_all()
+        lines = self.env['account.move.line'].search([('tenant_id', '=', self.tenant.id)])
+        clone_rows(self.env.cr, 'account_move_line', lines.ids, BENCH_CFO_LINES // len(lines), {
+            'date': 't.date - (gs % 730)',
+        })
+        self.env.invalidate_all()
+
+        start = time.perf_counter()
+        self.env.cr.execute("""
+            SELECT DISTINCT tenant_id, date_trunc('month', date)::date
+            FROM account_move_line WHERE tenant_id = %s
+        """, (self.tenant.id,))
+        self.Metric._refresh_buckets(self.env.cr.fetchall())
+        rebuild = time.perf_counter() - start
+
+        p95 = self.assertP95Less(lambda: self.Metric.get_trends(self.tenant, 'dso', 24), 20, 0.050)
+
+        _logger.info(
+            "CFO metrics benchmark: %d lines, 24-month rebuild %.1f s, trends p95 %.1f ms",
+            BENCH_CFO_LINES, rebuild, p95 * 1000,
+        )
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la consolidation multi-sociétés (quelyos.finance.consolidation)
+
+Benchmark consolidation (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_CONSOLIDATION_LINES (défaut : 1 000 000 lignes par société).
+"""
+
+import logging
+import os
+import time
+from datetime import date
+
+from odoo.tests import TransactionCase, tagged
+
+from .common import clone_rows
+
+_logger = logging.getLogger(__name__)
+
+BENCH_CONSOLIDATION_LINES = int(os.environ.get('QUELYOS_BENCH_CONSOLIDATION_LINES', 1000000))
+
+
+class ConsolidationCase(TransactionCase):
+    """Groupe mère + filiale, chacune avec son plan de comptes minimal"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Company = cls.env['res.company']
+        cls.parent_company = Company.create({'name': 'Groupe Test Consolidation'})
+        cls.subsidiary = Company.create({
+            'name': 'Filiale Test Consolidation',
+            'parent_id': cls.parent_company.id,
+        })
+        cls.env.user.company_ids |= cls.parent_company | cls.subsidiary
+
+        cls.tenant = cls.env['quelyos.tenant'].create({
+            'name': 'Tenant Consolidation',
+            'code': 'tenant-consolidation',
+            'domain': 'consolidation.quelyos.test',
+            'company_id': cls.parent_company.id,
+        })
+
+        cls.accounts = {}
+        cls.journals = {}
+        for company in cls.parent_company | cls.subsidiary:
+            Account = cls.env['account.account'].with_company(company)
+            cls.accounts[company.id] = {
+                account_type: Account.create({
+                    'name': f'{account_type} test',
+                    'code': code,
+                    'account_type': account_type,
+                    'reconcile': account_type in ('asset_receivable', 'liability_payable'),
+                })
+                for account_type, code in (
+                    ('asset_receivable', '411800'),
+                    ('liability_payable', '401800'),
+                    ('income', '707800'),
+                    ('expense', '607800'),
+                    ('asset_cash', '512800'),
+                )
+            }
+            cls.journals[company.id] = cls.env['account.journal'].with_company(company).create({
+                'name': 'Opérations diverses consolidation',
+                'code': 'QCON',
+                'type': 'general',
+            })
+
+        cls.today = date.today()
+        # Vente intra-groupe : la mère facture 1 000 à la filiale
+        cls._post_entry(cls.parent_company, 'asset_receivable', 'income', 1000.0, cls.subsidiary.partner_id)
+        cls._post_entry(cls.subsidiary, 'expense', 'liability_payable', 1000.0, cls.parent_company.partner_id)
+        # Vente externe de la filiale
+        cls._post_entry(cls.subsidiary, 'asset_cash', 'income', 400.0)
+
+        cls.Consolidation = cls.env['quelyos.finance.consolidation']
+
+    @classmethod
+    def _post_entry(cls, company, debit_type, credit_type, amount, partner=None, move_date=None):
+        move = cls.env['account.move'].with_company(company).create({
+            'move_type': 'entry',
+            'journal_id': cls.journals[company.id].id,
+            'date': move_date or cls.today,
+            'tenant_id': cls.tenant.id,
+            'line_ids': [
+                (0, 0, {
+                    'name': 'Débit',
+                    'account_id': cls.accounts[company.id][debit_type].id,
+                    'partner_id': partner.id if partner else False,
+                    'debit': amount,
+                    'credit': 0.0,
+                }),
+                (0, 0, {
+                    'name': 'Crédit',
+                    'account_id': cls.accounts[company.id][credit_type].id,
+                    'partner_id': partner.id if partner else False,
+                    'debit': 0.0,
+                    'credit': amount,
+                }),
+            ],
+        })
+        move.action_post()
+        return move
+
+
+@tagged('post_install', '-at_install')
+class TestConsolidation(ConsolidationCase):
+    """Agrégation par société, éliminations inter-sociétés, cache des résultats"""
+
+    def test_entities(self):
+        entities = self.Consolidation.get_entities(self.tenant)
+        self.assertEqual([entity['id'] for entity in entities], [self.parent_company.id, self.subsidiary.id])
+        self.assertEqual(entities[1]['parent'], self.parent_company.id)
+        self.assertEqual(entities[1]['type'], 'subsidiary')
+
+    def test_balance_sheet_eliminations(self):
+        result = self.Consolidation.get_balance_sheet(self.tenant, self.today, workers=1)
+        current_assets = result['report']['assets']['current']
+        self.assertEqual(current_assets['entities'], {str(self.parent_company.id): 1000.0, str(self.subsidiary.id): 400.0})
+        self.assertEqual(current_assets['eliminations'], -1000.0)
+        self.assertEqual(current_assets['consolidated'], 400.0)
+        self.assertEqual(result['report']['liabilities']['current']['consolidated'], 0.0)
+        self.assertEqual(result['report']['assets']['total']['consolidated'], result['report']['liabilities']['total']['consolidated'])
+
+        [elimination] = result['eliminations']
+        self.assertEqual(elimination['type'], 'inter_company_receivables')
+        self.assertEqual(elimination['debit'], 1000.0)
+        self.assertEqual(elimination['difference'], 0.0)
+
+    def test_profit_loss_eliminations(self):
+        result = self.Consolidation.get_profit_loss(self.tenant, self.today.replace(day=1), self.today, workers=1)
+        report = result['report']
+        self.assertEqual(report['revenue']['consolidated'], 400.0)
+        self.assertEqual(report['operatingExpenses']['consolidated'], 0.0)
+        self.assertEqual(report['netProfit']['consolidated'], 400.0)
+        self.assertEqual([elimination['type'] for elimination in result['eliminations']], ['inter_company_sales'])
+
+    def test_proportional_consolidation(self):
+        self.subsidiary.consolidation_percent = 50.0
+        report = self.Consolidation.get_profit_loss(self.tenant, self.today.replace(day=1), self.today, workers=1)
+        # Filiale à 50 % : 200 de ventes externes, 500 d'achats intra-groupe rapprochés
+        self.assertEqual(report['report']['revenue']['entities'][str(self.subsidiary.id)], 200.0)
+        self.assertEqual(report['eliminations'][0]['debit'], 500.0)
+        self.assertEqual(report['eliminations'][0]['difference'], 500.0)
+
+    def test_cache_invalidated_on_post(self):
+        first = self.Consolidation.get_balance_sheet(self.tenant, self.today, workers=1)
+        self.assertEqual(self.Consolidation.get_balance_sheet(self.tenant, self.today, workers=1), first)
+
+        self._post_entry(self.subsidiary, 'asset_cash', 'income', 100.0)
+        result = self.Consolidation.get_balance_sheet(self.tenant, self.today, workers=1)
+        self.assertEqual(result['report']['assets']['current']['consolidated'], 500.0)
+
+    def test_stale_result_not_read_after_post(self):
+        Cache = self.env['quelyos.consolidation.cache']
+        companies = self.parent_company | self.subsidiary
+        versions = Cache._get_versions_key(companies.ids)
+        stale = self.Consolidation.get_balance_sheet(self.tenant, self.today, workers=1)
+
+        self._post_entry(self.subsidiary, 'asset_cash', 'income', 100.0)
+        self.assertNotEqual(Cache._get_versions_key(companies.ids), versions)
+        # Calcul concurrent terminé après la validation : stocké sous les anciennes versions
+        [row] = Cache.search([('cache_key', 'like', f'%:{versions}:%')])
+        Cache._store(row.cache_key, row.company_key, stale)
+
+        result = self.Consolidation.get_balance_sheet(self.tenant, self.today, workers=1)
+        self.assertEqual(result['report']['assets']['current']['consolidated'], 500.0)
+
+    def test_missing_rate_flagged_until_rate_created(self):
+        currency = self.env.ref('base.CHF')
+        currency.active = True
+        self.assertNotEqual(currency, self.parent_company.currency_id)
+        self.env['res.currency.rate'].search([('currency_id', '=', currency.id)]).unlink()
+        foreign = self.env['res.company'].create({
+            'name': 'Filiale CHF consolidation',
+            'parent_id': self.parent_company.id,
+            'currency_id': currency.id,
+        })
+
+        result = self.Consolidation.get_balance_sheet(self.tenant, self.today, workers=1)
+        self.assertIn(foreign.id, [entity['id'] for entity in result['entities']])
+        self.assertEqual(result['missingRates'], ['CHF'])
+
+        self.env['res.currency.rate'].create({'currency_id': currency.id, 'name': self.today, 'rate': 2.0})
+        result = self.Consolidation.get_balance_sheet(self.tenant, self.today, workers=1)
+        self.assertEqual(result['missingRates'], [])
+
+    def test_purge(self):
+        Cache = self.env['quelyos.consolidation.cache']
+        self.Consolidation.get_balance_sheet(self.tenant, self.today, workers=1)
+        Cache._invalidate_companies(self.subsidiary.ids)
+        Cache._invalidate_companies(self.subsidiary.ids)
+        versions = Cache._get_versions_key(self.subsidiary.ids)
+        self.env.cr.execute(
+            "UPDATE quelyos_consolidation_cache SET computed_at = computed_at - interval '2 days'"
+        )
+        self.env.invalidate_all()
+
+        Cache.cron_purge()
+        self.assertFalse(Cache.search([]))
+        self.assertEqual(Cache._get_versions_key(self.subsidiary.ids), versions)
+        self.env.cr.execute(
+            "SELECT count(*) FROM quelyos_consolidation_version WHERE company_id = %s", (self.subsidiary.id,),
+        )
+        self.assertEqual(self.env.cr.fetchone()[0], 1)
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestConsolidationBenchmark(ConsolidationCase):
+    """Bilan consolidé de deux sociétés d'un million de lignes validées chacune"""
+
+    def test_balance_sheet_latency(self):
+        self.env.flush_all()
+        for company in self.parent_company | self.subsidiary:
+            lines = self.env['account.move.line'].search([('company_id', '=', company.id)])
+            clone_rows(self.env.cr, 'account_move_line', lines.ids, BENCH_CONSOLIDATION_LINES // len(lines), {
+                'date': 't.date - (gs % 730)',
+            })
+        self.env.invalidate_all()
+
+        start = time.perf_counter()
+        result = self.Consolidation.get_balance_sheet(self.tenant, self.today, workers=1)
+        duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.Consolidation.get_balance_sheet(self.tenant, self.today, workers=1)
+        cached = time.perf_counter() - start
+
+        _logger.info(
+            "Consolidation benchmark: %d lines per company, balance sheet %.2f s, cached %.1f ms",
+            BENCH_CONSOLIDATION_LINES, duration, cached * 1000,
+        )
+        self.assertEqual(len(result['entities']), 2)
+        self.assertLess(duration, 5.0)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Tests du store d'événements (lib/event_store.py) sur Redis
+
+Chaque test écrit sous un préfixe de clés unique, supprimé en fin de test.
+Ignorés si Redis (REDIS_URL) n'est pas joignable.
+"""
+
+import unittest
+import uuid
+
+from odoo.addons.quelyos_api.lib.event_store import (
+    Event, EventStore, EventType, ProductStockProjection,
+)
+
+
+class TestEventStore(unittest.TestCase):
+    """Snapshots, reconstruction bornée et journaux tronqués"""
+
+    def _store(self, **kwargs):
+        prefix = f"events-test-{uuid.uuid4().hex[:12]}"
+        store = EventStore(key_prefix=prefix, **kwargs)
+        if not store._redis:
+            self.skipTest("Redis indisponible")
+        self.addCleanup(lambda: [store._redis.delete(key) for key in store._redis.scan_iter(f"{prefix}:*")])
+        return store
+
+    def _adjust(self, store, product_id, quantity):
+        event = Event.create(EventType.STOCK_ADJUSTED, 'product', product_id, {'quantity': quantity})
+        self.assertTrue(store.append(event))
+
+    def test_snapshot_replay_matches_full_replay(self):
+        store = self._store(snapshot_interval=10)
+        projection = ProductStockProjection(max_movements=5)
+        store.register_snapshot_projection('product', projection)
+        for i in range(35):
+            self._adjust(store, 'p1', i + 1)
+
+        snapshot = store.get_snapshot('product', 'p1', projection)
+        self.assertEqual(snapshot['version'], 30)
+
+        from_snapshot = store.replay('product', 'p1', projection)
+        full = store.replay('product', 'p1', projection, use_snapshot=False)
+        self.assertEqual(from_snapshot, full)
+        self.assertEqual(full['quantity'], sum(range(1, 36)))
+        self.assertEqual(full['movements_total'], 35)
+        self.assertEqual([movement['quantity'] for movement in full['movements']], [31, 32, 33, 34, 35])
+
+    def test_rebuild_replays_only_events_after_snapshot(self):
+        store = self._store(snapshot_interval=10)
+        projection = ProductStockProjection()
+        store.register_snapshot_projection('product', projection)
+        for _i in range(47):
+            self._adjust(store, 'p2', 1)
+
+        applied = []
+        apply = projection.apply
+        projection.apply = lambda state, event: applied.append(event.version) or apply(state, event)
+        state = store.replay('product', 'p2', projection)
+
+        self.assertEqual(applied, list(range(41, 48)))
+        self.assertEqual(state['quantity'], 47)
+
+    def test_snapshot_keyed_by_projection_parameters(self):
+        store = self._store(snapshot_interval=5)
+        store.register_snapshot_projection('product', ProductStockProjection(max_movements=2))
+        for i in range(5):
+            self._adjust(store, 'p3', i + 1)
+
+        wide = ProductStockProjection(max_movements=10)
+        self.assertIsNone(store.get_snapshot('product', 'p3', wide))
+        self.assertEqual(len(store.replay('product', 'p3', wide)['movements']), 5)
+
+    def test_feeds_trimmed_aggregate_stream_kept(self):
+        store = self._store(snapshot_interval=0, feed_maxlen=100)
+        for _i in range(1000):
+            self._adjust(store, 'p4', 1)
+
+        self.assertLess(store._redis.xlen(store._global_stream_key), 1000)
+        self.assertLess(store._redis.xlen(store._type_stream_key(EventType.STOCK_ADJUSTED.value)), 1000)
+        self.assertEqual(len(store.get_events('product', 'p4')), 1000)
+
+        events, _cursor = store.read_stream(limit=10)
+        self.assertGreater(events[0].version, 1)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des moteurs de rapports Finance (balance générale, FEC, balance âgée, grand livre)
+
+Les benchmarks sont tagués `quelyos_benchmark` et exclus du lancement standard :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_LINES (défaut : 2 000 000 lignes).
+"""
+
+import logging
+import os
+import time
+from datetime import date
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from .common import FinanceReportCase, clone_rows
+
+_logger = logging.getLogger(__name__)
+
+BENCH_LINES = int(os.environ.get('QUELYOS_BENCH_LINES', 2000000))
+
+
+@tagged('post_install', '-at_install')
+class TestTrialBalance(FinanceReportCase):
+    """Balance générale : un seul passage agrégé pour tous les comptes"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Avant période : solde initial
+        cls._create_posted_move(date(2025, 12, 15), cls.account_receivable, cls.account_income, 300.0)
+        # Pendant période
+        cls._create_posted_move(date(2026, 1, 10), cls.account_receivable, cls.account_income, 1000.0)
+        cls._create_posted_move(date(2026, 1, 20), cls.account_bank, cls.account_receivable, 400.0)
+        # Après période : ignoré
+        cls._create_posted_move(date(2026, 3, 1), cls.account_receivable, cls.account_income, 999.0)
+
+    def _generate(self, **extra):
+        wizard = self.env['quelyos.finance.trial_balance'].create(dict({
+            'tenant_id': self.tenant.id,
+            'date_from': date(2026, 1, 1),
+            'date_to': date(2026, 1, 31),
+        }, **extra))
+        return wizard.generate_report()
+
+    def test_balances_per_account(self):
+        """Solde initial, mouvements et solde final par compte"""
+        report = self._generate()
+        lines = {line['accountId']: line for line in report['lines']}
+
+        receivable = lines[self.account_receivable.id]
+        self.assertAlmostEqual(receivable['initialBalance'], 300.0)
+        self.assertAlmostEqual(receivable['debit'], 1000.0)
+        self.assertAlmostEqual(receivable['credit'], 400.0)
+        self.assertAlmostEqual(receivable['endBalance'], 900.0)
+
+        income = lines[self.account_income.id]
+        self.assertAlmostEqual(income['initialBalance'], -300.0)
+        self.assertAlmostEqual(income['endBalance'], -1300.0)
+
+        self.assertAlmostEqual(report['totals']['debit'], report['totals']['credit'])
+        self.assertAlmostEqual(report['totals']['endBalance'], 0.0)
+
+    def _count_report_queries(self):
+        wizard = self.env['quelyos.finance.trial_balance'].create({
+            'tenant_id': self.tenant.id,
+            'date_from': date(2026, 1, 1),
+            'date_to': date(2026, 1, 31),
+        })
+        self.env.flush_all()
+        self.env.invalidate_all()
+        start = self.env.cr.sql_log_count
+        wizard.generate_report()
+        return self.env.cr.sql_log_count - start
+
+    def test_query_count_independent_of_accounts(self):
+        """Le nombre de requêtes ne dépend pas du nombre de comptes"""
+        baseline = self._count_report_queries()
+        self._create_posted_move(date(2026, 1, 25), self.account_payable, self.account_bank, 50.0)
+        self.assertEqual(self._count_report_queries(), baseline)
+
+    def test_journal_filter_applies_to_period_only(self):
+        """Le filtre journal ne modifie pas le solde initial"""
+        other_journal = self.env['account.journal'].create({
+            'name': 'Autre journal', 'code': 'QOTH', 'type': 'general',
+        })
+        report = self._generate(journal_ids=[(6, 0, other_journal.ids)], hide_zero_balance=False,
+                                account_ids=[(6, 0, self.account_receivable.ids)])
+        receivable = report['lines'][0]
+        self.assertAlmostEqual(receivable['initialBalance'], 300.0)
+        self.assertAlmostEqual(receivable['debit'], 0.0)
+        self.assertAlmostEqual(receivable['credit'], 0.0)
+
+
+@tagged('post_install', '-at_install')
+class TestFECExport(FinanceReportCase):
+    """Export FEC en flux : lots de lignes, fichier temporaire, pièce jointe"""
+
+    def test_streamed_export_across_chunks(self):
+        """Le fichier est identique quel que soit le découpage en lots"""
+        for day in range(1, 4):
+            self._create_posted_move(date(2026, 2, day), self.account_receivable, self.account_income, 100.0 * day,
+                                     partner=self.partner)
+
+        FecExport = self.env['quelyos.finance.fec_export']
+        wizard = FecExport.create({
+            'tenant_id': self.tenant.id,
+            'date_from': date(2026, 1, 1),
+            'date_to': date(2026, 12, 31),
+        })
+        with patch.object(type(FecExport), '_fec_chunk_size', 2):
+            result = wizard.generate_fec_file()
+
+        self.assertEqual(result['lines_count'], 6)
+        attachment = self.env['ir.attachment'].search([
+            ('res_model', '=', wizard._name),
+            ('res_id', '=', wizard.id),
+            ('res_field', '=', 'fec_data'),
+        ])
+        content = attachment.raw.decode('utf-8').splitlines()
+        self.assertEqual(len(content), 6)
+        self.assertTrue(all(len(row.split('|')) == 18 for row in content))
+        self.assertIn('|300,00|0,00|', content[4])
+
+    def test_empty_period_raises(self):
+        wizard = self.env['quelyos.finance.fec_export'].create({
+            'tenant_id': self.tenant.id,
+            'date_from': date(2020, 1, 1),
+            'date_to': date(2020, 12, 31),
+        })
+        with self.assertRaises(ValueError):
+            wizard.generate_fec_file()
+
+
+@tagged('post_install', '-at_install')
+class TestAgedReceivables(FinanceReportCase):
+    """Balance âgée : tranches calculées en une requête pour tous les partenaires"""
+
+    def test_buckets_for_all_partners(self):
+        other_partner = self.env['res.partner'].create({'name': 'Autre client'})
+        date_at = date(2026, 6, 30)
+        self._create_posted_move(date(2026, 6, 20), self.account_receivable, self.account_income, 100.0,
+                                 partner=self.partner)
+        self._create_posted_move(date(2026, 5, 15), self.account_receivable, self.account_income, 200.0,
+                                 partner=self.partner)
+        self._create_posted_move(date(2026, 4, 15), self.account_receivable, self.account_income, 300.0,
+                                 partner=self.partner)
+        self._create_posted_move(date(2025, 12, 1), self.account_receivable, self.account_income, 400.0,
+                                 partner=other_partner)
+
+        report = self.env['quelyos.finance.aged_receivables'].create({
+            'tenant_id': self.tenant.id,
+            'date_at': date_at,
+        }).generate_report()
+
+        partners = {partner['id']: partner for partner in report['partners']}
+        self.assertEqual(set(partners), {self.partner.id, other_partner.id})
+        self.assertAlmostEqual(partners[self.partner.id]['current'], 100.0)
+        self.assertAlmostEqual(partners[self.partner.id]['period1'], 200.0)
+        self.assertAlmostEqual(partners[self.partner.id]['period2'], 300.0)
+        self.assertAlmostEqual(partners[other_partner.id]['period3'], 400.0)
+        self.assertAlmostEqual(report['totals']['total'], 1000.0)
+        # Tri par total décroissant conservé
+        self.assertEqual(report['partners'][0]['id'], self.partner.id)
+
+
+@tagged('post_install', '-at_install')
+class TestGeneralLedger(FinanceReportCase):
+    """Grand livre : solde progressif fenêtré et pagination par clé"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._create_posted_move(date(2025, 12, 31), cls.account_bank, cls.account_income, 50.0)
+        for day in range(1, 8):
+            cls._create_posted_move(date(2026, 1, day), cls.account_bank, cls.account_income, 10.0 * day)
+        cls.ledger = cls.env['quelyos.finance.general_ledger'].create({
+            'tenant_id': cls.tenant.id,
+            'date_from': date(2026, 1, 1),
+            'date_to': date(2026, 1, 31),
+        })
+
+    def test_running_balance(self):
+        report = self.ledger.generate_report()
+        bank = next(acc for acc in report['accounts'] if acc['accountId'] == self.account_bank.id)
+        self.assertAlmostEqual(bank['initialBalance'], 50.0)
+        self.assertEqual([line['balance'] for line in bank['lines']], [60.0, 80.0, 110.0, 150.0, 200.0, 260.0, 330.0])
+        self.assertAlmostEqual(bank['endBalance'], 330.0)
+
+    def test_keyset_pages_match_full_report(self):
+        report = self.ledger.generate_report()
+        bank = next(acc for acc in report['accounts'] if acc['accountId'] == self.account_bank.id)
+
+        paged_lines, cursor = [], None
+        while True:
+            page = self.ledger.get_account_lines_page(self.account_bank.id, cursor=cursor, limit=3)
+            paged_lines.extend(page['lines'])
+            cursor = page['nextCursor']
+            if not cursor:
+                break
+
+        self.assertEqual([line['id'] for line in paged_lines], [line['id'] for line in bank['lines']])
+        self.assertEqual([line['balance'] for line in paged_lines], [line['balance'] for line in bank['lines']])
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestTrialBalanceBenchmark(FinanceReportCase):
+    """Benchmark balance générale sur un grand livre de plusieurs millions de lignes"""
+
+    def test_trial_balance_large_ledger(self):
+        move = self._create_posted_move(date(2026, 6, 30), self.account_receivable, self.account_income, 10.0)
+        accounts = [self.account_receivable, self.account_payable, self.account_income, self.account_bank]
+        account_ids = ','.join(str(account.id) for account in accounts)
+
+        self.env.flush_all()
+        clone_rows(self.env.cr, 'account_move_line', move.line_ids.ids, BENCH_LINES // 2, {
+            'account_id': f"(ARRAY[{account_ids}])[1 + (gs + t.id) %% {len(accounts)}]",
+            'date': "t.date - (gs %% 730)",
+        })
+        self.env.invalidate_all()
+
+        wizard = self.env['quelyos.finance.trial_balance'].create({
+            'tenant_id': self.tenant.id,
+            'date_from': date(2026, 1, 1),
+            'date_to': date(2026, 6, 30),
+        })
+
+        start = time.perf_counter()
+        report = wizard.generate_report()
+        elapsed = time.perf_counter() - start
+
+        _logger.info(
+            "Trial balance benchmark: %d lignes, %d comptes, %.2fs",
+            BENCH_LINES, len(report['lines']), elapsed,
+        )
+        self.assertAlmostEqual(report['totals']['debit'], report['totals']['credit'], places=2)
+        self.assertAlmostEqual(report['totals']['endBalance'], 0.0, places=2)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de l'analyse de stock du catalogue (quelyos.inventory.analytics)
+
+Benchmark catalogue (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_INVENTORY_PRODUCTS (défaut : 100 000 articles)
+et QUELYOS_BENCH_INVENTORY_MOVES (défaut : 2 000 000 mouvements).
+"""
+
+import logging
+import os
+import time
+import unittest
+from datetime import date, datetime, time as dt_time, timedelta
+
+import numpy as np
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.quelyos_api.models.inventory_analytics import (
+    abc_classes,
+    demand_statistics,
+    forecast_demand,
+    xyz_classes,
+)
+
+from .common import clone_rows
+
+_logger = logging.getLogger(__name__)
+
+BENCH_INVENTORY_PRODUCTS = int(os.environ.get('QUELYOS_BENCH_INVENTORY_PRODUCTS', 100000))
+BENCH_INVENTORY_MOVES = int(os.environ.get('QUELYOS_BENCH_INVENTORY_MOVES', 2000000))
+
+
+class TestDemandStatistics(unittest.TestCase):
+    """Réductions np.bincount identiques aux calculs sur séries denses"""
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.dense = rng.poisson(2.0, size=(50, 120)) * (rng.random((50, 120)) < 0.6)
+        self.dense[7] = 0  # produit sans vente
+        self.rows, self.days = np.nonzero(self.dense)
+        self.stats = demand_statistics(self.rows, self.days, self.dense[self.rows, self.days], 50, 120)
+
+    def test_matches_dense_computation(self):
+        np.testing.assert_allclose(self.stats['total'], self.dense.sum(axis=1))
+        np.testing.assert_allclose(self.stats['ma_7'], self.dense[:, -7:].mean(axis=1))
+        np.testing.assert_allclose(self.stats['ma_90'], self.dense[:, -90:].mean(axis=1))
+
+        slopes, intercepts = np.polyfit(np.arange(120), self.dense.T, 1)
+        np.testing.assert_allclose(self.stats['slope'], slopes, atol=1e-9)
+        np.testing.assert_allclose(self.stats['intercept'], intercepts, atol=1e-9)
+
+        active = self.dense.mean(axis=1) > 0
+        np.testing.assert_allclose(self.stats['cv'][active], (self.dense.std(axis=1) / self.dense.mean(axis=1))[active])
+        self.assertTrue(np.isnan(self.stats['cv'][7]))
+
+    def test_forecast_methods(self):
+        flat = forecast_demand(self.stats, 120, 30)
+        self.assertEqual(flat.shape, (50, 30))
+        np.testing.assert_allclose(flat[:, 0], np.where(self.stats['ma_7'] > 0, self.stats['ma_7'], self.stats['ma_30']))
+        self.assertTrue((forecast_demand(self.stats, 120, 30, 'linear_trend') >= 0).all())
+
+    def test_classes(self):
+        order, cumulative_pct, classes = abc_classes([10.0, 700.0, 290.0], 70, 99)
+        self.assertEqual(order.tolist(), [1, 2, 0])
+        np.testing.assert_allclose(cumulative_pct, [70.0, 99.0, 100.0])
+        self.assertEqual(classes.tolist(), ['A', 'B', 'C'])
+        self.assertEqual(xyz_classes([0.2, 0.8, 3.0, np.nan]).tolist(), ['X', 'Y', 'Z', 'Z'])
+
+
+class InventoryAnalyticsCase(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tenant = cls.env['quelyos.tenant'].create({
+            'name': 'Tenant Stock Analytics',
+            'code': 'tenant-stock-analytics',
+            'domain': 'stock-analytics.quelyos.test',
+            'company_id': cls.env.company.id,
+        })
+        Product = cls.env['product.product']
+        cls.regular = Product.create({
+            'name': 'Article Régulier', 'is_storable': True, 'standard_price': 10.0, 'tenant_id': cls.tenant.id,
+        })
+        cls.occasional = Product.create({
+            'name': 'Article Occasionnel', 'is_storable': True, 'standard_price': 2.0, 'tenant_id': cls.tenant.id,
+        })
+
+        cls.stock = cls.env['stock.warehouse'].search([('company_id', '=', cls.env.company.id)], limit=1).lot_stock_id
+        cls.customers = cls.env.ref('stock.stock_location_customers')
+        cls.env['stock.quant']._update_available_quantity(cls.regular, cls.stock, 100)
+        cls.env['stock.quant']._update_available_quantity(cls.occasional, cls.stock, 10)
+
+        # 2 unités par jour sur 10 jours ; 5 unités une seule fois
+        cls.today = date.today()
+        for offset in range(10):
+            cls._sell(cls.regular, 2, cls.today - timedelta(days=offset))
+        cls._sell(cls.occasional, 5, cls.today - timedelta(days=4))
+
+        cls.Analytics = cls.env['quelyos.inventory.analytics']
+
+    @classmethod
+    def _sell(cls, product, qty, day):
+        move = cls.env['stock.move'].create({
+            'name': f'Vente {product.name}',
+            'product_id': product.id,
+            'product_uom': product.uom_id.id,
+            'product_uom_qty': qty,
+            'location_id': cls.stock.id,
+            'location_dest_id': cls.customers.id,
+        })
+        move._action_confirm()
+        move._action_assign()
+        move._set_quantity_done(qty)
+        move._action_done()
+        move.date = datetime.combine(day, dt_time(12))
+        return move
+
+
+@tagged('post_install', '-at_install')
+class TestInventoryAnalytics(InventoryAnalyticsCase):
+    """Catalogue du tenant analysé en une passe, prévisions groupées"""
+
+    def test_abc_xyz(self):
+        result = self.Analytics.get_abc_analysis(self.tenant, threshold_a=99, threshold_b=99.5, period_days=10)
+        products = result['products']
+        self.assertEqual([product['id'] for product in products], [self.regular.id, self.occasional.id])
+        self.assertEqual([product['category'] for product in products], ['A', 'C'])
+        self.assertEqual([product['xyz'] for product in products], ['X', 'Z'])
+        self.assertEqual(products[0]['value'], 800.0)
+        self.assertEqual(result['kpis']['total_value'], 810.0)
+        self.assertEqual(result['kpis']['category_a']['count'], 1)
+
+    def test_catalog_cache(self):
+        catalog = self.Analytics.get_catalog(self.tenant, period_days=10)
+        self._sell(self.occasional, 1, self.today)
+        self.assertEqual(self.Analytics.get_catalog(self.tenant, period_days=10), catalog)
+        fresh = self.Analytics.get_catalog(self.tenant, period_days=10, use_cache=False)
+        self.assertNotEqual(fresh['qty'], catalog['qty'])
+
+    def test_store_is_an_upsert(self):
+        warehouse = self.stock.warehouse_id
+        for tenant_id, warehouse_id in ((self.tenant.id, warehouse.id), (self.tenant.id, False), (False, False)):
+            self.Analytics._store_catalog(tenant_id, warehouse_id, 10, {'ids': [1]})
+            self.Analytics._store_catalog(tenant_id, warehouse_id, 10, {'ids': [2]})
+            row = self.Analytics.search([
+                ('tenant_id', '=', tenant_id), ('warehouse_id', '=', warehouse_id), ('period_days', '=', 10),
+            ])
+            self.assertEqual(len(row), 1)
+            self.assertEqual(row.data, {'ids': [2]})
+
+    def test_forecast(self):
+        forecasts = self.Analytics.get_forecast([self.regular.id, self.occasional.id], 7, 'moving_average', 10)
+        regular = forecasts[self.regular.id]
+        self.assertEqual([point['qty_sold'] for point in regular['historical']], [2.0] * 10)
+        self.assertEqual(regular['metrics']['total_forecast'], 14.0)
+        self.assertEqual(regular['metrics']['current_stock'], 80.0)
+        self.assertEqual(regular['recommendations'][0]['type'], 'info')
+
+        occasional = forecasts[self.occasional.id]
+        self.assertEqual(sum(point['qty_sold'] for point in occasional['historical']), 5.0)
+        self.assertEqual(
+            self.Analytics.get_forecast([self.regular.id], 7, 'linear_trend', 10)[self.regular.id]['metrics']['total_forecast'],
+            14.0,
+        )
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestInventoryAnalyticsBenchmark(InventoryAnalyticsCase):
+    """Analyse d'un catalogue de 100 000 articles sur un an de ventes"""
+
+    def test_catalog_latency(self):
+        self.env.flush_all()
+        clone_rows(self.env.cr, 'product_product', self.regular.ids, BENCH_INVENTORY_PRODUCTS, {
+            'combination_indices': "'bench-' || gs",
+            'default_code': "'BENCH-' || gs",
+        })
+        self.env.cr.execute("SELECT min(id) FROM product_product WHERE default_code LIKE 'BENCH-%%'")
+        first_id = self.env.cr.fetchone()[0]
+
+        quant = self.env['stock.quant'].search([('product_id', '=', self.regular.id), ('location_id', '=', self.stock.id)])
+        clone_rows(self.env.cr, 'stock_quant', quant.ids, BENCH_INVENTORY_PRODUCTS, {
+            'product_id': f'{first_id} + gs - 1',
+            'quantity': '(gs % 100)',
+        })
+        move = self.env['stock.move'].search([('product_id', '=', self.regular.id)], limit=1)
+        clone_rows(self.env.cr, 'stock_move', move.ids, BENCH_INVENTORY_MOVES, {
+            'product_id': f'{first_id} + (gs % {BENCH_INVENTORY_PRODUCTS})',
+            'date': f"t.date - ((gs / {BENCH_INVENTORY_PRODUCTS}) % 365) * interval '1 day'",
+        })
+        self.env.invalidate_all()
+
+        start = time.perf_counter()
+        catalog = self.Analytics.get_catalog(self.tenant, period_days=365, use_cache=False)
+        duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.Analytics.get_abc_analysis(self.tenant, period_days=365)
+        abc_duration = time.perf_counter() - start
+
+        _logger.info(
+            "Inventory analytics benchmark: %d products, %d moves, catalog %.2f s, ABC %.2f s",
+            len(catalog['ids']), BENCH_INVENTORY_MOVES, duration, abc_duration,
+        )
+        self.assertLess(duration, 10.0)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Tests du worker de jobs (lib/job_worker.py) sur le backend mémoire
+
+Même sémantique que le backend Redis : priorité, différé, retries avec
+backoff, reprise après expiration de la visibilité.
+"""
+
+import time
+import unittest
+
+from odoo.addons.quelyos_api.lib.job_queue import JobQueue, JobPriority, JobStatus, MemoryJobBackend
+from odoo.addons.quelyos_api.lib.job_worker import JobWorker
+
+
+class TestJobWorker(unittest.TestCase):
+    """Consommation des files par JobWorker"""
+
+    def setUp(self):
+        self.now = time.time()
+        self.backend = MemoryJobBackend()
+        self.queue = JobQueue(backend=self.backend)
+        self.calls = []
+
+        def record(payload):
+            self.calls.append(payload['n'])
+            return {'n': payload['n']}
+
+        def fail(payload):
+            raise ValueError('boom')
+
+        self.worker = JobWorker(
+            'default', self.backend,
+            handlers={'record': record, 'fail': fail},
+            clock=lambda: self.now,
+        )
+
+    def _drain(self):
+        while self.worker.run_once():
+            pass
+
+    def test_priority_order(self):
+        self.queue.enqueue('record', {'n': 1}, priority=JobPriority.LOW)
+        self.queue.enqueue('record', {'n': 2}, priority=JobPriority.NORMAL)
+        self.queue.enqueue('record', {'n': 3}, priority=JobPriority.CRITICAL)
+        self.queue.enqueue('record', {'n': 4}, priority=JobPriority.NORMAL)
+        self._drain()
+        self.assertEqual(self.calls, [3, 2, 4, 1])
+
+    def test_delayed_job(self):
+        job_id = self.queue.enqueue('record', {'n': 1}, delay=60)
+        self.assertFalse(self.worker.run_once())
+        self.now += 61
+        self._drain()
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(self.queue.get_status(job_id)['status'], JobStatus.COMPLETED.value)
+
+    def test_retry_with_backoff_then_failure(self):
+        job_id = self.queue.enqueue('fail', {}, max_retries=2)
+        self._drain()
+        job = self.queue.get_status(job_id)
+        self.assertEqual(job['status'], JobStatus.RETRYING.value)
+        self.assertEqual(self.queue.get_queue_stats()['scheduled'], 1)
+
+        # Pas de nouvelle tentative avant l'échéance du backoff
+        self.now += 10
+        self.assertFalse(self.worker.run_once())
+
+        for _attempt in range(2):
+            self.now += 3600 * 2
+            self._drain()
+        job = self.queue.get_status(job_id)
+        self.assertEqual(job['status'], JobStatus.FAILED.value)
+        self.assertEqual(job['retry_count'], 2)
+        self.assertEqual(job['attempts'], 3)
+
+    def test_visibility_timeout_reclaims_crashed_job(self):
+        job_id = self.queue.enqueue('record', {'n': 7})
+        # Un worker réclame le job puis meurt sans acquitter
+        self.assertEqual(self.backend.claim('default', self.now, 30), job_id)
+        self.assertFalse(self.worker.run_once())
+
+        self.now += 31
+        self._drain()
+        self.assertEqual(self.calls, [7])
+        self.assertEqual(self.queue.get_queue_stats()['processing'], 0)
+
+    def test_cancelled_job_not_run(self):
+        job_id = self.queue.enqueue('record', {'n': 1})
+        self.assertTrue(self.queue.cancel(job_id))
+        self._drain()
+        self.assertEqual(self.calls, [])
+
+    def test_unknown_handler_not_retried(self):
+        job_id = self.queue.enqueue('missing', {})
+        self._drain()
+        self.assertEqual(self.queue.get_status(job_id)['status'], JobStatus.FAILED.value)
+        self.assertEqual(self.queue.get_queue_stats()['scheduled'], 0)
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Tests du catalogue POS synchronisé par deltas (quelyos.pos.catalog.change)
+
+Benchmark catalogue (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_POS_CATALOG_PRODUCTS (défaut : 50 000 produits).
+"""
+
+import logging
+import os
+import time
+
+from odoo.tests import tagged
+
+from .common import POSCase, clone_rows
+from ..models.pos_catalog import POS_CATALOG_FIELDS, POS_CATALOG_HORIZON_PARAM
+
+_logger = logging.getLogger(__name__)
+
+BENCH_POS_CATALOG_PRODUCTS = int(os.environ.get('QUELYOS_BENCH_POS_CATALOG_PRODUCTS', 50000))
+
+
+class POSCatalogCase(POSCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Catalog = cls.env['quelyos.pos.catalog.change']
+        cls.coffee.barcode = 'POS-COFFEE'
+
+    def _rows(self, data):
+        return {row[0]: dict(zip(POS_CATALOG_FIELDS, row)) for row in data['products']}
+
+
+@tagged('post_install', '-at_install')
+class TestPOSCatalog(POSCatalogCase):
+    """Instantané compact, deltas par watermark de transaction et rechargement forcé"""
+
+    def test_snapshot(self):
+        first = self.Catalog.get_snapshot(self.config, limit=1)
+        self.assertEqual(len(first['products']), 1)
+        self.assertTrue(first['nextAfterId'])
+
+        rows = {}
+        after_id = 0
+        while after_id is not None:
+            page = self.Catalog.get_snapshot(self.config, after_id=after_id)
+            rows.update(self._rows(page))
+            after_id = page['nextAfterId']
+
+        coffee = rows[self.coffee.id]
+        self.assertEqual(coffee['barcode'], 'POS-COFFEE')
+        self.assertEqual(coffee['price'], 2.5)
+        self.assertEqual(coffee['taxIds'], [])
+        self.assertEqual(coffee['stock'], 100000)
+        self.assertIn(self.croissant.id, rows)
+
+    def test_changes_since_watermark(self):
+        snapshot = self.Catalog.get_snapshot(self.config)
+        self.coffee.write({'barcode': 'POS-COFFEE-2', 'list_price': 2.8})
+        self.croissant.active = False
+        self.env['stock.quant']._update_available_quantity(self.coffee, self.warehouse.lot_stock_id, -10)
+
+        changes = self.Catalog.get_changes(self.config, snapshot['watermark'], snapshot['catalogKey'])
+        self.assertFalse(changes['reset'])
+        coffee = self._rows(changes)[self.coffee.id]
+        self.assertEqual((coffee['barcode'], coffee['price'], coffee['stock']), ('POS-COFFEE-2', 2.8, 99990))
+        self.assertIn(self.croissant.id, changes['removed'])
+        self.assertNotIn(self.croissant.id, self._rows(changes))
+        self.assertGreaterEqual(changes['watermark'], snapshot['watermark'])
+
+    def test_pricelist_rules(self):
+        snapshot = self.Catalog.get_snapshot(self.config)
+        self.env['product.pricelist.item'].create({
+            'pricelist_id': self.config.pricelist_id.id,
+            'applied_on': '0_product_variant',
+            'product_id': self.coffee.id,
+            'compute_price': 'fixed',
+            'fixed_price': 2.0,
+        })
+        changes = self.Catalog.get_changes(self.config, snapshot['watermark'], snapshot['catalogKey'])
+        self.assertFalse(changes['reset'])
+        self.assertEqual(self._rows(changes)[self.coffee.id]['price'], 2.0)
+
+        self.env['product.pricelist.item'].create({
+            'pricelist_id': self.config.pricelist_id.id,
+            'applied_on': '3_global',
+            'compute_price': 'percentage',
+            'percent_price': 10,
+        })
+        self.assertTrue(self.Catalog.get_changes(self.config, snapshot['watermark'], snapshot['catalogKey'])['reset'])
+
+    def test_reset_on_stale_terminal(self):
+        snapshot = self.Catalog.get_snapshot(self.config)
+        self.assertTrue(self.Catalog.get_changes(self.config, snapshot['watermark'], 'autre:terminal:0')['reset'])
+
+        self.env['ir.config_parameter'].set_param(POS_CATALOG_HORIZON_PARAM, snapshot['watermark'] + 1)
+        self.assertTrue(self.Catalog.get_changes(self.config, snapshot['watermark'], snapshot['catalogKey'])['reset'])
+
+    def test_watermark_below_open_transactions(self):
+        self.coffee.list_price = 2.9
+        self.env.cr.execute("""
+            SELECT xid, pg_current_xact_id()::text::bigint FROM quelyos_pos_catalog_change
+            WHERE product_id = %s ORDER BY id DESC LIMIT 1
+        """, (self.coffee.id,))
+        row_xid, current_xid = self.env.cr.fetchone()
+        self.assertEqual(row_xid, current_xid)
+
+        # Transaction encore ouverte : ses lignes restent au-dessus du watermark
+        snapshot = self.Catalog.get_snapshot(self.config)
+        self.assertLessEqual(snapshot['watermark'], row_xid)
+        changes = self.Catalog.get_changes(self.config, snapshot['watermark'], snapshot['catalogKey'])
+        self.assertEqual(self._rows(changes)[self.coffee.id]['price'], 2.9)
+
+    def test_changes_paged_by_last_id(self):
+        snapshot = self.Catalog.get_snapshot(self.config)
+        self.coffee.list_price = 2.9
+        self.croissant.list_price = 1.9
+
+        first = self.Catalog.get_changes(self.config, snapshot['watermark'], snapshot['catalogKey'], limit=1)
+        self.assertTrue(first['hasMore'])
+        self.assertTrue(first['lastId'])
+        seen = set(self._rows(first)) | set(first['removed'])
+        page = first
+        while page['hasMore']:
+            page = self.Catalog.get_changes(
+                self.config, snapshot['watermark'], snapshot['catalogKey'], limit=1, after_id=page['lastId'],
+            )
+            seen |= set(self._rows(page)) | set(page['removed'])
+        self.assertIsNone(page['lastId'])
+        self.assertLessEqual({self.coffee.id, self.croissant.id}, seen)
+
+    def test_compaction(self):
+        for price in (2.6, 2.7, 2.8):
+            self.coffee.list_price = price
+        self.Catalog.cron_compact_changes()
+        self.assertEqual(self.Catalog.search_count([('product_id', '=', self.coffee.id)]), 1)
+
+        changes = self.Catalog.get_changes(self.config, 0)
+        self.assertEqual(self._rows(changes)[self.coffee.id]['price'], 2.8)
+
+    def test_purge_moves_horizon(self):
+        snapshot = self.Catalog.get_snapshot(self.config)
+        self.coffee.list_price = 2.9
+        self.env.cr.execute("""
+            UPDATE quelyos_pos_catalog_change SET changed_at = changed_at - interval '1 year'
+            WHERE product_id = %s
+        """, (self.coffee.id,))
+        self.Catalog.cron_compact_changes()
+        self.assertTrue(self.Catalog.get_changes(self.config, snapshot['watermark'], snapshot['catalogKey'])['reset'])
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestPOSCatalogBenchmark(POSCatalogCase):
+    """Instantané d'un grand catalogue et delta de 100 modifications"""
+
+    def test_catalog_latency(self):
+        clone_rows(self.env.cr, 'product_product', self.croissant.ids, BENCH_POS_CATALOG_PRODUCTS, {
+            'combination_indices': "'bench-' || gs",
+            'barcode': "'BENCH-' || gs",
+        })
+        self.env.invalidate_all()
+
+        start = time.perf_counter()
+        snapshot = self.Catalog.get_snapshot(self.config)
+        count = len(snapshot['products'])
+        after_id = snapshot['nextAfterId']
+        while after_id is not None:
+            page = self.Catalog.get_snapshot(self.config, after_id=after_id)
+            count += len(page['products'])
+            after_id = page['nextAfterId']
+        snapshot_duration = time.perf_counter() - start
+
+        products = self.env['product.product'].search([('barcode', '=like', 'BENCH-%')], limit=100)
+        for product in products:
+            product.barcode = f'{product.barcode}-v2'
+
+        start = time.perf_counter()
+        changes = self.Catalog.get_changes(self.config, snapshot['watermark'], snapshot['catalogKey'])
+        delta_duration = time.perf_counter() - start
+
+        _logger.info(
+            "POS catalog benchmark: snapshot %d products in %.2f s, delta %d products in %.1f ms",
+            count, snapshot_duration, len(changes['products']), delta_duration * 1000,
+        )
+        self.assertGreaterEqual(count, BENCH_POS_CATALOG_PRODUCTS)
+        self.assertLess(delta_duration, 1.0)
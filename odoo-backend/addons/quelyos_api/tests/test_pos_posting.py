@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la passation stock / compta des ventes POS (par ticket ou par session)
+
+Benchmark encaissement (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_POS_TICKETS (défaut : 500 tickets par mode).
+"""
+
+import logging
+import os
+import time
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from .common import POSCase
+
+_logger = logging.getLogger(__name__)
+
+BENCH_POS_TICKETS = int(os.environ.get('QUELYOS_BENCH_POS_TICKETS', 500))
+
+
+class POSPostingCase(POSCase):
+
+    def _pay_ticket(self, lines):
+        """Crée et encaisse un ticket ; lines : [(produit, quantité)]"""
+        order = self.env['quelyos.pos.order'].create({
+            'session_id': self.session.id,
+            'line_ids': [(0, 0, {
+                'product_id': product.id,
+                'quantity': quantity,
+                'price_unit': product.list_price,
+            }) for product, quantity in lines],
+        })
+        order.action_pay([{
+            'payment_method_id': self.cash.id,
+            'amount': sum(product.list_price * quantity for product, quantity in lines),
+        }])
+        return order
+
+    def _close_session(self):
+        self.session.action_start_closing()
+        self.session.action_close()
+
+
+@tagged('post_install', '-at_install')
+class TestPOSPosting(POSPostingCase):
+    """Passation par ticket (défaut) et agrégée à la clôture de session"""
+
+    def test_order_mode(self):
+        order = self._pay_ticket([(self.coffee, 2)])
+        self.assertTrue(order.is_posted)
+        self.assertEqual(order.picking_ids.state, 'done')
+        self.assertEqual(order.invoice_id.state, 'posted')
+
+        self._close_session()
+        self.assertFalse(self.session.picking_ids)
+        self.assertFalse(self.session.account_move_ids)
+
+    def test_session_mode(self):
+        self.config.posting_mode = 'session'
+        orders = (
+            self._pay_ticket([(self.coffee, 2), (self.croissant, 1)])
+            | self._pay_ticket([(self.coffee, 1)])
+            | self._pay_ticket([(self.croissant, 3)])
+        )
+        self.assertFalse(orders.picking_ids)
+        self.assertFalse(orders.invoice_id)
+        self.assertFalse(any(orders.mapped('is_posted')))
+
+        self._close_session()
+        self.assertEqual(self.session.state, 'closed')
+        self.assertTrue(all(orders.mapped('is_posted')))
+
+        picking = self.session.picking_ids
+        self.assertEqual(picking.state, 'done')
+        self.assertEqual(
+            {move.product_id: move.quantity for move in picking.move_ids},
+            {self.coffee: 3.0, self.croissant: 4.0},
+        )
+
+        move = self.session.account_move_ids
+        self.assertEqual(move.state, 'posted')
+        lines = {line.account_id: (line.debit, line.credit) for line in move.line_ids}
+        self.assertEqual(lines, {self.account_income: (0.0, 13.5), self.account_cash: (13.5, 0.0)})
+
+    def test_reopened_session_posts_new_orders_only(self):
+        self.config.posting_mode = 'session'
+        self._pay_ticket([(self.coffee, 1)])
+        self._close_session()
+
+        self.session.action_reopen()
+        self._pay_ticket([(self.croissant, 2)])
+        self._close_session()
+
+        self.assertEqual(len(self.session.picking_ids), 2)
+        self.assertEqual(
+            sorted(sum(move.line_ids.mapped('debit')) for move in self.session.account_move_ids), [2.5, 3.0],
+        )
+
+    def test_mode_switched_during_session(self):
+        self.config.posting_mode = 'session'
+        order = self._pay_ticket([(self.coffee, 2)])
+        self.config.posting_mode = 'order'
+
+        self._close_session()
+        self.assertTrue(order.is_posted)
+        self.assertEqual(self.session.picking_ids.move_ids.quantity, 2.0)
+        self.assertEqual(self.session.account_move_ids.state, 'posted')
+
+    def test_failed_accounting_posted_at_close(self):
+        AccountMove = type(self.env['account.move'])
+        with patch.object(AccountMove, 'action_post', side_effect=UserError("Journal verrouillé")):
+            order = self._pay_ticket([(self.coffee, 2)])
+        self.assertFalse(order.is_posted)
+        self.assertEqual(order.picking_ids.state, 'done')
+        self.assertFalse(order.invoice_id)
+
+        self._close_session()
+        self.assertTrue(order.is_posted)
+        self.assertEqual(order.invoice_id.state, 'posted')
+        # Stock déjà sorti au ticket : pas de bon de session
+        self.assertFalse(self.session.picking_ids)
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestPOSPostingBenchmark(POSPostingCase):
+    """Latence d'encaissement d'un ticket selon le mode de passation"""
+
+    def _bench(self):
+        start = time.perf_counter()
+        for i in range(BENCH_POS_TICKETS):
+            self._pay_ticket([(self.coffee, 1 + i % 3), (self.croissant, 1)])
+        return (time.perf_counter() - start) * 1000 / BENCH_POS_TICKETS
+
+    def test_payment_latency(self):
+        order_mode = self._bench()
+
+        self.config.posting_mode = 'session'
+        session_mode = self._bench()
+
+        start = time.perf_counter()
+        self._close_session()
+        close_duration = time.perf_counter() - start
+
+        _logger.info(
+            "POS posting benchmark: %d tickets, %.1f ms/ticket (order), %.1f ms/ticket (session), close %.2f s",
+            BENCH_POS_TICKETS, order_mode, session_mode, close_duration,
+        )
+        self.assertLess(session_mode, order_mode / 3)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des compteurs de session POS (tenus à jour à chaque encaissement)
+
+Benchmark lecture de session (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_POS_SESSION_TICKETS (défaut : 5 000 tickets).
+"""
+
+import logging
+import os
+import time
+
+from odoo.tests import tagged
+
+from .common import POSCase
+
+_logger = logging.getLogger(__name__)
+
+BENCH_POS_SESSION_TICKETS = int(os.environ.get('QUELYOS_BENCH_POS_SESSION_TICKETS', 5000))
+
+
+class POSSessionTotalsCase(POSCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.config.posting_mode = 'session'
+        cls.card = cls.env['quelyos.pos.payment.method'].create({
+            'name': 'Carte test',
+            'code': 'card-test',
+            'type': 'card',
+            'journal_id': cls.cash_journal.id,
+        })
+
+    def _pay_ticket(self, lines, payments):
+        """Crée et encaisse un ticket ; lines : [(produit, quantité)], payments : [(méthode, montant)]"""
+        order = self.env['quelyos.pos.order'].create({
+            'session_id': self.session.id,
+            'line_ids': [(0, 0, {
+                'product_id': product.id,
+                'quantity': quantity,
+                'price_unit': product.list_price,
+            }) for product, quantity in lines],
+        })
+        order.action_pay([
+            {'payment_method_id': method.id, 'amount': amount} for method, amount in payments
+        ])
+        return order
+
+    def _totals(self):
+        self.session.invalidate_recordset()
+        return (
+            self.session.order_count, self.session.total_amount, self.session.total_cash,
+            self.session.total_card, self.session.total_returns,
+        )
+
+
+@tagged('post_install', '-at_install')
+class TestPOSSessionTotals(POSSessionTotalsCase):
+    """Compteurs incrémentaux, rapprochement à la clôture et rapport Z agrégé"""
+
+    def test_counters_follow_payments(self):
+        self.assertEqual(self._totals(), (0, 0.0, 0.0, 0.0, 0.0))
+
+        self._pay_ticket([(self.coffee, 2)], [(self.cash, 10.0)])
+        first = self._pay_ticket([(self.croissant, 2)], [(self.card, 1.0), (self.cash, 2.0)])
+        self.assertEqual(self._totals(), (2, 8.0, 12.0, 1.0, 5.0))
+        self.assertEqual(self.session.theoretical_closing_cash, self.session.opening_cash + 12.0 - 5.0)
+
+        first.action_cancel()
+        self.assertEqual(self._totals(), (1, 5.0, 10.0, 0.0, 5.0))
+
+        draft = self.env['quelyos.pos.order'].create({
+            'session_id': self.session.id,
+            'line_ids': [(0, 0, {'product_id': self.coffee.id, 'quantity': 1, 'price_unit': 2.5})],
+        })
+        self.env['quelyos.pos.payment'].create({
+            'order_id': draft.id, 'payment_method_id': self.cash.id, 'amount': 2.5,
+        })
+        self.assertEqual(self._totals(), (1, 5.0, 10.0, 0.0, 5.0))
+
+    def test_counters_match_orders(self):
+        for i in range(5):
+            self._pay_ticket([(self.coffee, 1 + i)], [(self.cash if i % 2 else self.card, 2.5 * (1 + i))])
+        self.assertEqual(
+            {fname: self.session[fname] for fname in self.session._get_orders_totals()[self.session.id]},
+            self.session._get_orders_totals()[self.session.id],
+        )
+
+    def test_close_reconciles_drift(self):
+        self._pay_ticket([(self.coffee, 2)], [(self.cash, 5.0)])
+        self.env.cr.execute("UPDATE quelyos_pos_session SET total_amount = 99 WHERE id = %s", (self.session.id,))
+        self.env.invalidate_all()
+
+        self.session.action_start_closing()
+        self.session.action_close()
+        self.assertEqual(self.session.total_amount, 5.0)
+        self.assertTrue(any(
+            'Compteurs de session corrigés' in body for body in self.session.message_ids.mapped('body')
+        ))
+
+    def test_z_report(self):
+        self._pay_ticket([(self.coffee, 2), (self.croissant, 1)], [(self.cash, 6.5)])
+        self._pay_ticket([(self.croissant, 4)], [(self.card, 6.0)])
+
+        report = self.session.get_z_report_data()
+        self.assertEqual(
+            {row['method']: (row['count'], row['amount']) for row in report['paymentsByMethod']},
+            {self.cash.name: (1, 6.5), self.card.name: (1, 6.0)},
+        )
+        self.assertEqual(
+            [(row['name'], row['quantity'], row['amount']) for row in report['topProducts']],
+            [(self.croissant.name, 5.0, 7.5), (self.coffee.name, 2.0, 5.0)],
+        )
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestPOSSessionTotalsBenchmark(POSSessionTotalsCase):
+    """Lecture d'une session ouverte de 5 000 tickets"""
+
+    def test_session_read_latency(self):
+        for i in range(BENCH_POS_SESSION_TICKETS):
+            self._pay_ticket([(self.coffee, 1 + i % 3)], [(self.cash, 2.5 * (1 + i % 3))])
+
+        self.env.invalidate_all()
+        start = time.perf_counter()
+        data = self.session.to_frontend_dict()
+        read_duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.session.get_z_report_data()
+        report_duration = time.perf_counter() - start
+
+        _logger.info(
+            "POS session totals benchmark: %d tickets, session read %.1f ms, Z report %.1f ms",
+            BENCH_POS_SESSION_TICKETS, read_duration * 1000, report_duration * 1000,
+        )
+        self.assertEqual(data['orderCount'], BENCH_POS_SESSION_TICKETS)
+        self.assertLess(read_duration, 0.05)
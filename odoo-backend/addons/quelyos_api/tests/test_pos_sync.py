@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la synchronisation POS offline par lots (quelyos.pos.sync.job)
+
+Benchmark synchronisation (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_POS_SYNC_ORDERS (défaut : 2 000 tickets).
+"""
+
+import logging
+import os
+import time
+from unittest.mock import patch
+
+from odoo.sql_db import db_connect
+from odoo.tests import tagged
+
+from odoo.addons.quelyos_api.models.pos_sync_job import POS_SYNC_LOCK
+
+from .common import POSCase
+
+_logger = logging.getLogger(__name__)
+
+BENCH_POS_SYNC_ORDERS = int(os.environ.get('QUELYOS_BENCH_POS_SYNC_ORDERS', 2000))
+
+
+@tagged('post_install', '-at_install')
+class TestPOSSync(POSCase):
+    """Déduplication ensembliste, création groupée, stock et compta par lot"""
+
+    def _sync(self, orders):
+        job = self.env['quelyos.pos.sync.job'].create_job(orders)
+        job._execute()
+        return job
+
+    def test_batch_sync(self):
+        already = self._sync([self._offline_order('off-0', [(self.coffee, 1)])])
+        self.assertEqual(already.results[0]['status'], 'synced')
+
+        job = self._sync([
+            self._offline_order('off-1', [(self.coffee, 2), (self.croissant, 1)]),
+            self._offline_order('off-0', [(self.coffee, 1)]),
+            self._offline_order('off-2', [(self.croissant, 4)]),
+            self._offline_order('off-1', [(self.coffee, 2), (self.croissant, 1)]),
+            self._offline_order('off-3', [(self.coffee, 1)], paid=False),
+        ])
+        self.assertEqual(job.state, 'completed')
+        self.assertEqual(
+            [result['status'] for result in job.results],
+            ['synced', 'already_synced', 'synced', 'already_synced', 'synced'],
+        )
+        self.assertEqual((job.synced_count, job.duplicate_count, job.error_count), (3, 2, 0))
+        self.assertEqual(job.to_frontend_dict()['progress'], 100)
+        self.assertEqual(job.results[1]['orderId'], already.results[0]['orderId'])
+        self.assertEqual(job.results[3]['orderId'], job.results[0]['orderId'])
+
+        orders = self.env['quelyos.pos.order'].search([('session_id', '=', self.session.id)])
+        self.assertEqual(len(orders), 4)
+        self.assertEqual(len(set(orders.mapped('name'))), 4)
+
+        paid = orders.filtered(lambda order: order.state == 'paid')
+        self.assertEqual(sorted(paid.mapped('offline_id')), ['off-0', 'off-1', 'off-2'])
+        self.assertEqual(set(paid.picking_ids.mapped('state')), {'done'})
+        self.assertEqual(set(paid.invoice_id.mapped('state')), {'posted'})
+        self.assertEqual(orders.filtered(lambda order: order.offline_id == 'off-3').state, 'draft')
+        self.assertEqual(self.session.total_amount, 2.5 + 6.5 + 6.0)
+
+    def test_invalid_orders_isolated(self):
+        closed = self.env['quelyos.pos.session'].create({'config_id': self.config.id})
+        closed.state = 'closed'
+        invalid_method = self._offline_order('off-bad-method', [(self.coffee, 1)])
+        invalid_method['payments'][0]['payment_method_id'] = 999999999
+
+        job = self._sync([
+            self._offline_order('off-ok', [(self.coffee, 1)]),
+            dict(self._offline_order('off-no-product', [(self.coffee, 1)]), lines=[{'product_id': 999999999}]),
+            dict(self._offline_order('off-closed', [(self.coffee, 1)]), session_id=closed.id),
+            invalid_method,
+            self._offline_order(None, [(self.coffee, 1)]),
+        ])
+        self.assertEqual(
+            [result['status'] for result in job.results],
+            ['synced', 'error', 'error', 'error', 'error'],
+        )
+        self.assertEqual(job.results[1]['error'], 'Produit 999999999 non trouvé')
+        self.assertEqual(job.results[2]['error'], "La session n'est pas ouverte")
+        self.assertEqual(
+            self.env['quelyos.pos.order'].search([('offline_id', '=', 'off-ok')]).state, 'paid',
+        )
+        self.assertFalse(self.env['quelyos.pos.order'].search([('offline_id', '=', 'off-bad-method')]))
+
+    def _interrupted_job(self):
+        """Job dont le premier lot est committé, exécutant disparu depuis 10 minutes"""
+        first = self._sync([self._offline_order('off-r1', [(self.coffee, 1)])])
+        job = self.env['quelyos.pos.sync.job'].create_job([
+            self._offline_order('off-r1', [(self.coffee, 1)]),
+            self._offline_order('off-r2', [(self.croissant, 2)]),
+        ])
+        job.write({'state': 'running', 'results': first.results, 'processed_count': 1, 'synced_count': 1})
+        job.flush_recordset()
+        self.env.cr.execute(
+            "UPDATE quelyos_pos_sync_job SET write_date = now() - interval '10 minutes' WHERE id = %s", (job.id,),
+        )
+        job.invalidate_recordset()
+        return job
+
+    def test_stale_job_resumed_by_cron(self):
+        job = self._interrupted_job()
+        fresh = self.env['quelyos.pos.sync.job'].create_job([self._offline_order('off-r3', [(self.coffee, 1)])])
+        fresh.flush_recordset()
+        self.env.cr.execute(
+            "UPDATE quelyos_pos_sync_job SET write_date = clock_timestamp() WHERE id = %s", (fresh.id,),
+        )
+
+        with patch.object(self.env.cr, 'commit'):
+            self.assertEqual(self.env['quelyos.pos.sync.job'].cron_requeue_stale(), 1)
+        self.assertEqual(job.state, 'completed')
+        self.assertEqual([result['offlineId'] for result in job.results], ['off-r1', 'off-r2'])
+        self.assertEqual((job.processed_count, job.synced_count), (2, 2))
+        self.assertEqual(len(self.env['quelyos.pos.order'].search([('offline_id', '=', 'off-r1')])), 1)
+        self.assertEqual(fresh.state, 'pending')
+
+    def test_running_job_not_resumed(self):
+        job = self._interrupted_job()
+        # Exécutant vivant dans une autre session : verrou tenu
+        cr = db_connect(self.env.cr.dbname).cursor()
+        self.addCleanup(cr.close)
+        self.addCleanup(cr.execute, "SELECT pg_advisory_unlock_all()")
+        cr.execute("SELECT pg_advisory_lock(%s, %s)", (POS_SYNC_LOCK, job.id))
+
+        with patch.object(self.env.cr, 'commit'):
+            self.assertEqual(self.env['quelyos.pos.sync.job'].cron_requeue_stale(), 0)
+        self.assertEqual(job.state, 'running')
+        self.assertFalse(self.env['quelyos.pos.order'].search([('offline_id', '=', 'off-r2')]))
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestPOSSyncBenchmark(POSCase):
+    """Synchronisation de 2 000 tickets offline après une coupure"""
+
+    def test_sync_latency(self):
+        orders = [
+            self._offline_order(f'bench-{i}', [(self.coffee, 1 + i % 3), (self.croissant, 1)])
+            for i in range(BENCH_POS_SYNC_ORDERS)
+        ]
+        job = self.env['quelyos.pos.sync.job'].create_job(orders)
+
+        start = time.perf_counter()
+        job._execute()
+        duration = time.perf_counter() - start
+
+        _logger.info(
+            "POS sync benchmark: %d orders in %.2f s (%.1f ms/order)",
+            job.synced_count, duration, duration * 1000 / BENCH_POS_SYNC_ORDERS,
+        )
+        self.assertEqual(job.synced_count, BENCH_POS_SYNC_ORDERS)
+        self.assertLess(duration, 120.0)
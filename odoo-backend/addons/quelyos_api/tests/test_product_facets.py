@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de l'index de facettes produits (/api/ecommerce/products/facets)
+"""
+
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestProductFacets(TransactionCase):
+    """Facettes calculées par intersection de bitmaps sur l'index matérialisé"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tenant = cls.env['quelyos.tenant'].search([], limit=1)
+        cls.category = cls.env['product.public.category'].create({'name': 'Facettes test'})
+        cls.color = cls.env['product.attribute'].create({
+            'name': 'Couleur facette',
+            'value_ids': [(0, 0, {'name': 'Rouge'}), (0, 0, {'name': 'Bleu'})],
+        })
+        cls.red, cls.blue = cls.color.value_ids
+
+        def create(name, price, value, published=True):
+            return cls.env['product.template'].create({
+                'name': name,
+                'list_price': price,
+                'tenant_id': cls.tenant.id,
+                'website_published': published,
+                'public_categ_ids': [(6, 0, cls.category.ids)],
+                'attribute_line_ids': [(0, 0, {'attribute_id': cls.color.id, 'value_ids': [(6, 0, value.ids)]})],
+            })
+
+        cls.cheap_red = create('Facette A', 20.0, cls.red)
+        cls.mid_blue = create('Facette B', 80.0, cls.blue)
+        cls.hidden = create('Facette C', 80.0, cls.blue, published=False)
+
+    def _facets(self, **filters):
+        return self.env['quelyos.product.facet'].get_facets(tenant_id=self.tenant.id, **filters)
+
+    def test_counts_exclude_unpublished(self):
+        facets = self._facets(category_id=self.category.id)
+        category = next(c for c in facets['categories'] if c['id'] == self.category.id)
+        self.assertEqual(category['count'], 2)
+        colors = {value['id']: value['count'] for value in facets['attributes']['Couleur facette']}
+        self.assertEqual(colors, {self.red.id: 1, self.blue.id: 1})
+
+    def test_filters_intersect(self):
+        facets = self._facets(category_id=self.category.id, price_ranges=['50-100'])
+        colors = {value['id'] for value in facets['attributes']['Couleur facette']}
+        self.assertEqual(colors, {self.blue.id})
+
+    def test_index_follows_writes(self):
+        self.mid_blue.write({'website_published': False})
+        facets = self._facets(category_id=self.category.id)
+        category = next(c for c in facets['categories'] if c['id'] == self.category.id)
+        self.assertEqual(category['count'], 1)
+
+    def test_attribute_line_changes(self):
+        """Les lignes d'attributs modifiées directement invalident l'index"""
+        self.cheap_red.attribute_line_ids.write({'value_ids': [(6, 0, self.blue.ids)]})
+        facets = self._facets(category_id=self.category.id)
+        colors = {value['id']: value['count'] for value in facets['attributes']['Couleur facette']}
+        self.assertEqual(colors, {self.blue.id: 2})
+
+    def test_empty_index_not_rebuilt_on_read(self):
+        """Un tenant sans produit publié ne déclenche aucune reconstruction à la lecture"""
+        Facet = self.env['quelyos.product.facet']
+        empty_tenant = self.env['quelyos.tenant'].create({
+            'name': 'Tenant facettes vide',
+            'code': 'tenant-facets-empty',
+            'domain': 'facets-empty.quelyos.test',
+            'company_id': self.env.company.id,
+        })
+        with patch.object(type(Facet), '_rebuild_index') as rebuild:
+            facets = Facet.get_facets(tenant_id=empty_tenant.id)
+        rebuild.assert_not_called()
+        self.assertEqual(facets['categories'], [])
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la recherche boutique (autocomplete et recherche sémantique)
+
+Benchmark autocomplete (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_PRODUCTS (défaut : 200 000 produits).
+"""
+
+import itertools
+import logging
+import os
+
+from odoo.tests import TransactionCase, tagged
+
+from .common import BenchmarkMixin, clone_rows
+
+_logger = logging.getLogger(__name__)
+
+BENCH_PRODUCTS = int(os.environ.get('QUELYOS_BENCH_PRODUCTS', 200000))
+
+
+class ProductSearchCase(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Template = cls.env['product.template']
+        cls.phone = Template.create({
+            'name': 'Smartphone Samsung Galaxy Élite',
+            'default_code': 'SGX-100',
+            'is_published': True,
+        })
+        cls.laptop = Template.create({
+            'name': 'Ordinateur portable léger',
+            'description_sale': 'Écran 14 pouces, idéal en déplacement',
+            'is_published': True,
+        })
+        cls.hidden = Template.create({
+            'name': 'Smartphone prototype',
+            'is_published': False,
+        })
+
+    def _search(self, query, **kwargs):
+        ranked, _total, synonyms = self.env['product.template']._search_storefront(query, **kwargs)
+        return [template_id for template_id, _score in ranked], synonyms
+
+
+@tagged('post_install', '-at_install')
+class TestProductSearch(ProductSearchCase):
+    """Classement SQL : préfixes, accents, synonymes, fautes de frappe"""
+
+    def test_search_document_normalized(self):
+        self.assertTrue(self.laptop.x_search_document.startswith('ordinateur portable leger'))
+        self.assertIn('ecran 14 pouces', self.laptop.x_search_document)
+        self.assertIn('sgx-100', self.phone.x_search_document)
+
+    def test_prefix_and_accents(self):
+        ids, _synonyms = self._search('élit')
+        self.assertEqual(ids, [self.phone.id])
+
+    def test_synonyms_expanded_in_query(self):
+        ids, synonyms = self._search('telephone')
+        self.assertIn('smartphone', synonyms)
+        self.assertIn(self.phone.id, ids)
+        self.assertNotIn(self.hidden.id, ids)
+
+    def test_description_and_code(self):
+        self.assertIn(self.laptop.id, self._search('pouces')[0])
+        self.assertIn(self.phone.id, self._search('sgx')[0])
+
+    def test_broad_query_ranked_before_candidate_limit(self):
+        """Les candidats sont triés par pertinence avant la borne ; le total n'est pas borné par elle"""
+        self.env['product.template'].create([{
+            'name': f'Coque {i}',
+            'description_sale': 'Protection pour smartphone',
+            'is_published': True,
+        } for i in range(5)])
+        ranked, total, _synonyms = self.env['product.template']._search_storefront(
+            'smartphone', limit=1, candidate_limit=2,
+        )
+        self.assertEqual([template_id for template_id, _score in ranked], [self.phone.id])
+        self.assertEqual(total, 6)
+
+    def test_typo_tolerance(self):
+        if not self.env.registry.has_trigram:
+            self.skipTest("Extension pg_trgm indisponible")
+        self.assertIn(self.phone.id, self._search('samsong')[0])
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestProductSearchBenchmark(BenchmarkMixin, ProductSearchCase):
+    """Latence autocomplete sur un catalogue de plusieurs centaines de milliers de produits"""
+
+    def test_autocomplete_p95(self):
+        self.env.flush_all()
+        clone_rows(self.env.cr, 'product_template', (self.phone | self.laptop).ids, BENCH_PRODUCTS // 2, {
+            'x_search_document': "t.x_search_document || ' ' || md5(gs::text)",
+        })
+        self.env.invalidate_all()
+
+        Template = self.env['product.template']
+        queries = itertools.cycle(['sm', 'sam', 'galaxy', 'ordi', 'portable', 'telephone', 'samsong', 'ecran'])
+        p95 = self.assertP95Less(
+            lambda: Template._search_storefront(next(queries), limit=3, candidate_limit=200, with_total=False),
+            80, 0.020,
+        )
+        _logger.info("Autocomplete benchmark: %d produits, p95 %.1f ms", BENCH_PRODUCTS, p95 * 1000)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la sérialisation batch du listing /api/ecommerce/products
+
+Vérifie que le coût en requêtes d'une page ne dépend pas de sa taille.
+"""
+
+from odoo.tests import TransactionCase, tagged
+
+# PNG 1x1 transparent
+PIXEL_PNG = (
+    b'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII='
+)
+
+
+@tagged('post_install', '-at_install')
+class TestProductsListing(TransactionCase):
+    """Listing produits : stock et images chargés en lot"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stock_location = cls.env.ref('stock.stock_location_stock')
+        cls.templates = cls.env['product.template']
+        for index in range(20):
+            template = cls.env['product.template'].create({
+                'name': f'Produit listing {index}',
+                'is_storable': True,
+                'sale_ok': True,
+                'list_price': 10.0 + index,
+            })
+            cls.env['product.image'].create({
+                'name': f'Image {index}',
+                'product_tmpl_id': template.id,
+                'image_1920': PIXEL_PNG,
+            })
+            cls.env['stock.quant']._update_available_quantity(
+                template.product_variant_id, cls.stock_location, float(index),
+            )
+            cls.templates |= template
+
+    def _count_listing_queries(self, size):
+        templates = self.env['product.template'].browse(self.templates[:size].ids)
+        self.env.flush_all()
+        self.env.invalidate_all()
+        start = self.env.cr.sql_log_count
+        data = templates._get_listing_data()
+        self.assertEqual(len(data), size)
+        return self.env.cr.sql_log_count - start
+
+    def test_query_count_constant_with_page_size(self):
+        """Le nombre de requêtes d'une page ne croît pas avec sa taille"""
+        self._count_listing_queries(5)  # Préchauffage (caches registre)
+        small_page = self._count_listing_queries(5)
+        large_page = self._count_listing_queries(20)
+        self.assertEqual(small_page, large_page)
+
+    def test_stock_and_images(self):
+        data = {item['id']: item for item in self.templates._get_listing_data()}
+
+        empty = data[self.templates[0].id]
+        self.assertEqual(empty['qty_available'], 0.0)
+        self.assertEqual(empty['stock_status'], 'out_of_stock')
+
+        low = data[self.templates[3].id]
+        self.assertEqual(low['qty_available'], 3.0)
+        self.assertEqual(low['stock_status'], 'low_stock')
+
+        stocked = data[self.templates[12].id]
+        self.assertEqual(stocked['stock_status'], 'in_stock')
+        self.assertEqual(len(stocked['images']), 1)
+        self.assertTrue(stocked['images'][0]['is_main'])
+        self.assertEqual(stocked['image_url'], stocked['images'][0]['url'])
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de l'agrégat quotidien des ventes (quelyos.sales.rollup)
+
+Benchmark graphiques (exclu du lancement standard) :
+    odoo-bin -d <db> -i quelyos_api --test-tags quelyos_benchmark --stop-after-init
+Volume réglable via QUELYOS_BENCH_ROLLUP_ORDERS (défaut : 1 000 000 commandes).
+"""
+
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from odoo.tests import TransactionCase, tagged
+
+from .common import BenchmarkMixin, clone_rows
+
+_logger = logging.getLogger(__name__)
+
+BENCH_ROLLUP_ORDERS = int(os.environ.get('QUELYOS_BENCH_ROLLUP_ORDERS', 1000000))
+
+
+class SalesRollupCase(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.company = cls.env.company
+        cls.customer = cls.env['res.partner'].create({'name': 'Client Rollup', 'customer_rank': 1})
+        cls.category = cls.env['product.category'].create({'name': 'Catégorie Rollup'})
+        cls.product = cls.env['product.product'].create({
+            'name': 'Produit Rollup',
+            'categ_id': cls.category.id,
+            'list_price': 100,
+        })
+        cls.day = date.today() - timedelta(days=3)
+        cls.order = cls._create_order(cls.day, 2)
+        cls.Rollup = cls.env['quelyos.sales.rollup']
+
+    @classmethod
+    def _create_order(cls, day, qty):
+        return cls.env['sale.order'].create({
+            'partner_id': cls.customer.id,
+            'date_order': datetime.combine(day, datetime.min.time()) + timedelta(hours=10),
+            'order_line': [(0, 0, {'product_id': cls.product.id, 'product_uom_qty': qty})],
+        })
+
+    def _day_states(self, day=None):
+        day = day or self.day
+        series = self.Rollup.get_series(day, day, 'day', company=self.company)
+        return series[0]['states'] if series else {}
+
+
+@tagged('post_install', '-at_install')
+class TestSalesRollup(SalesRollupCase):
+    """Maintenance incrémentale et lecture par granularité"""
+
+    def test_state_change_moves_bucket(self):
+        draft_before = self._day_states().get('draft', {}).get('orders', 0)
+        sale_before = self._day_states().get('sale', {}).get('orders', 0)
+
+        self.order.action_confirm()
+        states = self._day_states()
+        self.assertEqual(states.get('draft', {}).get('orders', 0), draft_before - 1)
+        self.assertEqual(states['sale']['orders'], sale_before + 1)
+        self.assertGreaterEqual(states['sale']['units'], 2)
+
+    def test_date_change_and_unlink(self):
+        other_day = self.day - timedelta(days=40)
+        drafts = lambda day: self._day_states(day).get('draft', {}).get('orders', 0)
+        before, other_before = drafts(self.day), drafts(other_day)
+
+        self.order.date_order = datetime.combine(other_day, datetime.min.time())
+        self.assertEqual(drafts(self.day), before - 1)
+        self.assertEqual(drafts(other_day), other_before + 1)
+
+        self.order.unlink()
+        self.assertEqual(drafts(other_day), other_before)
+
+    def test_matches_full_rebuild(self):
+        self.order.action_confirm()
+        self._create_order(self.day, 5).order_line.product_uom_qty = 7
+        incremental = self.Rollup.get_series(self.day, None, 'month', company=self.company)
+
+        self.Rollup._refresh_buckets()
+        rebuilt = self.Rollup.get_series(self.day, None, 'month', company=self.company)
+        self.assertEqual(incremental, rebuilt)
+
+    def test_top_categories(self):
+        self.order.action_confirm()
+        top = {category['id']: category for category in self.Rollup.get_top_categories(company=self.company)}
+        self.assertEqual(top[self.category.id]['qty_sold'], 2)
+        self.assertAlmostEqual(top[self.category.id]['revenue'], round(self.order.amount_total, 2))
+
+    def _pending(self):
+        self.env.cr.execute("SELECT company_id, date FROM quelyos_sales_rollup_pending")
+        return self.env.cr.fetchall()
+
+    def test_pending_day_recorded_once(self):
+        self.Rollup._refresh_pending(limit=None)
+        self.Rollup._mark_orders_dirty(self.order)
+        self.Rollup._mark_orders_dirty(self.order | self._create_order(self.day, 1))
+        self.assertEqual(self._pending(), [(self.company.id, self.day)])
+
+    def test_read_catches_up_its_scope_only(self):
+        other_day = self.day - timedelta(days=40)
+        self.Rollup._refresh_pending(limit=None)
+        self._create_order(self.day, 1)
+        self._create_order(other_day, 1)
+
+        self._day_states(self.day)
+        self.assertEqual(self._pending(), [(self.company.id, other_day)])
+
+        self.Rollup.cron_refresh_pending()
+        self.assertEqual(self._pending(), [])
+
+    def test_cron_catches_stored_compute_changes(self):
+        self.Rollup.cron_refresh_pending()
+        before = self._day_states()['draft']['revenue']
+
+        # Montant recalculé et écrit au flush (hors write()) : seule la write_date bouge
+        self.env.flush_all()
+        self.env.cr.execute(
+            "UPDATE sale_order SET amount_total = amount_total + 10, write_date = now() AT TIME ZONE 'UTC' WHERE id = %s",
+            (self.order.id,),
+        )
+        self.assertEqual(self._day_states()['draft']['revenue'], before)
+
+        self.Rollup.cron_refresh_pending()
+        self.assertAlmostEqual(self._day_states()['draft']['revenue'], before + 10)
+
+
+@tagged('post_install', '-at_install', '-standard', 'quelyos_benchmark')
+class TestSalesRollupBenchmark(BenchmarkMixin, SalesRollupCase):
+    """Temps de réponse d'un graphique 12 mois sur un tenant d'un million de commandes"""
+
+    def test_chart_latency(self):
+        self.order.action_confirm()
+        self.env.flush_all()
+        # Commandes réparties sur les 365 derniers jours
+        clone_rows(self.env.cr, 'sale_order', self.order.ids, BENCH_ROLLUP_ORDERS, {
+            'name': "'BENCH' || gs",
+            'date_order': "now() - (gs % 365) * interval '1 day'",
+        })
+        self.env.invalidate_all()
+
+        start = time.perf_counter()
+        self.Rollup._refresh_buckets()
+        rebuild = time.perf_counter() - start
+
+        date_from = date.today() - timedelta(days=365)
+        p95 = self.assertP95Less(
+            lambda: self.Rollup.get_series(date_from, None, 'month', company=self.company), 20, 0.050,
+        )
+
+        _logger.info(
+            "Sales rollup benchmark: %d orders, full rebuild %.1f s, 12-month chart p95 %.1f ms",
+            BENCH_ROLLUP_ORDERS, rebuild, p95 * 1000,
+        )
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la livraison des webhooks (lib/webhooks.py) par le worker de jobs
+
+Abonnements et slots dans Redis sous un préfixe de clés unique, supprimé en
+fin de test ; jobs sur le backend mémoire ; HTTP remplacé par une session
+factice. Ignorés si Redis (REDIS_URL) n'est pas joignable.
+"""
+
+import time
+import unittest
+import uuid
+from unittest.mock import patch
+
+from odoo.addons.quelyos_api.lib import webhooks
+from odoo.addons.quelyos_api.lib.job_queue import JobQueue, JobStatus, MemoryJobBackend
+from odoo.addons.quelyos_api.lib.job_worker import JobWorker
+from odoo.addons.quelyos_api.lib.webhooks import (
+    WEBHOOK_MAX_DEFERRALS, WEBHOOK_QUEUE, WEBHOOK_TIMEOUT,
+    WebhookDeliveryError, WebhookEvent, WebhookService, WebhookSubscription,
+)
+
+
+class FakeResponse:
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = ''
+
+
+class FakeSession:
+    """Session HTTP factice : réponses programmées, appels enregistrés"""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.calls = []
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self.calls.append(headers)
+        return FakeResponse(self.statuses.pop(0) if self.statuses else 200)
+
+
+class TestWebhookDelivery(unittest.TestCase):
+    """Livraison, retries et concurrence par abonné"""
+
+    def setUp(self):
+        self.now = time.time()
+        self.backend = MemoryJobBackend()
+        self.queue = JobQueue(backend=self.backend)
+
+        prefix = f"quelyos:webhooks-test-{uuid.uuid4().hex[:12]}:"
+        self.service = WebhookService(job_queue=self.queue, key_prefix=prefix, clock=lambda: self.now)
+        if not self.service._redis:
+            self.skipTest("Redis indisponible")
+        redis_client = self.service._redis
+        self.addCleanup(lambda: [redis_client.delete(key) for key in redis_client.scan_iter(f"{prefix}*")])
+
+        singleton = patch.object(webhooks, '_webhook_service', self.service)
+        singleton.start()
+        self.addCleanup(singleton.stop)
+
+        self.subscription = WebhookSubscription(
+            id=1, url='https://hooks.example.com/quelyos', events=['order.*'], max_concurrency=1,
+        )
+        self.service.register_subscription(self.subscription)
+        self.worker = JobWorker(
+            WEBHOOK_QUEUE, self.backend,
+            handlers={
+                'webhook_flush': webhooks.handle_webhook_flush,
+                'webhook_deliver': webhooks.handle_webhook_deliver,
+            },
+            clock=lambda: self.now,
+        )
+
+    def _drain(self):
+        while self.worker.run_once():
+            pass
+
+    def _http(self, *statuses):
+        session = FakeSession(statuses)
+        http = patch.object(webhooks, 'get_http_session', return_value=session)
+        http.start()
+        self.addCleanup(http.stop)
+        return session
+
+    def _event(self):
+        return WebhookEvent('order.created', {'order_id': 42}).to_dict()
+
+    def test_emit_flush_deliver(self):
+        session = self._http(200)
+        self.assertEqual(self.service.emit(WebhookEvent('order.created', {'order_id': 42})), [1])
+        self._drain()
+
+        self.assertEqual(len(session.calls), 1)
+        self.assertEqual(session.calls[0]['X-Webhook-Event'], 'order.created')
+        self.assertTrue(self.service.get_recent_deliveries(subscription_id=1)[0]['success'])
+
+    def test_server_error_retried_client_error_not(self):
+        session = self._http(503, 200)
+        job_id = self.queue.enqueue(
+            'webhook_deliver', {'subscription_id': 1, 'events': [self._event()]},
+            queue=WEBHOOK_QUEUE, max_retries=3,
+        )
+        self._drain()
+        self.assertEqual(self.queue.get_status(job_id)['status'], JobStatus.RETRYING.value)
+
+        self.now += 3600 * 2
+        self._drain()
+        self.assertEqual(self.queue.get_status(job_id)['status'], JobStatus.COMPLETED.value)
+        self.assertEqual(len(session.calls), 2)
+
+        self._http(404)
+        result = self.service.deliver_job(1, [self._event()])
+        self.assertEqual(result, {'success': False, 'status_code': 404})
+
+    def test_saturated_subscriber_deferred_then_counted(self):
+        self._http(200)
+        self.assertTrue(self.service._acquire_slot(self.subscription))
+
+        self.assertEqual(self.service.deliver_job(1, [self._event()]), {'deferred': True})
+        deferred = self.backend.load_job(next(iter(self.backend._scheduled[WEBHOOK_QUEUE])))
+        self.assertEqual(deferred['payload']['deferrals'], 1)
+
+        with self.assertRaises(WebhookDeliveryError):
+            self.service.deliver_job(1, [self._event()], deferrals=WEBHOOK_MAX_DEFERRALS)
+
+    def test_leaked_slot_expires_under_traffic(self):
+        session = self._http()
+        # Un worker prend le slot puis meurt sans le rendre
+        self.assertTrue(self.service._acquire_slot(self.subscription))
+
+        # Trafic continu pendant la durée du bail : toujours saturé
+        for _i in range(2):
+            self.now += WEBHOOK_TIMEOUT
+            self.assertEqual(self.service.deliver_job(1, [self._event()]), {'deferred': True})
+
+        self.now += WEBHOOK_TIMEOUT + 1
+        self.assertTrue(self.service.deliver_job(1, [self._event()])['success'])
+        self.assertEqual(len(session.calls), 1)
+
+    def test_slot_released_after_delivery(self):
+        self._http(200, 500)
+        self.assertTrue(self.service.deliver_job(1, [self._event()])['success'])
+        with self.assertRaises(WebhookDeliveryError):
+            self.service.deliver_job(1, [self._event()])
+        self.assertTrue(self.service._acquire_slot(self.subscription))
@@ -112,7 +112,7 @@ export default function CartPage() {
               <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M12 8v4m0 4h.01M21 12a9 9 0 11-18 0 9 9 0 0118 0z" />
             </svg>
             <p className="text-red-800 mb-4">{error}</p>
-            <Button onClick={fetchCart}>Réessayer</Button>
+            <Button onClick={() => fetchCart()}>Réessayer</Button>
           </div>
         )}
 
@@ -62,8 +62,9 @@ export default function CheckoutPaymentPage() {
   const { isAuthenticated } = useAuthStore();
   const [isSubmitting, setIsSubmitting] = useState(false);
 
+  // Panier enregistré en commande : cart.id est la commande payée par Stripe / PayPal
   useEffect(() => {
-    fetchCart();
+    fetchCart(true);
   }, [fetchCart]);
 
   // Redirection si non authentifié
@@ -358,8 +358,9 @@ export class BackendClient {
   // PANIER
   // ========================================
 
-  async getCart(): Promise<CartResponse> {
-    return this.jsonrpc<CartResponse>('/cart');
+  async getCart(forCheckout: boolean = false): Promise<CartResponse> {
+    // forCheckout : panier enregistré en commande, cart.id utilisable pour le paiement
+    return this.jsonrpc<CartResponse>('/cart', forCheckout ? { for_checkout: true } : {});
   }
 
   async addToCart(product_id: number, quantity: number = 1): Promise<CartResponse> {
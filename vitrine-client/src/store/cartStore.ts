@@ -9,7 +9,7 @@ interface CartState {
   error: string | null;
 
   // Actions
-  fetchCart: () => Promise<void>;
+  fetchCart: (forCheckout?: boolean) => Promise<void>;
   addToCart: (productId: number, quantity?: number) => Promise<boolean>;
   updateQuantity: (lineId: number, quantity: number) => Promise<boolean>;
   removeItem: (lineId: number) => Promise<boolean>;
@@ -25,10 +25,10 @@ export const useCartStore = create<CartState>()(
       isLoading: false,
       error: null,
 
-      fetchCart: async () => {
+      fetchCart: async (forCheckout: boolean = false) => {
         set({ isLoading: true, error: null });
         try {
-          const response = await backendClient.getCart();
+          const response = await backendClient.getCart(forCheckout);
           if (response.success && response.cart) {
             set({ cart: response.cart, isLoading: false });
           } else {